@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Ruleset Load Benchmark
+
+Compares the legacy backend (one iptables fork per rule) with the
+atomic iptables-restore and nftables backends on synthetic
+1k/10k/50k-rule rulesets.
+
+By default only the generation side is measured and the number of
+process spawns each script would perform is reported. With --load the
+generated scripts are executed inside a throw-away network namespace
+(requires root, iptables and unshare), which measures real load time
+without touching the host ruleset.
+
+Copyright (c) 2025 Phreakwall Contributors
+
+Usage:
+    python3 benchmarks/restore_load.py [--sizes 1000,10000,50000] [--load]
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from phreakwall.core.backends import BACKENDS, get_backend  # noqa: E402
+from phreakwall.core.chains import ChainManager, ChainType  # noqa: E402
+
+RULES_PER_CHAIN = 250
+
+
+def build_ruleset(num_rules: int, family: int = 4) -> ChainManager:
+    """
+    Build a synthetic ruleset with the given number of filter rules.
+
+    Args:
+        num_rules: Total number of rules to generate
+        family: IP family (4 or 6)
+
+    Returns:
+        Populated chain manager
+    """
+    manager = ChainManager(family=family)
+
+    for index in range(num_rules):
+        chain_name = f"bench_{index // RULES_PER_CHAIN}"
+        chain = manager.get_chain(chain_name)
+        if not chain:
+            chain = manager.create_chain(chain_name, ChainType.FILTER)
+            manager.add_rule("phreakwall_forward", f"-j {chain_name}")
+
+        if family == 6:
+            source = f"2001:db8:{index // 65536:x}:{index % 65536:x}::/64"
+        else:
+            source = f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+
+        manager.add_rule(
+            chain_name, f"-s {source} -p tcp --dport {1024 + index % 50000} -j ACCEPT"
+        )
+
+    manager.add_rule("FORWARD", "-j phreakwall_forward")
+    return manager
+
+
+def render_script(manager: ChainManager, backend_name: str) -> str:
+    """Render a minimal load script for the given backend."""
+    backend = get_backend(backend_name, manager)
+
+    lines = ["set -e", "VERBOSITY=0"]
+    lines.extend(backend.runtime_functions())
+    lines.extend(backend.generate_load())
+
+    return "\n".join(lines) + "\n"
+
+
+def count_spawns(script: str) -> int:
+    """Count the netfilter tool invocations a script performs."""
+    return sum(
+        1
+        for line in script.splitlines()
+        if line.startswith(("run_iptables ", "run_iptables_restore ", "run_nft "))
+    )
+
+
+def load_script(script: str) -> float:
+    """
+    Execute a script in a private network namespace.
+
+    Returns:
+        Wall-clock load time in seconds
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".sh", delete=False) as f:
+        f.write(script)
+        path = f.name
+
+    try:
+        start = time.perf_counter()
+        subprocess.run(["unshare", "--net", "bash", path], check=True)
+        return time.perf_counter() - start
+    finally:
+        Path(path).unlink()
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description="Phreakwall ruleset load benchmark")
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000,50000",
+        help="Comma-separated rule counts (default: 1000,10000,50000)",
+    )
+    parser.add_argument(
+        "-f", "--family", type=int, choices=[4, 6], default=4, help="IP family"
+    )
+    parser.add_argument(
+        "--load",
+        action="store_true",
+        help="Execute the scripts in a new network namespace (requires root)",
+    )
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    header = f"{'rules':>8} {'backend':>8} {'render s':>10} {'spawns':>8}"
+    if args.load:
+        header += f" {'load s':>10}"
+    print(header)
+
+    for size in sizes:
+        manager = build_ruleset(size, args.family)
+
+        for backend in BACKENDS:
+            start = time.perf_counter()
+            script = render_script(manager, backend)
+            render_time = time.perf_counter() - start
+
+            row = (
+                f"{size:>8} {backend:>8} {render_time:>10.3f} "
+                f"{count_spawns(script):>8}"
+            )
+            if args.load:
+                row += f" {load_script(script):>10.3f}"
+            print(row)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Rule Memory Benchmark
+
+Measures bytes per rule for chain rules held as plain strings (the
+pre-IR representation) and as Rule objects with interned match
+fragments, using synthetic rules shaped like compiled zone-pair rules.
+
+Two address distributions are measured: one distinct address per rule
+(the worst case for interning) and a pool of 256 host addresses reused
+across chains, as when the same hosts appear in many zone pairs.
+
+Copyright (c) 2025 Phreakwall Contributors
+
+Usage:
+    python3 benchmarks/rule_memory.py [--sizes 10000,100000]
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from phreakwall.core.rule import Rule, interning  # noqa: E402
+
+# Rule bodies as produced by macros and zone-pair chains
+TEMPLATES = [
+    '-i eth0 -s {addr} -p tcp -m multiport --dports 80,443 -m conntrack --ctstate NEW '
+    '-m comment --comment "HTTP(S) from partners" -j ACCEPT',
+    '-i eth0 -s {addr} -p udp --dport 53 -m comment --comment "DNS" -j ACCEPT',
+    "-i eth0 -s {addr} -p tcp --dport 22 -m conntrack --ctstate NEW "
+    "-m limit --limit 3/min --limit-burst 5 -j ACCEPT",
+    "-i eth1 -d {addr} -p tcp --dport 25 -j LOG --log-prefix \"net2dmz:SMTP:\" "
+    "--log-level info",
+    "-i eth1 -d {addr} -p icmp --icmp-type echo-request -j REJECT "
+    "--reject-with icmp-admin-prohibited",
+]
+
+
+def rule_texts(count: int, addresses: int) -> List[str]:
+    """Generate rule texts drawing from the given number of addresses."""
+    texts = []
+    for index in range(count):
+        host = index % addresses
+        texts.append(
+            TEMPLATES[index % len(TEMPLATES)].format(
+                addr=f"10.{host // 65536 % 256}.{host // 256 % 256}.{host % 256}"
+            )
+        )
+    return texts
+
+
+def measure(build: Callable[[], list]) -> int:
+    """Return the bytes retained by the object build() returns."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    retained = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del retained
+    return after - before
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description="Phreakwall rule memory benchmark")
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000",
+        help="Comma-separated rule counts (default: 10000,100000)",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'rules':>8} {'addresses':>10} {'strings B/rule':>15} "
+        f"{'Rule B/rule':>12} {'ratio':>7}"
+    )
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        for addresses in (size, 256):
+            # The string side builds its own texts so they are counted
+            string_bytes = measure(lambda: rule_texts(size, addresses))
+            texts = rule_texts(size, addresses)
+            with interning():
+                rule_bytes = measure(lambda: [Rule.parse(text) for text in texts])
+
+            print(
+                f"{size:>8} {addresses:>10} {string_bytes / size:>15.1f} "
+                f"{rule_bytes / size:>12.1f} {rule_bytes / string_bytes:>7.2f}"
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""
+Phreakwall Compile Throughput Benchmarks
+
+Generates synthetic configuration trees (zones, interfaces, params,
+macros, NAT entries and rules), compiles them end to end and phase by
+phase, and records time, peak RSS and output size as JSON. Results can
+be compared with a saved baseline to catch regressions.
+
+Copyright (c) 2025 Phreakwall Contributors
+
+Usage:
+    python3 -m benchmarks.throughput run [--sizes 1000,10000,50000] [-o FILE]
+    python3 -m benchmarks.throughput run --baseline BASELINE.json
+    python3 -m benchmarks.throughput compare BASELINE.json CURRENT.json
+    python3 -m benchmarks.throughput generate DIRECTORY [--rules N]
+"""
+
+from benchmarks.throughput.compare import Difference, compare
+from benchmarks.throughput.generate import TreeSpec, generate_tree
+from benchmarks.throughput.run import run_case, run_suite
+
+__all__ = [
+    "Difference",
+    "TreeSpec",
+    "compare",
+    "generate_tree",
+    "run_case",
+    "run_suite",
+]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Compile Throughput Benchmark CLI
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from benchmarks.throughput.compare import Difference, compare  # noqa: E402
+from benchmarks.throughput.generate import TreeSpec, generate_tree  # noqa: E402
+from benchmarks.throughput.run import run_suite  # noqa: E402
+from phreakwall.core.backends import BACKENDS  # noqa: E402
+
+
+def _print_case(case: Dict[str, Any]):
+    """Print one result row."""
+    print(
+        f"{case['name']:<60} {case['wall'] * 1000:>10.1f} {case['cpu'] * 1000:>10.1f} "
+        f"{case['peak_rss'] / 1048576:>8.1f} {case['output_bytes'] / 1024:>10.1f} "
+        f"{case.get('rules', '-'):>8}"
+    )
+    for phase in case["phases"]:
+        print(
+            f"  {phase['name']:<58} {phase['wall'] * 1000:>10.1f} "
+            f"{phase['cpu'] * 1000:>10.1f}"
+        )
+
+
+def _report(differences: List[Difference]) -> int:
+    """Print the differences; returns 1 if any is a regression."""
+    regressions = [difference for difference in differences if difference.regression]
+    for difference in differences:
+        print(difference)
+    print(f"\n{len(regressions)} regressions in {len(differences)} comparisons")
+    return 1 if regressions else 0
+
+
+def main():
+    """Run the benchmark CLI."""
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks.throughput",
+        description="Phreakwall compile throughput benchmark",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Generate trees, compile, record results")
+    run.add_argument(
+        "--sizes",
+        default="1000,10000,50000",
+        help="Comma-separated rule counts (default: 1000,10000,50000)",
+    )
+    run.add_argument("--zones", type=int, default=10, help="Zones per tree")
+    run.add_argument("--seed", type=int, default=1, help="Generator seed")
+    run.add_argument(
+        "--backends",
+        default="restore",
+        help=f"Comma-separated backends of {','.join(BACKENDS)} (default: restore)",
+    )
+    run.add_argument("-f", "--family", type=int, choices=[4, 6], default=4)
+    run.add_argument("-O", "--optimize", type=int, default=0, help="Optimization level")
+    run.add_argument(
+        "--repeat", type=int, default=3, help="End-to-end compiles per case (best kept)"
+    )
+    run.add_argument(
+        "--no-phases", action="store_true", help="Skip the profiled phase breakdown"
+    )
+    run.add_argument("-o", "--output", type=Path, help="Write the results as JSON")
+    run.add_argument("--baseline", type=Path, help="Compare with saved results")
+    run.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Relative growth flagged as a regression (default: 0.10)",
+    )
+
+    diff = commands.add_parser("compare", help="Compare two saved results")
+    diff.add_argument("baseline", type=Path)
+    diff.add_argument("current", type=Path)
+    diff.add_argument("--threshold", type=float, default=0.10)
+
+    generate = commands.add_parser("generate", help="Write a synthetic tree")
+    generate.add_argument("directory", type=Path)
+    generate.add_argument("--rules", type=int, default=1000)
+    generate.add_argument("--zones", type=int, default=10)
+    generate.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        spec = TreeSpec(rules=args.rules, zones=args.zones, seed=args.seed)
+        for name, count in generate_tree(args.directory, spec).items():
+            print(f"{name:<20} {count:>8}")
+        return 0
+
+    if args.command == "compare":
+        baseline = json.loads(args.baseline.read_text())
+        current = json.loads(args.current.read_text())
+        return _report(compare(baseline, current, args.threshold))
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    specs = [
+        TreeSpec(rules=int(size), zones=args.zones, seed=args.seed)
+        for size in args.sizes.split(",")
+    ]
+
+    print(
+        f"{'case':<60} {'wall ms':>10} {'cpu ms':>10} {'peak MB':>8} "
+        f"{'output KB':>10} {'rules':>8}"
+    )
+    results = run_suite(
+        specs,
+        backends=args.backends.split(","),
+        family=args.family,
+        optimize=args.optimize,
+        repeat=args.repeat,
+        phases=not args.no_phases,
+        progress=_print_case,
+    )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nResults written to {args.output}")
+
+    if baseline:
+        print()
+        return _report(compare(baseline, results, args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Benchmark Comparison
+
+Compares a benchmark run with a saved baseline and flags regressions:
+cases whose time, peak RSS or output size grew by more than a
+threshold. Phase times are compared too, but only for phases that took
+long enough in the baseline for the difference to be more than timer
+noise.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from benchmarks.throughput.run import RESULTS_FORMAT
+
+# Case metrics compared against the baseline
+METRICS = ("wall", "cpu", "peak_rss", "output_bytes")
+
+# Phases faster than this in the baseline are not compared (seconds)
+MIN_PHASE_TIME = 0.05
+
+
+@dataclass
+class Difference:
+    """Change of one metric of one case."""
+
+    case: str
+    metric: str
+    baseline: float
+    current: float
+    regression: bool
+
+    @property
+    def change(self) -> float:
+        """Relative change; positive means bigger or slower."""
+        if not self.baseline:
+            return 0.0 if not self.current else float("inf")
+        return self.current / self.baseline - 1
+
+    def __str__(self) -> str:
+        flag = "REGRESSION" if self.regression else ""
+        return (
+            f"{self.case}: {self.metric} {_format(self.metric, self.baseline)} -> "
+            f"{_format(self.metric, self.current)} ({self.change:+.1%}) {flag}"
+        ).rstrip()
+
+
+def _format(metric: str, value: float) -> str:
+    """Format a metric value for display."""
+    if metric == "peak_rss":
+        return f"{value / 1048576:.1f} MB"
+    if metric == "output_bytes":
+        return f"{value:.0f} B"
+    return f"{value * 1000:.1f} ms"
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.10
+) -> List[Difference]:
+    """
+    Compare two results documents.
+
+    Args:
+        baseline: Saved results
+        current: New results
+        threshold: Relative growth flagged as a regression
+
+    Returns:
+        Differences of every case present in both, regressions first
+
+    Raises:
+        ValueError: If either document has an unknown format
+    """
+    for results in (baseline, current):
+        if results.get("format") != RESULTS_FORMAT:
+            raise ValueError(f"Unsupported results format: {results.get('format')}")
+
+    previous = {case["name"]: case for case in baseline["cases"]}
+    differences = []
+
+    for case in current["cases"]:
+        base = previous.get(case["name"])
+        if base is None:
+            continue
+
+        for metric in METRICS:
+            differences.append(
+                _difference(case["name"], metric, base[metric], case[metric], threshold)
+            )
+
+        phases = {phase["name"]: phase for phase in base.get("phases", [])}
+        for phase in case.get("phases", []):
+            base_phase = phases.get(phase["name"])
+            if base_phase is None or base_phase["wall"] < MIN_PHASE_TIME:
+                continue
+            differences.append(
+                _difference(
+                    case["name"],
+                    f"phase {phase['name']}",
+                    base_phase["wall"],
+                    phase["wall"],
+                    threshold,
+                )
+            )
+
+    differences.sort(key=lambda difference: not difference.regression)
+    return differences
+
+
+def _difference(
+    case: str, metric: str, baseline: float, current: float, threshold: float
+) -> Difference:
+    """Build a Difference, deciding whether it is a regression."""
+    return Difference(
+        case, metric, baseline, current, current > baseline * (1 + threshold)
+    )
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Synthetic Configuration Generator
+
+Writes configuration trees shaped like those of real installations:
+zones with one or more interfaces each, a policy file, params naming
+networks and hosts, site-specific macros next to the stock ones, NAT
+entries and a rules file mixing single ports, service names, port
+lists and ranges, addresses, params, macro invocations and logging
+rules. Trees are reproducible from their spec.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+
+# Stock macros invoked by the generated rules
+STOCK_MACROS = ("HTTP", "HTTPS", "SSH", "DNS", "SMTP", "IMAPS", "NTP", "Ping")
+
+# Service names resolved through /etc/services
+SERVICES = ("ssh", "http", "https", "smtp", "imaps", "domain", "ldap", "pop3s")
+
+PROTOCOLS = ("tcp", "tcp", "tcp", "udp")
+
+
+@dataclass
+class TreeSpec:
+    """Size of a synthetic configuration tree."""
+
+    rules: int = 1000
+    zones: int = 10
+    interfaces: int = 12  # At least one per zone
+    macros: int = 20  # Site-specific macros
+    nat: int = 50  # masq and snat entries
+    params: int = 100  # Network and host params
+    seed: int = 1
+
+    @property
+    def name(self) -> str:
+        """Short label of the spec for reports."""
+        return f"rules={self.rules},zones={self.zones}"
+
+
+def _network(index: int) -> str:
+    return f"10.{index // 256 % 256}.{index % 256}.0/24"
+
+
+def _host(index: int) -> str:
+    return f"172.{16 + index // 65536 % 16}.{index // 256 % 256}.{index % 256 or 1}"
+
+
+def generate_tree(directory: Path, spec: TreeSpec) -> Dict[str, int]:
+    """
+    Write a synthetic configuration tree.
+
+    Args:
+        directory: Target directory, created if missing
+        spec: Size of the tree
+
+    Returns:
+        Mapping of file name to the number of entries written
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(spec.seed)
+    zones = [f"z{index}" for index in range(spec.zones)] + ["net"]
+    files: Dict[str, List[str]] = {}
+
+    files["phreakwall.conf"] = [
+        "STARTUP_ENABLED=Yes",
+        "IP_FORWARDING=On",
+        'LOGFORMAT="%s:%s:"',
+        "AUTO_SETS=Yes",
+        "MULTIPORT=Yes",
+    ]
+
+    files["zones"] = ["fw firewall"] + [f"{zone} ipv4" for zone in zones]
+
+    # Every zone gets an interface, the rest are spread over the zones
+    interfaces = max(spec.interfaces, len(zones))
+    files["interfaces"] = [
+        f"{zones[index % len(zones)]} eth{index} tcpflags,nosmurfs"
+        for index in range(interfaces)
+    ]
+
+    files["policy"] = [
+        "$FW all ACCEPT",
+        "net all DROP info",
+        "all all REJECT",
+    ]
+
+    files["params"] = []
+    for index in range(spec.params):
+        if index % 2:
+            files["params"].append(f"HOST_{index}={_host(index)}")
+        else:
+            files["params"].append(f"NET_{index}={_network(index)}")
+
+    macros = []
+    for index in range(spec.macros):
+        name = f"Site{index}"
+        macros.append(name)
+        port = 8000 + index * 3
+        files[f"macro.{name}"] = [
+            f"PARAM\t-\t-\ttcp\t{port}",
+            f"PARAM\t-\t-\tudp\t{port + 1}",
+        ]
+
+    files["masq"] = []
+    files["snat"] = []
+    for index in range(spec.nat):
+        interface = f"eth{index % interfaces}"
+        if index % 2:
+            files["masq"].append(f"{interface} {_network(index)}")
+        else:
+            files["snat"].append(f"MASQUERADE {_network(index)} {interface}")
+
+    files["rules"] = _rules(rng, spec, zones, macros)
+
+    counts = {}
+    for name, lines in files.items():
+        (directory / name).write_text("\n".join(lines) + "\n")
+        counts[name] = len(lines)
+    return counts
+
+
+def _rules(
+    rng: random.Random, spec: TreeSpec, zones: List[str], macros: List[str]
+) -> List[str]:
+    """Generate the rules file entries."""
+    rules = [
+        "Invalid(DROP) net all",
+        "DropSmurfs net all",
+        "NotSyn(DROP):info net all",
+        "AllowICMPs all all",
+    ]
+    params = [
+        f"$HOST_{index}" if index % 2 else f"$NET_{index}"
+        for index in range(spec.params)
+    ]
+    sources = zones + ["$FW"]
+
+    while len(rules) < spec.rules:
+        source, dest = rng.sample(sources, 2)
+        proto = rng.choice(PROTOCOLS)
+        kind = rng.random()
+
+        if kind < 0.30:
+            # Single numeric port, often to a specific host
+            if params and dest != "$FW" and rng.random() < 0.5:
+                dest = f"{dest}:{rng.choice(params)}"
+            port = rng.randint(1024, 65000)
+            rules.append(f"ACCEPT {source} {dest} {proto} {port}")
+        elif kind < 0.45:
+            rules.append(f"ACCEPT {source} {dest} tcp {rng.choice(SERVICES)}")
+        elif kind < 0.55:
+            ports = sorted(rng.sample(range(1024, 65000), rng.randint(2, 6)))
+            ports = ",".join(map(str, ports))
+            rules.append(f"ACCEPT {source} {dest} {proto} {ports}")
+        elif kind < 0.60:
+            low = rng.randint(1024, 60000)
+            high = low + rng.randint(1, 999)
+            rules.append(f"ACCEPT {source} {dest} {proto} {low}:{high}")
+        elif kind < 0.75:
+            macro = rng.choice(macros) if macros and rng.random() < 0.5 else None
+            macro = macro or rng.choice(STOCK_MACROS)
+            rules.append(f"{macro}(ACCEPT) {source} {dest}")
+        elif kind < 0.90:
+            # Blocked networks and hosts
+            source = rng.choice(zones)
+            address = rng.choice(params) if params else _host(len(rules))
+            verdict = rng.choice(("DROP", "REJECT"))
+            rules.append(f"{verdict} {source}:{address} {dest}")
+        else:
+            rules.append(
+                f"ACCEPT:info {source} {dest} {proto} {rng.randint(1024, 65000)}"
+            )
+
+    return rules[: spec.rules]
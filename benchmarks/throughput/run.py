@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Compile Throughput Runner
+
+Compiles synthetic configuration trees with the real Compiler and
+records wall and CPU time, peak RSS and output size.
+
+Every compile runs in a freshly spawned process, since the peak RSS of
+a process never goes down and an earlier, larger case would mask a
+later one. A case is compiled twice: once plain, for the end-to-end
+figures, and once with --profile-json for the per-phase breakdown.
+Tracing allocations slows the profiled compile down, so its phase
+times are only comparable with other profiled runs.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from benchmarks.throughput.generate import TreeSpec, generate_tree
+from phreakwall.core.compiler import Compiler, CompilerOptions
+
+# Results format; compare() refuses other formats
+RESULTS_FORMAT = 1
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _compile(
+    directory: str, backend: str, family: int, optimize: int, profile: bool
+) -> Dict[str, Any]:
+    """
+    Compile one tree (runs in a spawned worker process).
+
+    Returns:
+        Measurements of the compile
+    """
+    with tempfile.TemporaryDirectory(prefix="phreakwall-bench-") as work:
+        script = Path(work) / "firewall.sh"
+        profile_json = Path(work) / "profile.json" if profile else None
+        options = CompilerOptions(
+            script=script,
+            directory=Path(directory),
+            backend=backend,
+            family=family,
+            optimize=optimize,
+            cache_dir=None,
+            test=True,
+            verbosity=-1,
+            profile_json=profile_json,
+        )
+
+        start, cpu = time.perf_counter(), time.process_time()
+        result = Compiler(options).compile()
+        wall, cpu = time.perf_counter() - start, time.process_time() - cpu
+        if result != 0:
+            raise RuntimeError(f"Compiling {directory} with {backend} failed")
+
+        lines = 0
+        with script.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                lines += chunk.count(b"\n")
+
+        measurement = {
+            "wall": wall,
+            "cpu": cpu,
+            "peak_rss": _peak_rss(),
+            "output_bytes": script.stat().st_size,
+            "output_lines": lines,
+        }
+        if profile_json:
+            measurement["profile"] = json.loads(profile_json.read_text())
+        return measurement
+
+
+def _spawned(*args) -> Dict[str, Any]:
+    """Run _compile() in a new process."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_compile, *args).result()
+
+
+def run_case(
+    directory: Path,
+    spec: TreeSpec,
+    backend: str = "restore",
+    family: int = 4,
+    optimize: int = 0,
+    repeat: int = 3,
+    phases: bool = True,
+) -> Dict[str, Any]:
+    """
+    Benchmark one configuration tree with one backend.
+
+    Args:
+        directory: Tree written by generate_tree()
+        spec: Spec the tree was generated from
+        backend: Compiler backend
+        family: IP family
+        optimize: Optimization level
+        repeat: End-to-end compiles; the best time and RSS are kept
+        phases: Also run a profiled compile for the phase breakdown
+
+    Returns:
+        Case result
+    """
+    runs = [
+        _spawned(str(directory), backend, family, optimize, False)
+        for _ in range(max(1, repeat))
+    ]
+
+    case = {
+        "name": f"{spec.name},backend={backend},family={family},optimize={optimize}",
+        "spec": asdict(spec),
+        "backend": backend,
+        "family": family,
+        "optimize": optimize,
+        "repeat": len(runs),
+        "wall": min(run["wall"] for run in runs),
+        "cpu": min(run["cpu"] for run in runs),
+        "peak_rss": min(run["peak_rss"] for run in runs),
+        "output_bytes": runs[0]["output_bytes"],
+        "output_lines": runs[0]["output_lines"],
+        "phases": [],
+    }
+
+    if phases:
+        profile = _spawned(str(directory), backend, family, optimize, True)["profile"]
+        case["phases"] = profile["phases"]
+        case["rules"] = max(
+            (phase["rules_out"] or 0 for phase in profile["phases"]), default=0
+        )
+
+    return case
+
+
+def run_suite(
+    specs: Iterable[TreeSpec],
+    backends: Iterable[str] = ("restore",),
+    family: int = 4,
+    optimize: int = 0,
+    repeat: int = 3,
+    phases: bool = True,
+    progress: Optional[Any] = None,
+) -> Dict[str, Any]:
+    """
+    Benchmark every spec with every backend.
+
+    Args:
+        specs: Trees to generate and compile
+        backends: Compiler backends
+        family: IP family
+        optimize: Optimization level
+        repeat: End-to-end compiles per case
+        phases: Also record the phase breakdown
+        progress: Called with each finished case (optional)
+
+    Returns:
+        Results document with one entry per case
+    """
+    cases: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="phreakwall-tree-") as work:
+        for index, spec in enumerate(specs):
+            directory = Path(work) / str(index)
+            generate_tree(directory, spec)
+            for backend in backends:
+                case = run_case(
+                    directory, spec, backend, family, optimize, repeat, phases
+                )
+                cases.append(case)
+                if progress:
+                    progress(case)
+
+    return {
+        "format": RESULTS_FORMAT,
+        "version": Compiler.VERSION,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": multiprocessing.cpu_count(),
+        "cases": cases,
+    }
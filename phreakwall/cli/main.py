@@ -9,12 +9,17 @@ Copyright (c) 2025 Phreakwall Contributors
 
 import sys
 from pathlib import Path
+from typing import Any, Dict, Optional
 
 import click
 
 from phreakwall import __version__
+from phreakwall.core.cache import CACHE_DIR, CompileCache
 from phreakwall.core.compiler import Compiler, CompilerOptions
+from phreakwall.daemon import DEFAULT_SOCKET, DaemonClient, DaemonError
+from phreakwall.daemon.watch import ChangeBatch, Watcher, WatchError
 from rich.console import Console
+from rich.markup import escape
 from rich.table import Table
 
 console = Console()
@@ -30,12 +35,61 @@ console = Console()
     default=Path("/etc/phreakwall"),
     help="Configuration directory",
 )
+@click.option(
+    "--socket",
+    type=Path,
+    envvar="PHREAKWALL_SOCKET",
+    default=DEFAULT_SOCKET,
+    help="phreakwalld socket",
+)
+@click.option("--no-daemon", is_flag=True, help="Always compile in this process")
 @click.pass_context
-def cli(ctx, verbose, directory):
+def cli(ctx, verbose, directory, socket, no_daemon):
     """Phreakwall - Modern Python Firewall Manager"""
     ctx.ensure_object(dict)
     ctx.obj["verbose"] = verbose
     ctx.obj["directory"] = directory
+    ctx.obj["socket"] = socket
+    ctx.obj["no_daemon"] = no_daemon
+
+
+def _daemon(ctx) -> Optional[DaemonClient]:
+    """Client for phreakwalld, if it is running and not disabled."""
+    if ctx.obj["no_daemon"]:
+        return None
+    client = DaemonClient(ctx.obj["socket"])
+    return client if client.available() else None
+
+
+def _request(ctx, command: str, **args: Any) -> Optional[Dict[str, Any]]:
+    """
+    Run a command in phreakwalld.
+
+    Returns:
+        The response, or None if the command has to run in this process
+        because no daemon is reachable
+    """
+    client = _daemon(ctx)
+    if client is None:
+        return None
+
+    try:
+        response = client.request(
+            command, directory=str(ctx.obj["directory"].resolve()), **args
+        )
+    except DaemonError as e:
+        if e.response is None:
+            console.print(f"[dim]{escape(str(e))}; running locally[/dim]")
+            return None
+        response = e.response
+
+    for message in response.get("messages", []):
+        console.print(f"[yellow]{message['level']}[/yellow]: {escape(message['message'])}")
+    if not response["ok"]:
+        console.print(f"[red]phreakwalld:[/red] {escape(response['error'])}")
+    elif ctx.obj["verbose"]:
+        console.print(f"[dim]phreakwalld answered in {response['elapsed']:.1f} ms[/dim]")
+    return response
 
 
 @cli.command()
@@ -44,12 +98,14 @@ def check(ctx):
     """Validate firewall configuration"""
     console.print("[bold blue]Checking configuration...[/bold blue]")
 
-    options = CompilerOptions(
-        directory=ctx.obj["directory"], verbosity=ctx.obj["verbose"]
-    )
-
-    compiler = Compiler(options)
-    result = compiler.compile()
+    response = _request(ctx, "check")
+    if response is not None:
+        result = 0 if response["ok"] and response["result"]["valid"] else 1
+    else:
+        options = CompilerOptions(
+            directory=ctx.obj["directory"], verbosity=ctx.obj["verbose"]
+        )
+        result = Compiler(options).compile()
 
     if result == 0:
         console.print("[bold green]✓[/bold green] Configuration is valid")
@@ -61,31 +117,197 @@ def check(ctx):
 @cli.command()
 @click.option("-o", "--output", type=Path, help="Output script file")
 @click.option("--preview", is_flag=True, help="Preview the generated script")
+@click.option(
+    "--backend",
+    type=click.Choice(["restore", "nft", "legacy"]),
+    default="restore",
+    help="Load the ruleset atomically (restore, nft) or per rule (legacy)",
+)
+@click.option(
+    "-O",
+    "--optimize",
+    type=click.IntRange(0, 31),
+    default=None,
+    help="Optimization level (default: OPTIMIZE setting)",
+)
+@click.option("--no-cache", is_flag=True, help="Recompile everything from scratch")
+@click.option(
+    "--dual-stack",
+    is_flag=True,
+    help="Compile IPv4 and IPv6 in parallel (IPv6 script gets a '6' suffix)",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print the time, memory and rule counts of each compile phase",
+)
+@click.option(
+    "--profile-json",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write the phase profile to a JSON file",
+)
 @click.pass_context
-def compile(ctx, output, preview):
+def compile(
+    ctx, output, preview, backend, optimize, no_cache, dual_stack, profile, profile_json
+):
     """Compile firewall configuration to script"""
     console.print("[bold blue]Compiling firewall configuration...[/bold blue]")
 
     if not output:
         output = Path("/var/lib/phreakwall/firewall.sh")
 
-    options = CompilerOptions(
-        script=output,
-        directory=ctx.obj["directory"],
-        verbosity=ctx.obj["verbose"],
-        preview=preview,
-    )
+    # The daemon compiles single-family scripts without extras
+    response = None
+    if not (preview or no_cache or dual_stack or profile or profile_json):
+        response = _request(
+            ctx,
+            "compile",
+            output=str(output.resolve()),
+            backend=backend,
+            optimize=optimize,
+        )
 
-    compiler = Compiler(options)
-    result = compiler.compile()
+    if response is not None:
+        result = 0 if response["ok"] else 1
+    else:
+        options = CompilerOptions(
+            script=output,
+            directory=ctx.obj["directory"],
+            verbosity=ctx.obj["verbose"],
+            preview=preview,
+            backend=backend,
+            optimize=optimize,
+            cache_dir=None if no_cache else CACHE_DIR,
+            dual_stack=dual_stack,
+            profile=profile,
+            profile_json=profile_json,
+        )
+        result = Compiler(options).compile()
 
     if result == 0:
         console.print(f"[bold green]✓[/bold green] Script generated: {output}")
+        if dual_stack:
+            output6 = output.with_name(output.name + "6")
+            console.print(f"[bold green]✓[/bold green] Script generated: {output6}")
     else:
         console.print("[bold red]✗[/bold red] Compilation failed")
         sys.exit(1)
 
 
+@cli.command()
+@click.option(
+    "--backend",
+    type=click.Choice(["restore", "nft"]),
+    default="restore",
+    help="Ruleset backend the live ruleset was loaded with",
+)
+@click.option(
+    "--live",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Diff against a saved iptables-save -c / nft -j dump and print the delta",
+)
+@click.pass_context
+def apply(ctx, backend, live):
+    """Apply only the changes against the live ruleset"""
+    console.print("[bold blue]Applying configuration changes...[/bold blue]")
+
+    response = _request(
+        ctx, "apply", backend=backend, live=str(live.resolve()) if live else None
+    )
+    if response is not None:
+        result = 0 if response["ok"] else 1
+        if result == 0 and live:
+            click.echo(response["result"]["delta"], nl=False)
+    else:
+        options = CompilerOptions(
+            directory=ctx.obj["directory"],
+            verbosity=ctx.obj["verbose"],
+            backend=backend,
+        )
+        result = Compiler(options).apply(live)
+
+    if result == 0 and live:
+        console.print("[bold green]✓[/bold green] Delta computed")
+    elif result == 0:
+        console.print("[bold green]✓[/bold green] Live ruleset is up to date")
+    else:
+        console.print("[bold red]✗[/bold red] Apply failed")
+        sys.exit(1)
+
+
+@cli.command()
+@click.option(
+    "-o",
+    "--output",
+    type=Path,
+    default=Path("/var/lib/phreakwall/firewall.sh"),
+    help="Output script file",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["restore", "nft", "legacy"]),
+    default="restore",
+    help="Ruleset backend",
+)
+@click.option("--apply", "apply_changes", is_flag=True, help="Apply each new ruleset")
+@click.option(
+    "--debounce",
+    type=float,
+    default=0.5,
+    show_default=True,
+    help="Seconds without changes before recompiling",
+)
+@click.pass_context
+def watch(ctx, output, backend, apply_changes, debounce):
+    """Recompile whenever the configuration changes"""
+    if apply_changes and backend == "legacy":
+        raise click.BadParameter("--apply needs the restore or nft backend")
+
+    directory = ctx.obj["directory"].resolve()
+    cache = CompileCache(CACHE_DIR, version=Compiler.VERSION, memory=True)
+    options = CompilerOptions(
+        script=output,
+        directory=directory,
+        verbosity=ctx.obj["verbose"],
+        backend=backend,
+    )
+    apply_options = CompilerOptions(
+        directory=directory, verbosity=ctx.obj["verbose"], backend=backend
+    )
+
+    def rebuild(batch: Optional[ChangeBatch] = None) -> bool:
+        if batch:
+            # Rehash only what changed; everything after a queue overflow
+            cache.forget(
+                [directory] if batch.overflow else [directory / f for f in batch.files]
+            )
+        if Compiler(options, cache).compile() != 0:
+            return False
+        return not apply_changes or Compiler(apply_options, cache).apply() == 0
+
+    def report(batch: ChangeBatch):
+        mark = "[bold green]✓[/bold green]" if batch.ok else "[bold red]✗[/bold red]"
+        console.print(
+            f"{mark} {len(batch.files)} files, {batch.events} queued events: "
+            f"{'rebuilt' if batch.ok else 'failed'} in {batch.rebuild_ms:.0f} ms, "
+            f"{batch.latency_ms:.0f} ms after the first change"
+        )
+        if batch.files:
+            console.print(f"  [dim]{escape(' '.join(batch.files))}[/dim]")
+
+    if not rebuild():
+        console.print("[bold red]✗[/bold red] Compilation failed; watching for fixes")
+
+    console.print(f"[bold blue]Watching {directory}...[/bold blue] (Ctrl-C to stop)")
+    try:
+        Watcher(directory, rebuild, debounce, report=report).run()
+    except WatchError as e:
+        console.print(f"[bold red]✗[/bold red] {escape(str(e))}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        console.print("Stopped")
+
+
 @cli.command()
 @click.pass_context
 def start(ctx):
@@ -128,6 +350,27 @@ def status(ctx):
     table.add_row("Config Dir", str(ctx.obj["directory"]), "")
     table.add_row("State", "Unknown", "Use systemctl status phreakwall")
 
+    client = _daemon(ctx)
+    try:
+        daemon = client.status()["result"] if client else None
+    except DaemonError:
+        daemon = None
+    if daemon:
+        table.add_row(
+            "Daemon",
+            "Running",
+            f"pid {daemon['pid']}, up {daemon['uptime']:.0f}s, "
+            f"serving {daemon['directory']}",
+        )
+        for name, stats in daemon["commands"].items():
+            table.add_row(
+                f"  {name}",
+                f"{stats['requests']} requests",
+                f"{stats['cached']} cached, last {stats['last_ms']:.1f} ms",
+            )
+    else:
+        table.add_row("Daemon", "Not running", str(ctx.obj["socket"]))
+
     console.print(table)
 
 
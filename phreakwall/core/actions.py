@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Action Chains
+
+Registry of Shorewall actions (``Invalid(DROP)``, ``DropSmurfs``,
+``NotSyn(DROP):info``, ...) and their instantiated chains.
+
+Shorewall inlines many actions, so an action invoked from every
+zone-pair chain repeats its rules in each of them. Here every distinct
+invocation is compiled once into a shared chain and each caller jumps
+to it. Invocations are keyed by a normalized signature: the action
+name, its parameters with the action's DEFAULTS applied and trailing
+'-' dropped, and the log level. ``Invalid``, ``Invalid(DROP)`` and
+``Invalid(DROP,-)`` therefore share one chain.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from phreakwall.core.chains import Chain, ChainType
+from phreakwall.core.conditions import Conditions
+from phreakwall.core.rule import Match, Rule
+
+# Shared action files and actions.std after the configuration directory
+ACTION_PATH = (
+    Path("/usr/share/phreakwall/actions"),
+    Path(__file__).resolve().parents[2] / "Shorewall" / "Actions",
+)
+
+ACTIONS_STD = (
+    Path("/usr/share/phreakwall/actions.std"),
+    Path(__file__).resolve().parents[2] / "Shorewall" / "actions.std",
+)
+
+# Nested action invocations deeper than this are assumed to be a loop
+MAX_ACTION_DEPTH = 8
+
+# Log levels that mean "do not log"
+_NO_LEVELS = ("", "-", "none")
+
+# Populates a new action chain: (chain, instance)
+Populate = Callable[[Chain, "ActionInstance"], None]
+
+
+@dataclass
+class ActionDeclaration:
+    """An action declared in actions.std or an actions file."""
+
+    name: str
+    path: Path
+    options: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def state(self) -> Optional[str]:
+        """Conntrack state the action handles (state=)."""
+        return self.options.get("state")
+
+    @property
+    def proto(self) -> Optional[str]:
+        """Protocol added to jumps to the action (proto=)."""
+        return self.options.get("proto")
+
+
+@dataclass
+class ActionInstance:
+    """A distinct action invocation and its shared chain."""
+
+    name: str
+    params: Tuple[str, ...]
+    level: str
+    chain: str
+    references: int = 0  # Jump rules targeting the chain
+
+    @property
+    def invocation(self) -> str:
+        """The invocation as a rules file ACTION column."""
+        text = self.name
+        if self.params:
+            text += f"({','.join(self.params)})"
+        if self.level:
+            text += f":{self.level}"
+        return text
+
+
+class ActionManager:
+    """
+    Declared actions and the chains instantiated from them.
+
+    Lives alongside the ChainManager of one compilation; action chains
+    are ordinary filter chains, so backends and the phase cache need no
+    special handling.
+    """
+
+    def __init__(self, config, chain_manager):
+        """
+        Initialize the action registry.
+
+        Args:
+            config: Configuration object
+            chain_manager: Chain manager that receives the action chains
+        """
+        self.config = config
+        self.chain_manager = chain_manager
+        self.family = chain_manager.family
+        self.logger = logging.getLogger(__name__)
+
+        self.declarations: Dict[str, ActionDeclaration] = {}
+        self.instances: Dict[Tuple, ActionInstance] = {}
+        self._defaults: Dict[str, Tuple[str, ...]] = {}
+        self._populating: List[Tuple] = []
+        self._loaded = False
+
+    def _load(self):
+        """Read the action declarations and index the action files."""
+        if self._loaded:
+            return
+        self._loaded = True
+
+        directories = self.config.search_path()
+
+        files: Dict[str, Path] = {}
+        for directory in directories + list(ACTION_PATH):
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith("action.") and entry.is_file():
+                    files.setdefault(entry.name[7:], Path(entry.path))
+
+        standard = next((path for path in ACTIONS_STD if path.exists()), None)
+        sources = [standard] if standard else []
+        sources.extend(directory / "actions" for directory in directories)
+
+        for source in sources:
+            if not source.exists():
+                continue
+            for record in self.config.records(source):
+                name = record.columns[0]
+                if name not in files:
+                    self.logger.debug(f"{record.location}: no action file for {name}")
+                    continue
+                declaration = ActionDeclaration(name, files[name])
+                for option in "".join(record.columns[1:]).split(","):
+                    key, _, value = option.partition("=")
+                    if key:
+                        declaration.options[key] = value
+                self.declarations[name] = declaration
+
+        self.logger.debug(f"Declared {len(self.declarations)} actions")
+
+    def __contains__(self, name: str) -> bool:
+        self._load()
+        return name in self.declarations
+
+    def declaration(self, name: str) -> ActionDeclaration:
+        """Return the declaration of an action."""
+        self._load()
+        return self.declarations[name]
+
+    def defaults(self, name: str) -> Tuple[str, ...]:
+        """Default parameters from the action file's DEFAULTS line."""
+        defaults = self._defaults.get(name)
+        if defaults is None:
+            defaults = ()
+            conditions = Conditions(self.family, (), self.config.params)
+            for record in self.config.records(
+                self.declaration(name).path, conditions=conditions
+            ):
+                if record.columns[0].upper() in ("DEFAULT", "DEFAULTS"):
+                    defaults = tuple(record.get(1, "").split(","))
+                    break
+            self._defaults[name] = defaults
+        return defaults
+
+    def signature(
+        self, name: str, params: Tuple[str, ...], level: str
+    ) -> Tuple[str, Tuple[str, ...], str]:
+        """
+        Normalize an invocation.
+
+        Args:
+            name: Action name
+            params: Invocation parameters
+            level: Log level, optionally followed by ':tag'
+
+        Returns:
+            (name, parameters, level) with defaults applied, trailing
+            '-' parameters dropped and 'none' levels cleared
+        """
+        defaults = self.defaults(name)
+        values = []
+        for index in range(max(len(params), len(defaults))):
+            value = params[index] if index < len(params) else ""
+            if value in ("", "-") and index < len(defaults):
+                value = defaults[index]
+            values.append(value or "-")
+        while values and values[-1] == "-":
+            values.pop()
+
+        level, _, tag = level.partition(":")
+        level = "" if level.lower() in _NO_LEVELS else level
+        if tag:
+            level = f"{level or 'none'}:{tag}"
+        return name, tuple(values), level
+
+    def instantiate(
+        self, name: str, params: Tuple[str, ...], level: str, populate: Populate
+    ) -> ActionInstance:
+        """
+        Return the shared chain for an invocation, creating it on first use.
+
+        Args:
+            name: Action name
+            params: Invocation parameters
+            level: Log level
+            populate: Called once with the new chain to fill it
+
+        Returns:
+            The action instance; callers add their jumps to its references
+
+        Raises:
+            ValueError: For an unknown action or a loop between actions
+        """
+        if name not in self:
+            raise ValueError(f"Unknown action {name}")
+
+        key = self.signature(name, params, level)
+        instance = self.instances.get(key)
+        if instance is not None:
+            if key in self._populating:
+                raise ValueError(f"Action {instance.invocation} invokes itself")
+            return instance
+        if len(self._populating) >= MAX_ACTION_DEPTH:
+            raise ValueError(f"Action {name} nested too deeply")
+
+        instance = ActionInstance(*key, chain=self._chain_name(*key))
+        chain = self.chain_manager.create_chain(instance.chain, ChainType.FILTER)
+        self.instances[key] = instance
+
+        self._populating.append(key)
+        try:
+            populate(chain, instance)
+        except Exception:
+            del self.instances[key]
+            self.chain_manager.delete_chain(instance.chain)
+            raise
+        finally:
+            self._populating.pop()
+
+        self.logger.debug(
+            f"Action {instance.invocation}: chain {instance.chain}, "
+            f"{len(chain.rules)} rules"
+        )
+        return instance
+
+    def _chain_name(self, name: str, params: Tuple[str, ...], level: str) -> str:
+        """Chain name: the action name for the default invocation, else numbered."""
+        default = self.signature(name, (), "")
+        if (name, params, level) == default and name not in self.chain_manager.chains:
+            return name
+        index = 1
+        while f"{name}_{index}" in self.chain_manager.chains:
+            index += 1
+        return f"{name}_{index}"
+
+    @property
+    def saved(self) -> int:
+        """Rules saved by jumping to shared chains instead of inlining them."""
+        saved = 0
+        for instance in self.instances.values():
+            rules = len(self.chain_manager.chains[instance.chain].rules)
+            saved += rules * instance.references - rules - instance.references
+        return saved
+
+    def report(self) -> List[str]:
+        """
+        Describe the instantiated actions and how often each is reused.
+
+        Returns:
+            Comment lines, one per instance
+        """
+        return [
+            f"# {instance.invocation}: chain {instance.chain}, "
+            f"{len(self.chain_manager.chains[instance.chain].rules)} rules, "
+            f"{instance.references} jumps"
+            for instance in sorted(
+                self.instances.values(), key=lambda i: (-i.references, i.chain)
+            )
+        ]
+
+
+def log_rule(
+    chain_name: str, target: str, level: str, matches=(), **fields
+) -> Rule:
+    """Build the LOG rule logging a disposition of an action chain."""
+    return Rule(
+        matches,
+        "LOG",
+        target_options=[
+            Match.get("--log-prefix", (f"Shorewall:{chain_name}:{target}:",)),
+            Match.get("--log-level", (level,)),
+        ],
+        **fields,
+    )
+
+
+def drop_smurfs(manager: ActionManager, chain: Chain, instance: ActionInstance):
+    """DropSmurfs: drop packets with a broadcast or multicast source."""
+    level = instance.level.partition(":")[0]
+    target = "DROP"
+    if level:
+        log_chain = manager.chain_manager.create_chain(
+            f"{chain.name}_log", ChainType.FILTER
+        )
+        log_chain.add_rule(log_rule(chain.name, "DROP", level))
+        log_chain.add_rule(Rule(target="DROP"))
+        target = log_chain.name
+
+    if manager.family == 6:
+        unspecified, multicast = "::", "ff00::/8"
+    else:
+        unspecified, multicast = "0.0.0.0", "224.0.0.0/4"
+
+    chain.add_rule(Rule(target="RETURN", source=unspecified))
+    chain.add_rule(
+        Rule(
+            [Match.get("-m", ("addrtype",)), Match.get("--src-type", ("BROADCAST",))],
+            target,
+            "-g",
+        )
+    )
+    chain.add_rule(Rule(target=target, jump="-g", source=multicast))
+
+
+def limit(manager: ActionManager, chain: Chain, instance: ActionInstance):
+    """Limit:LEVEL:SET,CONN,INTERVAL: per-address connection rate limit."""
+    level, _, tag = instance.level.partition(":")
+    level = "" if level == "none" else level
+    params = [p for p in instance.params if p != "-"] or tag.split(",")
+    if len(params) != 3 or not all(p.isdigit() for p in params[1:]):
+        raise ValueError(
+            "Limit rules must include <set name>,<max connections>,<interval> "
+            "as the log tag or as parameters"
+        )
+    name, connections, seconds = params
+    recent = Match.get("-m", ("recent",))
+
+    chain.add_rule(Rule([recent, Match.get("--name", (name,)), Match.get("--set", ())]))
+    update = [
+        recent,
+        Match.get("--name", (name,)),
+        Match.get("--update", ()),
+        Match.get("--seconds", (seconds,)),
+        Match.get("--hitcount", (str(int(connections) + 1),)),
+    ]
+    # Logged through a chain of its own, as in Shorewall, so that the
+    # recent list is updated once per packet
+    target = "DROP"
+    if level:
+        log_chain = manager.chain_manager.create_chain(
+            f"{chain.name}_log", ChainType.FILTER
+        )
+        log_chain.add_rule(log_rule(chain.name, "DROP", level))
+        log_chain.add_rule(Rule(target="DROP"))
+        target = log_chain.name
+    chain.add_rule(Rule(update, target))
+    chain.add_rule(Rule(target="ACCEPT"))
+
+
+# Actions whose Shorewall bodies are embedded Perl
+NATIVE_ACTIONS: Dict[str, Callable[[ActionManager, Chain, ActionInstance], None]] = {
+    "DropSmurfs": drop_smurfs,
+    "Limit": limit,
+}
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Address Library
+
+Validation, normalization and aggregation of IPv4 and IPv6 addresses,
+networks and ranges (the Python counterpart of Shorewall's IPAddrs.pm).
+
+Addresses are handled as closed integer intervals. Aggregation sorts
+the intervals once, merges them in a single sweep and cuts every merged
+interval into the fewest aligned CIDR blocks, so large allowlists
+collapse in O(n log n) without building per-address structures. Overlap
+detection between named address lists uses the same sorted sweep.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import heapq
+import socket
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+VLSM = {4: 32, 6: 128}
+
+_AF = {4: socket.AF_INET, 6: socket.AF_INET6}
+
+ALLIP = {4: "0.0.0.0/0", 6: "::/0"}
+
+RFC1918_NETWORKS = ("10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16")
+
+# A closed interval of addresses as integers
+Interval = Tuple[int, int]
+
+
+class AddressError(ValueError):
+    """Raised for an invalid address, network or range."""
+
+    pass
+
+
+@dataclass(frozen=True)
+class Overlap:
+    """Addresses claimed by two address lists."""
+
+    first: str
+    second: str
+    start: int
+    end: int
+    family: int = 4
+
+    @property
+    def networks(self) -> List[str]:
+        """The shared addresses as CIDR blocks."""
+        return interval_to_cidrs(self.start, self.end, self.family)
+
+    def __str__(self) -> str:
+        return f"{self.first} and {self.second} overlap in {', '.join(self.networks)}"
+
+
+def address_family(text: str) -> int:
+    """
+    Guess the family of an address token.
+
+    Args:
+        text: Address, network or range
+
+    Returns:
+        6 if the token contains a colon, else 4
+    """
+    return 6 if ":" in text else 4
+
+
+def decode_address(text: str, family: int = 4) -> int:
+    """
+    Convert an address to an integer.
+
+    Args:
+        text: Address in dotted quad or IPv6 notation ('[...]' allowed)
+        family: IP family (4 or 6)
+
+    Returns:
+        Address as an integer
+
+    Raises:
+        AddressError: If the address is invalid
+    """
+    if family == 6 and text.startswith("[") and text.endswith("]"):
+        text = text[1:-1]
+    try:
+        return int.from_bytes(socket.inet_pton(_AF[family], text), "big")
+    except (OSError, KeyError, TypeError):
+        raise AddressError(f"Invalid IPv{family} address ({text})") from None
+
+
+def encode_address(value: int, family: int = 4) -> str:
+    """
+    Convert an integer to an address string.
+
+    Args:
+        value: Address as an integer
+        family: IP family (4 or 6)
+
+    Returns:
+        Dotted quad or compressed IPv6 address
+    """
+    return socket.inet_ntop(_AF[family], value.to_bytes(VLSM[family] // 8, "big"))
+
+
+def parse_address(text: str, family: int = 4) -> Interval:
+    """
+    Parse an address, network or range into an interval.
+
+    Host bits of a network are ignored, so 10.1.2.3/8 covers 10.0.0.0/8.
+
+    Args:
+        text: 'addr', 'addr/vlsm' or 'low-high'
+        family: IP family (4 or 6)
+
+    Returns:
+        (first, last) addresses as integers
+
+    Raises:
+        AddressError: If the token is invalid
+    """
+    if "-" in text:
+        low, _, high = text.partition("-")
+        first = decode_address(low, family)
+        last = decode_address(high, family)
+        if first > last:
+            raise AddressError(f"Invalid IP Range ({text})")
+        return first, last
+
+    net, slash, vlsm = text.partition("/")
+    if not slash:
+        first = decode_address(net, family)
+        return first, first
+
+    if family == 6 and net.startswith("[") and net.endswith("]"):
+        net = net[1:-1]
+    first = decode_address(net, family)
+    bits = VLSM[family]
+    if not vlsm.isdigit() or int(vlsm) > bits:
+        raise AddressError(f"Invalid VLSM ({vlsm})")
+    host_bits = bits - int(vlsm)
+    first = first >> host_bits << host_bits
+    return first, first | ((1 << host_bits) - 1)
+
+
+def validate_address(text: str, family: int = 4) -> str:
+    """
+    Validate and normalize an address, network or range.
+
+    Args:
+        text: Address token
+        family: IP family (4 or 6)
+
+    Returns:
+        The canonical spelling: a host address without /32 (or /128), a
+        network with its host bits cleared, or a 'low-high' range
+
+    Raises:
+        AddressError: If the token is invalid
+    """
+    first, last = parse_address(text, family)
+    if "-" in text:
+        return f"{encode_address(first, family)}-{encode_address(last, family)}"
+    cidrs = interval_to_cidrs(first, last, family)
+    return cidrs[0]
+
+
+def interval_to_cidrs(first: int, last: int, family: int = 4) -> List[str]:
+    """
+    Cut an interval into the fewest aligned CIDR blocks.
+
+    Args:
+        first: First address
+        last: Last address
+        family: IP family (4 or 6)
+
+    Returns:
+        Networks covering exactly the interval; hosts carry no prefix length
+    """
+    bits = VLSM[family]
+    cidrs = []
+    while first <= last:
+        # Largest block aligned at first that does not pass last
+        size = (first & -first).bit_length() - 1 if first else bits
+        span = (last - first + 1).bit_length() - 1
+        size = min(size, span)
+        prefix = bits - size
+        address = encode_address(first, family)
+        cidrs.append(address if prefix == bits else f"{address}/{prefix}")
+        first += 1 << size
+    return cidrs
+
+
+def merge_intervals(intervals: Iterable[Interval], family: int = 4) -> List[Interval]:
+    """
+    Merge overlapping and adjacent intervals.
+
+    Args:
+        intervals: (first, last) pairs in any order
+        family: IP family the addresses belong to
+
+    Returns:
+        Disjoint, non-adjacent intervals in ascending order
+    """
+    # Sorting one integer per interval is several times faster than
+    # sorting tuples, so pack (first, last) into first << bits | last
+    bits = VLSM[family]
+    mask = (1 << bits) - 1
+    packed = [first << bits | last for first, last in intervals]
+    packed.sort()
+
+    merged: List[Interval] = []
+    start = end = -2
+    for value in packed:
+        first = value >> bits
+        if first > end + 1:
+            if end >= 0:
+                merged.append((start, end))
+            start, end = first, value & mask
+        elif value & mask > end:
+            end = value & mask
+    if end >= 0:
+        merged.append((start, end))
+    return merged
+
+
+def collapse(addresses: Iterable[str], family: int = 4) -> List[str]:
+    """
+    Collapse addresses, networks and ranges to the minimal CIDR cover.
+
+    Args:
+        addresses: Address tokens of one family
+        family: IP family (4 or 6)
+
+    Returns:
+        The fewest networks covering exactly the same addresses, sorted
+
+    Raises:
+        AddressError: If a token is invalid
+    """
+    cidrs: List[str] = []
+    intervals = [parse_address(address, family) for address in addresses]
+    for first, last in merge_intervals(intervals, family):
+        if first == last:
+            cidrs.append(encode_address(first, family))
+        else:
+            cidrs.extend(interval_to_cidrs(first, last, family))
+    return cidrs
+
+
+def find_overlaps(
+    lists: Dict[str, Iterable[str]], family: int = 4
+) -> List[Overlap]:
+    """
+    Find addresses claimed by more than one named address list.
+
+    Each list is merged first, so overlaps within a list are not
+    reported. The lists are then swept in address order while a heap
+    tracks the intervals still open.
+
+    Args:
+        lists: Address tokens by name, e.g. zone host lists
+        family: IP family (4 or 6)
+
+    Returns:
+        One Overlap per pair of lists and shared interval, in address order
+
+    Raises:
+        AddressError: If a token is invalid
+    """
+    tagged = sorted(
+        (first, last, name)
+        for name, addresses in lists.items()
+        for first, last in merge_intervals(
+            (parse_address(address, family) for address in addresses), family
+        )
+    )
+
+    overlaps = []
+    active: List[Tuple[int, int, str]] = []  # (last, first, name)
+    for first, last, name in tagged:
+        while active and active[0][0] < first:
+            heapq.heappop(active)
+        for other_last, _, other in active:
+            if other != name:
+                pair = sorted((other, name))
+                overlaps.append(
+                    Overlap(pair[0], pair[1], first, min(last, other_last), family)
+                )
+        heapq.heappush(active, (last, first, name))
+
+    return overlaps
+
+
+def contains(network: str, address: str, family: Optional[int] = None) -> bool:
+    """
+    Check whether a network, range or address covers another.
+
+    Args:
+        network: Covering token
+        address: Covered token
+        family: IP family; guessed from network if omitted
+
+    Returns:
+        True if every address of 'address' lies within 'network'
+    """
+    family = family or address_family(network)
+    outer = parse_address(network, family)
+    inner = parse_address(address, family)
+    return outer[0] <= inner[0] and inner[1] <= outer[1]
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Rule Analyzer
+
+Finds rules that can never match or make no difference once macros and
+actions are expanded:
+
+    shadowed     an earlier rule with another verdict matches every
+                 packet the rule would match
+    redundant    an earlier rule with the same verdict does
+    policy       the rule only repeats the verdict the chain reaches
+                 anyway (its policy), and no later rule in between
+                 could see its packets
+    correlated   an earlier rule with another verdict, covering the
+                 rule's addresses, catches part of its ports; rule
+                 order decides, which is worth a look
+
+A rule is viewed as a box over source and destination addresses,
+protocol and destination ports; all other matches must be equal (or
+absent in the earlier rule) for one rule to cover another. Rules are
+indexed per chain by those dimensions: addresses by network, so the
+networks containing an address are found by probing the prefix lengths
+in use, and destination ports in Fenwick trees keyed by range start and
+holding the highest range end, so containment and overlap queries take
+O(log n). Policy repeats are found in a reverse pass against merged
+interval unions of the later rules. The analysis is O(n log n) overall
+and never compares rules pairwise.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import logging
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from phreakwall.core.addresses import VLSM, AddressError, parse_address
+from phreakwall.core.optimizer import TERMINAL_TARGETS
+from phreakwall.core.rule import Match, Rule
+
+MAX_PORT = 65535
+
+# Findings whose rules can be dropped without changing any verdict
+REMOVABLE = ("shadowed", "redundant", "policy")
+
+# Matches folded into the protocol and port dimensions
+_PORT_MATCHES = {"-m multiport", "-m tcp", "-m udp", "-m sctp", "-m udplite", "-m dccp"}
+_PORT_OPTIONS = ("--dport", "--dports", "--destination-port", "--destination-ports")
+
+# Address or port interval, inclusive
+Interval = Tuple[int, int]
+
+ALL_PORTS: List[Interval] = [(0, MAX_PORT)]
+
+
+@dataclass
+class Finding:
+    """A rule reported by the analyzer."""
+
+    kind: str  # 'shadowed', 'redundant', 'policy' or 'correlated'
+    chain: str
+    index: int  # Position of the rule in its chain
+    rule: Rule
+    other: Optional[int] = None  # The earlier rule responsible
+    other_rule: Optional[Rule] = None
+
+    def __str__(self) -> str:
+        text = f"{self.chain} rule {self.index + 1} ({self.rule})"
+        if self.kind == "policy":
+            return f"{text} repeats the chain policy"
+        verb = "overlaps" if self.kind == "correlated" else f"is {self.kind} by"
+        return f"{text} {verb} rule {self.other + 1} ({self.other_rule})"
+
+
+@dataclass
+class _Box:
+    """The dimensions of a rule."""
+
+    residual: Tuple
+    source: Optional[Interval]  # None: any
+    destination: Optional[Interval]
+    proto: Optional[str]  # None: any
+    sport: Optional[str]
+    ports: List[Interval]
+    verdict: Optional[Tuple]  # None: the rule does not end the chain
+
+
+class _Fenwick:
+    """
+    Sparse Fenwick tree over range starts holding (highest end, -index).
+
+    query(start) returns the entry with the highest end among ranges
+    starting at or below start.
+    """
+
+    SIZE = MAX_PORT + 1
+
+    def __init__(self):
+        self.tree: Dict[int, Tuple[int, int]] = {}
+
+    def add(self, start: int, end: int, index: int):
+        value = (end, -index)
+        position = start + 1
+        tree = self.tree
+        while position <= self.SIZE:
+            current = tree.get(position)
+            if current is None or value > current:
+                tree[position] = value
+            position += position & -position
+
+    def query(self, start: int) -> Optional[Tuple[int, int]]:
+        best = None
+        position = start + 1
+        tree = self.tree
+        while position > 0:
+            current = tree.get(position)
+            if current is not None and (best is None or current > best):
+                best = current
+            position -= position & -position
+        return best
+
+
+class _AddressIndex:
+    """Entries keyed by address interval, searchable by containment."""
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.entries: Dict[Optional[Interval], object] = {}
+        self.prefixes: Set[int] = set()
+        self.ranges: List[Interval] = []  # Intervals that are no network
+
+    def get(self, interval: Optional[Interval], factory):
+        entry = self.entries.get(interval)
+        if entry is None:
+            entry = self.entries[interval] = factory()
+            if interval is not None:
+                prefix = _prefix(interval, self.bits)
+                if prefix is None:
+                    self.ranges.append(interval)
+                else:
+                    self.prefixes.add(prefix)
+        return entry
+
+    def containing(self, interval: Optional[Interval]) -> Iterable:
+        """Entries whose interval contains the given one."""
+        entry = self.entries.get(None)
+        if entry is not None:
+            yield entry
+        if interval is None:
+            return
+        first, last = interval
+        for prefix in self.prefixes:
+            host = self.bits - prefix
+            start = first >> host << host
+            end = start | ((1 << host) - 1)
+            if end >= last:
+                entry = self.entries.get((start, end))
+                if entry is not None:
+                    yield entry
+        for start, end in self.ranges:
+            if start <= first and last <= end:
+                yield self.entries[(start, end)]
+
+
+class _Union:
+    """Union of intervals as sorted, disjoint starts and ends."""
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.everything = False
+
+    def add(self, interval: Optional[Interval]):
+        if self.everything:
+            return
+        if interval is None:
+            self.everything = True
+            return
+        first, last = interval
+        low = bisect_left(self.ends, first - 1)
+        high = bisect_right(self.starts, last + 1)
+        if low < high:
+            first = min(first, self.starts[low])
+            last = max(last, self.ends[high - 1])
+        self.starts[low:high] = [first]
+        self.ends[low:high] = [last]
+
+    def intersects(self, interval: Optional[Interval]) -> bool:
+        if self.everything:
+            return True
+        if not self.starts:
+            return False
+        if interval is None:
+            return True
+        first, last = interval
+        index = bisect_left(self.ends, first)
+        return index < len(self.starts) and self.starts[index] <= last
+
+
+class _Blockers:
+    """Later rules that could see a packet before the chain policy."""
+
+    def __init__(self):
+        self.source = _Union()
+        self.destination = _Union()
+        self.ports = _Union()
+
+    def add(self, box: _Box):
+        self.source.add(box.source)
+        self.destination.add(box.destination)
+        for interval in box.ports:
+            self.ports.add(interval)
+
+    def intersects(self, box: _Box) -> bool:
+        # Each dimension is checked on its own, which can only err
+        # towards reporting an overlap
+        return (
+            self.source.intersects(box.source)
+            and self.destination.intersects(box.destination)
+            and any(self.ports.intersects(interval) for interval in box.ports)
+        )
+
+
+def _prefix(interval: Interval, bits: int) -> Optional[int]:
+    """Prefix length of an interval that is a network, else None."""
+    first, last = interval
+    size = last - first + 1
+    if size & (size - 1) or first & (size - 1):
+        return None
+    return bits - (size.bit_length() - 1)
+
+
+class RuleAnalyzer:
+    """Finds shadowed, redundant and correlated rules in compiled chains."""
+
+    def __init__(self, chain_manager):
+        """
+        Initialize the analyzer.
+
+        Args:
+            chain_manager: Chain manager whose chains are analyzed
+        """
+        self.chain_manager = chain_manager
+        self.family = chain_manager.family
+        self.bits = VLSM[self.family]
+        self.logger = logging.getLogger(__name__)
+        self._addresses: Dict[str, Optional[Interval]] = {}
+
+    def analyze(self, chains: Optional[Iterable] = None) -> List[Finding]:
+        """
+        Analyze chains.
+
+        Args:
+            chains: Chains to analyze (default: all)
+
+        Returns:
+            Findings in chain and rule order
+        """
+        if chains is None:
+            chains = list(self.chain_manager.chains.values())
+
+        findings: List[Finding] = []
+        for chain in chains:
+            findings.extend(self._analyze_chain(chain))
+
+        counts: Dict[str, int] = {}
+        for finding in findings:
+            counts[finding.kind] = counts.get(finding.kind, 0) + 1
+        if counts:
+            self.logger.info(
+                "Rule analysis: %s",
+                ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items())),
+            )
+        return findings
+
+    def drop(self, findings: Iterable[Finding]) -> int:
+        """
+        Delete the rules of removable findings from their chains.
+
+        Args:
+            findings: Findings from analyze() on the current chains
+
+        Returns:
+            Number of rules deleted
+        """
+        doomed: Dict[str, Set[int]] = {}
+        for finding in findings:
+            if finding.kind in REMOVABLE:
+                doomed.setdefault(finding.chain, set()).add(finding.index)
+
+        removed = 0
+        for name, indexes in doomed.items():
+            chain = self.chain_manager.chains[name]
+            chain.rules = [r for i, r in enumerate(chain.rules) if i not in indexes]
+            removed += len(indexes)
+        if removed:
+            self.logger.info("Dropped %d redundant rules", removed)
+        return removed
+
+    def _analyze_chain(self, chain) -> List[Finding]:
+        rules = chain.rules
+        if len(rules) < 2 and not chain.builtin:
+            return []
+
+        boxes = [self._box(rule) for rule in rules]
+        findings: List[Finding] = []
+        dead: Set[int] = set()
+
+        # Forward pass: rules covered by earlier terminal rules
+        index: Dict[Tuple, _AddressIndex] = {}
+        for position, box in enumerate(boxes):
+            finding = self._covered(index, box)
+            if finding is not None:
+                kind, other = finding
+                findings.append(
+                    Finding(kind, chain.name, position, rules[position], other, rules[other])
+                )
+                if kind != "correlated":
+                    dead.add(position)
+                    continue
+            if box.verdict is not None:
+                self._insert(index, box, position)
+
+        # Reverse pass: rules repeating the verdict the chain ends with
+        end = len(rules)
+        if chain.builtin:
+            policy = ("-j", chain.policy, ())
+        else:
+            last = rules[-1]
+            if last.source or last.destination or last.matches or last.jump != "-j":
+                return findings
+            if last.target not in TERMINAL_TARGETS:
+                return findings
+            policy = last.action
+            end -= 1
+
+        blockers: Dict[Optional[str], _Blockers] = {}
+        everything = _Blockers()
+        for position in range(end - 1, -1, -1):
+            if position in dead:
+                continue
+            box = boxes[position]
+            if box.verdict == policy:
+                if box.proto is None:
+                    blocked = everything.intersects(box)
+                else:
+                    blocked = any(
+                        group.intersects(box)
+                        for group in (blockers.get(None), blockers.get(box.proto))
+                        if group is not None
+                    )
+                if not blocked:
+                    findings.append(Finding("policy", chain.name, position, rules[position]))
+                continue
+            blockers.setdefault(box.proto, _Blockers()).add(box)
+            everything.add(box)
+
+        findings.sort(key=lambda finding: finding.index)
+        return findings
+
+    def _covered(self, index, box: _Box) -> Optional[Tuple[str, int]]:
+        """
+        Look a rule up among the earlier terminal rules.
+
+        Returns:
+            ('shadowed' or 'redundant', covering rule) if the rule is
+            fully covered, ('correlated', rule) for a partial overlap
+            with another verdict, else None
+        """
+        keys = [(box.proto, box.sport)]
+        if box.sport is not None:
+            keys.append((box.proto, None))
+        if box.proto is not None:
+            keys.append((None, None))
+
+        trees = []
+        for residual in {box.residual, ()}:
+            sources = index.get(residual)
+            if sources is None:
+                continue
+            for destinations in sources.containing(box.source):
+                for buckets in destinations.containing(box.destination):
+                    for key in keys:
+                        verdicts = buckets.get(key)
+                        if verdicts:
+                            trees.extend(verdicts.items())
+
+        if not trees:
+            return None
+
+        covered: List[Tuple[int, bool]] = []
+        for start, end in box.ports:
+            best = None
+            for verdict, tree in trees:
+                found = tree.query(start)
+                if found is not None and found[0] >= end:
+                    if best is None or -found[1] < best[0]:
+                        best = (-found[1], verdict == box.verdict)
+            if best is None:
+                break
+            covered.append(best)
+        else:
+            other = min(position for position, _ in covered)
+            same = all(same for _, same in covered)
+            return ("redundant" if same else "shadowed"), other
+
+        # Earlier exceptions inside the rule's ports are the usual way to
+        # write rules; only ranges reaching past one of its ends count
+        if box.verdict is None:
+            return None
+        for start, end in box.ports:
+            for verdict, tree in trees:
+                if verdict == box.verdict:
+                    continue
+                found = tree.query(start - 1) if start else None
+                if found is not None and found[0] >= start:
+                    return "correlated", -found[1]
+                found = tree.query(end)
+                if found is not None and found[0] > end:
+                    return "correlated", -found[1]
+        return None
+
+    def _insert(self, index, box: _Box, position: int):
+        sources = index.get(box.residual)
+        if sources is None:
+            sources = index[box.residual] = _AddressIndex(self.bits)
+        destinations = sources.get(box.source, lambda: _AddressIndex(self.bits))
+        buckets = destinations.get(box.destination, dict)
+        verdicts = buckets.setdefault((box.proto, box.sport), {})
+        tree = verdicts.get(box.verdict)
+        if tree is None:
+            tree = verdicts[box.verdict] = _Fenwick()
+        for start, end in box.ports:
+            tree.add(start, end, position)
+
+    def _box(self, rule: Rule) -> _Box:
+        """Split a rule into its dimensions."""
+        residual: List = []
+        proto = sport = None
+        ports = ALL_PORTS
+
+        for match in rule.matches:
+            option = match.option
+            if option == "-p" and not match.negated:
+                proto = match.value.lower()
+                if proto in ("all", "0"):
+                    proto = None
+            elif option in _PORT_OPTIONS and not match.negated:
+                parsed = _ports(match.value)
+                if parsed is None:
+                    residual.append(match)
+                else:
+                    ports = parsed
+            elif option in ("--sport", "--sports", "--source-port", "--source-ports"):
+                sport = str(match)
+            elif f"{option} {match.value}" not in _PORT_MATCHES:
+                residual.append(match)
+
+        source = self._address(rule.source, residual, "-s")
+        destination = self._address(rule.destination, residual, "-d")
+
+        verdict = None
+        if rule.jump == "-g" or rule.target in TERMINAL_TARGETS or rule.target == "RETURN":
+            verdict = rule.action
+
+        return _Box(tuple(residual), source, destination, proto, sport, ports, verdict)
+
+    def _address(
+        self, address: Optional[str], residual: List, option: str
+    ) -> Optional[Interval]:
+        """Interval of an address; negated or odd ones join the residual."""
+        if not address:
+            return None
+        if address not in self._addresses:
+            interval = None
+            if not address.startswith("!"):
+                try:
+                    interval = parse_address(address, self.family)
+                except AddressError:
+                    pass
+            self._addresses[address] = interval
+        interval = self._addresses[address]
+        if interval is None:
+            residual.append(Match.get(option, (address,)))
+        return interval
+
+
+def _ports(value: str) -> Optional[List[Interval]]:
+    """Port intervals of a --dport or --dports value."""
+    intervals = []
+    for item in value.split(","):
+        low, colon, high = item.partition(":")
+        if not low.isdigit() or (colon and not high.isdigit()):
+            return None
+        intervals.append((int(low), int(high) if colon else int(low)))
+    return intervals
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Phreakwall ruleset backends.
+
+Backends lower the chains held by a ChainManager into the commands that
+load them into the kernel. New backends register themselves in BACKENDS.
+"""
+
+from typing import Dict, Type
+
+from phreakwall.core.backends.base import Backend, BackendError
+from phreakwall.core.backends.iptables import LegacyBackend, RestoreBackend
+from phreakwall.core.backends.nftables import NftablesBackend
+
+BACKENDS: Dict[str, Type[Backend]] = {
+    RestoreBackend.name: RestoreBackend,
+    LegacyBackend.name: LegacyBackend,
+    NftablesBackend.name: NftablesBackend,
+}
+
+
+def get_backend(name: str, chain_manager) -> Backend:
+    """
+    Instantiate a backend by name.
+
+    Args:
+        name: Backend name (see BACKENDS)
+        chain_manager: Chain manager holding the compiled chains
+
+    Returns:
+        Backend instance
+    """
+    if name not in BACKENDS:
+        raise BackendError(f"Unknown backend: {name}")
+    return BACKENDS[name](chain_manager)
+
+
+__all__ = [
+    "Backend",
+    "BackendError",
+    "BACKENDS",
+    "get_backend",
+    "LegacyBackend",
+    "RestoreBackend",
+    "NftablesBackend",
+]
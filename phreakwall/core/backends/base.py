@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Backend Base
+
+Defines the interface every ruleset backend implements.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import logging
+from typing import Iterator, List
+
+from phreakwall.core.sets import ipset_restore, used_sets
+
+
+class BackendError(Exception):
+    """Raised when a ruleset cannot be lowered by a backend."""
+
+    pass
+
+
+class Backend:
+    """
+    Base class for ruleset backends.
+
+    A backend lowers the chains held by a ChainManager into the shell
+    fragments that load them into the kernel.
+    """
+
+    name = ""
+
+    def __init__(self, chain_manager):
+        """
+        Initialize the backend.
+
+        Args:
+            chain_manager: Chain manager holding the compiled chains
+        """
+        self.chain_manager = chain_manager
+        self.family = chain_manager.family
+        self.logger = logging.getLogger(__name__)
+        self.delta_stats = None
+
+    def runtime_functions(self) -> List[str]:
+        """
+        Generate the runtime helper functions the load fragment uses.
+
+        Returns:
+            List of shell lines
+        """
+        return [
+            "# Runtime helper functions",
+            "",
+            "error_exit() {",
+            '    echo "ERROR: $1" >&2',
+            "    exit 1",
+            "}",
+            "",
+        ]
+
+    def set_command(self) -> List[str]:
+        """
+        Command that loads the set_payload() read from stdin.
+
+        Returns:
+            Command argument list
+        """
+        return ["ipset", "restore"]
+
+    def set_payload(self) -> List[str]:
+        """
+        Generate the input that loads the sets the rules match against.
+
+        Returns:
+            ipset restore lines; empty if no rule uses a set
+        """
+        return ipset_restore(used_sets(self.chain_manager))
+
+    def generate_set_load(self) -> Iterator[str]:
+        """
+        Generate the shell fragment that loads the sets.
+
+        Yields:
+            Shell lines
+        """
+        payload = self.set_payload()
+        if not payload:
+            return
+
+        command = " ".join(self.set_command())
+        yield from (
+            "# Load the address and port sets matched by the rules",
+            "",
+            f"{command} <<'__PHREAKWALL_SETS__' || error_exit \"{command} failed\"",
+        )
+        yield from payload
+        yield from ("__PHREAKWALL_SETS__", "")
+
+    def generate_load(self) -> Iterator[str]:
+        """
+        Generate the shell fragment that loads the ruleset.
+
+        Lines are generated as they are rendered so the compiler can
+        stream them to the script without holding the whole ruleset
+        as text.
+
+        Yields:
+            Shell lines
+        """
+        raise NotImplementedError
+
+    def dump_command(self) -> List[str]:
+        """
+        Command that dumps the live ruleset for generate_delta().
+
+        Returns:
+            Command argument list
+        """
+        raise BackendError(
+            f"The {self.name} backend does not support differential apply"
+        )
+
+    def delta_command(self) -> List[str]:
+        """
+        Command that applies the generate_delta() payload read from stdin.
+
+        Returns:
+            Command argument list
+        """
+        raise BackendError(
+            f"The {self.name} backend does not support differential apply"
+        )
+
+    def generate_delta(self, dump: str) -> List[str]:
+        """
+        Generate the changes that turn the live ruleset into the compiled one.
+
+        The payload is applied in one transaction by delta_command().
+        Rules that did not change are left alone and keep their counters.
+
+        Args:
+            dump: Live ruleset as printed by dump_command()
+
+        Returns:
+            Payload lines; empty if the live ruleset is up to date
+        """
+        raise BackendError(
+            f"The {self.name} backend does not support differential apply"
+        )
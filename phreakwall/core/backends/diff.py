@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Ruleset Diff
+
+Support for differential apply: parsers for the live ruleset as dumped
+by ``iptables-save -c`` and ``nft -j list ruleset``, canonical rule
+forms that let compiled and live rules be compared, and the edit
+script computation shared by the backends.
+
+The parsers only take text, so the diff engine can be exercised
+against saved dump files without a kernel.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import difflib
+import functools
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from phreakwall.core.backends.base import BackendError
+from phreakwall.core.rule import Match, Rule, interning
+
+# Protocol spellings normalized to the names iptables-save prints
+PROTOCOL_NAMES = {
+    "1": "icmp",
+    "6": "tcp",
+    "17": "udp",
+    "58": "ipv6-icmp",
+    "132": "sctp",
+    "icmpv6": "ipv6-icmp",
+    "icmp6": "ipv6-icmp",
+}
+
+# Matches iptables loads implicitly for the rule's protocol and
+# iptables-save prints explicitly
+IMPLICIT_MATCHES = ("tcp", "udp", "icmp", "icmp6", "icmpv6", "sctp", "udplite", "dccp")
+
+# Options iptables-save prints before any -m match, in this order
+BASIC_OPTIONS = ("-i", "-o", "-p", "-f")
+
+# Connection states in the order iptables-save prints them
+CT_STATES = ("INVALID", "NEW", "RELATED", "ESTABLISHED", "UNTRACKED", "SNAT", "DNAT")
+
+LIMIT_UNITS = {"s": "sec", "m": "min", "h": "hour", "d": "day"}
+
+LOG_LEVELS = {
+    "emerg": "0",
+    "alert": "1",
+    "crit": "2",
+    "err": "3",
+    "error": "3",
+    "warning": "4",
+    "warn": "4",
+    "notice": "5",
+    "info": "6",
+    "debug": "7",
+}
+
+# Meta keys nft prints without the 'meta' keyword
+BARE_META_KEYS = ("iifname", "oifname", "iif", "oif")
+
+
+@dataclass
+class LiveChain:
+    """A chain as found in the live ruleset."""
+
+    name: str
+    policy: Optional[str] = None  # Built-in chains only
+    counters: Tuple[int, int] = (0, 0)
+    # Rule objects (iptables) or (handle, statement) pairs (nftables)
+    rules: List[Any] = field(default_factory=list)
+
+
+@dataclass
+class LiveTable:
+    """An nftables table as found in the live ruleset."""
+
+    chains: Dict[str, LiveChain] = field(default_factory=dict)
+    sets: List[str] = field(default_factory=list)
+
+
+@dataclass
+class DeltaStats:
+    """Size of a differential apply."""
+
+    inserted: int = 0
+    deleted: int = 0
+    replaced: int = 0
+    unchanged: int = 0
+    chains_added: int = 0
+    chains_removed: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.inserted} inserted, {self.deleted} deleted, "
+            f"{self.replaced} replaced, {self.unchanged} unchanged rules; "
+            f"{self.chains_added} chains added, {self.chains_removed} removed"
+        )
+
+
+def edit_script(
+    old: Sequence, new: Sequence
+) -> List[Tuple[str, int, int, int, int]]:
+    """
+    Compute the operations turning old into new.
+
+    The common prefix and suffix are stripped before running the
+    matcher, so a small edit in a large chain costs linear time.
+
+    Args:
+        old: Live rule keys
+        new: Compiled rule keys
+
+    Returns:
+        difflib-style (tag, i1, i2, j1, j2) opcodes, 'equal' omitted
+    """
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+
+    suffix = 0
+    while (
+        suffix < limit - prefix
+        and old[len(old) - suffix - 1] == new[len(new) - suffix - 1]
+    ):
+        suffix += 1
+
+    matcher = difflib.SequenceMatcher(
+        None,
+        old[prefix : len(old) - suffix],
+        new[prefix : len(new) - suffix],
+        autojunk=False,
+    )
+    return [
+        (tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def parse_iptables_save(text: str) -> Dict[str, Dict[str, LiveChain]]:
+    """
+    Parse ``iptables-save -c`` output.
+
+    Args:
+        text: Dump text
+
+    Returns:
+        Mapping of table name to its chains by name
+    """
+    tables: Dict[str, Dict[str, LiveChain]] = {}
+    chains: Optional[Dict[str, LiveChain]] = None
+
+    # Live rules share fragments among themselves, not with later dumps
+    with interning():
+        for line_num, line in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            if line.startswith("*"):
+                chains = tables.setdefault(line[1:], {})
+                continue
+
+            if chains is None:
+                raise BackendError(f"Ruleset dump line {line_num} outside a table: {line}")
+
+            if line == "COMMIT":
+                chains = None
+            elif line.startswith(":"):
+                parts = line[1:].split()
+                counters = (0, 0)
+                if len(parts) > 2:
+                    packets, _, nbytes = parts[2].strip("[]").partition(":")
+                    counters = (int(packets), int(nbytes))
+                policy = parts[1] if len(parts) > 1 and parts[1] != "-" else None
+                chains[parts[0]] = LiveChain(parts[0], policy, counters)
+            else:
+                prefix = ""
+                if line.startswith("["):
+                    prefix, _, line = line.partition("] ")
+                    prefix += "] "
+                command, _, rest = line.partition(" ")
+                name, _, spec = rest.partition(" ")
+                if command != "-A" or name not in chains:
+                    raise BackendError(f"Unexpected ruleset dump line {line_num}: {line}")
+                chains[name].rules.append(Rule.parse(prefix + spec))
+
+    return tables
+
+
+def _canonical_address(value: Optional[str], family: int) -> Optional[str]:
+    """Give a host address the prefix length iptables-save prints."""
+    if not value:
+        return value
+    negated = value.startswith("!")
+    address = value.lstrip("!")
+    if "/" not in address and (":" in address or address.replace(".", "").isdigit()):
+        address += "/128" if family == 6 else "/32"
+    return ("!" if negated else "") + address
+
+
+# Rulesets use far fewer distinct fragments than this
+CANONICAL_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=CANONICAL_CACHE_SIZE)
+def _canonical_match(match: Match) -> Optional[Match]:
+    """Normalize a match fragment; None drops it from the key."""
+    option, args = match.option, match.args
+
+    if option == "-p":
+        args = (PROTOCOL_NAMES.get(match.value.lower(), match.value.lower()),)
+    elif option == "-m" and len(args) == 1 and args[0] in IMPLICIT_MATCHES:
+        return None
+    elif option in ("--ctstate", "--state"):
+        states = match.value.upper().split(",")
+        known = [state for state in CT_STATES if state in states]
+        args = (",".join(known + [s for s in states if s not in CT_STATES]),)
+    elif option == "--limit":
+        count, _, unit = match.value.partition("/")
+        args = (f"{count}/{LIMIT_UNITS.get(unit[:1], unit)}",)
+    elif option == "--limit-burst" and match.value == "5":
+        return None
+
+    return Match.get(option, args, match.negated)
+
+
+def iptables_key(rule: Rule, family: int) -> Tuple:
+    """
+    Canonical form of a rule for comparison with iptables-save output.
+
+    iptables-save adds host prefix lengths, implicit protocol matches
+    and default target options, and prints the basic options first.
+    Anything not normalized here merely shows up as a changed rule.
+
+    Args:
+        rule: Compiled or live rule
+        family: IP family (4 or 6)
+
+    Returns:
+        Hashable key
+    """
+    basic: List[Match] = []
+    rest: List[Match] = []
+    for match in rule.matches:
+        match = _canonical_match(match)
+        if match is None:
+            continue
+        (basic if match.option in BASIC_OPTIONS else rest).append(match)
+    basic.sort(key=lambda match: BASIC_OPTIONS.index(match.option))
+
+    options = {match.option: match for match in rule.target_options}
+    if rule.target == "REJECT" and "--reject-with" not in options:
+        default = "icmp6-port-unreachable" if family == 6 else "icmp-port-unreachable"
+        options["--reject-with"] = Match.get("--reject-with", (default,))
+    if rule.target == "LOG" and "--log-level" in options:
+        level = options["--log-level"].value
+        level = LOG_LEVELS.get(level, level)
+        if level == "4":
+            del options["--log-level"]
+        else:
+            options["--log-level"] = Match.get("--log-level", (level,))
+
+    return (
+        _canonical_address(rule.source, family),
+        _canonical_address(rule.destination, family),
+        tuple(basic + rest),
+        rule.jump,
+        rule.target,
+        tuple(sorted(options.values(), key=lambda match: match.option)),
+        rule.comment,
+    )
+
+
+def parse_nft_json(text: str, table: str) -> Optional[LiveTable]:
+    """
+    Parse ``nft -j list ruleset`` output for one inet table.
+
+    Rules are returned as (handle, statement) pairs, with statements
+    rendered in the syntax the nftables backend emits.
+
+    Args:
+        text: JSON dump text
+        table: Name of the inet table
+
+    Returns:
+        The table's chains and sets, or None if the table is not loaded
+    """
+    try:
+        objects = json.loads(text)["nftables"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise BackendError(f"Invalid nft JSON ruleset: {e}")
+
+    live: Optional[LiveTable] = None
+
+    for obj in objects:
+        kind, value = next(iter(obj.items()))
+        name = value.get("table", value.get("name"))
+        if value.get("family") != "inet" or name != table:
+            continue
+
+        if kind == "table":
+            live = LiveTable()
+        elif live is None:
+            continue
+        elif kind == "chain":
+            live.chains[value["name"]] = LiveChain(value["name"], value.get("policy"))
+        elif kind == "set":
+            live.sets.append(value["name"])
+        elif kind == "rule" and value["chain"] in live.chains:
+            live.chains[value["chain"]].rules.append(
+                (value["handle"], nft_statement(value["expr"], value.get("comment")))
+            )
+
+    return live
+
+
+def _nft_value(value, context: str = "") -> str:
+    """Render an nft JSON value or expression."""
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        return f'"{value}"' if context in BARE_META_KEYS else value
+    if isinstance(value, list):
+        if context.startswith("ct "):
+            return "{ " + ", ".join(_nft_value(v, context) for v in value) + " }"
+        return "|".join(_nft_value(v, context) for v in value)
+
+    key, body = next(iter(value.items()))
+    if key == "set":
+        items = body if isinstance(body, list) else [body]
+        return "{ " + ", ".join(_nft_value(item, context) for item in items) + " }"
+    if key == "prefix":
+        return f"{body['addr']}/{body['len']}"
+    if key == "range":
+        return f"{_nft_value(body[0], context)}-{_nft_value(body[1], context)}"
+    if key == "payload":
+        return f"{body['protocol']} {body['field']}"
+    if key == "meta":
+        return body["key"] if body["key"] in BARE_META_KEYS else f"meta {body['key']}"
+    if key == "ct":
+        return f"ct {body['key']}"
+    if key == "fib":
+        return f"fib {' . '.join(body.get('flags', []))} {body['result']}"
+    if key in ("&", "|", "^"):
+        left, right = body
+        mask = _nft_value(right, context)
+        if isinstance(right, list):
+            mask = f"({mask})"
+        return f"{_nft_value(left, context)} {key} {mask}"
+    if key in ("accept", "drop", "return", "continue"):
+        return key
+    if key in ("jump", "goto"):
+        return f"{key} {body['target']}"
+
+    return json.dumps(value, sort_keys=True)
+
+
+def _nft_expression(expr: Dict) -> Optional[str]:
+    """Render one rule expression; None for expressions we never emit."""
+    key, body = next(iter(expr.items()))
+
+    if key == "match":
+        left = _nft_value(body["left"])
+        op = body.get("op", "==")
+        if op in ("==", "in") and not any(c in body["left"] for c in "&|^"):
+            op = ""
+        right = _nft_value(body["right"], left)
+        return f"{left} {op} {right}" if op else f"{left} {right}"
+    if key == "vmap":
+        left = _nft_value(body["key"])
+        entries = ", ".join(
+            f"{_nft_value(item, left)} : {_nft_value(verdict)}"
+            for item, verdict in body["data"]["set"]
+        )
+        return f"{left} vmap {{ {entries} }}"
+    if key == "counter":
+        return None
+    if key == "log":
+        statement = "log"
+        if body and "prefix" in body:
+            statement += f' prefix "{body["prefix"]}"'
+        if body and "level" in body:
+            statement += f" level {body['level']}"
+        return statement
+    if key == "reject":
+        if not body:
+            return "reject"
+        if "expr" in body:
+            return f"reject with {body['type']} type {body['expr']}"
+        return f"reject with {body['type']}"
+    if key in ("masquerade", "redirect"):
+        if body and "port" in body:
+            return f"{key} to :{body['port']}"
+        return key
+    if key in ("snat", "dnat"):
+        target = body["addr"] + (f":{body['port']}" if "port" in body else "")
+        return f"{key} {body.get('family', 'ip')} to {target}"
+    if key == "mangle":
+        return f"{_nft_value(body['key'])} set {_nft_value(body['value'])}"
+    if key == "limit":
+        over = "over " if body.get("inv") else ""
+        statement = f"limit rate {over}{body['rate']}/{body.get('per', 'second')}"
+        if body.get("burst"):
+            statement += f" burst {body['burst']} packets"
+        return statement
+    if key == "notrack":
+        return "notrack"
+    if key == "meter":
+        stmts = body["stmt"] if isinstance(body["stmt"], list) else [body["stmt"]]
+        inner = " ".join(part for part in map(_nft_expression, stmts) if part)
+        return f"meter {body['name']} {{ {_nft_value(body['key'])} {inner} }}"
+
+    return _nft_value(expr)
+
+
+def nft_statement(exprs: List[Dict], comment: Optional[str] = None) -> str:
+    """
+    Render an nft JSON rule as a backend-style statement.
+
+    Args:
+        exprs: The rule's 'expr' list
+        comment: Rule comment
+
+    Returns:
+        Statement text
+    """
+    parts = [part for part in map(_nft_expression, exprs) if part]
+    if comment:
+        parts.append(f'comment "{comment}"')
+    return " ".join(parts) if parts else "continue"
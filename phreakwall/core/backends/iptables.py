@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Phreakwall iptables Backends
+
+Backends that load the ruleset through the iptables tool family.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+from typing import Dict, Iterator, List
+
+from phreakwall.core.backends.base import Backend
+from phreakwall.core.backends.diff import (
+    DeltaStats,
+    LiveChain,
+    edit_script,
+    iptables_key,
+    parse_iptables_save,
+)
+from phreakwall.core.chains import ChainType
+from phreakwall.core.rule import Rule
+
+
+class LegacyBackend(Backend):
+    """Loads the ruleset with one iptables invocation per rule."""
+
+    name = "legacy"
+
+    def runtime_functions(self) -> List[str]:
+        """Generate the run_iptables helper."""
+        return super().runtime_functions() + [
+            "run_iptables() {",
+            "    if [ $VERBOSITY -ge 2 ]; then",
+            '        echo "Running: iptables $@"',
+            "    fi",
+            '    iptables "$@" || error_exit "iptables command failed: $@"',
+            "}",
+            "",
+        ]
+
+    def generate_load(self) -> Iterator[str]:
+        """Generate one run_iptables command per chain and rule."""
+        yield from self.generate_set_load()
+        yield from self.chain_manager.generate_chains()
+
+
+class RestoreBackend(Backend):
+    """Loads every table in a single atomic iptables-restore transaction."""
+
+    name = "restore"
+
+    @property
+    def restore_cmd(self) -> str:
+        """The restore tool for the backend's IP family."""
+        return "ip6tables-restore" if self.family == 6 else "iptables-restore"
+
+    def runtime_functions(self) -> List[str]:
+        """Generate the run_iptables_restore helper."""
+        return super().runtime_functions() + [
+            "run_iptables_restore() {",
+            "    if [ ${VERBOSITY:-0} -ge 2 ]; then",
+            f'        echo "Running: {self.restore_cmd}"',
+            "    fi",
+            f'    {self.restore_cmd} "$@" || error_exit "{self.restore_cmd} failed"',
+            "}",
+            "",
+        ]
+
+    def dump_command(self) -> List[str]:
+        """Dump the live tables with their counters."""
+        return ["ip6tables-save" if self.family == 6 else "iptables-save", "-c"]
+
+    def delta_command(self) -> List[str]:
+        """Apply the delta without flushing the tables."""
+        return [self.restore_cmd, "--noflush"]
+
+    def generate_delta(self, dump: str) -> List[str]:
+        """
+        Generate an iptables-restore --noflush payload from a live dump.
+
+        Tables without compiled chains are left alone, as a full load
+        would. In the other tables, live chains that were not compiled
+        are flushed (built-ins) or deleted, again matching a full load.
+
+        Args:
+            dump: ``iptables-save -c`` output
+
+        Returns:
+            iptables-restore payload lines
+        """
+        live = parse_iptables_save(dump)
+        stats = DeltaStats()
+        lines = []
+
+        for chain_type in ChainType:
+            compiled = {
+                c.name: c
+                for c in self.chain_manager.chains.values()
+                if c.chain_type == chain_type
+            }
+            if not compiled:
+                continue
+
+            current: Dict[str, LiveChain] = live.get(chain_type.value, {})
+            declarations = []
+            commands = []
+            removed = []
+
+            for chain in compiled.values():
+                live_chain = current.get(chain.name)
+                if live_chain is None:
+                    policy = chain.policy if chain.builtin else "-"
+                    declarations.append(f":{chain.name} {policy} [0:0]")
+                    commands.extend(
+                        f"-A {chain.name} {rule.render()}" for rule in chain.rules
+                    )
+                    stats.inserted += len(chain.rules)
+                    stats.chains_added += 1
+                    continue
+
+                if chain.builtin and live_chain.policy != chain.policy:
+                    # Keep the policy counters of the built-in chain
+                    packets, nbytes = live_chain.counters
+                    declarations.append(
+                        f":{chain.name} {chain.policy} [{packets}:{nbytes}]"
+                    )
+
+                commands.extend(
+                    self._chain_delta(chain.name, live_chain.rules, chain.rules, stats)
+                )
+
+            for name, live_chain in current.items():
+                if name in compiled:
+                    continue
+                if live_chain.policy:
+                    # Built-in chains are flushed by a full load
+                    commands.extend(
+                        self._chain_delta(name, live_chain.rules, [], stats)
+                    )
+                else:
+                    removed.append(name)
+                    stats.deleted += len(live_chain.rules)
+                    stats.chains_removed += 1
+
+            if declarations or commands or removed:
+                lines.append(f"*{chain_type.value}")
+                lines.extend(declarations)
+                lines.extend(commands)
+                # Jumps to removed chains are gone by now
+                lines.extend(f"-F {name}" for name in removed)
+                lines.extend(f"-X {name}" for name in removed)
+                lines.append("COMMIT")
+
+        self.delta_stats = stats
+        return lines
+
+    def _chain_delta(
+        self, name: str, live: List[Rule], compiled: List[Rule], stats: DeltaStats
+    ) -> List[str]:
+        """Generate the -R/-D/-I commands that update one live chain."""
+        commands = []
+        changed = 0
+
+        old = [iptables_key(rule, self.family) for rule in live]
+        new = [iptables_key(rule, self.family) for rule in compiled]
+
+        for _, i1, i2, j1, j2 in edit_script(old, new):
+            # Rule positions before j1 already match the compiled chain
+            common = min(i2 - i1, j2 - j1)
+            for k in range(common):
+                commands.append(f"-R {name} {j1 + k + 1} {compiled[j1 + k].render()}")
+            for _ in range(i2 - i1 - common):
+                commands.append(f"-D {name} {j1 + common + 1}")
+            for k in range(common, j2 - j1):
+                commands.append(f"-I {name} {j1 + k + 1} {compiled[j1 + k].render()}")
+
+            stats.replaced += common
+            stats.deleted += i2 - i1 - common
+            stats.inserted += j2 - j1 - common
+            changed += j2 - j1
+
+        stats.unchanged += len(compiled) - changed
+        return commands
+
+    def generate_load(self) -> Iterator[str]:
+        """Generate the atomic iptables-restore load of all tables."""
+        yield from self.generate_set_load()
+        yield from (
+            "# Load all tables in a single iptables-restore transaction",
+            "",
+            "run_iptables_restore <<'__PHREAKWALL_RESTORE__'",
+        )
+        yield from self.chain_manager.generate_restore()
+        yield from ("__PHREAKWALL_RESTORE__", "")
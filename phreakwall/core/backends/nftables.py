@@ -0,0 +1,755 @@
+#!/usr/bin/env python3
+"""
+Phreakwall nftables Backend
+
+Lowers the compiled chains into a single nftables ruleset that is
+loaded with one ``nft -f`` invocation, i.e. one kernel transaction.
+
+All netfilter tables are folded into one ``inet`` table. Base chains
+carry an ``meta nfproto`` guard so the IPv4 and IPv6 rulesets can be
+loaded side by side, and runs of interface dispatch jumps are turned
+into verdict maps so they cost a single lookup per packet.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from phreakwall.core.backends.base import Backend, BackendError
+from phreakwall.core.backends.diff import DeltaStats, edit_script, parse_nft_json
+from phreakwall.core.chains import Chain, ChainType
+from phreakwall.core.rule import Rule
+from phreakwall.core.sets import IpSet, used_sets
+
+# (chain type, hook, priority) of the base chain for each built-in chain
+HOOKS: Dict[Tuple[ChainType, str], Tuple[str, str, str]] = {
+    (ChainType.FILTER, "INPUT"): ("filter", "input", "filter"),
+    (ChainType.FILTER, "FORWARD"): ("filter", "forward", "filter"),
+    (ChainType.FILTER, "OUTPUT"): ("filter", "output", "filter"),
+    (ChainType.NAT, "PREROUTING"): ("nat", "prerouting", "dstnat"),
+    (ChainType.NAT, "INPUT"): ("nat", "input", "100"),
+    (ChainType.NAT, "OUTPUT"): ("nat", "output", "-100"),
+    (ChainType.NAT, "POSTROUTING"): ("nat", "postrouting", "srcnat"),
+    (ChainType.MANGLE, "PREROUTING"): ("filter", "prerouting", "mangle"),
+    (ChainType.MANGLE, "INPUT"): ("filter", "input", "mangle"),
+    (ChainType.MANGLE, "FORWARD"): ("filter", "forward", "mangle"),
+    (ChainType.MANGLE, "OUTPUT"): ("route", "output", "mangle"),
+    (ChainType.MANGLE, "POSTROUTING"): ("filter", "postrouting", "mangle"),
+    (ChainType.RAW, "PREROUTING"): ("filter", "prerouting", "raw"),
+    (ChainType.RAW, "OUTPUT"): ("filter", "output", "raw"),
+}
+
+PROTOCOLS = {"1": "icmp", "6": "tcp", "17": "udp", "58": "ipv6-icmp", "132": "sctp"}
+
+TCP_FLAGS = "fin|syn|rst|psh|ack|urg"
+
+# Options that take no argument
+FLAG_OPTIONS = ("--syn", "--notrack", "--set", "--update", "--rcheck")
+
+LIMIT_UNITS = {"s": "second", "m": "minute", "h": "hour", "d": "day"}
+
+# Rate units by length in seconds, shortest first
+RATE_UNITS = ((1, "second"), (60, "minute"), (3600, "hour"), (86400, "day"))
+
+REJECT_WITH = {
+    "tcp-reset": "with tcp reset",
+    "icmp-port-unreachable": "with icmp type port-unreachable",
+    "icmp-host-unreachable": "with icmp type host-unreachable",
+    "icmp-net-unreachable": "with icmp type net-unreachable",
+    "icmp-admin-prohibited": "with icmp type admin-prohibited",
+    "icmp6-port-unreachable": "with icmpv6 type port-unreachable",
+    "icmp6-adm-prohibited": "with icmpv6 type admin-prohibited",
+}
+
+VERDICTS = {"ACCEPT": "accept", "DROP": "drop", "RETURN": "return"}
+
+SET_ELEMENTS_PER_LINE = 8
+
+
+class NftablesBackend(Backend):
+    """Loads the ruleset as one nftables transaction."""
+
+    name = "nft"
+
+    def __init__(self, chain_manager):
+        """
+        Initialize the nftables backend.
+
+        Args:
+            chain_manager: Chain manager holding the compiled chains
+        """
+        super().__init__(chain_manager)
+        self.table = "phreakwall6" if self.family == 6 else "phreakwall"
+        self.nfproto = "ipv6" if self.family == 6 else "ipv4"
+        self.addr = "ip6" if self.family == 6 else "ip"
+        self.vmap_rules = 0
+
+    def runtime_functions(self) -> List[str]:
+        """Generate the run_nft helper."""
+        return super().runtime_functions() + [
+            "run_nft() {",
+            "    if [ ${VERBOSITY:-0} -ge 2 ]; then",
+            '        echo "Running: nft $@"',
+            "    fi",
+            '    nft "$@" || error_exit "nft failed"',
+            "}",
+            "",
+        ]
+
+    def generate_load(self) -> Iterator[str]:
+        """Generate the single nft -f load of the ruleset."""
+        yield from (
+            "# Load the ruleset in a single nftables transaction",
+            "",
+            "run_nft -f /dev/stdin <<'__PHREAKWALL_NFT__'",
+        )
+        yield from self.render_ruleset()
+        yield from ("__PHREAKWALL_NFT__", "")
+
+    def set_payload(self) -> List[str]:
+        """Sets are part of the nftables ruleset itself."""
+        return []
+
+    def dump_command(self) -> List[str]:
+        """Dump the live ruleset as JSON."""
+        return ["nft", "-j", "list", "ruleset"]
+
+    def delta_command(self) -> List[str]:
+        """Apply the delta as one nft transaction."""
+        return ["nft", "-f", "-"]
+
+    def generate_delta(self, dump: str) -> List[str]:
+        """
+        Generate the nft commands that update the live table in place.
+
+        Rules are addressed by their handles, so every command refers to
+        the live rule it changes no matter what else the transaction
+        does. Without a live table the full ruleset is returned.
+
+        Args:
+            dump: ``nft -j list ruleset`` output
+
+        Returns:
+            nft -f input lines
+        """
+        table = parse_nft_json(dump, self.table)
+        if table is None:
+            self.logger.info(
+                "nftables: table %s not loaded, using full load", self.table
+            )
+            self.delta_stats = None
+            return list(self.render_ruleset())
+
+        self.vmap_rules = 0
+        stats = DeltaStats()
+        live = table.chains
+        prefix = f"inet {self.table}"
+        declarations = []
+        commands = []
+        compiled = set()
+
+        # Sets are refilled in the same transaction; they carry no counters
+        sets = used_sets(self.chain_manager)
+        for ipset in sets:
+            elements = ", ".join(ipset.elements())
+            declarations.append(
+                f"add set {prefix} {ipset.name} {{ {self._set_spec(ipset)} }}"
+            )
+            declarations.append(f"flush set {prefix} {ipset.name}")
+            # nft rejects an empty element list
+            if elements:
+                declarations.append(
+                    f"add element {prefix} {ipset.name} {{ {elements} }}"
+                )
+
+        for chain in self.chain_manager.chains.values():
+            name = self.chain_name(chain)
+            compiled.add(name)
+            statements = self._chain_statements(chain)
+
+            if name not in live:
+                spec = f" {{ {self._chain_spec(chain)} }}" if chain.builtin else ""
+                declarations.append(f"add chain {prefix} {name}{spec}")
+                commands.extend(f"add rule {prefix} {name} {s}" for s in statements)
+                stats.inserted += len(statements)
+                stats.chains_added += 1
+                continue
+
+            handles = [handle for handle, _ in live[name].rules]
+            old = [statement for _, statement in live[name].rules]
+            changed = 0
+
+            for _, i1, i2, j1, j2 in edit_script(old, statements):
+                common = min(i2 - i1, j2 - j1)
+                for k in range(common):
+                    commands.append(
+                        f"replace rule {prefix} {name} handle {handles[i1 + k]} "
+                        f"{statements[j1 + k]}"
+                    )
+                for k in range(common, i2 - i1):
+                    commands.append(
+                        f"delete rule {prefix} {name} handle {handles[i1 + k]}"
+                    )
+                # New rules go in front of the next live rule, or at the end
+                for k in range(j1 + common, j2):
+                    if i2 < len(handles):
+                        commands.append(
+                            f"insert rule {prefix} {name} position {handles[i2]} "
+                            f"{statements[k]}"
+                        )
+                    else:
+                        commands.append(f"add rule {prefix} {name} {statements[k]}")
+
+                stats.replaced += common
+                stats.deleted += i2 - i1 - common
+                stats.inserted += j2 - j1 - common
+                changed += j2 - j1
+
+            stats.unchanged += len(statements) - changed
+
+        removed = [name for name in live if name not in compiled]
+        for name in removed:
+            stats.deleted += len(live[name].rules)
+            stats.chains_removed += 1
+
+        stale_sets = set(table.sets) - {ipset.name for ipset in sets}
+
+        self.delta_stats = stats
+        return (
+            declarations
+            + commands
+            + [f"flush chain {prefix} {name}" for name in removed]
+            + [f"delete chain {prefix} {name}" for name in removed]
+            + [f"delete set {prefix} {name}" for name in sorted(stale_sets)]
+        )
+
+    def render_ruleset(self) -> Iterator[str]:
+        """
+        Render the complete ruleset in ``nft -f`` syntax.
+
+        The table is created, deleted and redefined in the same file so
+        the replacement is applied atomically.
+
+        Yields:
+            Ruleset lines
+        """
+        self.vmap_rules = 0
+        chains = list(self.chain_manager.chains.values())
+
+        yield from (
+            f"table inet {self.table}",
+            f"delete table inet {self.table}",
+            "",
+            f"table inet {self.table} {{",
+        )
+
+        for ipset in used_sets(self.chain_manager):
+            yield from self._render_set(ipset)
+
+        # Forward-declare regular chains so jumps resolve in any order
+        for chain in chains:
+            if not chain.builtin:
+                yield f"    chain {self.chain_name(chain)} {{"
+                yield "    }"
+
+        for chain in chains:
+            yield ""
+            yield from self._render_chain(chain)
+
+        yield "}"
+
+        if self.vmap_rules:
+            self.logger.info(
+                "nftables: folded %d dispatch rules into verdict maps", self.vmap_rules
+            )
+
+    def _render_set(self, ipset: IpSet) -> List[str]:
+        """Render one named set block."""
+        lines = [f"    set {ipset.name} {{", f"        {self._set_spec(ipset)}"]
+
+        elements = ipset.elements()
+        for start in range(0, len(elements), SET_ELEMENTS_PER_LINE):
+            chunk = ", ".join(elements[start : start + SET_ELEMENTS_PER_LINE])
+            if start == 0:
+                lines.append(f"        elements = {{ {chunk},")
+            else:
+                lines.append(f"                     {chunk},")
+        if elements:
+            lines[-1] = lines[-1][:-1] + " }"
+
+        lines.append("    }")
+        return lines
+
+    @staticmethod
+    def _set_spec(ipset: IpSet) -> str:
+        """The type and flags of a named set."""
+        return f"type {ipset.nft_type}; flags interval; auto-merge;"
+
+    def chain_name(self, chain: Chain) -> str:
+        """
+        Map a chain to its nftables name.
+
+        Filter chains keep their names; chains of the other netfilter
+        tables are prefixed with the table name since they all share a
+        single nftables table.
+        """
+        if chain.chain_type == ChainType.FILTER:
+            return chain.name
+        return f"{chain.chain_type.value}_{chain.name}"
+
+    def _render_chain(self, chain: Chain) -> List[str]:
+        """Render one chain block."""
+        lines = [f"    chain {self.chain_name(chain)} {{"]
+
+        if chain.builtin:
+            lines.append(f"        {self._chain_spec(chain)}")
+
+        for statement in self._chain_statements(chain):
+            lines.append(f"        {statement}")
+
+        lines.append("    }")
+        return lines
+
+    def _chain_spec(self, chain: Chain) -> str:
+        """The type, hook and policy of a base chain."""
+        nft_type, hook, priority = HOOKS[(chain.chain_type, chain.name)]
+        return f"type {nft_type} hook {hook} priority {priority}; policy accept;"
+
+    def _chain_statements(self, chain: Chain) -> List[str]:
+        """Render the statements of one chain."""
+        statements = []
+
+        if chain.builtin:
+            # Leave packets of the other family to that family's table
+            statements.append(f"meta nfproto != {self.nfproto} accept")
+
+        statements.extend(self._render_rules(chain))
+
+        # Built-in policies become a terminal rule behind the guard
+        if chain.builtin and chain.policy != "ACCEPT":
+            statements.append(VERDICTS.get(chain.policy, chain.policy.lower()))
+
+        return statements
+
+    def _render_rules(self, chain: Chain) -> List[str]:
+        """Render the rules of a chain, folding dispatch runs into vmaps."""
+        statements: List[str] = []
+        run: List[Tuple[str, str, str]] = []
+        run_dir = None
+
+        def flush():
+            if len(run) > 1:
+                key = "iifname" if run_dir == "i" else "oifname"
+                entries = ", ".join(f'"{iface}" : {verdict}' for iface, verdict, _ in run)
+                statements.append(f"{key} vmap {{ {entries} }}")
+                self.vmap_rules += len(run)
+            else:
+                statements.extend(rule for _, _, rule in run)
+            run.clear()
+
+        for rule in chain.rules:
+            dispatch = self._dispatch(chain, rule)
+
+            # A repeated interface is reached again when the first jump
+            # returns, so it cannot share the verdict map
+            if (
+                dispatch
+                and (not run or dispatch[0] == run_dir)
+                and all(iface != dispatch[1] for iface, _, _ in run)
+            ):
+                run.append((dispatch[1], dispatch[2], self.translate(chain, rule)))
+                run_dir = dispatch[0]
+                continue
+
+            flush()
+            if dispatch:
+                run_dir = dispatch[0]
+                run.append((dispatch[1], dispatch[2], self.translate(chain, rule)))
+            else:
+                statement = self.translate(chain, rule)
+                if statement is not None:
+                    statements.append(statement)
+
+        flush()
+        return statements
+
+    def _dispatch(self, chain: Chain, rule: Rule):
+        """
+        Classify a rule that only dispatches on an interface.
+
+        Returns:
+            (direction, interface, verdict) or None
+        """
+        if (
+            len(rule.matches) != 1
+            or rule.source
+            or rule.destination
+            or rule.comment
+            or rule.target_options
+            or not self._find_chain(chain, rule.target)
+        ):
+            return None
+
+        match = rule.matches[0]
+        if match.option not in ("-i", "-o") or match.negated or match.value.endswith("+"):
+            return None
+
+        verdict = self._jump(chain, "goto" if rule.jump == "-g" else "jump", rule.target)
+        return match.option[1], match.value, verdict
+
+    def translate(self, chain: Chain, rule: Rule) -> Optional[str]:
+        """
+        Translate one rule to an nftables rule statement.
+
+        Args:
+            chain: Chain the rule belongs to
+            rule: Rule to translate
+
+        Returns:
+            nftables rule statement, or None for a rule that has no
+            counterpart (a recent --set; see _recent_matches())
+        """
+        tokens = rule.tokens()
+
+        matches: List[str] = []
+        options: Dict[str, str] = {}
+        proto: Optional[str] = None
+        proto_neg = False
+        target = None
+        jump = "jump"
+        comment = None
+        negate = False
+
+        index = 0
+        while index < len(tokens):
+            token = tokens[index]
+            index += 1
+
+            if token == "!":
+                negate = True
+                continue
+
+            if token in ("-m", "--match"):
+                index += 1
+            elif token in ("-j", "--jump", "-g", "--goto"):
+                target = tokens[index]
+                jump = "goto" if token in ("-g", "--goto") else "jump"
+                index += 1
+            elif token in FLAG_OPTIONS:
+                options[token] = (negate, "")
+            elif token.startswith("-") and index < len(tokens):
+                value = tokens[index]
+                index += 1
+
+                if token in ("-p", "--protocol"):
+                    proto = PROTOCOLS.get(value, value.lower())
+                    proto_neg = negate
+                elif token == "--match-set":
+                    # ipset name followed by its direction flags
+                    options[token] = (value, tokens[index])
+                    index += 1
+                elif token == "--tcp-flags":
+                    options[token] = (value, tokens[index])
+                    index += 1
+                elif token == "--comment":
+                    comment = self._string(value, chain, rule)
+                else:
+                    options[token] = (negate, value)
+            else:
+                raise BackendError(
+                    f"Cannot translate '{token}' in {chain.name} to nftables: {rule}"
+                )
+
+            negate = False
+
+        matches.extend(self._interface_matches(options))
+        matches.extend(self._address_matches(options))
+        matches.extend(self._protocol_matches(chain, rule, proto, proto_neg, options))
+        matches.extend(self._state_matches(options))
+
+        if "--set" in options:
+            options.pop("--set")
+            options.pop("--name", None)
+            if target is not None or matches or options:
+                raise BackendError(
+                    f"Cannot translate a recent --set with other matches in "
+                    f"{chain.name} to nftables: {rule}"
+                )
+            return None
+        matches.extend(self._recent_matches(chain, rule, options))
+
+        if target is not None:
+            target_statement = self._target(chain, rule, target, jump, options)
+
+        if options:
+            raise BackendError(
+                f"Cannot translate '{next(iter(options))}' in {chain.name} "
+                f"to nftables: {rule}"
+            )
+
+        if target is None:
+            statement = " ".join(matches) if matches else "continue"
+            if comment:
+                statement += f" comment {comment}"
+            return statement
+
+        matches.append(target_statement)
+        if comment:
+            matches.append(f"comment {comment}")
+
+        return " ".join(m for m in matches if m)
+
+    @staticmethod
+    def _op(negate: bool) -> str:
+        return "!= " if negate else ""
+
+    @staticmethod
+    def _string(value: str, chain: Chain, rule: Rule) -> str:
+        """Quote an nft string literal; nft has no escapes inside quotes."""
+        if '"' in value or "\\" in value:
+            raise BackendError(
+                f"Cannot quote '{value}' in {chain.name} for nftables: {rule}"
+            )
+        return f'"{value}"'
+
+    @staticmethod
+    def _set_or_value(value: str, sep: str = ",") -> str:
+        """Turn a comma list into an anonymous set."""
+        items = [item for item in value.split(sep) if item]
+        if len(items) > 1:
+            return "{ " + ", ".join(items) + " }"
+        return value
+
+    def _interface_matches(self, options: Dict) -> List[str]:
+        matches = []
+        for names, key in (
+            (("-i", "--in-interface"), "iifname"),
+            (("-o", "--out-interface"), "oifname"),
+        ):
+            for name in names:
+                if name in options:
+                    negate, iface = options.pop(name)
+                    iface = iface[:-1] + "*" if iface.endswith("+") else iface
+                    matches.append(f'{key} {self._op(negate)}"{iface}"')
+        return matches
+
+    def _address_matches(self, options: Dict) -> List[str]:
+        matches = []
+        for names, key in (
+            (("-s", "--source", "--src"), "saddr"),
+            (("-d", "--destination", "--dst"), "daddr"),
+        ):
+            for name in names:
+                if name in options:
+                    negate, value = options.pop(name)
+                    matches.append(
+                        f"{self.addr} {key} {self._op(negate)}{self._set_or_value(value)}"
+                    )
+
+        if "--match-set" in options:
+            set_name, flags = options["--match-set"]
+            ipset = self.chain_manager.sets.get(set_name)
+            if not ipset or ipset.kind != "port":
+                del options["--match-set"]
+                key = "saddr" if flags.split(",")[0] == "src" else "daddr"
+                matches.append(f"{self.addr} {key} @{set_name}")
+
+        for name, key in (("--src-type", "saddr"), ("--dst-type", "daddr")):
+            if name in options:
+                negate, value = options.pop(name)
+                matches.append(f"fib {key} type {self._op(negate)}{value.lower()}")
+
+        return matches
+
+    def _protocol_matches(
+        self, chain: Chain, rule: Rule, proto, proto_neg: bool, options: Dict
+    ) -> List[str]:
+        matches = []
+        ports = []
+
+        for names, key in (
+            (("--dport", "--destination-port"), "dport"),
+            (("--sport", "--source-port"), "sport"),
+            (("--dports", "--destination-ports"), "dport"),
+            (("--sports", "--source-ports"), "sport"),
+        ):
+            for name in names:
+                if name in options:
+                    negate, value = options.pop(name)
+                    value = self._set_or_value(value.replace(":", "-"))
+                    ports.append(f"{key} {self._op(negate)}{value}")
+
+        # Address sets were consumed by _address_matches
+        if "--match-set" in options:
+            set_name, flags = options.pop("--match-set")
+            key = "sport" if flags.split(",")[0] == "src" else "dport"
+            ports.append(f"{key} @{set_name}")
+
+        if ports or "--syn" in options or "--tcp-flags" in options:
+            if proto not in ("tcp", "udp", "sctp", "udplite", "dccp") or proto_neg:
+                raise BackendError(
+                    f"Port match without a port protocol in {chain.name}: {rule}"
+                )
+            matches.extend(f"{proto} {port}" for port in ports)
+        elif proto and proto != "all":
+            matches.append(f"meta l4proto {self._op(proto_neg)}{proto}")
+
+        if "--syn" in options:
+            negate, _ = options.pop("--syn")
+            matches.append(f"tcp flags & (fin|syn|rst|ack) {'!=' if negate else '=='} syn")
+
+        if "--tcp-flags" in options:
+            mask, comp = options.pop("--tcp-flags")
+            matches.append(
+                f"tcp flags & ({self._tcp_flags(mask)}) == {self._tcp_flags(comp)}"
+            )
+
+        for name, key in (("--icmp-type", "icmp"), ("--icmpv6-type", "icmpv6")):
+            if name in options:
+                negate, value = options.pop(name)
+                matches.append(f"{key} type {self._op(negate)}{value}")
+
+        return matches
+
+    @staticmethod
+    def _tcp_flags(flags: str) -> str:
+        if flags == "ALL":
+            return TCP_FLAGS
+        if flags == "NONE":
+            return "0x0"
+        return "|".join(flag.lower() for flag in flags.split(","))
+
+    def _state_matches(self, options: Dict) -> List[str]:
+        matches = []
+
+        for name in ("--state", "--ctstate"):
+            if name in options:
+                negate, value = options.pop(name)
+                states = value.lower().replace(",", ", ")
+                if "," in value:
+                    states = "{ " + states + " }"
+                matches.append(f"ct state {self._op(negate)}{states}")
+
+        if "--mark" in options:
+            negate, value = options.pop("--mark")
+            if "/" in value:
+                mark, mask = value.split("/", 1)
+                matches.append(f"meta mark & {mask} {'!=' if negate else '=='} {mark}")
+            else:
+                matches.append(f"meta mark {self._op(negate)}{value}")
+
+        if "--limit" in options:
+            _, rate = options.pop("--limit")
+            count, _, unit = rate.partition("/")
+            unit = LIMIT_UNITS.get(unit[:1], "second")
+            limit = f"limit rate {count}/{unit}"
+            if "--limit-burst" in options:
+                limit += f" burst {options.pop('--limit-burst')[1]} packets"
+            matches.append(limit)
+
+        return matches
+
+    def _recent_matches(self, chain: Chain, rule: Rule, options: Dict) -> List[str]:
+        """
+        Translate a recent --update match, as the Limit action emits it.
+
+        recent drops a source once it was seen hitcount times within
+        the last --seconds; this becomes a meter keyed on the source
+        address holding a token bucket of hitcount - 1 packets refilled
+        at that many per interval. The --set rule that feeds the recent
+        list has nothing left to do and is not rendered.
+        """
+        if "--update" not in options:
+            return []
+        if "--seconds" not in options or "--hitcount" not in options:
+            raise BackendError(
+                f"recent --update without --seconds and --hitcount in "
+                f"{chain.name} cannot be translated to nftables: {rule}"
+            )
+
+        options.pop("--update")
+        _, name = options.pop("--name", (False, "DEFAULT"))
+        seconds = int(options.pop("--seconds")[1])
+        burst = int(options.pop("--hitcount")[1]) - 1
+        if burst < 1 or seconds < 1:
+            raise BackendError(
+                f"recent limit of {burst} hits per {seconds}s in {chain.name} "
+                f"cannot be translated to nftables: {rule}"
+            )
+
+        # The shortest unit the rate is a whole number of, else per day
+        for length, unit in RATE_UNITS:
+            if burst * length % seconds == 0:
+                rate = burst * length // seconds
+                break
+        else:
+            rate = max(1, round(burst * length / seconds))
+
+        return [
+            f"meter {name} {{ {self.addr} saddr limit rate over {rate}/{unit} "
+            f"burst {burst} packets }}"
+        ]
+
+    @staticmethod
+    def _required(options: Dict, name: str, chain: Chain, rule: Rule) -> str:
+        """Pop a target option the translation cannot do without."""
+        value = options.pop(name, None)
+        if value is None:
+            raise BackendError(
+                f"{rule.target} without {name} in {chain.name} "
+                f"cannot be translated to nftables: {rule}"
+            )
+        return value[1]
+
+    def _target(
+        self, chain: Chain, rule: Rule, target: str, jump: str, options: Dict
+    ) -> str:
+        """Translate a rule target to an nftables statement."""
+        if target in VERDICTS:
+            return VERDICTS[target]
+        if target == "REJECT":
+            reject_with = options.pop("--reject-with", (False, ""))[1]
+            return f"reject {REJECT_WITH.get(reject_with, '')}".rstrip()
+        if target == "LOG":
+            statement = "log"
+            if "--log-prefix" in options:
+                prefix = options.pop("--log-prefix")[1]
+                statement += f" prefix {self._string(prefix, chain, rule)}"
+            if "--log-level" in options:
+                statement += f" level {options.pop('--log-level')[1]}"
+            return statement
+        if target == "MASQUERADE":
+            if "--to-ports" in options:
+                return f"masquerade to :{options.pop('--to-ports')[1]}"
+            return "masquerade"
+        if target == "SNAT":
+            to = self._required(options, "--to-source", chain, rule)
+            return f"snat {self.addr} to {to}"
+        if target == "DNAT":
+            to = self._required(options, "--to-destination", chain, rule)
+            return f"dnat {self.addr} to {to}"
+        if target == "REDIRECT":
+            # Without --to-ports the packet keeps its destination port
+            if "--to-ports" in options:
+                return f"redirect to :{options.pop('--to-ports')[1]}"
+            return "redirect"
+        if target == "MARK":
+            return f"meta mark set {self._required(options, '--set-mark', chain, rule)}"
+        if target in ("NOTRACK", "CT"):
+            options.pop("--notrack", None)
+            return "notrack"
+
+        if not self._find_chain(chain, target):
+            raise BackendError(f"Unknown target '{target}' in chain {chain.name}")
+
+        return self._jump(chain, jump, target)
+
+    def _find_chain(self, chain: Chain, name: str) -> Optional[Chain]:
+        """Find a jump target in the same netfilter table as chain."""
+        target = self.chain_manager.get_chain(name)
+        if target and target.chain_type == chain.chain_type:
+            return target
+        return None
+
+    def _jump(self, chain: Chain, jump: str, name: str) -> str:
+        return f"{jump} {self.chain_name(self._find_chain(chain, name))}"
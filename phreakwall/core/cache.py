@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Compile Cache
+
+Persistent cache that lets the compiler skip work whose inputs have not
+changed since the last run.
+
+Every input file is identified by the SHA-256 of its content. Hashing
+hundreds of files on every compile would defeat the purpose, so digests
+are kept in an index validated by (mtime, size, inode): a file is only
+read again when its stat signature changes. Cache entries are pickles
+stored under keys derived from those digests and the compiler version,
+so an edit to one file only invalidates the entries that depend on it.
+Results built from files that cannot be known before they are read,
+such as INCLUDEs, are stored with the digests of every file they were
+built from (put_checked()) and are a miss once any of them changed.
+Large text results such as the script body are stored as plain text and
+streamed line by line instead, so they are never held in memory whole.
+
+A long-running process can also keep the latest entries of each
+namespace in memory (memory=True) so a recompile skips the disk. They
+are kept pickled, so every lookup still returns a private copy.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+CACHE_DIR = Path("/var/lib/phreakwall/cache")
+
+# Bump when the layout of cached values changes
+CACHE_FORMAT = 3
+
+# Entries kept per namespace before the oldest are pruned
+MAX_ENTRIES = 64
+
+# Entries kept per namespace by the in-memory layer
+MEMORY_ENTRIES = 4
+
+# Files modified this recently may change again within the same mtime
+# tick, so their stat signature is not trusted
+RACY_NS = 2_000_000_000
+
+# Digest recorded for input files that do not exist
+MISSING = "-"
+
+
+def _atomic_write(path: Path, data: bytes):
+    """Write data to path through a temporary file and rename."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class CompileCache:
+    """
+    Content-addressed cache for compiler phases.
+
+    A cache that cannot be created or written (for example when the
+    compiler runs unprivileged) disables itself with a warning; the
+    compiler then simply does all the work.
+    """
+
+    def __init__(
+        self, cache_dir: Path = CACHE_DIR, version: str = "", memory: bool = False
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory holding the cache
+            version: Compiler version; part of every key
+            memory: Also keep the latest entries in memory; these work
+                even if the cache directory is unusable
+        """
+        self.cache_dir = Path(cache_dir)
+        self.version = version
+        self.logger = logging.getLogger(__name__)
+
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+
+        self._index: Dict[str, List] = {}
+        self._index_dirty = False
+        self.memory = memory
+        self._memory: Dict[str, "OrderedDict[str, bytes]"] = {}
+        self._load_index()
+
+    @property
+    def index_path(self) -> Path:
+        """Path of the file digest index."""
+        return self.cache_dir / "files.json"
+
+    def _load_index(self):
+        """Create the cache directory and read the file digest index."""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True, mode=0o700)
+        except OSError as e:
+            self.logger.warning("Compile cache disabled: %s", e)
+            self.enabled = False
+            return
+
+        try:
+            with self.index_path.open() as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if index.get("format") == CACHE_FORMAT:
+            self._index = index.get("files", {})
+
+    def save(self):
+        """Write the file digest index if it changed."""
+        if not self.enabled or not self._index_dirty:
+            return
+
+        data = json.dumps({"format": CACHE_FORMAT, "files": self._index})
+        try:
+            _atomic_write(self.index_path, data.encode())
+            self._index_dirty = False
+        except OSError as e:
+            self.logger.warning("Cannot write compile cache index: %s", e)
+
+    def file_digest(self, path: Path) -> str:
+        """
+        Return the content digest of a file.
+
+        Args:
+            path: File path
+
+        Returns:
+            Hex SHA-256 of the content, or MISSING if there is no file
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return MISSING
+
+        key = str(path)
+        signature = [st.st_mtime_ns, st.st_size, st.st_ino]
+        entry = self._index.get(key)
+        if entry and entry[:3] == signature:
+            return entry[3]
+
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        if time.time_ns() - st.st_mtime_ns > RACY_NS:
+            self._index[key] = signature + [digest]
+            self._index_dirty = True
+
+        return digest
+
+    def tree_digests(self, directory: Path) -> Dict[str, str]:
+        """
+        Return the digests of all files below a directory.
+
+        Args:
+            directory: Directory to scan
+
+        Returns:
+            Mapping of relative path to content digest
+        """
+        directory = Path(directory)
+        digests = {}
+
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if name.startswith(".") or name.endswith("~"):
+                    continue
+                path = Path(root, name)
+                digests[str(path.relative_to(directory))] = self.file_digest(path)
+
+        return digests
+
+    def forget(self, paths: Iterable[Path]):
+        """
+        Drop the indexed digests of files known to have changed.
+
+        The stat signature misses rewrites that keep mtime, size and
+        inode (e.g. cp -p over a file); a caller that is told about
+        changes, such as a file watcher, makes sure those files are
+        hashed again. Only entries depending on them are invalidated.
+
+        Args:
+            paths: Changed files; a directory covers everything below it
+        """
+        for path in paths:
+            key = str(path)
+            prefix = key.rstrip(os.sep) + os.sep
+            for name in [n for n in self._index if n == key or n.startswith(prefix)]:
+                del self._index[name]
+                self._index_dirty = True
+
+    def digest(self, *parts: Any) -> str:
+        """
+        Derive a cache key from the compiler version and parts.
+
+        Args:
+            parts: Values the cached result depends on
+
+        Returns:
+            Hex key
+        """
+        h = hashlib.sha256(f"{CACHE_FORMAT}\0{self.version}".encode())
+        for part in parts:
+            h.update(b"\0")
+            h.update(str(part).encode())
+        return h.hexdigest()
+
+    def _entry_path(self, namespace: str, key: str, suffix: str = ".pickle") -> Path:
+        return self.cache_dir / namespace / f"{key}{suffix}"
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """
+        Look up a cache entry.
+
+        Args:
+            namespace: Entry namespace, e.g. 'config' or 'phase'
+            key: Key from digest()
+
+        Returns:
+            Cached value or None
+        """
+        if self.memory:
+            data = self._memory.get(namespace, {}).get(key)
+            if data is not None:
+                self._memory[namespace].move_to_end(key)
+                self.hits += 1
+                return pickle.loads(data)
+
+        if not self.enabled:
+            if self.memory:
+                self.misses += 1
+            return None
+
+        path = self._entry_path(namespace, key)
+        try:
+            with path.open("rb") as f:
+                data = f.read()
+            value = pickle.loads(data)
+            os.utime(path)  # Pruning keeps recently used entries
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            self.logger.debug(
+                "Ignoring unreadable cache entry %s/%s: %s", namespace, key, e
+            )
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if self.memory:
+            self._remember(namespace, key, data)
+        return value
+
+    def put(self, namespace: str, key: str, value: Any):
+        """
+        Store a cache entry, pruning the oldest entries of the namespace.
+
+        Args:
+            namespace: Entry namespace
+            key: Key from digest()
+            value: Picklable value
+        """
+        if not self.enabled and not self.memory:
+            return
+
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if self.memory:
+            self._remember(namespace, key, data)
+        if not self.enabled:
+            return
+
+        path = self._entry_path(namespace, key)
+        try:
+            path.parent.mkdir(exist_ok=True, mode=0o700)
+            _atomic_write(path, data)
+            self._prune(path.parent)
+        except OSError as e:
+            self.logger.warning("Cannot write compile cache entry: %s", e)
+
+    def get_checked(self, namespace: str, key: str) -> Optional[Tuple[Any, List[str]]]:
+        """
+        Look up an entry stored by put_checked().
+
+        Args:
+            namespace: Entry namespace
+            key: Key from digest()
+
+        Returns:
+            (value, files it was built from), or None if there is no
+            entry or any of the files changed since it was stored
+        """
+        entry = self.get(namespace, key)
+        if entry is None:
+            return None
+
+        value, files = entry
+        for path, digest in files.items():
+            if self.file_digest(Path(path)) != digest:
+                self.logger.debug(
+                    "Cache entry %s/%s is stale: %s changed", namespace, key, path
+                )
+                self.hits -= 1
+                self.misses += 1
+                return None
+        return value, list(files)
+
+    def put_checked(self, namespace: str, key: str, value: Any, files: Iterable[str]):
+        """
+        Store an entry together with the digests of the files it was built from.
+
+        Args:
+            namespace: Entry namespace
+            key: Key from digest()
+            value: Picklable value
+            files: Paths of every file read to build the value
+        """
+        digests = {path: self.file_digest(Path(path)) for path in sorted(files)}
+        self.put(namespace, key, (value, digests))
+
+    def _remember(self, namespace: str, key: str, data: bytes):
+        """Keep a pickled entry in memory, evicting the least recent."""
+        entries = self._memory.setdefault(namespace, OrderedDict())
+        entries[key] = data
+        entries.move_to_end(key)
+        while len(entries) > MEMORY_ENTRIES:
+            entries.popitem(last=False)
+
+    def get_lines(self, namespace: str, key: str) -> Optional[Iterator[str]]:
+        """
+        Look up a text entry stored by put_lines().
+
+        Args:
+            namespace: Entry namespace
+            key: Key from digest()
+
+        Returns:
+            Iterator over the cached lines, or None
+        """
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(namespace, key, ".lines")
+        try:
+            f = path.open(encoding="utf-8")
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except OSError as e:
+            self.logger.debug(
+                "Ignoring unreadable cache entry %s/%s: %s", namespace, key, e
+            )
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return self._read_lines(f)
+
+    @staticmethod
+    def _read_lines(f) -> Iterator[str]:
+        with f:
+            for line in f:
+                yield line[:-1]
+
+    def put_lines(
+        self, namespace: str, key: str, lines: Iterable[str]
+    ) -> Iterator[str]:
+        """
+        Pass lines through while storing them as a text entry.
+
+        The entry is written to a temporary file and only renamed into
+        place once the lines are exhausted, so an abandoned or failed
+        generation leaves no partial entry behind.
+
+        Args:
+            namespace: Entry namespace
+            key: Key from digest()
+            lines: Lines to store, without newlines
+
+        Yields:
+            The lines, unchanged
+        """
+        if not self.enabled:
+            yield from lines
+            return
+
+        path = self._entry_path(namespace, key, ".lines")
+        try:
+            path.parent.mkdir(exist_ok=True, mode=0o700)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        except OSError as e:
+            self.logger.warning("Cannot write compile cache entry: %s", e)
+            yield from lines
+            return
+
+        f = os.fdopen(fd, "w", encoding="utf-8")
+        stored = False
+        try:
+            for line in lines:
+                if f:
+                    try:
+                        f.write(line)
+                        f.write("\n")
+                    except OSError as e:
+                        self.logger.warning("Cannot write compile cache entry: %s", e)
+                        with contextlib.suppress(OSError):
+                            f.close()
+                        f = None
+                yield line
+            if f:
+                try:
+                    f.close()
+                    os.replace(tmp, path)
+                    stored = True
+                except OSError as e:
+                    self.logger.warning("Cannot write compile cache entry: %s", e)
+        finally:
+            if not stored:
+                if f:
+                    with contextlib.suppress(OSError):
+                        f.close()
+                os.unlink(tmp)
+
+        if stored:
+            self._prune(path.parent, ".lines")
+
+    def _prune(self, directory: Path, suffix: str = ".pickle"):
+        """Keep only the MAX_ENTRIES most recent entries of a namespace."""
+        entries = list(directory.glob(f"*{suffix}"))
+        if len(entries) <= MAX_ENTRIES:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in entries[:-MAX_ENTRIES]:
+            entry.unlink(missing_ok=True)
+
+    def memoize(self, namespace: str, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for key, computing and storing it on a miss.
+
+        Args:
+            namespace: Entry namespace
+            key: Key from digest()
+            compute: Function producing the value
+
+        Returns:
+            Cached or computed value
+        """
+        value = self.get(namespace, key)
+        if value is None:
+            value = compute()
+            self.put(namespace, key, value)
+        return value
@@ -9,7 +9,10 @@ Copyright (c) 2025 Phreakwall Contributors
 
 import logging
 from enum import Enum
-from typing import Dict, List, Optional, Set
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from phreakwall.core.rule import Rule
+from phreakwall.core.sets import IpSet
 
 
 class ChainType(Enum):
@@ -21,6 +24,20 @@ class ChainType(Enum):
     RAW = "raw"
 
 
+# Built-in chains of each netfilter table, in kernel hook order
+BUILTIN_CHAINS: Dict[ChainType, Tuple[str, ...]] = {
+    ChainType.FILTER: ("INPUT", "FORWARD", "OUTPUT"),
+    ChainType.NAT: ("PREROUTING", "INPUT", "OUTPUT", "POSTROUTING"),
+    ChainType.MANGLE: ("PREROUTING", "INPUT", "FORWARD", "OUTPUT", "POSTROUTING"),
+    ChainType.RAW: ("PREROUTING", "OUTPUT"),
+}
+
+# Optimizer opt-out flags (see phreakwall.core.optimizer)
+DONT_OPTIMIZE = 1  # Leave the chain's rules alone
+DONT_DELETE = 2  # Never delete the chain, even when unreferenced
+DONT_MOVE = 4  # Never inline the chain's rules into its callers
+
+
 class Chain:
     """Represents a firewall chain."""
 
@@ -29,6 +46,7 @@ class Chain:
         name: str,
         chain_type: ChainType = ChainType.FILTER,
         policy: str = "ACCEPT",
+        optflags: int = 0,
     ):
         """
         Initialize a chain.
@@ -37,14 +55,23 @@ class Chain:
             name: Chain name
             chain_type: Type of chain
             policy: Default policy
+            optflags: Optimizer opt-out flags (DONT_OPTIMIZE, ...)
         """
         self.name = name
         self.chain_type = chain_type
         self.policy = policy
-        self.rules: List[str] = []
-
-    def add_rule(self, rule: str):
-        """Add a rule to the chain."""
+        self.optflags = optflags
+        self.rules: List[Rule] = []
+
+    @property
+    def builtin(self) -> bool:
+        """True if this is a built-in chain of its table."""
+        return self.name in BUILTIN_CHAINS[self.chain_type]
+
+    def add_rule(self, rule: Union[str, Rule]):
+        """Add a rule to the chain, parsing rule text if necessary."""
+        if isinstance(rule, str):
+            rule = Rule.parse(rule)
         self.rules.append(rule)
 
     def clear_rules(self):
@@ -72,6 +99,7 @@ class ChainManager:
         self.logger = logging.getLogger(__name__)
 
         self.chains: Dict[str, Chain] = {}
+        self.sets: Dict[str, IpSet] = {}
         self._initialize_standard_chains()
 
     def _initialize_standard_chains(self):
@@ -95,6 +123,7 @@ class ChainManager:
         name: str,
         chain_type: ChainType = ChainType.FILTER,
         policy: Optional[str] = None,
+        optflags: int = 0,
     ) -> Chain:
         """
         Create a new chain.
@@ -103,6 +132,7 @@ class ChainManager:
             name: Chain name
             chain_type: Type of chain
             policy: Chain policy (optional)
+            optflags: Optimizer opt-out flags (optional)
 
         Returns:
             Created chain object
@@ -112,7 +142,7 @@ class ChainManager:
             return self.chains[name]
 
         policy = policy or "ACCEPT"
-        chain = Chain(name, chain_type, policy)
+        chain = Chain(name, chain_type, policy, optflags)
         self.chains[name] = chain
 
         self.logger.debug(f"Created chain: {name} ({chain_type.value})")
@@ -130,13 +160,13 @@ class ChainManager:
         """
         return self.chains.get(name)
 
-    def add_rule(self, chain_name: str, rule: str):
+    def add_rule(self, chain_name: str, rule: Union[str, Rule]):
         """
         Add a rule to a chain.
 
         Args:
             chain_name: Name of the chain
-            rule: Rule specification
+            rule: Rule object or iptables rule specification
         """
         chain = self.get_chain(chain_name)
         if not chain:
@@ -144,16 +174,37 @@ class ChainManager:
 
         chain.add_rule(rule)
 
-    def generate_chains(self) -> List[str]:
+    def add_set(self, ipset: IpSet):
         """
-        Generate iptables commands for all chains.
+        Register a generated set.
 
-        Returns:
-            List of iptables command lines
+        Args:
+            ipset: Set matched by rules through --match-set
         """
-        lines = ["# Create and configure chains", ""]
+        if ipset.name in self.sets:
+            raise ValueError(f"Set already exists: {ipset.name}")
+        self.sets[ipset.name] = ipset
+        self.logger.debug(f"Created set: {ipset.name} ({len(ipset.entries)} entries)")
 
-        iptables_cmd = "ip6tables" if self.family == 6 else "iptables"
+    def delete_chain(self, name: str):
+        """
+        Delete a chain.
+
+        Args:
+            name: Chain name
+        """
+        chain = self.chains.pop(name, None)
+        if chain:
+            self.logger.debug(f"Deleted chain: {name}")
+
+    def generate_chains(self) -> Iterator[str]:
+        """
+        Generate iptables commands for all chains.
+
+        Yields:
+            iptables command lines
+        """
+        yield from ("# Create and configure chains", "")
 
         # Group chains by type
         for chain_type in ChainType:
@@ -164,46 +215,68 @@ class ChainManager:
             if not type_chains:
                 continue
 
-            lines.append(f"# {chain_type.value.upper()} table chains")
+            yield f"# {chain_type.value.upper()} table chains"
 
             for chain in type_chains:
                 # Create custom chains
-                if chain.name not in [
-                    "INPUT",
-                    "OUTPUT",
-                    "FORWARD",
-                    "PREROUTING",
-                    "POSTROUTING",
-                ]:
-                    lines.append(
+                if not chain.builtin:
+                    yield (
                         f"run_iptables -t {chain_type.value} -N {chain.name} "
                         f"2>/dev/null || true"
                     )
-                    lines.append(f"run_iptables -t {chain_type.value} -F {chain.name}")
+                    yield f"run_iptables -t {chain_type.value} -F {chain.name}"
                 else:
                     # Set policy for built-in chains
-                    lines.append(
+                    yield (
                         f"run_iptables -t {chain_type.value} "
                         f"-P {chain.name} {chain.policy}"
                     )
 
-            lines.append("")
+            yield ""
 
         # Add rules to chains
-        lines.append("# Add rules to chains")
-        lines.append("")
+        yield from ("# Add rules to chains", "")
 
         for chain in self.chains.values():
             if chain.rules:
-                lines.append(f"# Rules for {chain.name}")
+                yield f"# Rules for {chain.name}"
+                prefix = f"run_iptables -t {chain.chain_type.value} -A {chain.name} "
                 for rule in chain.rules:
-                    lines.append(
-                        f"run_iptables -t {chain.chain_type.value} "
-                        f"-A {chain.name} {rule}"
-                    )
-                lines.append("")
+                    yield prefix + rule.render()
+                yield ""
+
+    def generate_restore(self) -> Iterator[str]:
+        """
+        Generate an iptables-restore payload for all chains.
+
+        Every table is rendered as one ``*table`` ... ``COMMIT`` block so
+        the kernel swaps in each table atomically with a single process
+        invocation, instead of one iptables fork per rule.
+
+        Yields:
+            iptables-restore input lines
+        """
+        for chain_type in ChainType:
+            type_chains = [
+                c for c in self.chains.values() if c.chain_type == chain_type
+            ]
+
+            if not type_chains:
+                continue
+
+            yield f"*{chain_type.value}"
+
+            # Chain declarations: built-ins carry their policy
+            for chain in type_chains:
+                policy = chain.policy if chain.builtin else "-"
+                yield f":{chain.name} {policy} [0:0]"
+
+            for chain in type_chains:
+                prefix = f"-A {chain.name} "
+                for rule in chain.rules:
+                    yield prefix + rule.render()
 
-        return lines
+            yield "COMMIT"
 
     def validate(self):
         """Validate chain configuration."""
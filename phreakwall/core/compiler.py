@@ -13,20 +13,51 @@ it under the terms of the GNU General Public License version 2.
 """
 
 import argparse
+import contextlib
+import dataclasses
+import itertools
 import logging
+import os
+import subprocess
 import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-
-from phreakwall.core.chains import ChainManager
-
-from phreakwall.core.config import Config
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from phreakwall.core.actions import ActionManager
+from phreakwall.core.analyzer import RuleAnalyzer
+from phreakwall.core.backends import BACKENDS, Backend, BackendError, get_backend
+from phreakwall.core.cache import CACHE_DIR, CompileCache
+from phreakwall.core.chains import DONT_DELETE, DONT_MOVE, DONT_OPTIMIZE, ChainManager
+from phreakwall.core.config import Config, ConfigError
+from phreakwall.core.optimizer import ChainOptimizer, parse_level
+from phreakwall.core.profiler import Profiler
+from phreakwall.core.rule import interning
 from phreakwall.modules.nat import NatManager
-from phreakwall.modules.rules import RuleProcessor
+from phreakwall.modules.rules import PROTOCOLS_FILE, SERVICES_FILE, RuleProcessor, library_files
 from phreakwall.modules.zones import ZoneManager
 
+# Lines shown by --preview
+PREVIEW_LINES = 50
+
+# Write buffer of the generated script
+OUTPUT_BUFFER = 1 << 20
+
+# phreakwall.conf settings listing chains the optimizer leaves alone
+OPTFLAG_SETTINGS = {
+    "DONT_OPTIMIZE": DONT_OPTIMIZE,
+    "DONT_DELETE": DONT_DELETE,
+    "DONT_MOVE": DONT_MOVE,
+}
+
+# Stand-in for Profiler.phase() when not profiling
+_UNPROFILED = contextlib.nullcontext()
+
 
 @dataclass
 class CompilerOptions:
@@ -43,11 +74,19 @@ class CompilerOptions:
     test: bool = False
     preview: bool = False
     family: int = 4  # 4 for IPv4, 6 for IPv6
+    dual_stack: bool = False  # Compile IPv4 and IPv6 in parallel
+    script6: Optional[Path] = None  # Dual-stack IPv6 script (default: script + "6")
     confess: bool = False
     update: bool = False
     annotate: bool = False
     config_path: Optional[str] = None
     output: Optional[Path] = None
+    backend: str = "restore"  # "restore", "nft" (atomic) or "legacy" (per-rule)
+    optimize: Optional[int] = None  # None: use OPTIMIZE from phreakwall.conf
+    cache_dir: Optional[Path] = CACHE_DIR  # None disables the compile cache
+    drop_redundant: bool = False  # Drop shadowed and redundant rules
+    profile: bool = False  # Print a table of per-phase statistics
+    profile_json: Optional[Path] = None  # Write them to this JSON file
 
 
 class CompilerError(Exception):
@@ -66,20 +105,45 @@ class Compiler:
 
     VERSION = "6.0.0"
 
-    def __init__(self, options: CompilerOptions):
+    BACKENDS = tuple(BACKENDS)
+
+    # Compilation phases in order, with the configuration files each
+    # one reads. Files not listed here (macros, actions, includes) are
+    # assumed to affect every phase.
+    PHASES = (
+        ("zones", ("zones", "interfaces", "hosts")),
+        ("nat", ("masq", "snat", "nat")),
+        ("rules", ("policy", "rules")),
+    )
+
+    FAMILIES = (4, 6)
+
+    def __init__(
+        self, options: CompilerOptions, cache: Optional[CompileCache] = None
+    ):
         """
         Initialize the compiler.
 
         Args:
             options: Compiler configuration options
+            cache: Compile cache shared with other compiles, e.g. kept
+                warm by the daemon; by default one is opened in
+                options.cache_dir
         """
         self.options = options
         self.config: Config
         self.chain_manager: ChainManager
+        self.action_manager: ActionManager
         self.zone_manager: ZoneManager
         self.nat_manager: NatManager
         self.rule_processor: RuleProcessor
-        self.output_lines: List[str] = []
+        self.backend: Backend
+        self.cache: Optional[CompileCache] = cache
+        self.profiler: Optional[Profiler] = None
+        if options.profile or options.profile_json:
+            self.profiler = Profiler(
+                rules=self._count_rules, records=self._count_records
+            )
 
         # Setup logging
         self._setup_logging()
@@ -107,24 +171,49 @@ class Compiler:
 
         logging.basicConfig(level=level, format=log_format, handlers=handlers)
 
-    def initialize_components(self):
-        """Initialize all compiler components."""
+    def initialize_components(self, state: Optional[Tuple] = None):
+        """
+        Initialize all compiler components.
+
+        Args:
+            state: Parsed configuration from Config.state(); the
+                configuration files are read if omitted
+        """
         self.logger.info("Initializing Phreakwall compiler v%s", self.VERSION)
 
+        if self.options.backend not in self.BACKENDS:
+            raise CompilerError(f"Unknown backend: {self.options.backend}")
+
+        if self.cache is None and self.options.cache_dir:
+            self.cache = CompileCache(self.options.cache_dir, version=self.VERSION)
+            if not self.cache.enabled:
+                self.cache = None
+
         # Load configuration
         self.config = Config(
             config_dir=self.options.directory,
             family=self.options.family,
             export=self.options.export,
+            cache=self.cache,
         )
-        self.config.load()
+        if self.profiler:
+            self.config.records_read = 0
+        self.config.load(state)
 
         # Initialize managers
         self.chain_manager = ChainManager(
             family=self.options.family, export=self.options.export
         )
 
-        self.zone_manager = ZoneManager(config=self.config, family=self.options.family)
+        self.action_manager = ActionManager(self.config, self.chain_manager)
+
+        self.backend = get_backend(self.options.backend, self.chain_manager)
+
+        self.zone_manager = ZoneManager(
+            config=self.config,
+            family=self.options.family,
+            chain_manager=self.chain_manager,
+        )
 
         self.nat_manager = NatManager(config=self.config, family=self.options.family)
 
@@ -133,140 +222,507 @@ class Compiler:
             chain_manager=self.chain_manager,
             zone_manager=self.zone_manager,
             family=self.options.family,
+            action_manager=self.action_manager,
         )
 
-    def generate_script_header(self) -> List[str]:
+    def generate_script_header(self) -> Iterator[str]:
         """
         Generate the script header.
 
-        Returns:
-            List of header lines
+        Yields:
+            Header lines
         """
-        lines = ["#!/bin/bash", "#", "# Phreakwall Firewall Script", "#"]
+        yield from ("#!/bin/bash", "#", "# Phreakwall Firewall Script", "#")
 
         if not self.options.test:
             date_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            lines.extend(
-                [
-                    f"# Generated by Phreakwall {self.VERSION}",
-                    f"# Date: {date_str}",
-                    "#",
-                ]
+            yield from (
+                f"# Generated by Phreakwall {self.VERSION}",
+                f"# Date: {date_str}",
+                "#",
             )
         else:
-            lines.append("# Generated by Phreakwall")
+            yield "# Generated by Phreakwall"
 
-        lines.extend(["", "set -e", "", "# Phreakwall runtime library", ""])
+        yield from ("", "set -e", "", "# Phreakwall runtime library", "")
 
-        return lines
-
-    def generate_script_body(self) -> List[str]:
+    def generate_script_body(self) -> Iterator[str]:
         """
         Generate the main script body.
 
+        The load fragment is rendered while it is written, so the script
+        is never held in memory as text; with the compile cache it is
+        stored on the way through and streamed back on a hit.
+
+        Yields:
+            Script body lines
+        """
+        # Add runtime functions
+        yield from self.backend.runtime_functions()
+
+        keys = None
+        if self.cache:
+            keys = self._phase_keys()
+            load_key = self.cache.digest(
+                keys[-1],
+                self.options.backend,
+                self._optimize_level(),
+                self.options.drop_redundant,
+            )
+            # The pickled entry records the files the body was built from
+            cached = None
+            if self.cache.get_checked("load", load_key) is not None:
+                cached = self.cache.get_lines("load", load_key)
+            if cached is not None:
+                self.logger.info("Ruleset unchanged, reusing cached script body")
+                yield from cached
+                return
+
+        body = self._generate_load(keys)
+        if keys:
+            body = self.cache.put_lines("load", load_key, body)
+        yield from body
+        if keys:
+            self.cache.put_checked("load", load_key, True, self.config.files)
+
+    def _generate_load(self, keys: Optional[List[str]]) -> Iterator[str]:
+        """Build the ruleset, then load the chains through the backend."""
+        yield from self.build_ruleset(keys)
+
+        load = self.backend.generate_load()
+        if self.profiler:
+            load = self.profiler.iterate("render", load)
+        yield from load
+
+    def build_ruleset(self, keys: Optional[List[str]] = None) -> List[str]:
+        """
+        Run the compilation phases and optimize the resulting chains.
+
+        Args:
+            keys: Phase cache keys from _phase_keys(), None without cache
+
         Returns:
-            List of script body lines
+            Script lines emitted by the phases
         """
-        lines = []
+        phases = {
+            "zones": self.zone_manager.generate_zone_rules,
+            "nat": self.nat_manager.generate_nat_rules,
+            "rules": self.rule_processor.generate_rules,
+        }
 
-        # Add runtime functions
-        lines.extend(self._generate_runtime_functions())
-
-        # Generate chains
-        lines.extend(self.chain_manager.generate_chains())
-
-        # Process zones
-        lines.extend(self.zone_manager.generate_zone_rules())
-
-        # Process NAT rules
-        lines.extend(self.nat_manager.generate_nat_rules())
-
-        # Process firewall rules
-        lines.extend(self.rule_processor.generate_rules())
-
-        return lines
-
-    def _generate_runtime_functions(self) -> List[str]:
-        """Generate runtime helper functions."""
-        return [
-            "# Runtime helper functions",
-            "",
-            "error_exit() {",
-            '    echo "ERROR: $1" >&2',
-            "    exit 1",
-            "}",
-            "",
-            "run_iptables() {",
-            "    if [ $VERBOSITY -ge 2 ]; then",
-            '        echo "Running: iptables $@"',
-            "    fi",
-            '    iptables "$@" || error_exit "iptables command failed: $@"',
-            "}",
-            "",
+        # Resume after the last phase whose result is still valid; each
+        # phase may add chains, so every later phase has to run again
+        body: List[str] = []
+        start = 0
+        for index in reversed(range(len(self.PHASES)) if keys else []):
+            cached = self.cache.get_checked("phase", keys[index])
+            if cached is not None:
+                snapshot, files = cached
+                body, self.chain_manager.chains, self.chain_manager.sets = snapshot
+                self.config.files.update(files)
+                start = index + 1
+                break
+
+        for index, (name, _) in enumerate(self.PHASES):
+            if index < start:
+                self.logger.info("Phase %s unchanged, using cached result", name)
+                continue
+            with self._phase(name) as stats:
+                lines = phases[name]()
+                if stats:
+                    stats.lines += len(lines)
+            body.extend(lines)
+            if keys:
+                # Also depends on INCLUDEs outside the configuration tree
+                self.cache.put_checked(
+                    "phase",
+                    keys[index],
+                    (body, self.chain_manager.chains, self.chain_manager.sets),
+                    self.config.files,
+                )
+
+        # Optimize the chains before they are rendered; level 0 still
+        # deletes unreferenced chains
+        with self._phase("optimize"):
+            self._set_optflags()
+            ChainOptimizer(self.chain_manager).optimize(self._optimize_level())
+
+        if self.options.drop_redundant:
+            with self._phase("analyze"):
+                analyzer = RuleAnalyzer(self.chain_manager)
+                analyzer.drop(analyzer.analyze())
+
+        return body
+
+    def _phase_keys(self) -> List[str]:
+        """
+        Derive the cache key of each phase.
+
+        A phase key covers the phase's own input files, the files no
+        phase claims, /etc/services and /etc/protocols, the macro and
+        action files on the search path, and the key of the previous
+        phase, since phases build on the chains created before them.
+
+        Returns:
+            One key per entry of PHASES
+        """
+        digests = self.cache.tree_digests(self.options.directory)
+        claimed = {name for _, files in self.PHASES for name in files}
+        shared = sorted(
+            (path, digest) for path, digest in digests.items() if path not in claimed
+        )
+
+        # Rules resolve service and protocol names through these files
+        system = [
+            self.cache.file_digest(path) for path in (SERVICES_FILE, PROTOCOLS_FILE)
+        ]
+        # Rules expand macros and actions from outside the tree
+        library = [
+            (path, self.cache.file_digest(Path(path)))
+            for path in library_files(self.rule_processor.library_directories())
         ]
+        key = self.cache.digest(
+            "options", self.options.family, self.options.export, shared, system, library
+        )
+        keys = []
+        for name, files in self.PHASES:
+            key = self.cache.digest(
+                key, name, [(file, digests.get(file)) for file in files]
+            )
+            keys.append(key)
+        return keys
 
-    def generate_script_footer(self) -> List[str]:
+    def _phase(self, name: str):
         """
-        Generate the script footer.
+        Profile a phase with --profile.
 
         Returns:
-            List of footer lines
+            Context manager yielding the phase's PhaseStats, or None
+            when not profiling
         """
-        return [
-            "",
-            "# End of generated script",
-            "exit 0",
-        ]
+        if self.profiler is None:
+            return _UNPROFILED
+        return self.profiler.phase(name)
+
+    def _count_rules(self) -> int:
+        """Number of rules in all chains, for the profiler."""
+        chain_manager = getattr(self, "chain_manager", None)
+        if chain_manager is None:
+            return 0
+        return sum(len(chain.rules) for chain in chain_manager.chains.values())
+
+    def _count_records(self) -> int:
+        """Number of configuration records read, for the profiler."""
+        config = getattr(self, "config", None)
+        return (config and config.records_read) or 0
+
+    def _report_profile(self):
+        """Print the phase profile or write it as JSON."""
+        self.profiler.stop()
+        if self.options.profile:
+            print(
+                f"\nIPv{self.options.family} compile profile "
+                f"({self.options.backend})\n"
+            )
+            print(self.profiler.table())
+            print()
+
+        if not self.options.profile_json:
+            return
+        try:
+            self.profiler.write_json(
+                self.options.profile_json,
+                version=self.VERSION,
+                family=self.options.family,
+                backend=self.options.backend,
+            )
+        except OSError as e:
+            self.logger.error("Cannot write profile: %s", e)
+
+    def _set_optflags(self):
+        """Flag the chains phreakwall.conf exempts from optimization."""
+        for setting, flag in OPTFLAG_SETTINGS.items():
+            for name in str(self.config.get(setting, "")).split(","):
+                name = name.strip()
+                if not name:
+                    continue
+                chain = self.chain_manager.get_chain(name)
+                if chain is None:
+                    self.logger.info("%s: no chain %s", setting, name)
+                    continue
+                chain.optflags |= flag
+
+    def _optimize_level(self) -> int:
+        """Determine the optimization level from options or configuration."""
+        if self.options.optimize is not None:
+            return self.options.optimize
+
+        try:
+            return parse_level(self.config.get("OPTIMIZE", 0))
+        except ValueError as e:
+            raise CompilerError(str(e))
+
+    def generate_script_footer(self) -> Iterator[str]:
+        """
+        Generate the script footer.
 
-    def compile(self) -> int:
+        Yields:
+            Footer lines
+        """
+        yield from ("", "# End of generated script", "exit 0")
+
+    def compile(self, state: Optional[Tuple] = None) -> int:
         """
         Run the compilation process.
 
+        Args:
+            state: Parsed configuration from Config.state(), as handed
+                to dual-stack workers (optional)
+
         Returns:
             Exit code (0 for success, non-zero for error)
         """
+        if self.options.dual_stack:
+            return self.compile_dual_stack()
+
+        # Rules share match fragments for the duration of this compile
+        with interning():
+            start, cpu = time.perf_counter(), time.process_time()
+            if self.profiler:
+                self.profiler.start()
+            try:
+                self.logger.info("Starting compilation")
+
+                # Initialize all components
+                with self._phase("config"):
+                    self.initialize_components(state)
+
+                # Check mode - validate only, don't generate script
+                if not self.options.script:
+                    self.logger.info("Running in check mode")
+                    self.validate_configuration()
+                    self.logger.info("Configuration is valid")
+                    return 0
+
+                # Generate the firewall script
+                self.logger.info("Generating firewall script: %s", self.options.script)
+
+                lines = itertools.chain(
+                    self.generate_script_header(),
+                    self.generate_script_body(),
+                    self.generate_script_footer(),
+                )
+
+                # Stream the script out, keeping the first lines for a preview
+                head: List[str] = []
+                with self._phase("write") as stats:
+                    total = self._write_output(
+                        lines, head if self.options.preview else None
+                    )
+                    if stats:
+                        stats.lines = total
+
+                # Preview if requested
+                if self.options.preview:
+                    self._preview_output(head, total)
+
+                self.logger.info(
+                    "IPv%d compilation completed in %.1f ms (%.1f ms CPU)",
+                    self.options.family,
+                    (time.perf_counter() - start) * 1000,
+                    (time.process_time() - cpu) * 1000,
+                )
+                return 0
+
+            except (CompilerError, ConfigError, BackendError) as e:
+                self.logger.error("Compilation failed: %s", e)
+                if self.options.debug or self.options.confess:
+                    raise
+                return 1
+
+            except Exception as e:
+                self.logger.error("Unexpected error: %s", e)
+                if self.options.debug or self.options.confess:
+                    raise
+                return 1
+
+            finally:
+                if self.cache:
+                    self.cache.save()
+                    self.logger.info(
+                        "Compile cache: %d hits, %d misses",
+                        self.cache.hits,
+                        self.cache.misses,
+                    )
+                if self.profiler:
+                    self._report_profile()
+
+    def compile_dual_stack(self) -> int:
+        """
+        Compile the IPv4 and IPv6 rulesets in parallel.
+
+        The family-independent configuration (phreakwall.conf, params)
+        is parsed once here and handed to one worker process per family,
+        so the wall time approaches that of the slower family.
+
+        Returns:
+            Exit code (0 if both families compiled, non-zero otherwise)
+        """
+        start = time.perf_counter()
+        self.logger.info("Starting dual-stack compilation")
+
+        cache = None
+        if self.options.cache_dir:
+            cache = CompileCache(self.options.cache_dir, version=self.VERSION)
+        config = Config(
+            self.options.directory,
+            export=self.options.export,
+            cache=cache if cache and cache.enabled else None,
+        )
         try:
-            self.logger.info("Starting compilation")
+            config.load()
+        except ConfigError as e:
+            self.logger.error("Compilation failed: %s", e)
+            return 1
+        finally:
+            if cache:
+                cache.save()
 
-            # Initialize all components
-            self.initialize_components()
+        jobs = [(self._family_options(family), config.state()) for family in self.FAMILIES]
 
-            # Check mode - validate only, don't generate script
-            if not self.options.script:
-                self.logger.info("Running in check mode")
-                self.validate_configuration()
-                self.logger.info("Configuration is valid")
-                return 0
+        try:
+            with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+                results = list(pool.map(_compile_family, *zip(*jobs)))
+        except (OSError, BrokenProcessPool) as e:
+            self.logger.warning("No process pool (%s), compiling sequentially", e)
+            results = [_compile_family(*job) for job in jobs]
+
+        for family, result, wall, cpu in results:
+            self.logger.info(
+                "IPv%d: %s in %.1f ms (%.1f ms CPU)",
+                family,
+                "compiled" if result == 0 else "FAILED",
+                wall * 1000,
+                cpu * 1000,
+            )
+        self.logger.info(
+            "Dual-stack compilation finished in %.1f ms wall, %.1f ms summed",
+            (time.perf_counter() - start) * 1000,
+            sum(wall for _, _, wall, _ in results) * 1000,
+        )
 
-            # Generate the firewall script
-            self.logger.info("Generating firewall script: %s", self.options.script)
+        return max(result for _, result, _, _ in results)
+
+    def _family_options(self, family: int) -> CompilerOptions:
+        """Options for the single-family compile of a dual-stack run."""
+        script = self.options.script
+        if family == 6 and script:
+            script = self.options.script6 or script.with_name(script.name + "6")
+        profile_json = self.options.profile_json
+        if family == 6 and profile_json:
+            profile_json = profile_json.with_name(
+                f"{profile_json.stem}6{profile_json.suffix}"
+            )
+        return dataclasses.replace(
+            self.options,
+            family=family,
+            dual_stack=False,
+            script=script,
+            profile_json=profile_json,
+        )
 
-            self.output_lines = []
-            self.output_lines.extend(self.generate_script_header())
-            self.output_lines.extend(self.generate_script_body())
-            self.output_lines.extend(self.generate_script_footer())
+    def apply(self, dump: Optional[Path] = None) -> int:
+        """
+        Apply the compiled ruleset as a delta against the live ruleset.
 
-            # Write output
-            self._write_output()
+        Only the rules that differ are inserted, deleted or replaced, in a
+        single transaction; unchanged rules keep their counters.
 
-            # Preview if requested
-            if self.options.preview:
-                self._preview_output()
+        Args:
+            dump: Saved live ruleset to diff against instead of the kernel;
+                the delta is printed rather than applied
 
-            self.logger.info("Compilation completed successfully")
-            return 0
+        Returns:
+            Exit code (0 for success, non-zero for error)
+        """
+        # The compiled and the live rules each share match fragments
+        with interning():
+            if self.profiler:
+                self.profiler.start()
+            try:
+                self.logger.info("Starting differential apply")
+
+                with self._phase("config"):
+                    self.initialize_components()
+                self.build_ruleset(self._phase_keys() if self.cache else None)
+
+                if dump:
+                    live = Path(dump).read_text()
+                else:
+                    live = subprocess.run(
+                        self.backend.dump_command(),
+                        capture_output=True,
+                        text=True,
+                        check=True,
+                    ).stdout
+
+                # Sets are swapped in before rules that reference them change
+                sets = self.backend.set_payload()
+                if dump:
+                    for line in sets:
+                        print(line)
+                elif sets:
+                    subprocess.run(
+                        self.backend.set_command(),
+                        input="\n".join(sets) + "\n",
+                        text=True,
+                        check=True,
+                    )
+                    self.logger.info("Loaded %d set commands", len(sets))
+
+                start = time.perf_counter()
+                with self._phase("delta") as stats:
+                    delta = self.backend.generate_delta(live)
+                    if stats:
+                        stats.lines = len(delta)
+                self.logger.info(
+                    "Delta computed in %.1f ms: %s",
+                    (time.perf_counter() - start) * 1000,
+                    self.backend.delta_stats or "full load",
+                )
+
+                if dump:
+                    for line in delta:
+                        print(line)
+                elif delta:
+                    subprocess.run(
+                        self.backend.delta_command(),
+                        input="\n".join(delta) + "\n",
+                        text=True,
+                        check=True,
+                    )
+                    self.logger.info("Delta applied")
+                else:
+                    self.logger.info("Live ruleset is up to date")
 
-        except CompilerError as e:
-            self.logger.error("Compilation failed: %s", e)
-            if self.options.debug or self.options.confess:
-                raise
-            return 1
+                return 0
 
-        except Exception as e:
-            self.logger.error("Unexpected error: %s", e)
-            if self.options.debug or self.options.confess:
-                raise
-            return 1
+            except (
+                CompilerError,
+                BackendError,
+                OSError,
+                subprocess.CalledProcessError,
+            ) as e:
+                self.logger.error("Apply failed: %s", e)
+                if self.options.debug or self.options.confess:
+                    raise
+                return 1
+
+            finally:
+                if self.cache:
+                    self.cache.save()
+                if self.profiler:
+                    self._report_profile()
 
     def validate_configuration(self):
         """Validate the configuration without generating output."""
@@ -281,44 +737,114 @@ class Compiler:
         # Validate firewall rules
         self.rule_processor.validate()
 
+        # Analyze the expanded rules for shadowed and redundant entries
+        self.build_ruleset()
+        with self._phase("analyze"):
+            findings = RuleAnalyzer(self.chain_manager).analyze()
+        for finding in findings:
+            if finding.kind in ("shadowed", "correlated"):
+                self.logger.warning("%s", finding)
+            else:
+                self.logger.info("%s", finding)
+
         self.logger.debug("Validation completed")
 
-    def _write_output(self):
-        """Write the generated script to file."""
+    def _write_output(
+        self, lines: Iterable[str], head: Optional[List[str]] = None
+    ) -> int:
+        """
+        Stream the generated script to its file, or to stdout.
+
+        The script is written through a buffer to a temporary file next
+        to the target and renamed over it once complete, so a failed
+        compile never leaves a truncated script behind.
+
+        Args:
+            lines: Script lines, consumed once
+            head: Receives the first PREVIEW_LINES lines if given
+
+        Returns:
+            Number of lines written
+        """
         output_path = self.options.script or self.options.output
 
+        total = 0
+
+        def tee(lines: Iterable[str]) -> Iterator[str]:
+            nonlocal total
+            for total, line in enumerate(lines, 1):
+                if head is not None and total <= PREVIEW_LINES:
+                    head.append(line)
+                yield line + "\n"
+
         if not output_path:
             # Write to stdout
-            for line in self.output_lines:
-                print(line)
-        else:
-            output_path = Path(output_path)
-            output_path.parent.mkdir(parents=True, exist_ok=True)
+            sys.stdout.writelines(tee(lines))
+            return total
 
-            with output_path.open("w") as f:
-                f.write("\n".join(self.output_lines))
-                f.write("\n")
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
 
-            # Make executable
-            output_path.chmod(0o755)
-
-            self.logger.info("Script written to: %s", output_path)
+        fd, tmp = tempfile.mkstemp(
+            dir=output_path.parent, prefix=f".{output_path.name}."
+        )
+        try:
+            with os.fdopen(fd, "w", buffering=OUTPUT_BUFFER) as f:
+                f.writelines(tee(lines))
+                # Make executable
+                os.fchmod(f.fileno(), 0o755)
+            os.replace(tmp, output_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self.logger.info("Script written to: %s (%d lines)", output_path, total)
+        return total
+
+    def _preview_output(self, head: List[str], total: int):
+        """
+        Display a preview of the generated output.
 
-    def _preview_output(self):
-        """Display a preview of the generated output."""
+        Args:
+            head: First lines of the script
+            total: Number of lines in the script
+        """
         print("\n" + "=" * 70)
         print("PREVIEW OF GENERATED SCRIPT")
         print("=" * 70 + "\n")
 
-        for i, line in enumerate(self.output_lines[:50], 1):
+        for i, line in enumerate(head, 1):
             print(f"{i:4d}: {line}")
 
-        if len(self.output_lines) > 50:
-            print(f"\n... ({len(self.output_lines) - 50} more lines)")
+        if total > len(head):
+            print(f"\n... ({total - len(head)} more lines)")
 
         print("\n" + "=" * 70 + "\n")
 
 
+def _compile_family(
+    options: CompilerOptions, state: Tuple
+) -> Tuple[int, int, float, float]:
+    """
+    Compile one family of a dual-stack run (process pool worker).
+
+    Args:
+        options: Single-family compiler options
+        state: Parsed configuration from Config.state()
+
+    Returns:
+        (family, exit code, wall seconds, CPU seconds)
+    """
+    start, cpu = time.perf_counter(), time.process_time()
+    result = Compiler(options).compile(state)
+    return (
+        options.family,
+        result,
+        time.perf_counter() - start,
+        time.process_time() - cpu,
+    )
+
+
 def main():
     """Main entry point for the compiler."""
     parser = argparse.ArgumentParser(
@@ -376,6 +902,81 @@ def main():
         help="IP family (4 for IPv4, 6 for IPv6)",
     )
 
+    parser.add_argument(
+        "--dual-stack",
+        action="store_true",
+        help="Compile the IPv4 and IPv6 rulesets in parallel",
+    )
+
+    parser.add_argument(
+        "--script6",
+        type=Path,
+        help="IPv6 output script with --dual-stack (default: SCRIPT with '6' appended)",
+    )
+
+    parser.add_argument(
+        "-b",
+        "--backend",
+        choices=Compiler.BACKENDS,
+        default="restore",
+        help="Ruleset backend: atomic iptables-restore (default), nftables "
+        "or legacy per-rule iptables commands",
+    )
+
+    parser.add_argument(
+        "-O",
+        "--optimize",
+        type=parse_level,
+        default=None,
+        help="Optimization level 0-31 or All/None (default: OPTIMIZE setting)",
+    )
+
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Apply only the changes against the live ruleset instead of "
+        "writing a script (restore and nft backends)",
+    )
+
+    parser.add_argument(
+        "--live",
+        type=Path,
+        metavar="DUMP",
+        help="With --apply, diff against a saved iptables-save -c or "
+        "nft -j list ruleset dump and print the delta",
+    )
+
+    parser.add_argument(
+        "--drop-redundant",
+        action="store_true",
+        help="Drop rules that are shadowed, redundant or repeat the chain policy",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the time, memory and rule counts of each compile phase",
+    )
+
+    parser.add_argument(
+        "--profile-json",
+        type=Path,
+        metavar="FILE",
+        help="Write the phase profile to a JSON file "
+        "(IPv6 with --dual-stack: FILE with '6' before the suffix)",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=CACHE_DIR,
+        help=f"Compile cache directory (default: {CACHE_DIR})",
+    )
+
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Compile without the compile cache"
+    )
+
     parser.add_argument(
         "--version", action="version", version=f"Phreakwall Compiler {Compiler.VERSION}"
     )
@@ -394,10 +995,20 @@ def main():
         test=args.test,
         preview=args.preview,
         family=args.family,
+        dual_stack=args.dual_stack,
+        script6=args.script6,
+        backend=args.backend,
+        optimize=args.optimize,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        drop_redundant=args.drop_redundant,
+        profile=args.profile,
+        profile_json=args.profile_json,
     )
 
     # Create and run compiler
     compiler = Compiler(options)
+    if args.apply:
+        return compiler.apply(args.live)
     return compiler.compile()
 
 
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Compile-Time Conditions
+
+Evaluates the expressions of compile-time ?IF/?ELSIF directives, such
+as ``__ADDRTYPE && ! passed(@1)`` or ``@1 eq 'audit'``, and substitutes
+variables and action parameters into entries. The directives themselves
+are processed by phreakwall.core.config.ConfigTokenizer.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import re
+from collections import ChainMap
+from typing import Dict, List, Mapping, Optional, Tuple
+
+# Capabilities the generated rulesets rely on; anything else tests false
+CAPABILITIES = {
+    "ADDRTYPE": True,
+    "CONNTRACK_MATCH": True,
+    "MULTIPORT": True,
+    "RECENT_MATCH": True,
+    "COMMENTS": True,
+}
+
+_TOKEN_RE = re.compile(
+    r"""\s*(?:
+        (&&|\|\||==|!=|=~|!~|<=|>=|[!()<>])   # operator
+      | '([^']*)'                             # literal string
+      | "([^"]*)"                             # interpolated string
+      | /((?:[^/\\]|\\.)*)/                   # regular expression
+      | ([@$]?\{?\w+\}?(?:\([^)]*\))?)        # operand
+    )""",
+    re.X,
+)
+
+_COMPARISONS = ("==", "!=", "=~", "!~", "<", ">", "<=", ">=")
+
+
+class ConditionError(ValueError):
+    """Raised for a malformed directive or an ?ERROR directive."""
+
+    pass
+
+
+class Conditions:
+    """
+    Expression evaluator for compile-time directives.
+
+    Values are strings; a value is true unless it is empty, '0' or '-'.
+    """
+
+    def __init__(
+        self,
+        family: int = 4,
+        params: Optional[Tuple[str, ...]] = None,
+        variables: Optional[Mapping[str, str]] = None,
+        capabilities: Optional[Dict[str, bool]] = None,
+    ):
+        """
+        Initialize the evaluator.
+
+        Args:
+            family: IP family (4 or 6)
+            params: Action parameters (@1/$1, ...); None leaves numbered
+                references alone
+            variables: Params from the params file; looked up, never
+                copied, so lazily evaluated params stay lazy. ?SET
+                variables shadow them.
+            capabilities: Capability overrides
+        """
+        self.family = family
+        self.params = params
+        self.variables: ChainMap = ChainMap({}, variables if variables is not None else {})
+        self.capabilities = dict(CAPABILITIES, IPV4=family == 4, IPV6=family == 6)
+        self.capabilities.update(capabilities or {})
+
+    def value(self, token: str) -> str:
+        """Resolve one operand token."""
+        if token.startswith("__"):
+            return "1" if self.capabilities.get(token[2:]) else ""
+        if token.startswith("passed(") and token.endswith(")"):
+            return "1" if _true(self.value(token[7:-1].strip())) else ""
+        if token[0] in "@$":
+            name = token[1:].strip("{}")
+            if name.isdigit():
+                index = int(name) - 1
+                params = self.params or ()
+                return params[index] if 0 <= index < len(params) else ""
+            return self.variables.get(name, "")
+        return token
+
+    def substitute(self, text: str) -> str:
+        """Replace @N, $N and @VAR/$VAR references in a line."""
+        if "@" not in text and "$" not in text:
+            return text
+
+        def replace(match):
+            name = match.group(2)
+            if name.isdigit():
+                if self.params is None:
+                    return match.group(0)
+                return self.value("@" + name) or "-"
+            if name in self.variables:
+                return self.variables[name]
+            return match.group(0)
+
+        text = re.sub(r"(?<!\\)([@$])\{?(\w+)\}?", replace, text)
+        return text.replace("\\@", "@")
+
+    def evaluate(self, expression: str) -> bool:
+        """
+        Evaluate an ?IF expression.
+
+        Args:
+            expression: e.g. "__ADDRTYPE && ! passed(@1)"
+
+        Returns:
+            Truth value
+
+        Raises:
+            ConditionError: If the expression is malformed
+        """
+        tokens: List[Tuple[str, str]] = []
+        position = 0
+        expression = expression.strip()
+        while position < len(expression):
+            match = _TOKEN_RE.match(expression, position)
+            if not match or match.end() == position:
+                raise ConditionError(f"Invalid expression ({expression})")
+            position = match.end()
+            operator, single, double, pattern, operand = match.groups()
+            if operator:
+                tokens.append(("op", operator))
+            elif single is not None:
+                tokens.append(("str", single))
+            elif double is not None:
+                tokens.append(("str", self.substitute(double)))
+            elif pattern is not None:
+                tokens.append(("re", pattern))
+            elif operand in ("eq", "ne"):
+                tokens.append(("op", "==" if operand == "eq" else "!="))
+            else:
+                tokens.append(("val", operand))
+
+        result, index = self._or(tokens, 0)
+        if index != len(tokens):
+            raise ConditionError(f"Invalid expression ({expression})")
+        return _true(result)
+
+    # Recursive descent: or -> and -> not -> comparison -> primary
+
+    def _or(self, tokens, index):
+        left, index = self._and(tokens, index)
+        while index < len(tokens) and tokens[index] == ("op", "||"):
+            right, index = self._and(tokens, index + 1)
+            left = "1" if _true(left) or _true(right) else ""
+        return left, index
+
+    def _and(self, tokens, index):
+        left, index = self._not(tokens, index)
+        while index < len(tokens) and tokens[index] == ("op", "&&"):
+            right, index = self._not(tokens, index + 1)
+            left = "1" if _true(left) and _true(right) else ""
+        return left, index
+
+    def _not(self, tokens, index):
+        if index < len(tokens) and tokens[index] == ("op", "!"):
+            value, index = self._not(tokens, index + 1)
+            return ("" if _true(value) else "1"), index
+        return self._comparison(tokens, index)
+
+    def _comparison(self, tokens, index):
+        left, index = self._primary(tokens, index)
+        if index >= len(tokens) or tokens[index][0] != "op":
+            return left, index
+        operator = tokens[index][1]
+        if operator not in _COMPARISONS:
+            return left, index
+
+        if operator in ("=~", "!~"):
+            if index + 1 >= len(tokens) or tokens[index + 1][0] != "re":
+                raise ConditionError(f"'{operator}' requires /pattern/")
+            found = re.search(tokens[index + 1][1], left) is not None
+            return ("1" if found == (operator == "=~") else ""), index + 2
+
+        right, index = self._primary(tokens, index + 1)
+        if operator in ("==", "!="):
+            result = (left == right) == (operator == "==")
+        elif left.isdigit() and right.isdigit():
+            result = {
+                "<": int(left) < int(right),
+                ">": int(left) > int(right),
+                "<=": int(left) <= int(right),
+                ">=": int(left) >= int(right),
+            }[operator]
+        else:
+            result = False
+        return ("1" if result else ""), index
+
+    def _primary(self, tokens, index):
+        if index >= len(tokens):
+            raise ConditionError("Unexpected end of expression")
+        kind, text = tokens[index]
+        if (kind, text) == ("op", "("):
+            value, index = self._or(tokens, index + 1)
+            if index >= len(tokens) or tokens[index] != ("op", ")"):
+                raise ConditionError("Missing ')'")
+            return value, index + 1
+        if kind == "str":
+            return text, index + 1
+        if kind == "val":
+            if text == "passed" and index + 1 < len(tokens):
+                # 'passed @1' without parentheses
+                value, index = self._primary(tokens, index + 1)
+                return ("1" if _true(value) else ""), index
+            return self.value(text), index + 1
+        raise ConditionError(f"Unexpected '{text}'")
+
+
+def _true(value: str) -> bool:
+    return value not in ("", "0", "-")
+
@@ -4,13 +4,37 @@ Phreakwall Configuration Management
 
 Handles loading, parsing, and validating firewall configuration files.
 
+All files are read through ConfigTokenizer, a streaming tokenizer for
+the Shorewall file grammar: comments, continuation lines, ?FORMAT,
+?IF/?ELSIF/?ELSE/?ENDIF, ?SET/?RESET, ?COMMENT, ?ERROR/?WARNING/?INFO,
+?REQUIRE, INCLUDE, $PARAM expansion, ';' column options and ';;'
+passthrough. It yields one Record per entry from a generator and holds
+a single line per open file, so memory does not grow with file size.
+
+The params file is shell rather than this grammar; it is evaluated by
+phreakwall.core.params.
+
 Copyright (c) 2025 Phreakwall Contributors
 """
 
 import logging
+import re
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from phreakwall.core.cache import CompileCache
+from phreakwall.core.conditions import ConditionError, Conditions
+from phreakwall.core.params import Params, ParamsError
+
+# Nested INCLUDEs deeper than this are assumed to be a loop
+MAX_INCLUDE_DEPTH = 4
+
+# name=value column options (';' section or {...})
+_OPTION_RE = re.compile(r"(\w+)\s*=\s*(\"[^\"]*\"|'[^']*'|[^\s,}]+)")
+
+# {...} column options inside an entry
+_BRACES_RE = re.compile(r"\{([^}]*)\}")
 
 
 @dataclass
@@ -31,6 +55,302 @@ class ConfigError(Exception):
     pass
 
 
+@dataclass(slots=True)
+class Record:
+    """One entry of a configuration file, split into columns."""
+
+    columns: List[str]
+    file: str
+    line: int
+    names: Tuple[str, ...] = ()
+    options: Optional[Dict[str, str]] = None
+    passthrough: Optional[str] = None
+    comment: Optional[str] = None
+    format: int = 1
+
+    def get(self, column: Union[int, str], default: Optional[str] = None):
+        """
+        Return a column value.
+
+        Args:
+            column: Column index or name (from names)
+            default: Returned for a missing or '-' column
+
+        Returns:
+            Column value or default
+        """
+        index = column if isinstance(column, int) else self.names.index(column)
+        if index >= len(self.columns):
+            return default
+        value = self.columns[index]
+        return default if value == "-" else value
+
+    @property
+    def location(self) -> str:
+        """'file:line' for diagnostics."""
+        return f"{self.file}:{self.line}"
+
+
+class ConfigTokenizer:
+    """
+    Streaming tokenizer for Shorewall-format configuration files.
+
+    Directives are evaluated while reading, so entries in inactive
+    ?IF branches are never split or expanded. ?SET variables live in
+    the shared Conditions and stay visible to later files.
+    """
+
+    def __init__(
+        self,
+        config_dir: Path,
+        conditions: Conditions,
+        perl: Optional[Callable[[List[str]], None]] = None,
+        files: Optional[Set[str]] = None,
+    ):
+        """
+        Initialize the tokenizer.
+
+        Args:
+            config_dir: Directory relative INCLUDEs are resolved against
+            conditions: Expression evaluator holding variables and params
+            perl: Receiver of active ?BEGIN PERL blocks (optional; they
+                are skipped with a warning otherwise)
+            files: Receives the path of every file opened, INCLUDEs
+                included (optional)
+        """
+        self.config_dir = Path(config_dir)
+        self.conditions = conditions
+        self.perl = perl
+        self.files = files
+        self.logger = logging.getLogger(__name__)
+
+    def records(
+        self,
+        path: Path,
+        names: Tuple[str, ...] = (),
+        format: int = 1,
+        raw: bool = False,
+    ) -> Iterator[Record]:
+        """
+        Tokenize a file.
+
+        Args:
+            path: File to read
+            names: Column names; 'name=value' options fill these columns
+            format: Format assumed until a ?FORMAT directive
+            raw: Yield each entry as one column (key=value files)
+
+        Yields:
+            One Record per active entry
+
+        Raises:
+            ConfigError: For a malformed directive, a missing INCLUDE or
+                an active ?ERROR
+        """
+        return self._read(Path(path), names, format, raw, 0)
+
+    def _read(
+        self, path: Path, names: Tuple[str, ...], format: int, raw: bool, depth: int
+    ) -> Iterator[Record]:
+        conditions = self.conditions
+        substitute = conditions.substitute
+        at = conditions.params is not None
+        file = str(path)
+
+        # Per file: stack of (active, branch taken) per open ?IF
+        stack: List[Tuple[bool, bool]] = []
+        active = True
+        comment: Optional[str] = None
+        perl: Optional[List[str]] = None
+        continued = ""
+        start = 0
+
+        if self.files is not None:
+            self.files.add(file)
+        with path.open() as f:
+            for number, text in enumerate(f, 1):
+                if perl is not None:
+                    if text.lstrip()[:9].lower() == "?end perl":
+                        self._perl(perl, active, file, number)
+                        perl = None
+                    else:
+                        perl.append(text.rstrip("\n"))
+                    continue
+
+                hash = text.find("#")
+                if hash >= 0:
+                    text = text[:hash]
+                text = text.strip()
+                if not text:
+                    continue
+                if text[-1] == "\\":
+                    if not continued:
+                        start = number
+                    continued += text[:-1] + " "
+                    continue
+                if continued:
+                    text, continued, line = continued + text, "", start
+                else:
+                    line = number
+
+                if text[0] == "?":
+                    keyword, argument = (text.split(None, 1) + [""])[:2]
+                    keyword = keyword.upper().rstrip(";")
+                    try:
+                        if keyword in ("?IF", "?ELSIF", "?ELSE", "?ENDIF"):
+                            active = self._conditional(keyword, argument, stack)
+                        elif keyword == "?BEGIN" and argument.lower().startswith("perl"):
+                            perl = []
+                        elif not active:
+                            pass
+                        elif keyword == "?INCLUDE":
+                            yield from self._include(argument, path, names, raw, depth)
+                        else:
+                            comment, format = self._directive(
+                                keyword, argument, comment, format
+                            )
+                    except (ConditionError, ConfigError, ParamsError) as e:
+                        raise ConfigError(f"{file}:{line}: {e}") from None
+                    continue
+
+                if not active:
+                    continue
+
+                if "$" in text or (at and "@" in text):
+                    try:
+                        text = substitute(text)
+                    except ParamsError as e:
+                        raise ConfigError(f"{file}:{line}: {e}") from None
+
+                if text[:8] == "INCLUDE " or text[:8] == "INCLUDE\t":
+                    try:
+                        yield from self._include(text[8:], path, names, raw, depth)
+                    except ConfigError as e:
+                        raise ConfigError(f"{file}:{line}: {e}") from None
+                    continue
+
+                if raw:
+                    yield Record([text], file, line, names, None, None, comment, format)
+                    continue
+
+                options = passthrough = None
+                if ";" in text:
+                    text, _, rest = text.partition(";")
+                    if rest[:1] == ";":
+                        passthrough = rest[1:].strip()
+                    else:
+                        options = dict(_OPTION_RE.findall(rest))
+                if "{" in text:
+                    options = options or {}
+                    for group in _BRACES_RE.findall(text):
+                        options.update(_OPTION_RE.findall(group))
+                    text = _BRACES_RE.sub(" ", text)
+
+                columns = text.split()
+                if options:
+                    for key, value in options.items():
+                        if value[:1] in ("'", '"'):
+                            value = options[key] = value[1:-1]
+                        if key in names:
+                            index = names.index(key)
+                            if index >= len(columns):
+                                columns.extend("-" * (index + 1 - len(columns)))
+                            columns[index] = value
+
+                yield Record(
+                    columns, file, line, names, options, passthrough, comment, format
+                )
+
+        if continued:
+            raise ConfigError(f"{file}:{start}: continuation line at end of file")
+        if perl is not None:
+            raise ConfigError(f"{file}: missing ?END PERL")
+        if stack:
+            raise ConfigError(f"{file}: missing ?ENDIF")
+
+    def _conditional(
+        self, keyword: str, argument: str, stack: List[Tuple[bool, bool]]
+    ) -> bool:
+        """Apply ?IF/?ELSIF/?ELSE/?ENDIF and return whether entries are active."""
+        if keyword == "?IF":
+            enclosing = all(entry[0] for entry in stack)
+            taken = enclosing and self.conditions.evaluate(argument)
+            stack.append((taken, taken))
+        elif not stack:
+            raise ConfigError(f"{keyword} without ?IF")
+        elif keyword == "?ENDIF":
+            stack.pop()
+        else:
+            _, taken = stack.pop()
+            enclosing = all(entry[0] for entry in stack)
+            if keyword == "?ELSE":
+                stack.append((enclosing and not taken, True))
+            else:
+                now = enclosing and not taken and self.conditions.evaluate(argument)
+                stack.append((now, taken or now))
+        return all(entry[0] for entry in stack)
+
+    def _directive(
+        self, keyword: str, argument: str, comment: Optional[str], format: int
+    ) -> Tuple[Optional[str], int]:
+        """Apply an active directive; returns the new (comment, format)."""
+        conditions = self.conditions
+        if keyword == "?FORMAT":
+            if not argument.isdigit():
+                raise ConfigError(f"Invalid ?FORMAT ({argument})")
+            format = int(argument)
+        elif keyword == "?COMMENT":
+            comment = argument or None
+        elif keyword == "?SET":
+            name, _, value = argument.partition(" ")
+            value = value.strip()
+            if len(value) > 1 and value[0] == value[-1] and value[0] in "'\"":
+                value = value[1:-1]
+            elif value:
+                value = conditions.value(value)
+            conditions.variables[name.lstrip("$@")] = value
+        elif keyword == "?RESET":
+            conditions.variables.pop(argument.lstrip("$@"), None)
+        elif keyword == "?ERROR":
+            raise ConfigError(conditions.substitute(argument))
+        elif keyword == "?WARNING":
+            self.logger.warning(conditions.substitute(argument))
+        elif keyword == "?INFO":
+            self.logger.info(conditions.substitute(argument))
+        elif keyword == "?REQUIRE":
+            if not conditions.capabilities.get(argument.upper()):
+                raise ConfigError(f"Required capability {argument} not available")
+        elif keyword != "?SECTION":
+            self.logger.warning(f"Unsupported directive {keyword} ignored")
+        return comment, format
+
+    def _include(
+        self,
+        argument: str,
+        current: Path,
+        names: Tuple[str, ...],
+        raw: bool,
+        depth: int,
+    ) -> Iterator[Record]:
+        """Tokenize an INCLUDEd file (config directory first, then alongside)."""
+        name = Path(argument.strip().strip("'\""))
+        if depth >= MAX_INCLUDE_DEPTH:
+            raise ConfigError(f"INCLUDEs nested too deeply ({name})")
+        for candidate in (self.config_dir / name, current.parent / name):
+            if candidate.is_file():
+                return self._read(candidate, names, 1, raw, depth + 1)
+        raise ConfigError(f"INCLUDE file {name} not found")
+
+    def _perl(self, block: List[str], active: bool, file: str, line: int):
+        """Hand an active embedded Perl block to the receiver."""
+        if not active:
+            return
+        if self.perl:
+            self.perl(block)
+        else:
+            self.logger.warning(f"{file}:{line}: embedded Perl is not supported, skipped")
+
+
 class Config:
     """
     Configuration manager for Phreakwall.
@@ -38,7 +358,13 @@ class Config:
     Loads and parses configuration files from the config directory.
     """
 
-    def __init__(self, config_dir: Path, family: int = 4, export: bool = False):
+    def __init__(
+        self,
+        config_dir: Path,
+        family: int = 4,
+        export: bool = False,
+        cache: Optional[CompileCache] = None,
+    ):
         """
         Initialize configuration manager.
 
@@ -46,37 +372,85 @@ class Config:
             config_dir: Configuration directory path
             family: IP family (4 or 6)
             export: Export mode flag
+            cache: Compile cache for parsed files (optional)
         """
         self.config_dir = Path(config_dir)
         self.family = family
         self.export = export
+        self.cache = cache
         self.logger = logging.getLogger(__name__)
 
         self.options = ConfigOptions()
-        self.params: Dict[str, str] = {}
+        self.params: Params = Params()
         self._loaded = False
 
-    def load(self):
-        """Load all configuration files."""
+        # Every file the configuration was read from, INCLUDEs included;
+        # cache entries built from them are validated against these
+        self.files: Set[str] = set()
+
+        # Records handed out by records(); None while nobody is counting
+        self.records_read: Optional[int] = None
+
+    def load(self, state: Optional[Tuple[Dict[str, Any], Params]] = None):
+        """
+        Load all configuration files.
+
+        Args:
+            state: Already parsed settings and params from state(), e.g.
+                handed to a worker process; the files are not read again
+        """
         if self._loaded:
             return
 
+        if state is not None:
+            self.options.config, self.params = state
+            self._loaded = True
+            return
+
         self.logger.info(f"Loading configuration from {self.config_dir}")
 
         if not self.config_dir.exists():
             raise ConfigError(f"Configuration directory not found: {self.config_dir}")
 
+        key = None
+        if self.cache:
+            key = self.cache.digest(
+                "config",
+                self.cache.file_digest(self.config_dir / "phreakwall.conf"),
+                self.cache.file_digest(self.config_dir / "params"),
+            )
+            cached = self.cache.get_checked("config", key)
+            if cached is not None:
+                (self.options.config, self.params), files = cached
+                self.files.update(files)
+                self._loaded = True
+                self.logger.info("Configuration loaded from cache")
+                return
+
+        files: Set[str] = set()
+
         # Load main configuration
-        self._load_main_config()
+        self._load_main_config(files)
 
         # Load params
-        self._load_params()
+        self._load_params(files)
+
+        self.files.update(files)
+        if key:
+            self.cache.put_checked(
+                "config", key, (self.options.config, self.params), files
+            )
 
         self._loaded = True
         self.logger.info("Configuration loaded successfully")
 
-    def _load_main_config(self):
-        """Load the main configuration file."""
+    def _load_main_config(self, files: Set[str]):
+        """
+        Load the main configuration file.
+
+        Args:
+            files: Receives the files read
+        """
         config_file = self.config_dir / "phreakwall.conf"
 
         if not config_file.exists():
@@ -85,23 +459,25 @@ class Config:
 
         self.logger.debug(f"Loading main config: {config_file}")
 
-        with config_file.open() as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
+        for record in self.records(config_file, raw=True, files=files):
+            # Parse key=value
+            line = record.columns[0]
+            if "=" in line:
+                key, value = line.split("=", 1)
+                key = key.strip()
+                value = value.strip().strip('"').strip("'")
+                self.options.config[key] = value
 
-                # Skip comments and empty lines
-                if not line or line.startswith("#"):
-                    continue
+    def _load_params(self, files: Set[str]):
+        """
+        Load parameter definitions.
 
-                # Parse key=value
-                if "=" in line:
-                    key, value = line.split("=", 1)
-                    key = key.strip()
-                    value = value.strip().strip('"').strip("'")
-                    self.options.config[key] = value
+        Values are evaluated when first looked up, so params no
+        configuration file refers to are never expanded.
 
-    def _load_params(self):
-        """Load parameter definitions."""
+        Args:
+            files: Receives the files read
+        """
         params_file = self.config_dir / "params"
 
         if not params_file.exists():
@@ -109,17 +485,66 @@ class Config:
             return
 
         self.logger.debug(f"Loading params: {params_file}")
+        files.add(str(params_file))
+
+        try:
+            self.params = Params.load(params_file)
+        except (OSError, ParamsError) as e:
+            raise ConfigError(f"Error loading params: {e}")
+
+    def records(
+        self,
+        path: Path,
+        names: Tuple[str, ...] = (),
+        format: int = 1,
+        raw: bool = False,
+        conditions: Optional[Conditions] = None,
+        perl: Optional[Callable[[List[str]], None]] = None,
+        files: Optional[Set[str]] = None,
+    ) -> Iterator[Record]:
+        """
+        Tokenize a configuration file.
 
-        with params_file.open() as f:
-            for line in f:
-                line = line.strip()
+        Args:
+            path: File to read
+            names: Column names of the file
+            format: Format assumed until a ?FORMAT directive
+            raw: Yield each entry as one column
+            conditions: Evaluator to use; by default one over the params
+            perl: Receiver of embedded Perl blocks (optional)
+            files: Receives the files opened, for a caller caching what
+                it builds from them (default: files)
 
-                if not line or line.startswith("#"):
-                    continue
+        Returns:
+            Generator of Records
 
-                if "=" in line:
-                    key, value = line.split("=", 1)
-                    self.params[key.strip()] = value.strip()
+        Raises:
+            ConfigError: For malformed directives (while iterating)
+        """
+        if conditions is None:
+            conditions = Conditions(self.family, variables=self.params)
+        tokenizer = ConfigTokenizer(
+            self.config_dir, conditions, perl, self.files if files is None else files
+        )
+        records = tokenizer.records(path, names, format, raw)
+        if self.records_read is None:
+            return records
+        return self._count(records)
+
+    def _count(self, records: Iterator[Record]) -> Iterator[Record]:
+        """Count the records passing through in records_read."""
+        for record in records:
+            self.records_read += 1
+            yield record
+
+    def state(self) -> Tuple[Dict[str, Any], Params]:
+        """
+        Return the parsed settings and params for load(state).
+
+        Returns:
+            (settings, params)
+        """
+        return self.options.config, self.params
 
     def get(self, key: str, default: Any = None) -> Any:
         """
@@ -134,6 +559,20 @@ class Config:
         """
         return self.options.config.get(key, default)
 
+    def search_path(self) -> List[Path]:
+        """
+        Directories searched for macro and action files.
+
+        Returns:
+            The configuration directory followed by the CONFIG_PATH
+            directories, most specific first
+        """
+        directories = [self.config_dir]
+        config_path = self.get("CONFIG_PATH")
+        if config_path:
+            directories.extend(Path(d) for d in str(config_path).split(":") if d)
+        return directories
+
     def get_param(self, key: str, default: str = "") -> str:
         """
         Get a parameter value.
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Multiport Coalescing
+
+Merges runs of consecutive rules that differ only in their destination
+ports into ``-m multiport --dports`` rules. The nftables backend renders
+the port lists as anonymous sets.
+
+Overlapping and adjacent ports and ranges are merged and duplicates
+dropped. The ports of a run are then packed into groups within the
+multiport limit of 15 ports, where a range counts as two. Only
+consecutive rules with the same verdict are merged, so rule order and
+therefore the verdict for every packet stay the same.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from phreakwall.core.rule import Match, Rule
+
+# Ports a single multiport match may hold; a range takes two
+MAX_MULTIPORT = 15
+
+# Longest comment the comment match accepts
+MAX_COMMENT = 256
+
+PORT_PROTOCOLS = ("tcp", "udp", "sctp", "udplite", "dccp")
+
+# Options that cannot share the rule with the merged multiport match
+_CONFLICTS = ("--sports", "--ports", "--source-ports")
+
+_MULTIPORT = Match.get("-m", ("multiport",))
+
+# Port interval, inclusive
+Interval = Tuple[int, int]
+
+
+def merge_ports(intervals: Iterable[Interval]) -> List[Interval]:
+    """
+    Merge overlapping and adjacent port intervals.
+
+    Args:
+        intervals: (low, high) port intervals
+
+    Returns:
+        Sorted, disjoint intervals
+    """
+    merged: List[List[int]] = []
+    for low, high in sorted(intervals):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return [(low, high) for low, high in merged]
+
+
+def pack_ports(intervals: List[Interval], limit: int = MAX_MULTIPORT) -> List[List[str]]:
+    """
+    Pack port intervals into multiport groups.
+
+    Args:
+        intervals: Disjoint intervals from merge_ports()
+        limit: Ports per group, ranges counting as two
+
+    Returns:
+        Groups of port specifications ('22' or '1000:2000')
+    """
+    groups: List[List[str]] = []
+    used = limit
+    for low, high in intervals:
+        size = 1 if low == high else 2
+        if used + size > limit:
+            groups.append([])
+            used = 0
+        groups[-1].append(str(low) if low == high else f"{low}:{high}")
+        used += size
+    return groups
+
+
+def split_ports(ports: str, limit: int = MAX_MULTIPORT) -> List[str]:
+    """
+    Split a port list into lists that each fit one multiport match.
+
+    Args:
+        ports: Numeric port list, e.g. '22,80,1024:65535'
+        limit: Ports per match, ranges counting as two
+
+    Returns:
+        The list itself if it fits, otherwise its merged intervals
+        packed into as few lists as possible
+    """
+    items = ports.split(",")
+    if sum(2 if ":" in item else 1 for item in items) <= limit:
+        return [ports]
+
+    intervals = []
+    for item in items:
+        low, _, high = item.partition(":")
+        intervals.append((int(low), int(high or low)))
+    return [",".join(group) for group in pack_ports(merge_ports(intervals), limit)]
+
+
+class MultiportCompiler:
+    """Coalesces runs of rules differing only by destination port."""
+
+    def __init__(self, limit: int = MAX_MULTIPORT):
+        """
+        Initialize the multiport compiler.
+
+        Args:
+            limit: Ports per multiport match, ranges counting as two
+        """
+        self.limit = max(2, limit)
+        self._matches: Dict[Tuple[Match, ...], Optional[Tuple]] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def compile(self, chains: Iterable) -> int:
+        """
+        Coalesce the rules of the given chains.
+
+        Args:
+            chains: Chains whose rules are rewritten in place
+
+        Returns:
+            Number of rules eliminated
+        """
+        removed = 0
+        merged = 0
+        for chain in chains:
+            before = len(chain.rules)
+            chain.rules, runs = self._compile_chain(chain.rules)
+            removed += before - len(chain.rules)
+            merged += runs
+
+        if removed:
+            self.logger.info(
+                "Multiport coalescing: %d rules eliminated in %d runs", removed, merged
+            )
+        return removed
+
+    def _compile_chain(self, rules: List[Rule]) -> Tuple[List[Rule], int]:
+        """Coalesce one chain; returns the new rules and the runs merged."""
+        if len(rules) < 2:
+            return rules, 0
+
+        split = [self._split(rule) for rule in rules]
+        compiled: List[Rule] = []
+        runs = 0
+        index = 0
+        while index < len(rules):
+            if split[index] is None:
+                compiled.append(rules[index])
+                index += 1
+                continue
+
+            residual, position, _ = split[index]
+            comments = [rules[index].comment] if rules[index].comment else []
+            end = index + 1
+            while end < len(rules) and split[end] is not None and split[end][0] == residual:
+                comment = rules[end].comment
+                if comment and comment not in comments:
+                    if len(", ".join(comments + [comment])) >= MAX_COMMENT:
+                        break
+                    comments.append(comment)
+                end += 1
+
+            if end - index < 2:
+                compiled.append(rules[index])
+                index += 1
+                continue
+
+            intervals = merge_ports(
+                interval for i in range(index, end) for interval in split[i][2]
+            )
+            groups = pack_ports(intervals, self.limit)
+            if len(groups) < end - index:
+                comment = ", ".join(comments) or None
+                compiled.extend(
+                    self._rule(rules[index], residual[2], position, group, comment)
+                    for group in groups
+                )
+                runs += 1
+            else:
+                compiled.extend(rules[index:end])
+            index = end
+
+        return compiled, runs
+
+    def _split(self, rule: Rule) -> Optional[Tuple[Tuple, int, List[Interval]]]:
+        """
+        Split a rule into what must match across a run and its ports.
+
+        Returns:
+            (residual key, position of the port match, port intervals),
+            or None if the rule cannot be coalesced
+        """
+        split = self._matches.get(rule.matches, False)
+        if split is False:
+            split = self._matches[rule.matches] = self._split_matches(rule.matches)
+        if split is None:
+            return None
+        residual, position, intervals = split
+        return (rule.source, rule.destination, residual, rule.action), position, intervals
+
+    def _split_matches(
+        self, matches: Tuple[Match, ...]
+    ) -> Optional[Tuple[Tuple[Match, ...], int, List[Interval]]]:
+        """Split the matches of a rule; memoized since rules share them."""
+        protocol = ports = None
+        position = 0
+        residual = []
+        for match in matches:
+            option = match.option
+            if option == "-p":
+                protocol = match
+            elif option in ("--dport", "--dports") and ports is None:
+                ports = match
+                position = len(residual)
+                continue
+            elif option in _CONFLICTS:
+                return None
+            elif match == _MULTIPORT:
+                continue
+            residual.append(match)
+
+        if (
+            protocol is None
+            or protocol.negated
+            or protocol.value not in PORT_PROTOCOLS
+            or ports is None
+            or ports.negated
+        ):
+            return None
+
+        intervals = []
+        for item in ports.value.split(","):
+            low, _, high = item.partition(":")
+            if not low.isdigit() or (high and not high.isdigit()):
+                return None
+            intervals.append((int(low), int(high) if high else int(low)))
+        return tuple(residual), position, intervals
+
+    def _rule(
+        self, first: Rule, residual: Tuple, position: int, ports: List[str], comment
+    ) -> Rule:
+        """Build the rule matching one group of ports."""
+        if len(ports) == 1:
+            port_matches = (Match.get("--dport", (ports[0],)),)
+        else:
+            port_matches = (_MULTIPORT, Match.get("--dports", (",".join(ports),)))
+        matches = residual[:position] + port_matches + residual[position:]
+        return first.replace(matches=matches, comment=comment)
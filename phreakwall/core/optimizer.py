@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Chain Optimizer
+
+Multi-pass optimizer that shrinks the compiled chains before they are
+rendered by a backend. The passes follow Shorewall's OPTIMIZE levels:
+
+    0   Delete chains that nothing jumps to (always on)
+    1   Delete trailing rules that repeat the chain policy
+    4   Delete empty chains and inline single-rule chains
+    8   Merge chains with identical rules
+
+The level 0 pass runs whatever OPTIMIZE is set to. Chains opt out
+through their DONT_OPTIMIZE, DONT_DELETE and DONT_MOVE flags, which
+ChainManager users pass to create_chain() and phreakwall.conf sets
+for named chains. Passes repeat until none of them makes progress.
+
+Copyright (c) 2025 Phreakwall Contributors
+Based on Shorewall Chains.pm (c) 2007-2019 Tom Eastep
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from phreakwall.core.chains import DONT_DELETE, DONT_MOVE, DONT_OPTIMIZE, Chain
+from phreakwall.core.rule import Rule
+
+OPTIMIZE_POLICY = 1
+OPTIMIZE_SHORT = 4
+OPTIMIZE_DUPLICATE = 8
+OPTIMIZE_ALL = 31
+
+# Targets that end rule traversal for the packet
+TERMINAL_TARGETS = {"ACCEPT", "DROP", "REJECT", "DNAT", "SNAT", "MASQUERADE", "REDIRECT"}
+
+
+@dataclass
+class PassStats:
+    """Work done by one optimizer pass."""
+
+    name: str
+    rules: int = 0
+    jumps: int = 0
+
+
+def parse_level(value) -> int:
+    """
+    Parse an OPTIMIZE setting.
+
+    Args:
+        value: Integer level, or 'All'/'None' as in phreakwall.conf
+
+    Returns:
+        Optimization level bitmask
+    """
+    text = str(value).strip().lower()
+    if text in ("all", "yes"):
+        return OPTIMIZE_ALL
+    if text in ("", "none", "no"):
+        return 0
+    if not text.isdigit() or int(text) > OPTIMIZE_ALL:
+        raise ValueError(f"Invalid OPTIMIZE setting: {value}")
+    return int(text)
+
+
+def _conditional(rule: Rule) -> bool:
+    """True if the rule has any match."""
+    return bool(rule.source or rule.destination or rule.matches)
+
+
+class ChainOptimizer:
+    """Optimizes the chains of a ChainManager in place."""
+
+    def __init__(self, chain_manager):
+        """
+        Initialize the optimizer.
+
+        Args:
+            chain_manager: Chain manager whose chains are optimized
+        """
+        self.chain_manager = chain_manager
+        self.logger = logging.getLogger(__name__)
+
+    def optimize(self, level: int) -> List[PassStats]:
+        """
+        Run the optimizer passes enabled by level until nothing changes.
+
+        Args:
+            level: Optimization level bitmask
+
+        Returns:
+            Statistics for each pass
+        """
+        stats = {
+            "unreferenced": PassStats("unreferenced"),
+            "policy": PassStats("policy"),
+            "short": PassStats("short"),
+            "duplicate": PassStats("duplicate"),
+        }
+
+        passes = 0
+        progress = True
+        while progress:
+            passes += 1
+            progress = self._delete_unreferenced(stats["unreferenced"])
+            if level & OPTIMIZE_POLICY:
+                progress |= self._trim_policy_tails(stats["policy"])
+            if level & OPTIMIZE_SHORT:
+                progress |= self._optimize_short_chains(stats["short"])
+            if level & OPTIMIZE_DUPLICATE:
+                progress |= self._merge_duplicates(stats["duplicate"])
+
+        for pass_stats in stats.values():
+            if pass_stats.rules or pass_stats.jumps:
+                self.logger.info(
+                    "Optimizer %s pass: %d rules and %d jumps removed",
+                    pass_stats.name,
+                    pass_stats.rules,
+                    pass_stats.jumps,
+                )
+        self.logger.info("Optimization level %d completed in %d passes", level, passes)
+
+        return list(stats.values())
+
+    def _references(self) -> Dict[str, List[Tuple[Chain, int]]]:
+        """Map each chain name to the (chain, rule index) pairs jumping to it."""
+        references: Dict[str, List[Tuple[Chain, int]]] = {}
+        for chain in self.chain_manager.chains.values():
+            for index, rule in enumerate(chain.rules):
+                if rule.target:
+                    target_chain = self.chain_manager.get_chain(rule.target)
+                    if target_chain and target_chain.chain_type == chain.chain_type:
+                        references.setdefault(rule.target, []).append((chain, index))
+        return references
+
+    def _is_jump(self, rule: Rule) -> bool:
+        """True if rule jumps to another chain."""
+        return bool(rule.target) and self.chain_manager.get_chain(rule.target) is not None
+
+    def _delete_unreferenced(self, stats: PassStats) -> bool:
+        """Delete non-builtin chains that nothing jumps to."""
+        references = self._references()
+        progress = False
+
+        for chain in list(self.chain_manager.chains.values()):
+            if chain.builtin or chain.optflags & DONT_DELETE or chain.name in references:
+                continue
+
+            stats.rules += len(chain.rules)
+            stats.jumps += sum(1 for rule in chain.rules if self._is_jump(rule))
+            self.chain_manager.delete_chain(chain.name)
+            progress = True
+
+        return progress
+
+    def _trim_policy_tails(self, stats: PassStats) -> bool:
+        """Delete trailing rules whose verdict the chain reaches anyway."""
+        progress = False
+
+        for chain in self.chain_manager.chains.values():
+            if chain.optflags & DONT_OPTIMIZE or not chain.rules:
+                continue
+
+            if chain.builtin:
+                # Built-in chains fall through to their policy
+                verdict = (chain.policy, ())
+                keep_last = False
+            else:
+                last = chain.rules[-1]
+                if _conditional(last) or last.jump != "-j":
+                    continue
+                if last.target == "RETURN":
+                    # Falling off the end of a chain is an implicit RETURN
+                    chain.rules.pop()
+                    stats.rules += 1
+                    progress = True
+                    continue
+                if last.target not in TERMINAL_TARGETS:
+                    continue
+                verdict = (last.target, last.target_options)
+                keep_last = True
+
+            tail = chain.rules[:-1] if keep_last else chain.rules
+            removed = 0
+            while tail:
+                rule = tail[-1]
+                if rule.jump != "-j" or (rule.target, rule.target_options) != verdict:
+                    break
+                tail.pop()
+                removed += 1
+
+            if removed:
+                chain.rules = tail + chain.rules[-1:] if keep_last else tail
+                stats.rules += removed
+                progress = True
+
+        return progress
+
+    def _optimize_short_chains(self, stats: PassStats) -> bool:
+        """Bypass empty chains and inline chains with a single rule."""
+        references = self._references()
+        progress = False
+
+        for chain in list(self.chain_manager.chains.values()):
+            refs = references.get(chain.name)
+            if (
+                chain.builtin
+                or not refs
+                or chain.optflags & DONT_OPTIMIZE
+                or len(chain.rules) > 1
+                or any(caller.optflags & DONT_OPTIMIZE for caller, _ in refs)
+            ):
+                continue
+
+            if chain.rules:
+                if chain.optflags & DONT_MOVE:
+                    continue
+                inner = chain.rules[0]
+            else:
+                inner = Rule(target="RETURN")
+
+            for caller, index in refs:
+                outer = caller.rules[index]
+                if outer is None:
+                    continue
+                replacement = self._inline(outer, inner)
+                if replacement is False:
+                    continue
+
+                caller.rules[index] = replacement
+                stats.jumps += 1
+                progress = True
+
+        # Drop the no-op jumps, blanked above to keep rule indexes stable
+        for chain in self.chain_manager.chains.values():
+            if None in chain.rules:
+                before = len(chain.rules)
+                chain.rules = [rule for rule in chain.rules if rule is not None]
+                stats.rules += before - len(chain.rules)
+
+        return progress
+
+    def _inline(self, outer: Rule, inner: Rule):
+        """
+        Combine a jump with the single rule of its target chain.
+
+        Returns:
+            The replacement rule, None if the jump is a no-op, or False
+            if the two rules cannot be combined safely
+        """
+        terminal = inner.target in TERMINAL_TARGETS
+        conditional = _conditional(inner)
+
+        if inner.target == "RETURN":
+            # Jumping to a chain that only returns does nothing; a goto
+            # to it returns from the calling chain, which must be kept
+            return None if outer.jump == "-j" and not conditional else False
+
+        if outer.jump == "-g":
+            # A non-matching packet leaves a goto chain to the caller's
+            # caller, so only unconditional rules can move, and only if
+            # they end there too: a verdict, or a chain that returns there
+            if conditional:
+                return False
+            if terminal:
+                jump = "-j"
+            elif self.chain_manager.get_chain(inner.target):
+                jump = "-g"
+            else:
+                return False
+        else:
+            # A goto from the inner chain returns to the caller's caller
+            if inner.jump == "-g" and not terminal:
+                return False
+            jump = inner.jump
+
+        if outer.options() & inner.options():
+            return False
+
+        return Rule(
+            outer.matches + inner.matches,
+            inner.target,
+            jump,
+            source=outer.source or inner.source,
+            destination=outer.destination or inner.destination,
+            target_options=inner.target_options,
+            comment=outer.comment or inner.comment,
+        )
+
+    def _merge_duplicates(self, stats: PassStats) -> bool:
+        """Point jumps to identical chains at a single copy."""
+        references = self._references()
+        seen: Dict[Tuple, Chain] = {}
+        progress = False
+
+        for chain in list(self.chain_manager.chains.values()):
+            if chain.builtin or not chain.rules or chain.optflags & DONT_OPTIMIZE:
+                continue
+
+            key = (chain.chain_type, tuple(rule.key() for rule in chain.rules))
+            original = seen.setdefault(key, chain)
+            if original is chain or chain.optflags & DONT_DELETE:
+                continue
+
+            for caller, index in references.get(chain.name, []):
+                caller.rules[index] = caller.rules[index].replace(target=original.name)
+
+            stats.rules += len(chain.rules)
+            stats.jumps += sum(1 for rule in chain.rules if self._is_jump(rule))
+            self.chain_manager.delete_chain(chain.name)
+            progress = True
+
+        return progress
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Params Evaluation
+
+The params file is a shell script; Shorewall sourced it in a shell and
+read back the exported variables. Most params files only assign
+variables, so they are evaluated here in-process instead:
+
+    NAME=value  NAME='literal'  NAME="text $VAR ${VAR}"  export NAME=...
+    ${VAR:-default}  ${VAR-default}  ${VAR:+alternate}  ${VAR+alternate}
+    $(echo ...)  $(cat FILE)  $(hostname)  $(uname -n)  and `...`
+
+Assignments are parsed once and a value is only computed when something
+looks it up, so params no rule refers to are never evaluated. A file
+using anything beyond this subset (if, for, functions, pipes, other
+commands, ...) is sourced by /bin/sh once, as Shorewall did.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import logging
+import os
+import re
+import shlex
+import socket
+import subprocess
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+SHELL = "/bin/sh"
+
+# Seconds the shell fallback may take
+SHELL_TIMEOUT = 30
+
+_NAME_RE = re.compile(r"[A-Za-z_]\w*")
+_ASSIGNMENT_RE = re.compile(r"([A-Za-z_]\w*)=")
+
+# Variables every shell exports by itself
+_SHELL_VARIABLES = {"PWD", "OLDPWD", "SHLVL", "_"}
+
+# A value is a list of parts:
+#   ("lit", text)
+#   ("var", name, operator or None, default parts)
+#   ("cmd", [word parts, ...])
+Part = Tuple
+
+
+class Unsupported(Exception):
+    """Raised for shell syntax outside the supported subset."""
+
+    pass
+
+
+class ParamsError(Exception):
+    """Raised when the params file cannot be evaluated."""
+
+    pass
+
+
+@dataclass
+class Assignment:
+    """One NAME=value assignment of the params file."""
+
+    name: str
+    parts: List[Part]
+    line: int
+
+
+def _echo(args: List[str]) -> str:
+    if args and args[0] == "-n":
+        return " ".join(args[1:])
+    return " ".join(args) + "\n"
+
+
+def _cat(args: List[str]) -> str:
+    try:
+        return "".join(Path(arg).read_text() for arg in args)
+    except OSError as e:
+        raise ParamsError(f"cat: {e}") from None
+
+
+def _hostname(args: List[str]) -> str:
+    if args:
+        raise Unsupported("hostname with arguments")
+    return socket.gethostname() + "\n"
+
+
+def _uname(args: List[str]) -> str:
+    if args != ["-n"]:
+        raise Unsupported("uname without -n")
+    return socket.gethostname() + "\n"
+
+
+# Commands allowed in $(...), run in-process
+COMMANDS: Dict[str, Callable[[List[str]], str]] = {
+    "echo": _echo,
+    "cat": _cat,
+    "hostname": _hostname,
+    "uname": _uname,
+}
+
+
+class _Parser:
+    """Parser for the supported shell subset."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        self.line = 1
+
+    def peek(self, offset: int = 0) -> str:
+        pos = self.pos + offset
+        return self.text[pos] if pos < len(self.text) else ""
+
+    def advance(self, count: int = 1) -> str:
+        chunk = self.text[self.pos : self.pos + count]
+        self.pos += count
+        self.line += chunk.count("\n")
+        return chunk
+
+    def statements(self) -> Iterator[Tuple[int, List[List[Part]]]]:
+        """Yield (line, words) per simple command."""
+        while True:
+            self._blank()
+            if self.pos >= len(self.text):
+                return
+            line = self.line
+            words = []
+            while True:
+                while self.peek() in (" ", "\t"):
+                    self.advance()
+                if self.peek() == "\\" and self.peek(1) == "\n":
+                    self.advance(2)
+                    continue
+                char = self.peek()
+                if char in ("", "\n", ";", "#"):
+                    break
+                if char in "|&<>(){}":
+                    raise Unsupported(f"'{char}'")
+                words.append(self.word())
+            if char == ";":
+                self.advance()
+            if words:
+                yield line, words
+
+    def _blank(self):
+        """Skip blank lines and comments."""
+        while self.pos < len(self.text):
+            char = self.peek()
+            if char in " \t\n;":
+                self.advance()
+            elif char == "#":
+                while self.peek() not in ("", "\n"):
+                    self.advance()
+            else:
+                return
+
+    def word(self, stop: str = "") -> List[Part]:
+        """Parse one word up to unquoted whitespace (or a stop character)."""
+        parts: List[Part] = []
+        while True:
+            char = self.peek()
+            if char == "" or char in " \t\n;|&<>()" or (stop and char in stop):
+                return parts
+            if char == "\\":
+                self.advance()
+                escaped = self.advance()
+                if escaped != "\n":
+                    parts.append(("lit", escaped))
+            elif char == "'":
+                self.advance()
+                end = self.text.find("'", self.pos)
+                if end < 0:
+                    raise ParamsError(f"line {self.line}: unterminated quote")
+                parts.append(("lit", self.advance(end - self.pos)))
+                self.advance()
+            elif char == '"':
+                self.advance()
+                parts.extend(self._double_quoted())
+            elif char in "$`":
+                parts.append(self._expansion())
+            elif char in "*?[~":
+                raise Unsupported(f"unquoted '{char}'")
+            else:
+                start = self.pos
+                while self.peek() and self.peek() not in " \t\n;|&<>()\\'\"$`*?[~" and not (
+                    stop and self.peek() in stop
+                ):
+                    self.advance()
+                parts.append(("lit", self.text[start : self.pos]))
+
+    def _double_quoted(self) -> List[Part]:
+        parts: List[Part] = []
+        while True:
+            char = self.peek()
+            if char == "":
+                raise ParamsError(f"line {self.line}: unterminated quote")
+            if char == '"':
+                self.advance()
+                return parts
+            if char == "\\" and self.peek(1) in '$`"\\\n':
+                self.advance()
+                escaped = self.advance()
+                if escaped != "\n":
+                    parts.append(("lit", escaped))
+            elif char in "$`":
+                parts.append(self._expansion())
+            else:
+                parts.append(("lit", self.advance()))
+
+    def _expansion(self) -> Part:
+        """Parse $NAME, ${NAME...}, $(...) or `...`."""
+        if self.advance() == "`":
+            end = self.text.find("`", self.pos)
+            if end < 0:
+                raise ParamsError(f"line {self.line}: unterminated command substitution")
+            return self._command(self.advance(end - self.pos), skip=1)
+
+        char = self.peek()
+        if char == "(":
+            if self.peek(1) == "(":
+                raise Unsupported("arithmetic expansion")
+            self.advance()
+            depth, start = 1, self.pos
+            while depth:
+                char = self.advance()
+                if char == "":
+                    raise ParamsError(f"line {self.line}: unterminated command substitution")
+                depth += {"(": 1, ")": -1}.get(char, 0)
+            return self._command(self.text[start : self.pos - 1])
+
+        if char == "{":
+            self.advance()
+            match = _NAME_RE.match(self.text, self.pos)
+            if not match:
+                raise Unsupported("special parameter expansion")
+            name = match.group(0)
+            self.advance(len(name))
+            operator = None
+            for candidate in (":-", ":+", "-", "+"):
+                if self.text.startswith(candidate, self.pos):
+                    operator = candidate
+                    self.advance(len(candidate))
+                    break
+            default = self.word(stop="}") if operator else []
+            if self.advance() != "}":
+                raise Unsupported(f"${{{name}...}} expansion")
+            return ("var", name, operator, default)
+
+        match = _NAME_RE.match(self.text, self.pos)
+        if not match:
+            if char and char not in " \t\n\"":
+                raise Unsupported(f"special parameter ${char}")
+            return ("lit", "$")
+        self.advance(len(match.group(0)))
+        return ("var", match.group(0), None, [])
+
+    def _command(self, text: str, skip: int = 0) -> Part:
+        """Parse the words of an allowed command substitution."""
+        self.advance(skip)
+        inner = _Parser(text)
+        statements = list(inner.statements())
+        if len(statements) != 1:
+            raise Unsupported("compound command substitution")
+        words = statements[0][1]
+        name = words[0]
+        if len(name) != 1 or name[0][0] != "lit" or name[0][1] not in COMMANDS:
+            raise Unsupported(f"command substitution $({text.strip()})")
+        return ("cmd", words)
+
+
+def parse(text: str) -> List[Assignment]:
+    """
+    Parse a params file into assignments.
+
+    Args:
+        text: File contents
+
+    Returns:
+        Assignments in file order
+
+    Raises:
+        Unsupported: For syntax outside the supported subset
+        ParamsError: For malformed input
+    """
+    assignments = []
+    for line, words in _Parser(text).statements():
+        first = words[0]
+        literal = first[0][1] if first and first[0][0] == "lit" else ""
+        if literal in ("export", "readonly") and len(first) == 1:
+            words = words[1:]
+        elif literal == "set" and len(first) == 1 and all(
+            len(w) == 1 and w[0][0] == "lit" and w[0][1] in ("-a", "+a") for w in words[1:]
+        ):
+            continue
+
+        for word in words:
+            if not word or word[0][0] != "lit":
+                raise Unsupported(f"line {line}: command")
+            match = _ASSIGNMENT_RE.match(word[0][1])
+            if not match:
+                if literal in ("export", "readonly") and _NAME_RE.fullmatch(word[0][1]):
+                    # 'export NAME': params are exported anyway
+                    continue
+                raise Unsupported(f"line {line}: command '{word[0][1]}'")
+            rest = word[0][1][match.end() :]
+            parts = ([("lit", rest)] if rest else []) + word[1:]
+            assignments.append(Assignment(match.group(1), parts, line))
+    return assignments
+
+
+class Params(MutableMapping):
+    """
+    Params as a lazily evaluated mapping.
+
+    A value is computed on first lookup from the last assignment of its
+    name, whose references in turn resolve to the assignments preceding
+    it, exactly as sequential shell evaluation would.
+    """
+
+    def __init__(
+        self,
+        assignments: Optional[List[Assignment]] = None,
+        environment: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Initialize the params.
+
+        Args:
+            assignments: Parsed assignments in file order
+            environment: Values of names the file does not assign
+                (defaults to the process environment)
+        """
+        self.assignments: List[Assignment] = list(assignments or [])
+        self.environment = environment
+        self._index: Dict[str, List[int]] = {}
+        for index, assignment in enumerate(self.assignments):
+            self._index.setdefault(assignment.name, []).append(index)
+        self._values: Dict[int, str] = {}
+
+    @classmethod
+    def load(cls, path: Path, environment: Optional[Dict[str, str]] = None) -> "Params":
+        """
+        Load a params file, in-process when possible.
+
+        Args:
+            path: params file
+            environment: Environment for unassigned names and the shell
+
+        Returns:
+            Params
+
+        Raises:
+            ParamsError: If the file cannot be evaluated
+        """
+        logger = logging.getLogger(__name__)
+        text = Path(path).read_text()
+        try:
+            params = cls(parse(text), environment)
+            logger.debug(f"{path}: {len(params.assignments)} assignments parsed")
+            return params
+        except Unsupported as e:
+            logger.info(f"{path}: {e} is not supported in-process, using {SHELL}")
+        return cls.from_shell(path, environment)
+
+    @classmethod
+    def from_shell(
+        cls, path: Path, environment: Optional[Dict[str, str]] = None
+    ) -> "Params":
+        """
+        Source a params file in a shell and collect what it exports.
+
+        Args:
+            path: params file
+            environment: Environment of the shell (defaults to ours)
+
+        Returns:
+            Params holding the exported values
+
+        Raises:
+            ParamsError: If the shell fails
+        """
+        env = dict(os.environ if environment is None else environment)
+        try:
+            result = subprocess.run(
+                [SHELL, "-c", 'set -a; . "$1" >&2; set +a; export -p', "sh", str(path)],
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=SHELL_TIMEOUT,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise ParamsError(f"{path}: {e}") from None
+        if result.returncode != 0:
+            raise ParamsError(f"{path}: {result.stderr.strip() or 'shell failed'}")
+
+        assignments = []
+        for token in shlex.split(result.stdout):
+            match = _ASSIGNMENT_RE.match(token)
+            if not match:
+                continue
+            name, value = match.group(1), token[match.end() :]
+            if name in _SHELL_VARIABLES or env.get(name) == value:
+                continue
+            assignments.append(Assignment(name, [("lit", value)], 0))
+        return cls(assignments, environment)
+
+    def __getstate__(self):
+        # Command substitutions are evaluated again after unpickling
+        state = self.__dict__.copy()
+        state["_values"] = {}
+        return state
+
+    def __getitem__(self, name: str) -> str:
+        indexes = self._index.get(name)
+        if not indexes:
+            raise KeyError(name)
+        return self._value(indexes[-1])
+
+    def __setitem__(self, name: str, value: str):
+        self._index.setdefault(name, []).append(len(self.assignments))
+        self.assignments.append(Assignment(name, [("lit", value)], 0))
+
+    def __delitem__(self, name: str):
+        for index in self._index.pop(name):
+            self.assignments[index] = Assignment("", [], 0)
+            self._values.pop(index, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, name) -> bool:
+        return name in self._index
+
+    def _value(self, index: int) -> str:
+        value = self._values.get(index)
+        if value is None:
+            value = self._values[index] = self._evaluate(self.assignments[index].parts, index)
+        return value
+
+    def _lookup(self, name: str, before: int) -> Optional[str]:
+        """Value of a name as of the assignment at 'before'; None if unset."""
+        indexes = self._index.get(name)
+        if indexes:
+            position = bisect_left(indexes, before)
+            if position:
+                return self._value(indexes[position - 1])
+        environment = os.environ if self.environment is None else self.environment
+        return environment.get(name)
+
+    def _evaluate(self, parts: List[Part], index: int) -> str:
+        text = []
+        for part in parts:
+            kind = part[0]
+            if kind == "lit":
+                text.append(part[1])
+            elif kind == "var":
+                _, name, operator, default = part
+                value = self._lookup(name, index)
+                if operator == ":-" and not value or operator == "-" and value is None:
+                    value = self._evaluate(default, index)
+                elif operator == ":+":
+                    value = self._evaluate(default, index) if value else ""
+                elif operator == "+":
+                    value = self._evaluate(default, index) if value is not None else ""
+                text.append(value or "")
+            else:
+                words = [self._evaluate(word, index) for word in part[1]]
+                output = COMMANDS[words[0]](words[1:])
+                text.append(output.rstrip("\n"))
+        return "".join(text)
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Compile Profiler
+
+Records where a compile spends its time and memory. The compiler wraps
+each of its phases (configuration, zones, NAT, rules, optimization,
+rendering, writing) in Profiler.phase(), which records wall and CPU
+time, the tracemalloc peak and the records, rules and lines the phase
+consumed and produced.
+
+Phases nest: a phase's times exclude those of the phases run inside
+it, so the rows add up to the total. Rendering is interleaved with
+writing since the script is streamed; Profiler.iterate() charges the
+time spent producing each line to the rendering phase.
+
+The compiler only creates a profiler for --profile, so a normal compile
+pays nothing for it.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+
+@dataclass
+class PhaseStats:
+    """Measurements of one compile phase, summed over its runs."""
+
+    name: str
+    calls: int = 0
+    wall: float = 0.0  # Seconds, excluding nested phases
+    cpu: float = 0.0  # Seconds, excluding nested phases
+    peak: int = 0  # Highest traced memory while running, in bytes
+    records: int = 0  # Configuration records read, excluding nested phases
+    rules_in: Optional[int] = None  # Rules in the chains before the first run
+    rules_out: Optional[int] = None  # Rules in the chains after the last run
+    lines: int = 0  # Script lines produced or written
+
+
+@dataclass
+class _Frame:
+    """A running phase."""
+
+    stats: PhaseStats
+    wall: float
+    cpu: float
+    peak: int
+    records: int
+    nested_wall: float = 0.0
+    nested_cpu: float = 0.0
+    nested_records: int = 0
+
+
+class Profiler:
+    """Collects per-phase statistics of a compile."""
+
+    def __init__(
+        self,
+        rules: Optional[Callable[[], int]] = None,
+        records: Optional[Callable[[], int]] = None,
+        trace_memory: bool = True,
+    ):
+        """
+        Initialize the profiler.
+
+        Args:
+            rules: Returns the number of rules currently in the chains
+            records: Returns the number of configuration records read so far
+            trace_memory: Record tracemalloc peaks; tracing slows the
+                compile down, which inflates the times
+        """
+        self.rules = rules
+        self.records = records
+        self.trace_memory = trace_memory
+        self.phases: Dict[str, PhaseStats] = {}
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+        self.logger = logging.getLogger(__name__)
+
+        self._stack: List[_Frame] = []
+        self._running: Dict[str, PhaseStats] = {}
+        self._started = None
+        self._tracing = False
+
+    def start(self):
+        """Start measuring; phases outside start()/stop() are still timed."""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self._started = (time.perf_counter(), time.process_time())
+
+    def stop(self):
+        """Stop measuring and record the totals."""
+        if self._started is None:
+            return
+        wall, cpu = self._started
+        self.wall += time.perf_counter() - wall
+        self.cpu += time.process_time() - cpu
+        if tracemalloc.is_tracing():
+            # Phases reset the tracemalloc peak; their own peaks count too
+            self.peak = max(
+                [self.peak, tracemalloc.get_traced_memory()[1]]
+                + [stats.peak for stats in self.phases.values()]
+            )
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        self._started = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[PhaseStats]:
+        """
+        Measure a phase.
+
+        Args:
+            name: Phase name; repeated runs are summed
+
+        Yields:
+            The phase's statistics, for the caller to add counts to
+        """
+        stats = self._stats(name)
+        self._enter(stats)
+        try:
+            yield stats
+        finally:
+            self._exit()
+            if self.rules:
+                stats.rules_out = self.rules()
+
+    def iterate(self, name: str, lines: Iterable[str]) -> Iterator[str]:
+        """
+        Charge the production of lines to a phase.
+
+        Args:
+            name: Phase name
+            lines: Lines generated lazily, e.g. by a backend
+
+        Yields:
+            The lines, unchanged
+        """
+        stats = self._stats(name)
+        iterator = iter(lines)
+        while True:
+            self._enter(stats)
+            try:
+                line = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                # One run covers all the lines
+                self._exit(run=False)
+            stats.lines += 1
+            yield line
+
+        stats.calls += 1
+        if self.rules:
+            stats.rules_out = self.rules()
+
+    def _stats(self, name: str) -> PhaseStats:
+        """Return the statistics of a phase, creating them on its first run."""
+        stats = self.phases.get(name) or self._running.get(name)
+        if stats is None:
+            stats = self._running[name] = PhaseStats(name)
+            if self.rules:
+                stats.rules_in = self.rules()
+        return stats
+
+    def _enter(self, stats: PhaseStats):
+        """Push a frame for a phase run."""
+        current = 0
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak is reset for the nested phase; keep the outer one's
+            if self._stack:
+                self._stack[-1].peak = max(self._stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+        records = self.records() if self.records else 0
+        self._stack.append(
+            _Frame(stats, time.perf_counter(), time.process_time(), current, records)
+        )
+
+    def _exit(self, run: bool = True):
+        """
+        Pop the frame of the innermost phase run.
+
+        Args:
+            run: Count the frame as a run of the phase
+        """
+        frame = self._stack.pop()
+        wall = time.perf_counter() - frame.wall
+        cpu = time.process_time() - frame.cpu
+        records = self.records() - frame.records if self.records else 0
+        peak = frame.peak
+        if tracemalloc.is_tracing():
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+
+        # Phases are listed in the order they first finish, so nested
+        # phases come before the phase they ran in
+        stats = frame.stats
+        if stats.name not in self.phases:
+            self.phases[stats.name] = self._running.pop(stats.name)
+        stats.calls += run
+        stats.wall += wall - frame.nested_wall
+        stats.cpu += cpu - frame.nested_cpu
+        stats.records += records - frame.nested_records
+        stats.peak = max(stats.peak, peak)
+
+        if self._stack:
+            parent = self._stack[-1]
+            parent.nested_wall += wall
+            parent.nested_cpu += cpu
+            parent.nested_records += records
+            parent.peak = max(parent.peak, peak)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Return the profile as JSON-serializable data.
+
+        Returns:
+            Totals and the phases in the order they first ran
+        """
+        return {
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "peak": self.peak if self.trace_memory else None,
+            "phases": [asdict(stats) for stats in self.phases.values()],
+        }
+
+    def write_json(self, path: Path, **extra: Any):
+        """
+        Write the profile as JSON.
+
+        Args:
+            path: Output file
+            extra: Additional top-level fields, e.g. the IP family
+        """
+        data = dict(extra, **self.to_dict())
+        Path(path).write_text(json.dumps(data, indent=2) + "\n")
+        self.logger.info("Profile written to: %s", path)
+
+    def table(self) -> str:
+        """
+        Format the profile as a table.
+
+        Returns:
+            Table text
+        """
+
+        def count(value: Optional[int]) -> str:
+            return "-" if value is None else str(value)
+
+        def megabytes(value: int) -> str:
+            return f"{value / 1048576:.1f}" if self.trace_memory else "-"
+
+        header = (
+            "Phase",
+            "Calls",
+            "Wall ms",
+            "CPU ms",
+            "Peak MB",
+            "Records",
+            "Rules in",
+            "Rules out",
+            "Lines",
+        )
+        rows = [
+            (
+                stats.name,
+                str(stats.calls),
+                f"{stats.wall * 1000:.1f}",
+                f"{stats.cpu * 1000:.1f}",
+                megabytes(stats.peak),
+                str(stats.records),
+                count(stats.rules_in),
+                count(stats.rules_out),
+                str(stats.lines),
+            )
+            for stats in self.phases.values()
+        ]
+        rows.append(
+            (
+                "total",
+                "",
+                f"{self.wall * 1000:.1f}",
+                f"{self.cpu * 1000:.1f}",
+                megabytes(self.peak),
+                str(sum(stats.records for stats in self.phases.values())),
+                "",
+                "",
+                "",
+            )
+        )
+
+        rows.insert(0, header)
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        lines = []
+        for index, row in enumerate(rows):
+            if index in (1, len(rows) - 1):
+                lines.append("  ".join("-" * width for width in widths))
+            lines.append(
+                "  ".join(
+                    cell.ljust(width) if column == 0 else cell.rjust(width)
+                    for column, (cell, width) in enumerate(zip(row, widths))
+                ).rstrip()
+            )
+        if self.trace_memory:
+            lines.append("")
+            lines.append("Times include the overhead of tracing allocations.")
+        return "\n".join(lines)
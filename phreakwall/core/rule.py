@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Rule Representation
+
+Typed, compact representation of a single chain rule.
+
+Rules are stored as a handful of slots instead of opaque strings so
+optimizers and backends can inspect and rewrite them without parsing
+text. Inside an interning() block, match fragments and match tuples
+are interned: the same ``-p tcp`` or ``-m conntrack --ctstate NEW``
+object is shared by every rule that uses it, so a large ruleset mostly
+costs one Rule object and its source/destination strings per rule. The
+tables belong to the block (one compile), so a long-running process
+does not accumulate the fragments of every ruleset it ever built.
+Outside a block, rules are built without sharing; equality never
+depends on it.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import re
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+_TOKEN_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|\'([^\']*)\'|(\S+)')
+_QUOTE_RE = re.compile(r'[\s"\'\\;$`]')
+_ESCAPE_RE = re.compile(r'[\\"$`]')
+_UNESCAPE_RE = re.compile(r"\\(.)")
+
+# Option aliases normalized on parse
+_ALIASES = {
+    "--source": "-s",
+    "--src": "-s",
+    "--destination": "-d",
+    "--dst": "-d",
+    "--protocol": "-p",
+    "--in-interface": "-i",
+    "--out-interface": "-o",
+    "--match": "-m",
+    "--jump": "-j",
+    "--goto": "-g",
+}
+
+
+def _tokenize(text: str) -> List[Tuple[str, bool]]:
+    """Split rule text into (token, quoted) pairs, honoring quotes."""
+    if '"' not in text and "'" not in text:
+        return [(token, False) for token in text.split()]
+
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        if match.group(1) is not None:
+            tokens.append((_UNESCAPE_RE.sub(r"\1", match.group(1)), True))
+        elif match.group(2) is not None:
+            tokens.append((match.group(2), True))
+        else:
+            tokens.append((match.group(3), False))
+    return tokens
+
+
+def _is_option(token: Tuple[str, bool]) -> bool:
+    """True for an unquoted option name such as '-p' or '--dport'."""
+    text, quoted = token
+    return not quoted and len(text) > 1 and text[0] == "-" and not text[1].isdigit()
+
+
+def quote(value: str) -> str:
+    """Quote an option argument for iptables-restore and the shell.
+
+    Both parse the result the same way: words with '$' or '`' are single
+    quoted so the shell does not expand them, unless they also hold a quote
+    or backslash; everything else is double quoted with backslash escapes.
+    """
+    if value and not _QUOTE_RE.search(value):
+        return value
+    if ("$" in value or "`" in value) and "'" not in value and "\\" not in value:
+        return "'" + value + "'"
+    return '"' + _ESCAPE_RE.sub(r"\\\g<0>", value) + '"'
+
+
+class InternTable:
+    """Shared match fragments, match tuples and actions of one compile."""
+
+    __slots__ = ("matches", "match_tuples", "actions")
+
+    def __init__(self):
+        self.matches: Dict[Tuple, "Match"] = {}
+        self.match_tuples: Dict[Tuple["Match", ...], Tuple["Match", ...]] = {}
+        self.actions: Dict[Tuple, Tuple] = {}
+
+
+# Table of the innermost interning() block; per thread, like the compiles
+_table: ContextVar[Optional[InternTable]] = ContextVar("intern_table", default=None)
+
+
+@contextmanager
+def interning() -> Iterator[InternTable]:
+    """
+    Share match fragments between the rules built in a block.
+
+    The table is dropped when the outermost block ends; rules keep the
+    objects they use. Nested blocks share the outer table.
+
+    Yields:
+        The intern table of the block
+    """
+    table = _table.get()
+    if table is not None:
+        yield table
+        return
+    token = _table.set(InternTable())
+    try:
+        yield _table.get()
+    finally:
+        _table.reset(token)
+
+
+class Match:
+    """
+    One match fragment such as ``-p tcp`` or ``! --dport 22``.
+
+    Create instances with Match.get(), which interns them.
+    """
+
+    __slots__ = ("option", "args", "negated", "_hash")
+
+    def __init__(self, option: str, args: Tuple[str, ...] = (), negated: bool = False):
+        self.option = option
+        self.args = args
+        self.negated = negated
+        # Rules and match tuples are dict keys; hash each fragment once
+        self._hash = hash((option, args, negated))
+
+    @classmethod
+    def get(cls, option: str, args: Tuple[str, ...] = (), negated: bool = False) -> "Match":
+        """
+        Return the match fragment, interned inside an interning() block.
+
+        Args:
+            option: Option name, e.g. '-p' or '--dport'
+            args: Option arguments
+            negated: True for a '!' match
+
+        Returns:
+            Match instance, shared within the block
+        """
+        table = _table.get()
+        if table is None:
+            return cls(option, args, negated)
+
+        key = (option, args, negated)
+        match = table.matches.get(key)
+        if match is None:
+            match = cls(
+                sys.intern(option), tuple(sys.intern(arg) for arg in args), negated
+            )
+            table.matches[key] = match
+        return match
+
+    @property
+    def value(self) -> str:
+        """The option arguments as one string."""
+        return " ".join(self.args)
+
+    def tokens(self) -> List[str]:
+        """The fragment as unquoted tokens."""
+        return (["!"] if self.negated else []) + [self.option, *self.args]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Match):
+            return NotImplemented
+        return (
+            self.option == other.option
+            and self.args == other.args
+            and self.negated == other.negated
+        )
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __reduce__(self):
+        # Unpickled fragments are interned like freshly parsed ones
+        return Match.get, (self.option, self.args, self.negated)
+
+    def __str__(self) -> str:
+        prefix = "! " if self.negated else ""
+        return prefix + " ".join([self.option, *(quote(arg) for arg in self.args)])
+
+    def __repr__(self) -> str:
+        return f"Match({str(self)!r})"
+
+
+def intern_matches(matches) -> Tuple[Match, ...]:
+    """Return the shared tuple for a sequence of interned matches."""
+    matches = tuple(matches)
+    table = _table.get()
+    if table is None:
+        return matches
+    return table.match_tuples.setdefault(matches, matches)
+
+
+class Rule:
+    """
+    A single chain rule.
+
+    Source and destination addresses get slots of their own since they
+    are what usually differs between otherwise identical rules; all
+    other matches live in an interned tuple, and the jump, target and
+    target options share one interned action tuple. A negated address
+    is stored with a leading '!'.
+    """
+
+    __slots__ = ("source", "destination", "matches", "action", "comment", "counters")
+
+    FIELDS = (
+        "matches",
+        "target",
+        "jump",
+        "source",
+        "destination",
+        "target_options",
+        "comment",
+        "counters",
+    )
+
+    def __init__(
+        self,
+        matches=(),
+        target: str = "",
+        jump: str = "-j",
+        source: Optional[str] = None,
+        destination: Optional[str] = None,
+        target_options=(),
+        comment: Optional[str] = None,
+        counters: Optional[Tuple[int, int]] = None,
+    ):
+        """
+        Initialize a rule.
+
+        Args:
+            matches: Match fragments other than source/destination
+            target: Target name (chain, ACCEPT, DROP, ...); '' for none
+            jump: '-j' or '-g'
+            source: Source address ('!' prefix negates)
+            destination: Destination address ('!' prefix negates)
+            target_options: Target option fragments
+            comment: Rule comment
+            counters: (packets, bytes) counters
+        """
+        self.source = sys.intern(source) if source else None
+        self.destination = sys.intern(destination) if destination else None
+        self.matches = intern_matches(matches)
+        action = (
+            sys.intern(jump) if target else "",
+            sys.intern(target),
+            intern_matches(target_options),
+        )
+        table = _table.get()
+        self.action = table.actions.setdefault(action, action) if table else action
+        self.comment = sys.intern(comment) if comment else None
+        self.counters = counters
+
+    @classmethod
+    def parse(cls, text: str) -> "Rule":
+        """
+        Parse an iptables rule specification.
+
+        Args:
+            text: Rule text, e.g. '-s 10.0.0.1 -p tcp --dport 22 -j ACCEPT',
+                optionally preceded by iptables-save '[packets:bytes]'
+
+        Returns:
+            Parsed rule
+        """
+        counters = None
+        text = text.strip()
+        if text.startswith("["):
+            packets, _, rest = text[1:].partition("]")
+            packets, _, nbytes = packets.partition(":")
+            counters = (int(packets), int(nbytes))
+            text = rest.strip()
+
+        tokens = _tokenize(text)
+
+        fields: Dict = {"source": None, "destination": None, "comment": None}
+        matches: List[Match] = []
+        target_options: List[Match] = []
+        target = ""
+        jump = "-j"
+        current = matches
+        negate = False
+
+        index = 0
+        while index < len(tokens):
+            token, quoted = tokens[index]
+            index += 1
+
+            if token == "!" and not quoted:
+                negate = True
+                continue
+
+            option = _ALIASES.get(token, token)
+            args: List[str] = []
+            while index < len(tokens) and not _is_option(tokens[index]):
+                arg, quoted = tokens[index]
+                if arg == "!" and not quoted:
+                    if args:
+                        break
+                    negate = True  # Old 'option ! value' syntax
+                else:
+                    args.append(arg)
+                index += 1
+
+            if option in ("-j", "-g"):
+                jump = option
+                target = args[0] if args else ""
+                current = target_options
+            elif option in ("-s", "-d") and current is matches:
+                key = "source" if option == "-s" else "destination"
+                fields[key] = ("!" if negate else "") + " ".join(args)
+            elif option == "-m" and args == ["comment"]:
+                pass
+            elif option == "--comment":
+                fields["comment"] = " ".join(args)
+            else:
+                current.append(Match.get(option, tuple(args), negate))
+
+            negate = False
+
+        return cls(
+            matches,
+            target,
+            jump,
+            target_options=target_options,
+            counters=counters,
+            **fields,
+        )
+
+    @property
+    def jump(self) -> str:
+        """'-j', '-g', or '' for a rule without target."""
+        return self.action[0]
+
+    @property
+    def target(self) -> str:
+        """Target name; '' for a rule without target."""
+        return self.action[1]
+
+    @property
+    def target_options(self) -> Tuple[Match, ...]:
+        """Target option fragments."""
+        return self.action[2]
+
+    def match_fragments(self) -> Iterator[Match]:
+        """Iterate over all match fragments including addresses."""
+        for option, address in (("-s", self.source), ("-d", self.destination)):
+            if address:
+                negated = address.startswith("!")
+                yield Match.get(option, (address.lstrip("!"),), negated)
+        yield from self.matches
+
+    def options(self) -> Set[str]:
+        """Option names used by the rule's matches (module loads excluded)."""
+        return {m.option for m in self.match_fragments() if m.option != "-m"}
+
+    def get(self, option: str) -> Optional[Match]:
+        """
+        Find a match fragment by option name.
+
+        Args:
+            option: Option name, e.g. '--dport'
+
+        Returns:
+            The first matching fragment or None
+        """
+        for match in self.match_fragments():
+            if match.option == option:
+                return match
+        return None
+
+    def tokens(self) -> List[str]:
+        """The rule as unquoted tokens (comment included)."""
+        tokens: List[str] = []
+        for match in self.match_fragments():
+            tokens.extend(match.tokens())
+        if self.comment:
+            tokens.extend(["-m", "comment", "--comment", self.comment])
+        if self.target:
+            tokens.extend([self.jump, self.target])
+            for match in self.target_options:
+                tokens.extend(match.tokens())
+        return tokens
+
+    def render(self) -> str:
+        """Render the rule as an iptables rule specification."""
+        parts = [str(match) for match in self.match_fragments()]
+        if self.comment:
+            parts.append(f"-m comment --comment {quote(self.comment)}")
+        if self.target:
+            parts.append(f"{self.jump} {self.target}")
+            parts.extend(str(match) for match in self.target_options)
+        return " ".join(parts)
+
+    def replace(self, **changes) -> "Rule":
+        """Return a copy of the rule with the given fields changed."""
+        fields = {name: getattr(self, name) for name in self.FIELDS}
+        fields.update(changes)
+        return Rule(**fields)
+
+    def key(self) -> Tuple:
+        """Identity of the rule, ignoring counters."""
+        return (self.source, self.destination, self.matches, self.action, self.comment)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Rule):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
+    def __reduce__(self):
+        return Rule, tuple(getattr(self, name) for name in self.FIELDS)
+
+    def __str__(self) -> str:
+        return self.render()
+
+    def __repr__(self) -> str:
+        return f"Rule({self.render()!r})"
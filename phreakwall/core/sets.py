@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Set Compilation
+
+Collapses runs of rules that differ only in their source address,
+destination address or destination port into a single rule matching a
+generated set. A chain walking hundreds of allowlist rules per packet
+then does one hash (ipset) or interval (nftables) lookup instead.
+
+Only consecutive rules are merged, so rule order and therefore the
+verdict for every packet stay the same.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import hashlib
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from phreakwall.core.addresses import AddressError, collapse
+from phreakwall.core.rule import Match, Rule
+
+# Smallest run worth a set; shorter runs stay linear
+MIN_SET_SIZE = 4
+
+# ipset names are limited to 31 characters; leave room for '-new'
+MAX_NAME_LENGTH = 26
+
+_ADDRESS_RE = re.compile(r"^[0-9A-Fa-f.:]+(/\d+)?$")
+_PORT_RE = re.compile(r"^\d+(:\d+)?$")
+
+PORT_PROTOCOLS = ("tcp", "udp", "sctp", "udplite", "dccp", "6", "17", "132")
+
+# Set kinds (the rule field a set replaces) and their set name suffixes
+KINDS = {"src": "s", "dst": "d", "dport": "p"}
+
+
+@dataclass
+class IpSet:
+    """A generated address or port set."""
+
+    name: str
+    kind: str  # 'net' or 'port'
+    family: int = 4
+    entries: List[str] = field(default_factory=list)
+
+    @property
+    def ipset_type(self) -> str:
+        """ipset type specification."""
+        if self.kind == "port":
+            return "bitmap:port range 0-65535"
+        family = "inet6" if self.family == 6 else "inet"
+        return f"hash:net family {family} maxelem {max(65536, len(self.entries))}"
+
+    @property
+    def nft_type(self) -> str:
+        """nftables element type."""
+        if self.kind == "port":
+            return "inet_service"
+        return "ipv6_addr" if self.family == 6 else "ipv4_addr"
+
+    def elements(self) -> List[str]:
+        """Entries as ipset and nftables spell them (port ranges use '-')."""
+        if self.kind == "port":
+            return [entry.replace(":", "-") for entry in self.entries]
+        return list(self.entries)
+
+
+def ipset_restore(sets: Iterable[IpSet]) -> List[str]:
+    """
+    Generate ``ipset restore`` input that reloads sets atomically.
+
+    Each set is filled under a temporary name and swapped in, so rules
+    referencing the live set never see it partially loaded.
+
+    Args:
+        sets: Sets to load
+
+    Returns:
+        ipset restore lines
+    """
+    lines = []
+    for ipset in sets:
+        new = f"{ipset.name}-new"
+        lines.append(f"create {ipset.name} {ipset.ipset_type} -exist")
+        lines.append(f"create {new} {ipset.ipset_type} -exist")
+        lines.append(f"flush {new}")
+        lines.extend(f"add {new} {element}" for element in ipset.elements())
+        lines.append(f"swap {new} {ipset.name}")
+        lines.append(f"destroy {new}")
+    return lines
+
+
+class SetCompiler:
+    """Replaces runs of near-identical rules with set matches."""
+
+    def __init__(self, chain_manager, min_size: int = MIN_SET_SIZE):
+        """
+        Initialize the set compiler.
+
+        Args:
+            chain_manager: Chain manager that receives the generated sets
+            min_size: Smallest run of rules turned into a set
+        """
+        self.chain_manager = chain_manager
+        self.family = chain_manager.family
+        self.min_size = max(2, min_size)
+        self.logger = logging.getLogger(__name__)
+
+    def compile(self, chains: Iterable) -> int:
+        """
+        Compile sets for the given chains.
+
+        Args:
+            chains: Chains whose rules are rewritten in place
+
+        Returns:
+            Number of rules removed
+        """
+        removed = 0
+        sets = len(self.chain_manager.sets)
+        for chain in chains:
+            before = len(chain.rules)
+            chain.rules = self._compile_chain(chain)
+            removed += before - len(chain.rules)
+
+        created = len(self.chain_manager.sets) - sets
+        if created:
+            self.logger.info(
+                "Set compilation: %d rules folded into %d sets",
+                removed + created,
+                created,
+            )
+        return removed
+
+    def _compile_chain(self, chain) -> List[Rule]:
+        rules = chain.rules
+        if len(rules) < self.min_size:
+            return rules
+
+        # (residual key, value) of every rule for each set kind
+        split = {kind: [self._split(rule, kind) for rule in rules] for kind in KINDS}
+
+        compiled: List[Rule] = []
+        index = 0
+        while index < len(rules):
+            best_kind, best_end = None, index + 1
+            for kind, parts in split.items():
+                if parts[index] is None:
+                    continue
+                end = index + 1
+                while (
+                    end < len(rules)
+                    and parts[end] is not None
+                    and parts[end][0] == parts[index][0]
+                ):
+                    end += 1
+                if end > best_end:
+                    best_kind, best_end = kind, end
+
+            if best_kind and best_end - index >= self.min_size:
+                values = [split[best_kind][i][1] for i in range(index, best_end)]
+                compiled.append(
+                    self._set_rule(chain, best_kind, rules[index], values)
+                )
+                index = best_end
+            else:
+                compiled.append(rules[index])
+                index += 1
+
+        return compiled
+
+    def _split(self, rule: Rule, kind: str) -> Optional[Tuple[Tuple, str]]:
+        """
+        Split a rule into what must match across a run and the set value.
+
+        Returns:
+            (residual key, value), or None if the rule cannot join a set
+        """
+        if kind in ("src", "dst"):
+            address = rule.source if kind == "src" else rule.destination
+            if not address or not _ADDRESS_RE.match(address):
+                return None
+            if kind == "src":
+                residual = rule.replace(source=None)
+            else:
+                residual = rule.replace(destination=None)
+            return residual.key(), address
+
+        port = rule.get("--dport")
+        protocol = rule.get("-p")
+        if (
+            port is None
+            or port.negated
+            or not _PORT_RE.match(port.value)
+            or protocol is None
+            or protocol.negated
+            or protocol.value not in PORT_PROTOCOLS
+        ):
+            return None
+        residual = rule.replace(matches=[m for m in rule.matches if m is not port])
+        return residual.key(), port.value
+
+    def _set_rule(self, chain, kind: str, first: Rule, values: List[str]) -> Rule:
+        """Create the set for a run and the rule matching it."""
+        name = self._set_name(chain.name, KINDS[kind])
+        entries = list(dict.fromkeys(values))
+        if kind != "dport":
+            # Members share one verdict, so the set may hold any cover
+            try:
+                entries = collapse(entries, self.family)
+            except AddressError:
+                pass
+        self.chain_manager.add_set(
+            IpSet(name, "port" if kind == "dport" else "net", self.family, entries)
+        )
+
+        direction = "src" if kind == "src" else "dst"
+        set_match = [
+            Match.get("-m", ("set",)),
+            Match.get("--match-set", (name, direction)),
+        ]
+
+        if kind == "src":
+            return first.replace(source=None, matches=first.matches + tuple(set_match))
+        if kind == "dst":
+            return first.replace(
+                destination=None, matches=first.matches + tuple(set_match)
+            )
+
+        matches = [m for m in first.matches if m.option != "--dport"]
+        return first.replace(matches=matches + set_match)
+
+    def _set_name(self, chain_name: str, suffix: str) -> str:
+        """Derive a stable, unique set name for a chain."""
+        prefix = "pw6" if self.family == 6 else "pw"
+        base = f"{prefix}_{chain_name}"
+        if len(base) + 4 > MAX_NAME_LENGTH:
+            digest = hashlib.sha1(chain_name.encode()).hexdigest()[:10]
+            base = f"{prefix}_{digest}"
+
+        index = 1
+        while f"{base}_{suffix}{index}" in self.chain_manager.sets:
+            index += 1
+        return f"{base}_{suffix}{index}"
+
+
+def used_sets(chain_manager) -> List[IpSet]:
+    """
+    Return the sets still referenced by the chains' rules.
+
+    Args:
+        chain_manager: Chain manager holding chains and sets
+
+    Returns:
+        Referenced sets in creation order
+    """
+    names: Dict[str, None] = {}
+    for chain in chain_manager.chains.values():
+        for rule in chain.rules:
+            match = rule.get("--match-set")
+            if match:
+                names[match.args[0]] = None
+    return [ipset for name, ipset in chain_manager.sets.items() if name in names]
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Phreakwall daemon (phreakwalld) and its client.
+
+The daemon keeps a configuration tree compiled in memory and serves
+check, compile, apply and status requests over a Unix socket.
+"""
+
+from phreakwall.daemon.client import DaemonClient, DaemonError
+from phreakwall.daemon.protocol import DEFAULT_SOCKET
+from phreakwall.daemon.server import Daemon
+from phreakwall.daemon.watch import Watcher, WatchError
+
+__all__ = [
+    "DEFAULT_SOCKET",
+    "Daemon",
+    "DaemonClient",
+    "DaemonError",
+    "Watcher",
+    "WatchError",
+]
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Daemon Client
+
+Client side of the phreakwalld socket protocol, used by the CLI and
+the web interface.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import itertools
+import socket
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from phreakwall.daemon.protocol import (
+    DEFAULT_SOCKET,
+    ProtocolError,
+    encode,
+    read_message,
+)
+
+
+class DaemonError(Exception):
+    """Raised when the daemon cannot be reached or a request fails."""
+
+    def __init__(self, message: str, response: Optional[Dict[str, Any]] = None):
+        """
+        Initialize the error.
+
+        Args:
+            message: Error message
+            response: Failed response, if the daemon answered
+        """
+        super().__init__(message)
+        self.response = response
+
+
+class DaemonClient:
+    """Sends requests to phreakwalld over its Unix socket."""
+
+    def __init__(self, path: Path = DEFAULT_SOCKET, timeout: Optional[float] = None):
+        """
+        Initialize the client.
+
+        Args:
+            path: Daemon socket
+            timeout: Seconds to wait for a response (None: no limit)
+        """
+        self.path = Path(path)
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+
+    def available(self) -> bool:
+        """Whether a daemon socket exists at the path."""
+        return self.path.is_socket()
+
+    def request(self, command: str, **args: Any) -> Dict[str, Any]:
+        """
+        Send one request and wait for its response.
+
+        Args:
+            command: Command name, e.g. 'check'
+            args: Command arguments
+
+        Returns:
+            Response with 'result' and 'messages'
+
+        Raises:
+            DaemonError: If the daemon is unreachable or the request failed
+        """
+        request = {"id": next(self._ids), "command": command, "args": args}
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(str(self.path))
+                sock.sendall(encode(request))
+                with sock.makefile("rb") as stream:
+                    response = read_message(stream)
+        except (OSError, ProtocolError) as e:
+            raise DaemonError(f"phreakwalld at {self.path}: {e}")
+
+        if response is None:
+            raise DaemonError(f"phreakwalld at {self.path} closed the connection")
+        if not response.get("ok"):
+            raise DaemonError(response.get("error", "Request failed"), response)
+        return response
+
+    def check(self, **args: Any) -> Dict[str, Any]:
+        """Validate the configuration."""
+        return self.request("check", **args)
+
+    def compile(self, **args: Any) -> Dict[str, Any]:
+        """Compile the configuration to a script."""
+        return self.request("compile", **args)
+
+    def apply(self, **args: Any) -> Dict[str, Any]:
+        """Apply the changes against the live ruleset."""
+        return self.request("apply", **args)
+
+    def status(self) -> Dict[str, Any]:
+        """Report the daemon state."""
+        return self.request("status")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Daemon Protocol
+
+phreakwalld speaks line-delimited JSON over a Unix stream socket. A
+client writes one request per line and reads one response per line;
+a connection may carry any number of requests.
+
+Request::
+
+    {"id": 1, "command": "check", "args": {"family": 4}}
+
+Response::
+
+    {"id": 1, "ok": true, "result": {...}, "messages": [...],
+     "elapsed": 1.7}
+
+``messages`` holds the warnings and errors logged while the request
+ran, as ``{"level": ..., "message": ...}``; ``elapsed`` is in
+milliseconds. A failed request has ``"ok": false`` and an ``error``.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import json
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional
+
+DEFAULT_SOCKET = Path("/run/phreakwall/phreakwalld.sock")
+
+# Longest request or response line accepted
+MAX_LINE = 16 << 20
+
+
+class ProtocolError(Exception):
+    """Raised for malformed messages."""
+
+    pass
+
+
+def encode(message: Dict[str, Any]) -> bytes:
+    """
+    Encode a message as one protocol line.
+
+    Args:
+        message: JSON-serializable message
+
+    Returns:
+        UTF-8 line including the newline
+    """
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def read_message(stream: BinaryIO) -> Optional[Dict[str, Any]]:
+    """
+    Read one message from a stream.
+
+    Args:
+        stream: Binary stream, e.g. from socket.makefile("rb")
+
+    Returns:
+        The message, or None at end of stream
+
+    Raises:
+        ProtocolError: If the line is too long or not a JSON object
+    """
+    line = stream.readline(MAX_LINE + 1)
+    if not line:
+        return None
+    if len(line) > MAX_LINE:
+        raise ProtocolError("Message too long")
+
+    try:
+        message = json.loads(line)
+    except ValueError as e:
+        raise ProtocolError(f"Invalid JSON: {e}")
+    if not isinstance(message, dict):
+        raise ProtocolError("Message is not an object")
+    return message
@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Daemon
+
+phreakwalld keeps a compiler process running so repeated checks and
+compiles skip the interpreter start, the imports and most of the
+parsing. It serves one configuration directory over a Unix socket
+(see phreakwall.daemon.protocol) with the commands check, compile,
+apply and status.
+
+The daemon holds a compile cache whose file digest index and latest
+entries (parsed configuration, zones, phase snapshots) stay in memory,
+so a changed tree is recompiled from the phases it invalidates without
+touching the disk cache. The results of the last check and of every
+compiled script are kept with the digest of the tree they were
+produced from: asking again while the tree is unchanged only costs a
+stat of each configuration file.
+
+Requests other than status run one at a time.
+
+With --watch the daemon also recompiles the script (and optionally
+applies it) whenever the directory changes; see
+phreakwall.daemon.watch.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import argparse
+import contextlib
+import inspect
+import io
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from phreakwall import __version__
+from phreakwall.core.cache import CACHE_DIR, CompileCache
+from phreakwall.core.compiler import Compiler, CompilerOptions
+from phreakwall.core.optimizer import OPTIMIZE_ALL
+from phreakwall.daemon.protocol import (
+    DEFAULT_SOCKET,
+    ProtocolError,
+    encode,
+    read_message,
+)
+from phreakwall.daemon.watch import ChangeBatch, Watcher, WatchError
+from phreakwall.modules.rules import PROTOCOLS_FILE, SERVICES_FILE, library_files
+
+
+class CommandError(Exception):
+    """Raised when a daemon command fails."""
+
+    pass
+
+
+@dataclass
+class CommandStats:
+    """Request counts and latencies of one command."""
+
+    requests: int = 0
+    failures: int = 0
+    cached: int = 0
+    total_ms: float = 0.0
+    last_ms: float = 0.0
+    last_at: Optional[float] = None
+
+
+class _Capture(logging.Handler):
+    """Collects the warnings and errors logged during a request."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages: List[Dict[str, str]] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(
+            {"level": record.levelname, "message": record.getMessage()}
+        )
+
+
+class Daemon:
+    """Serves check, compile, apply and status requests for one directory."""
+
+    def __init__(
+        self,
+        directory: Path = Path("/etc/phreakwall"),
+        socket_path: Path = DEFAULT_SOCKET,
+        cache_dir: Path = CACHE_DIR,
+    ):
+        """
+        Initialize the daemon.
+
+        Args:
+            directory: Configuration directory served
+            socket_path: Unix socket to listen on
+            cache_dir: On-disk compile cache; the in-memory layer works
+                even if it cannot be used
+        """
+        self.directory = Path(directory).resolve()
+        self.socket_path = Path(socket_path)
+        self.cache = CompileCache(cache_dir, version=Compiler.VERSION, memory=True)
+        self.logger = logging.getLogger(__name__)
+
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.stats: Dict[str, CommandStats] = {}
+        self.server: Optional[socketserver.BaseServer] = None
+
+        # Results keyed by options, with the tree digest they belong to
+        self._checks: Dict[Tuple, Tuple[str, Dict[str, Any], List[Dict]]] = {}
+        self._scripts: Dict[str, Tuple[str, Tuple, Tuple]] = {}
+
+        # Files outside the directory that compiles read (INCLUDEs,
+        # macros and actions), and the macro and action search path
+        self._external: Set[str] = set()
+        self._libraries: List[Path] = []
+        self._capture: Optional[_Capture] = None
+        self.watcher: Optional[Watcher] = None
+        self._watch_args: Dict[str, Any] = {}
+
+        self.commands: Dict[str, Callable[..., Dict[str, Any]]] = {
+            "check": self.check,
+            "compile": self.compile,
+            "apply": self.apply,
+            "status": self.status,
+        }
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Execute one request.
+
+        Args:
+            request: Decoded request message
+
+        Returns:
+            Response message
+        """
+        start = time.perf_counter()
+        command = request.get("command")
+        args = request.get("args") or {}
+        response: Dict[str, Any] = {"id": request.get("id")}
+        capture = _Capture()
+
+        try:
+            method = self.commands.get(command)
+            if method is None:
+                raise CommandError(f"Unknown command: {command}")
+            if not isinstance(args, dict):
+                raise CommandError("args must be an object")
+            signature = inspect.signature(method)
+            unknown = set(args) - set(signature.parameters)
+            if unknown:
+                raise CommandError(f"Unknown arguments: {', '.join(sorted(unknown))}")
+            try:
+                signature.bind(**args)
+            except TypeError as e:
+                raise CommandError(str(e)) from None
+
+            if command == "status":
+                result = method(**args)
+            else:
+                with self.lock, self._capturing(capture):
+                    result = method(**args)
+            response.update(ok=True, result=result)
+
+        except CommandError as e:
+            response.update(ok=False, error=str(e))
+        except Exception as e:
+            self.logger.exception("Request %s failed", command)
+            response.update(ok=False, error=f"Internal error: {e}")
+
+        elapsed = (time.perf_counter() - start) * 1000
+        response["messages"] = capture.messages
+        response["elapsed"] = round(elapsed, 3)
+
+        if command in self.commands:
+            stats = self.stats.setdefault(command, CommandStats())
+            stats.requests += 1
+            stats.failures += not response["ok"]
+            stats.cached += bool(response.get("result", {}).get("cached"))
+            stats.total_ms += elapsed
+            stats.last_ms = elapsed
+            stats.last_at = time.time()
+
+        self.logger.info(
+            "%s: %s in %.1f ms",
+            command,
+            "ok" if response["ok"] else response["error"],
+            elapsed,
+        )
+        return response
+
+    @contextlib.contextmanager
+    def _capturing(self, capture: _Capture):
+        """Collect the messages logged by the compiler into capture."""
+        logger = logging.getLogger("phreakwall")
+        logger.addHandler(capture)
+        self._capture = capture
+        try:
+            yield
+        finally:
+            logger.removeHandler(capture)
+            self._capture = None
+
+    def _check_directory(self, directory: Optional[str]):
+        """Refuse requests for another configuration directory."""
+        if directory and Path(directory).resolve() != self.directory:
+            raise CommandError(f"phreakwalld serves {self.directory}, not {directory}")
+
+    def _tree_key(self) -> str:
+        """
+        Digest of the configuration tree and the system tables it uses.
+
+        Only files whose stat signature changed are read again, so this
+        costs one stat per file for an unchanged tree. Files outside the
+        tree that earlier compiles read are covered as well, and so are
+        the macro and action files on their search path, which may
+        shadow the ones read.
+        """
+        digests = self.cache.tree_digests(self.directory)
+        system = [self.cache.file_digest(path) for path in (SERVICES_FILE, PROTOCOLS_FILE)]
+        external = self._external.union(library_files(self._libraries))
+        external_digests = [(path, self.cache.file_digest(Path(path))) for path in sorted(external)]
+        return self.cache.digest(sorted(digests.items()), system, external_digests)
+
+    def _compile(self, options: CompilerOptions, tree: str) -> Tuple[bool, str]:
+        """
+        Run a compile, noting the files it read outside the tree.
+
+        Args:
+            options: Compiler options
+            tree: Tree key taken before the compile
+
+        Returns:
+            (success, tree key to keep the result under); the key is
+            taken again if the compile read files it did not cover
+        """
+        inputs = (set(self._external), list(self._libraries))
+        compiler = Compiler(options, self.cache)
+        ok = compiler.compile() == 0
+        rule_processor = getattr(compiler, "rule_processor", None)
+        if rule_processor:
+            self._libraries = rule_processor.library_directories()
+        config = getattr(compiler, "config", None)
+        if config:
+            prefix = str(self.directory) + os.sep
+            self._external.update(
+                path for path in config.files if not str(Path(path).resolve()).startswith(prefix)
+            )
+        if (self._external, self._libraries) != inputs:
+            tree = self._tree_key()
+        return ok, tree
+
+    @staticmethod
+    def _family(family: Any) -> int:
+        """Validate an IP family argument."""
+        if family not in (4, 6):
+            raise CommandError(f"Invalid family: {family}")
+        return family
+
+    @staticmethod
+    def _optimize(optimize: Any) -> Optional[int]:
+        """Validate an optimization level argument."""
+        if optimize is None:
+            return None
+        if (
+            isinstance(optimize, bool)
+            or not isinstance(optimize, int)
+            or not 0 <= optimize <= OPTIMIZE_ALL
+        ):
+            raise CommandError(f"Invalid optimization level: {optimize}")
+        return optimize
+
+    def check(
+        self,
+        family: int = 4,
+        optimize: Optional[int] = None,
+        directory: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Validate the configuration.
+
+        Args:
+            family: IP family
+            optimize: Optimization level (default: OPTIMIZE setting)
+            directory: Configuration directory the client expects
+
+        Returns:
+            {'valid': bool, 'cached': bool}; the warnings and errors are
+            the response messages
+        """
+        self._check_directory(directory)
+        key = (self._family(family), self._optimize(optimize))
+        tree = self._tree_key()
+
+        previous = self._checks.get(key)
+        if previous and previous[0] == tree:
+            _, result, messages = previous
+            self._capture.messages.extend(messages)
+            return dict(result, cached=True)
+
+        options = CompilerOptions(
+            directory=self.directory, family=family, optimize=optimize
+        )
+        valid, tree = self._compile(options, tree)
+        result = {"valid": valid}
+        self._checks[key] = (tree, result, list(self._capture.messages))
+        return dict(result, cached=False)
+
+    def compile(
+        self,
+        output: str,
+        backend: str = "restore",
+        family: int = 4,
+        optimize: Optional[int] = None,
+        drop_redundant: bool = False,
+        test: bool = False,
+        directory: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Compile the configuration to a script.
+
+        The script is not written again if it was compiled from the
+        same tree with the same options and is still as written.
+
+        Args:
+            output: Script path
+            backend: Ruleset backend
+            family: IP family
+            optimize: Optimization level (default: OPTIMIZE setting)
+            drop_redundant: Drop shadowed and redundant rules
+            test: Omit the version and date from the script
+            directory: Configuration directory the client expects
+
+        Returns:
+            {'script': path, 'cached': bool}
+        """
+        self._check_directory(directory)
+        if backend not in Compiler.BACKENDS:
+            raise CommandError(f"Unknown backend: {backend}")
+        if not isinstance(output, str) or not output:
+            raise CommandError(f"Invalid output: {output}")
+
+        script = Path(output)
+        key = (
+            backend,
+            self._family(family),
+            self._optimize(optimize),
+            bool(drop_redundant),
+            bool(test),
+        )
+        tree = self._tree_key()
+
+        previous = self._scripts.get(str(script))
+        if previous and previous[:2] == (tree, key) and previous[2] == _signature(script):
+            return {"script": str(script), "cached": True}
+
+        options = CompilerOptions(
+            script=script,
+            directory=self.directory,
+            backend=backend,
+            family=family,
+            optimize=optimize,
+            drop_redundant=bool(drop_redundant),
+            test=bool(test),
+        )
+        ok, tree = self._compile(options, tree)
+        if not ok:
+            self._scripts.pop(str(script), None)
+            raise CommandError("Compilation failed")
+
+        self._scripts[str(script)] = (tree, key, _signature(script))
+        return {"script": str(script), "cached": False}
+
+    def apply(
+        self,
+        backend: str = "restore",
+        family: int = 4,
+        live: Optional[str] = None,
+        directory: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Apply the changes against the live ruleset.
+
+        Args:
+            backend: Backend the live ruleset was loaded with
+            family: IP family
+            live: Saved ruleset dump to diff against; the delta is
+                returned instead of applied
+            directory: Configuration directory the client expects
+
+        Returns:
+            {'applied': bool, 'delta': text or None, 'stats': text}
+        """
+        self._check_directory(directory)
+        if backend not in Compiler.BACKENDS:
+            raise CommandError(f"Unknown backend: {backend}")
+
+        options = CompilerOptions(
+            directory=self.directory, backend=backend, family=self._family(family)
+        )
+        compiler = Compiler(options, self.cache)
+
+        # A dump's delta is printed; requests run one at a time
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result = compiler.apply(Path(live) if live else None)
+        if result != 0:
+            raise CommandError("Apply failed")
+
+        stats = getattr(compiler, "backend", None) and compiler.backend.delta_stats
+        return {
+            "applied": live is None,
+            "delta": output.getvalue() if live else None,
+            "stats": str(stats) if stats else "full load",
+        }
+
+    def status(self, directory: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Report the daemon state; answered even while a request runs.
+
+        Returns:
+            Version, directory, uptime, per-command statistics and
+            compile cache counters
+        """
+        return {
+            "version": __version__,
+            "pid": os.getpid(),
+            "directory": str(self.directory),
+            "socket": str(self.socket_path),
+            "uptime": round(time.time() - self.started, 3),
+            "busy": self.lock.locked(),
+            "commands": {
+                name: asdict(stats) for name, stats in sorted(self.stats.items())
+            },
+            "cache": {
+                "enabled": self.cache.enabled,
+                "hits": self.cache.hits,
+                "misses": self.cache.misses,
+            },
+            "scripts": sorted(self._scripts),
+            "watch": asdict(self.watcher.stats) if self.watcher else None,
+        }
+
+    def watch(
+        self,
+        output: Path,
+        backend: str = "restore",
+        apply: bool = False,
+        debounce: float = 0.5,
+    ):
+        """
+        Recompile whenever the directory changes, once serving.
+
+        Args:
+            output: Script to keep up to date
+            backend: Ruleset backend
+            apply: Also apply each new ruleset to the kernel
+            debounce: Quiet time that ends a burst of changes (seconds)
+        """
+        self._watch_args = {
+            "output": str(Path(output).resolve()),
+            "backend": backend,
+            "apply": apply,
+        }
+        self.watcher = Watcher(self.directory, self._rebuild, debounce)
+
+    def _rebuild(self, batch: ChangeBatch) -> bool:
+        """Invalidate the changed files and recompile the watched script."""
+        changed = [self.directory / name for name in batch.files]
+        with self.lock:
+            self.cache.forget([self.directory] if batch.overflow else changed)
+
+        args = self._watch_args
+        response = self.handle(
+            {
+                "command": "compile",
+                "args": {"output": args["output"], "backend": args["backend"]},
+            }
+        )
+        if response["ok"] and args["apply"] and not response["result"]["cached"]:
+            response = self.handle(
+                {"command": "apply", "args": {"backend": args["backend"]}}
+            )
+        return response["ok"]
+
+    def reset(self):
+        """Forget the kept results, e.g. after files outside the tree changed."""
+        with self.lock:
+            self._checks.clear()
+            self._scripts.clear()
+        self.logger.info("Cached results dropped")
+
+    def serve_forever(self):
+        """Listen on the socket until shut down by SIGTERM or SIGINT."""
+        self._prepare_socket()
+
+        # Parse and compile the tree once so the first request is warm
+        response = self.handle({"command": "check"})
+        if response["ok"] and not response["result"]["valid"]:
+            self.logger.warning("Configuration in %s has errors", self.directory)
+        if self.watcher:
+            self._rebuild(ChangeBatch([], 0))
+
+        self.server = self._bind()
+
+        def stop(signum, frame):
+            # shutdown() waits for serve_forever(), which runs in this thread
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.reset())
+
+        self.logger.warning(
+            "phreakwalld %s serving %s on %s", __version__, self.directory, self.socket_path
+        )
+        try:
+            if self.watcher:
+                self.watcher.start()
+            self.server.serve_forever()
+        finally:
+            if self.watcher:
+                self.watcher.stop()
+            self.server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+            self.cache.save()
+            self.logger.warning("phreakwalld stopped")
+
+    def _bind(self) -> socketserver.BaseServer:
+        """
+        Create the listening socket, connectable by owner and group only.
+
+        The mode comes from the umask at bind(): a chmod afterwards
+        would leave the socket open to everyone in between.
+        """
+        umask = os.umask(0o117)
+        try:
+            server = _Server(str(self.socket_path), _Handler)
+        finally:
+            os.umask(umask)
+        server.phreakwalld = self
+        return server
+
+    def _prepare_socket(self):
+        """Create the socket directory and remove a stale socket."""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True, mode=0o755)
+        if not self.socket_path.exists():
+            return
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(str(self.socket_path))
+            except OSError:
+                self.socket_path.unlink()
+                return
+        raise CommandError(f"phreakwalld is already running on {self.socket_path}")
+
+
+def _signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    """Stat signature of a file, None if it is missing."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server with one thread per connection."""
+
+    daemon_threads = True
+    phreakwalld: Daemon
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Answers the requests of one connection."""
+
+    def handle(self):
+        while True:
+            try:
+                request = read_message(self.rfile)
+            except ProtocolError as e:
+                self.wfile.write(encode({"id": None, "ok": False, "error": str(e)}))
+                return
+            if request is None:
+                return
+
+            response = self.server.phreakwalld.handle(request)
+            try:
+                self.wfile.write(encode(response))
+            except OSError:
+                return
+
+
+def main():
+    """Main entry point for phreakwalld."""
+    parser = argparse.ArgumentParser(
+        description="Phreakwall daemon: serves check/compile/apply over a Unix socket"
+    )
+    parser.add_argument(
+        "-d",
+        "--directory",
+        type=Path,
+        default=Path("/etc/phreakwall"),
+        help="Configuration directory (default: /etc/phreakwall)",
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        type=Path,
+        default=DEFAULT_SOCKET,
+        help=f"Socket path (default: {DEFAULT_SOCKET})",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=CACHE_DIR,
+        help=f"Compile cache directory (default: {CACHE_DIR})",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        dest="verbosity",
+        help="Increase verbosity (-v, -vv)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Recompile the script whenever the configuration changes",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        default=Path("/var/lib/phreakwall/firewall.sh"),
+        help="Script kept up to date by --watch",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=Compiler.BACKENDS,
+        default="restore",
+        help="Backend of the --watch script",
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Apply each ruleset compiled by --watch",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.5,
+        help="Seconds without changes before --watch recompiles (default: 0.5)",
+    )
+    args = parser.parse_args()
+
+    # Configured once here; the compilers' own logging setup is then a no-op
+    logging.basicConfig(
+        level={0: logging.WARNING, 1: logging.INFO}.get(args.verbosity, logging.DEBUG),
+        format="%(asctime)s %(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+    daemon = Daemon(args.directory, args.socket, args.cache_dir)
+    if args.watch:
+        daemon.watch(args.output, args.backend, args.apply, args.debounce)
+    try:
+        daemon.serve_forever()
+    except (CommandError, WatchError, OSError) as e:
+        daemon.logger.error("%s", e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Configuration Watcher
+
+Watches a configuration directory with inotify and rebuilds once per
+burst of changes. Configuration management typically drops many files
+in quick succession; events are collected until the directory has been
+quiet for the debounce window (or for at most max_delay after the
+first event), then the rebuild callback runs once with every file that
+changed. Events that arrive while it runs are queued by the kernel and
+form the next batch.
+
+inotify is used through ctypes, so no extra package is needed; it is
+only available on Linux.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+# inotify event masks (linux/inotify.h)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# Events that change what the compiler reads; IN_MODIFY is left out
+# since a file is complete only once it is closed
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+_EVENT = struct.Struct("iIII")
+
+# Bytes read from the inotify descriptor at a time
+READ_SIZE = 64 * 1024
+
+
+class WatchError(Exception):
+    """Raised when a directory cannot be watched."""
+
+    pass
+
+
+class Inotify:
+    """Minimal inotify binding."""
+
+    def __init__(self):
+        """
+        Create an inotify instance.
+
+        Raises:
+            WatchError: If inotify is not available
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise WatchError("inotify is not available on this system")
+
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = init(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise WatchError(f"inotify_init1: {os.strerror(ctypes.get_errno())}")
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        """
+        Watch a path.
+
+        Returns:
+            Watch descriptor
+
+        Raises:
+            WatchError: If the watch cannot be added
+        """
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise WatchError(f"Cannot watch {path}: {os.strerror(ctypes.get_errno())}")
+        return wd
+
+    def read(self) -> List[tuple]:
+        """
+        Read the queued events without blocking.
+
+        Returns:
+            (wd, mask, name) per event
+        """
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        """Close the inotify descriptor."""
+        os.close(self.fd)
+
+
+@dataclass
+class ChangeBatch:
+    """Changes coalesced into one rebuild, and its outcome."""
+
+    files: List[str]
+    events: int
+    overflow: bool = False
+    first: float = 0.0
+    ok: Optional[bool] = None
+    rebuild_ms: float = 0.0
+    latency_ms: float = 0.0
+
+
+@dataclass
+class WatchStats:
+    """Counters of a watcher."""
+
+    directory: str
+    debounce: float
+    events: int = 0
+    batches: int = 0
+    failures: int = 0
+    queue: int = 0
+    max_queue: int = 0
+    last_rebuild_ms: Optional[float] = None
+    last_latency_ms: Optional[float] = None
+    last_files: List[str] = field(default_factory=list)
+
+
+class Watcher:
+    """Calls a rebuild function once per burst of configuration changes."""
+
+    def __init__(
+        self,
+        directory: Path,
+        rebuild: Callable[[ChangeBatch], bool],
+        debounce: float = 0.5,
+        max_delay: float = 10.0,
+        report: Optional[Callable[[ChangeBatch], None]] = None,
+    ):
+        """
+        Initialize the watcher.
+
+        Args:
+            directory: Configuration directory
+            rebuild: Called with each batch; returns whether it succeeded
+            debounce: Quiet time that ends a burst (seconds)
+            max_delay: Longest wait after the first event of a burst
+            report: Called with each finished batch (default: log it)
+        """
+        self.directory = Path(directory).resolve()
+        self.rebuild = rebuild
+        self.debounce = debounce
+        self.max_delay = max(max_delay, debounce)
+        self.report = report or self._log
+        self.logger = logging.getLogger(__name__)
+        self.stats = WatchStats(str(self.directory), debounce)
+
+        self._inotify: Optional[Inotify] = None
+        self._dirs: Dict[int, Path] = {}
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread: Optional[threading.Thread] = None
+
+    def _watch_tree(self, directory: Path):
+        """Watch a directory and its subdirectories, as tree_digests() reads them."""
+        for root, dirs, _ in os.walk(directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            wd = self._inotify.add_watch(Path(root), WATCH_MASK | IN_ONLYDIR)
+            self._dirs[wd] = Path(root)
+
+    def _open(self):
+        """Set up the inotify watches."""
+        self._inotify = Inotify()
+        try:
+            self._watch_tree(self.directory)
+        except WatchError:
+            self._close()
+            raise
+        self.logger.info(
+            "Watching %s (%d directories, debounce %.2fs)",
+            self.directory,
+            len(self._dirs),
+            self.debounce,
+        )
+
+    def _close(self):
+        """Remove the inotify watches."""
+        self._inotify.close()
+        self._inotify = None
+        self._dirs.clear()
+
+    def _serve(self):
+        """Rebuild on changes until stop() is called."""
+        try:
+            self._loop()
+        finally:
+            self._close()
+
+    def run(self):
+        """
+        Watch until stop() is called.
+
+        Raises:
+            WatchError: If the directory cannot be watched
+        """
+        self._open()
+        self._serve()
+
+    def _loop(self):
+        """Collect events into batches and rebuild after each burst."""
+        files: Set[str] = set()
+        events = 0
+        overflow = False
+        first = last = 0.0
+
+        while True:
+            timeout = None
+            if events:
+                deadline = min(last + self.debounce, first + self.max_delay)
+                timeout = max(0.0, deadline - time.monotonic())
+
+            ready, _, _ = select.select([self._inotify.fd, self._stop_r], [], [], timeout)
+            if self._stop_r in ready:
+                return
+
+            if ready:
+                now = time.monotonic()
+                for wd, mask, name in self._inotify.read():
+                    changed = self._event(wd, mask, name)
+                    if changed is None and not mask & IN_Q_OVERFLOW:
+                        continue
+                    if not events:
+                        first = now
+                    last = now
+                    events += 1
+                    if mask & IN_Q_OVERFLOW:
+                        overflow = True
+                    else:
+                        files.add(changed)
+                self.stats.queue = events
+
+            # A steady stream of events is cut off after max_delay
+            now = time.monotonic()
+            if events and now >= min(last + self.debounce, first + self.max_delay):
+                batch = ChangeBatch(sorted(files), events, overflow, first)
+                files, events, overflow = set(), 0, False
+                self._rebuild(batch)
+
+    def _event(self, wd: int, mask: int, name: str) -> Optional[str]:
+        """
+        Interpret one event.
+
+        Returns:
+            Path of the changed file relative to the directory ("." for
+            the directory itself), or None for events to ignore
+        """
+        if mask & IN_IGNORED:
+            self._dirs.pop(wd, None)
+            return None
+
+        parent = self._dirs.get(wd)
+        if parent is None:
+            return None
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if parent == self.directory:
+                self.logger.warning("%s was removed or moved", self.directory)
+            return str(parent.relative_to(self.directory))
+        if not name or name.startswith(".") or name.endswith("~"):
+            return None
+
+        path = parent / name
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            try:
+                self._watch_tree(path)
+            except WatchError as e:
+                self.logger.warning("%s", e)
+        return str(path.relative_to(self.directory))
+
+    def _rebuild(self, batch: ChangeBatch):
+        """Run the rebuild for a batch and record its statistics."""
+        start = time.monotonic()
+        try:
+            batch.ok = bool(self.rebuild(batch))
+        except Exception as e:
+            self.logger.exception("Rebuild failed: %s", e)
+            batch.ok = False
+        end = time.monotonic()
+        batch.rebuild_ms = (end - start) * 1000
+        batch.latency_ms = (end - batch.first) * 1000
+
+        stats = self.stats
+        stats.events += batch.events
+        stats.batches += 1
+        stats.failures += not batch.ok
+        stats.queue = 0
+        stats.max_queue = max(stats.max_queue, batch.events)
+        stats.last_rebuild_ms = batch.rebuild_ms
+        stats.last_latency_ms = batch.latency_ms
+        stats.last_files = batch.files
+        self.report(batch)
+
+    def _log(self, batch: ChangeBatch):
+        """Default report: one log line per batch."""
+        self.logger.info(
+            "%s after %d events on %d files: rebuild %.0f ms, %.0f ms after the first change",
+            "Rebuilt" if batch.ok else "Rebuild failed",
+            batch.events,
+            len(batch.files),
+            batch.rebuild_ms,
+            batch.latency_ms,
+        )
+
+    def start(self):
+        """
+        Watch in a background thread.
+
+        Raises:
+            WatchError: If the directory cannot be watched
+        """
+        self._open()
+        self._thread = threading.Thread(target=self._serve, name="watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching and wait for a running rebuild to finish."""
+        os.write(self._stop_w, b"x")
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
@@ -4,17 +4,606 @@ Phreakwall Rule Processing
 
 Processes and generates firewall rules from configuration.
 
+Rules may invoke Shorewall macros such as ``HTTP(ACCEPT)`` or
+``SSH/DROP:info``. The macro library indexes the macro directories
+once, parses each macro file on first use and memoizes every distinct
+invocation, so a macro used thousands of times is read and expanded
+once.
+
+Actions such as ``Invalid(DROP)`` or ``DropSmurfs`` compile into shared
+chains (see phreakwall.core.actions): each distinct invocation is built
+once and every zone-pair chain using it jumps there.
+
 Copyright (c) 2025 Phreakwall Contributors
 """
 
 import logging
-from typing import List
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from phreakwall.core.actions import ACTION_PATH, ACTIONS_STD, NATIVE_ACTIONS, ActionManager
+from phreakwall.core.addresses import AddressError, collapse
+from phreakwall.core.chains import ChainType
+from phreakwall.core.conditions import Conditions
+from phreakwall.core.config import ConfigError, ConfigTokenizer, Record
+from phreakwall.core.multiport import MAX_MULTIPORT, MultiportCompiler, split_ports
+from phreakwall.core.rule import Match, Rule
+from phreakwall.core.sets import SetCompiler
+
+# Targets the rules file can use directly
+TARGETS = ("ACCEPT", "DROP", "REJECT", "LOG")
+
+# Targets an action body can use besides TARGETS
+ACTION_TARGETS = TARGETS + ("RETURN",)
+
+# Rules file columns (ACTION SOURCE DEST PROTO DPORT SPORT ...); the
+# compiler uses the first COLUMNS
+RULE_COLUMNS = (
+    "action",
+    "source",
+    "dest",
+    "proto",
+    "dport",
+    "sport",
+    "origdest",
+    "rate",
+    "user",
+    "mark",
+    "connlimit",
+    "time",
+    "headers",
+    "switch",
+    "helper",
+)
+COLUMNS = 6
+
+POLICY_COLUMNS = ("source", "dest", "policy", "loglevel", "rate", "connlimit")
+
+# Macro search path after the configuration directory and CONFIG_PATH
+MACRO_PATH = (
+    Path("/usr/share/phreakwall/macros"),
+    Path(__file__).resolve().parents[2] / "Shorewall" / "Macros",
+)
+
+# Nested macro invocations deeper than this are assumed to be a loop
+MAX_MACRO_DEPTH = 8
+
+# ACTION column: NAME[(PARAMS)|/PARAM][:LEVEL]
+_ACTION_RE = re.compile(r"^([\w-]+)(?:\((.*)\)|/([^:]*))?(?::(.*))?$")
+
+_PARAM_RE = re.compile(r"\$(\d+)")
+
+# Protocols whose DPORT column holds an ICMP type
+ICMP_OPTIONS = {"icmp": "--icmp-type", "1": "--icmp-type"}
+ICMP6_OPTIONS = {"ipv6-icmp": "--icmpv6-type", "icmpv6": "--icmpv6-type", "58": "--icmpv6-type"}
+
+# Name resolution for the PROTO, DPORT and SPORT columns
+SERVICES_FILE = Path("/etc/services")
+PROTOCOLS_FILE = Path("/etc/protocols")
+
+# Protocols known without /etc/protocols, and aliases it lacks
+BUILTIN_PROTOCOLS = {
+    "icmp": "icmp",
+    "tcp": "tcp",
+    "udp": "udp",
+    "ipv6-icmp": "ipv6-icmp",
+    "icmpv6": "ipv6-icmp",
+    "icmp6": "ipv6-icmp",
+    "sctp": "sctp",
+    "udplite": "udplite",
+    "dccp": "dccp",
+    "1": "icmp",
+    "6": "tcp",
+    "17": "udp",
+    "58": "ipv6-icmp",
+    "132": "sctp",
+    "136": "udplite",
+    "33": "dccp",
+}
+
+# Protocols with ports
+PORT_PROTOCOLS = ("tcp", "udp", "sctp", "udplite", "dccp")
+
+MAX_PORT = 65535
+
+# Policies and the target that ends a zone-pair chain (None: fall through)
+POLICIES = {
+    "ACCEPT": "ACCEPT",
+    "DROP": "DROP",
+    "REJECT": "REJECT",
+    "CONTINUE": None,
+    "NONE": None,
+}
+
+
+@dataclass(frozen=True)
+class MacroRule:
+    """One rule of an expanded macro, in rules file columns."""
+
+    action: str
+    source: Optional[str] = None
+    dest: Optional[str] = None
+    proto: Optional[str] = None
+    dport: Optional[str] = None
+    sport: Optional[str] = None
+    comment: Optional[str] = None
+
+
+def parse_action(action: str) -> Tuple[str, Tuple[str, ...], str]:
+    """
+    Split an ACTION column into target, parameters and log level.
+
+    Args:
+        action: e.g. 'ACCEPT', 'DROP:info', 'HTTP(ACCEPT)', 'SSH/DROP:info'
+
+    Returns:
+        (target, parameters, level)
+    """
+    match = _ACTION_RE.match(action)
+    if not match:
+        return action, (), ""
+    name, params, param, level = match.groups()
+    if params is not None:
+        args = tuple(p.strip() for p in params.split(",")) if params else ()
+    elif param is not None:
+        args = (param,)
+    else:
+        args = ()
+    return name, args, level or ""
+
+
+def _merge_source_dest(body: str, invocation: Optional[str]) -> Optional[str]:
+    """Merge a macro SOURCE/DEST column with the invoking rule's (Shorewall rules)."""
+    if not invocation:
+        return body or None
+    if not body:
+        return invocation
+    if re.match(r".*?\.*?\.|^\+|^!+|^~|^!~|~<|~\[", invocation):
+        return f"{body}:{invocation}"
+    return f"{invocation}:{body}"
+
+
+def library_files(directories: Iterable[Path]) -> List[str]:
+    """
+    List the macro and action files in a search path.
+
+    The files a compile reads are recorded as it opens them, but a new
+    file can also shadow one read before, so caches of compiled rules
+    cover the whole listing.
+
+    Args:
+        directories: Search path, as from RuleProcessor.library_directories()
+
+    Returns:
+        Sorted file paths
+    """
+    files = set()
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        files.update(
+            entry.path
+            for entry in entries
+            if entry.name.startswith(("macro.", "action.", "actions")) and entry.is_file()
+        )
+    return sorted(files)
+
+
+class MacroLibrary:
+    """
+    Lazily parsed, memoized Shorewall macros.
+
+    Macro files are looked up by name in the search path once; the
+    first directory holding ``macro.NAME`` wins, so a macro in the
+    configuration directory overrides the shipped one.
+    """
+
+    def __init__(
+        self,
+        directories: List[Path],
+        autocomment: bool = True,
+        conditions: Optional[Conditions] = None,
+        read_files: Optional[Set[str]] = None,
+    ):
+        """
+        Initialize the macro library.
+
+        Args:
+            directories: Search path, most specific first
+            autocomment: Comment macro rules with the macro name
+            conditions: Evaluator for ?IF directives and $PARAM expansion
+            read_files: Receives the path of every macro file read,
+                INCLUDEs included (optional)
+        """
+        self.autocomment = autocomment
+        self.conditions = conditions or Conditions()
+        self.read_files = read_files
+        self.logger = logging.getLogger(__name__)
+
+        self.files: Dict[str, Path] = {}
+        self._index(directories)
+
+        self._bodies: Dict[str, Tuple[Tuple[str, ...], Tuple[Tuple, ...]]] = {}
+        self._expansions: Dict[Tuple, Tuple[MacroRule, ...]] = {}
+        self.parsed = 0
+        self.hits = 0
+
+    def _index(self, directories: List[Path]):
+        """Map macro names to files, scanning each directory once."""
+        for directory in directories:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith("macro.") and entry.is_file():
+                    self.files.setdefault(entry.name[6:], Path(entry.path))
+
+        self.logger.debug(f"Indexed {len(self.files)} macros")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.files
+
+    def _body(self, name: str) -> Tuple[Tuple[str, ...], Tuple[Tuple, ...]]:
+        """
+        Parse a macro file on first use.
+
+        Conditional sections (?if/?else/?endif) test compiler
+        capabilities such as conntrack helpers; the generated rulesets
+        do not use those, so their ?else branches apply.
+
+        Returns:
+            (default parameters, entries as (comment, columns) pairs)
+        """
+        body = self._bodies.get(name)
+        if body is not None:
+            return body
+
+        defaults: Tuple[str, ...] = ()
+        entries = []
+
+        path = self.files[name]
+        tokenizer = ConfigTokenizer(path.parent, self.conditions, files=self.read_files)
+        for record in tokenizer.records(path, RULE_COLUMNS):
+            columns = tuple(
+                None if column == "-" else column for column in record.columns[:COLUMNS]
+            )
+            if not columns:
+                continue
+            if columns[0].upper() in ("DEFAULT", "DEFAULTS"):
+                defaults = tuple((columns[1] or "").split(",")) if len(columns) > 1 else ()
+                continue
+            comment = (record.options or {}).get("comment", record.comment)
+            entries.append((comment, columns + (None,) * (COLUMNS - len(columns))))
+
+        body = self._bodies[name] = (defaults, tuple(entries))
+        self.parsed += 1
+        return body
+
+    def expand(
+        self,
+        name: str,
+        params: Tuple[str, ...],
+        level: str,
+        source: Optional[str],
+        dest: Optional[str],
+        proto: Optional[str] = None,
+        dport: Optional[str] = None,
+        sport: Optional[str] = None,
+        depth: int = 0,
+    ) -> Tuple[MacroRule, ...]:
+        """
+        Expand a macro invocation, memoized per distinct invocation.
+
+        Args:
+            name: Macro name
+            params: Invocation parameters ($1, $2, ...; $1 is PARAM)
+            level: Log level applied to entries without their own
+            source: SOURCE column of the invoking rule
+            dest: DEST column of the invoking rule
+            proto: PROTO column of the invoking rule
+            dport: DPORT column of the invoking rule
+            sport: SPORT column of the invoking rule
+            depth: Nesting depth
+
+        Returns:
+            Rules with basic targets or actions the caller resolves
+
+        Raises:
+            ValueError: For an unknown macro, a missing parameter or a loop
+        """
+        key = (name, params, level, source, dest, proto, dport, sport)
+        expansion = self._expansions.get(key)
+        if expansion is not None:
+            self.hits += 1
+            return expansion
+
+        if name not in self.files:
+            raise ValueError(f"Unknown macro {name}")
+        if depth > MAX_MACRO_DEPTH:
+            raise ValueError(f"Macro {name} nested too deeply")
+
+        defaults, entries = self._body(name)
+        params = params or defaults
+
+        def substitute(column: Optional[str]) -> Optional[str]:
+            if column is None or "$" not in column:
+                return column
+            return _PARAM_RE.sub(
+                lambda m: params[int(m.group(1)) - 1]
+                if 0 < int(m.group(1)) <= len(params)
+                else m.group(0),
+                column,
+            )
+
+        rules: List[MacroRule] = []
+        for comment, columns in entries:
+            action, msource, mdest, mproto, mdport, msport = map(substitute, columns)
+            if not action:
+                raise ValueError(f"Macro {name}: missing ACTION")
+
+            target, args, mlevel = parse_action(action)
+            if target == "PARAM":
+                if not params:
+                    raise ValueError(f"Macro {name} requires a parameter")
+                target, args, plevel = parse_action(params[0])
+                mlevel = mlevel or plevel
+            mlevel = mlevel or level
+
+            rule_source = self._column(msource, source, dest)
+            rule_dest = self._column(mdest, dest, source, swap="SOURCE")
+            rule_proto = proto or mproto
+            rule_dport = dport or mdport
+            rule_sport = sport or msport
+
+            if target in self.files:
+                # A nested macro without parameters inherits ours
+                rules.extend(
+                    self.expand(
+                        target,
+                        args or params,
+                        mlevel,
+                        rule_source,
+                        rule_dest,
+                        rule_proto,
+                        rule_dport,
+                        rule_sport,
+                        depth + 1,
+                    )
+                )
+                continue
+
+            if comment is None and self.autocomment:
+                comment = name
+            action = f"{target}:{mlevel}" if mlevel else target
+            rules.append(
+                MacroRule(
+                    action,
+                    rule_source,
+                    rule_dest,
+                    rule_proto,
+                    rule_dport,
+                    rule_sport,
+                    comment,
+                )
+            )
+
+        expansion = self._expansions[key] = tuple(rules)
+        return expansion
+
+    @staticmethod
+    def _column(
+        body: Optional[str],
+        invocation: Optional[str],
+        other: Optional[str],
+        swap: str = "DEST",
+    ) -> Optional[str]:
+        """Resolve a macro SOURCE or DEST column against the invocation."""
+        if not body:
+            return invocation
+        if body == swap or body.startswith(swap + ":"):
+            return _merge_source_dest(body[len(swap) + 1 :], other)
+        own = "SOURCE" if swap == "DEST" else "DEST"
+        if body == own or body.startswith(own + ":"):
+            body = body[len(own) + 1 :]
+        return _merge_source_dest(body, invocation)
+
+
+class ServiceResolver:
+    """
+    Protocol and service name resolution from /etc/protocols and /etc/services.
+
+    Both files are parsed once per process into read-only mappings; with
+    a compile cache the parsed tables are also kept on disk, keyed by the
+    files' mtime and size. Port columns are resolved, normalized and
+    validated in one pass and memoized, so ``ssh`` in thousands of rules
+    is looked up once.
+    """
+
+    # Parsed tables per (services, protocols, mtimes), shared by instances
+    _tables: Dict[Tuple, Tuple[Mapping[str, int], Mapping[str, str]]] = {}
+
+    def __init__(
+        self,
+        services: Path = SERVICES_FILE,
+        protocols: Path = PROTOCOLS_FILE,
+        cache=None,
+    ):
+        """
+        Initialize the resolver.
+
+        Args:
+            services: services(5) file
+            protocols: protocols(5) file
+            cache: Compile cache holding the parsed tables (optional)
+        """
+        self.services_file = Path(services)
+        self.protocols_file = Path(protocols)
+        self.cache = cache
+        self.logger = logging.getLogger(__name__)
+
+        self._services: Optional[Mapping[str, int]] = None
+        self._protocols: Optional[Mapping[str, str]] = None
+        self._ports: Dict[Tuple[str, str], str] = {}
+
+    def _load(self):
+        """Parse the files, or reuse the tables of an earlier parse."""
+        if self._services is not None:
+            return
+
+        signature = []
+        for path in (self.services_file, self.protocols_file):
+            try:
+                st = os.stat(path)
+                signature.append((str(path), st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((str(path), None, None))
+        key = tuple(signature)
+
+        tables = self._tables.get(key)
+        if tables is None:
+            if self.cache:
+                services, protocols = self.cache.memoize(
+                    "services", self.cache.digest(*key), self._parse
+                )
+            else:
+                services, protocols = self._parse()
+            tables = MappingProxyType(services), MappingProxyType(protocols)
+            self._tables[key] = tables
+        self._services, self._protocols = tables
+
+    def _parse(self) -> Tuple[Dict[str, int], Dict[str, str]]:
+        """
+        Parse the services and protocols files.
+
+        Returns:
+            ({'name/proto': port}, {name, alias or number: protocol name})
+        """
+        protocols = dict(BUILTIN_PROTOCOLS)
+        try:
+            with open(self.protocols_file) as f:
+                for line in f:
+                    fields = line.partition("#")[0].split()
+                    if len(fields) < 2 or not fields[1].isdigit():
+                        continue
+                    name = fields[0].lower()
+                    for alias in [name, fields[1]] + fields[2:]:
+                        protocols.setdefault(alias.lower(), name)
+        except OSError as e:
+            self.logger.debug(f"{self.protocols_file}: {e}, using built-in protocols")
+
+        services: Dict[str, int] = {}
+        try:
+            with open(self.services_file) as f:
+                for line in f:
+                    fields = line.partition("#")[0].split()
+                    if len(fields) < 2:
+                        continue
+                    port, _, proto = fields[1].partition("/")
+                    if not port.isdigit() or not proto:
+                        continue
+                    for name in [fields[0]] + fields[2:]:
+                        services.setdefault(f"{name}/{proto.lower()}", int(port))
+        except OSError as e:
+            self.logger.debug(f"{self.services_file}: {e}, ports must be numeric")
+
+        return services, protocols
+
+    def protocol(self, proto: str) -> str:
+        """
+        Normalize a PROTO column.
+
+        Args:
+            proto: Protocol name, alias or number, e.g. 'TCP' or '6'
+
+        Returns:
+            The protocol's canonical name; unknown numbers stay numeric
+
+        Raises:
+            ValueError: For an unknown protocol
+        """
+        self._load()
+        negated = proto.startswith("!")
+        name = proto.lstrip("!").lower()
+        canonical = self._protocols.get(name)
+        if canonical is None:
+            if not (name.isdigit() and int(name) <= 255) and name != "all":
+                raise ValueError(f"Unknown protocol ({proto})")
+            canonical = name
+        return f"!{canonical}" if negated else canonical
+
+    def ports(self, ports: str, proto: str) -> str:
+        """
+        Resolve, normalize and validate a DPORT or SPORT column.
+
+        Args:
+            ports: Port, service name or 'low:high' range, or a
+                comma-separated list of them; '!' negates the list
+            proto: Canonical protocol name from protocol()
+
+        Returns:
+            Numeric list without duplicates, e.g. '22,80,1024:65535'
+
+        Raises:
+            ValueError: For an unknown service, a port out of range or
+                ports with a protocol that has none
+        """
+        key = (ports, proto)
+        normalized = self._ports.get(key)
+        if normalized is None:
+            normalized = self._ports[key] = self._normalize(ports, proto)
+        return normalized
+
+    def _normalize(self, ports: str, proto: str) -> str:
+        if proto not in PORT_PROTOCOLS:
+            raise ValueError(f"Ports are not allowed with protocol {proto}")
+        self._load()
+
+        negated = ports.startswith("!")
+        items = []
+        for item in ports.lstrip("!").split(","):
+            if ":" in item:
+                low, _, high = item.partition(":")
+                low = self._port(low, proto) if low else 0
+                high = self._port(high, proto) if high else MAX_PORT
+                if low > high:
+                    raise ValueError(f"Invalid port range ({item})")
+                items.append(f"{low}:{high}")
+            else:
+                items.append(str(self._port(item, proto)))
+        normalized = ",".join(dict.fromkeys(items))
+        return f"!{normalized}" if negated else normalized
+
+    def _port(self, port: str, proto: str) -> int:
+        """Resolve one port number or service name."""
+        if port.isdigit():
+            number = int(port)
+            if number > MAX_PORT:
+                raise ValueError(f"Invalid port ({port})")
+            return number
+        number = self._services.get(f"{port}/{proto}")
+        if number is None:
+            raise ValueError(f"Unknown {proto} service ({port})")
+        return number
 
 
 class RuleProcessor:
     """Processes firewall rules from configuration files."""
 
-    def __init__(self, config, chain_manager, zone_manager, family: int = 4):
+    def __init__(
+        self,
+        config,
+        chain_manager,
+        zone_manager,
+        family: int = 4,
+        action_manager: Optional[ActionManager] = None,
+    ):
         """
         Initialize rule processor.
 
@@ -23,18 +612,643 @@ class RuleProcessor:
             chain_manager: Chain manager instance
             zone_manager: Zone manager instance
             family: IP family
+            action_manager: Action registry (optional; created if omitted)
         """
         self.config = config
         self.chain_manager = chain_manager
         self.zone_manager = zone_manager
         self.family = family
+        self.actions = action_manager or ActionManager(config, chain_manager)
         self.logger = logging.getLogger(__name__)
 
+        # Zone-pair chains that received rules, in creation order
+        self.rule_chains: Dict[str, object] = {}
+
+        # (source, dest) -> (policy, log level)
+        self.policies: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+        # Service and protocol names of the PROTO/DPORT/SPORT columns
+        self.resolver = ServiceResolver(cache=config.cache)
+
+        self._macros: Optional[MacroLibrary] = None
+
+    @property
+    def macros(self) -> MacroLibrary:
+        """The macro library, indexed on first use."""
+        if self._macros is None:
+            autocomment = str(self.config.get("AUTOCOMMENT", "Yes")).lower()
+            self._macros = MacroLibrary(
+                self.config.search_path() + list(MACRO_PATH),
+                autocomment not in ("no", "false", "0"),
+                self._conditions(),
+                self.config.files,
+            )
+        return self._macros
+
+    def library_directories(self) -> List[Path]:
+        """Every directory rules may read macro and action files from."""
+        directories = self.config.search_path() + list(MACRO_PATH) + list(ACTION_PATH)
+        directories.extend(path.parent for path in ACTIONS_STD)
+        return directories
+
+    @property
+    def firewall_zone(self) -> Optional[str]:
+        """Name of the firewall zone, if one is defined."""
+        return self.zone_manager.firewall_zone
+
     def generate_rules(self) -> List[str]:
         """Generate firewall rules."""
         lines = ["# Firewall rules", ""]
+
+        count = 0
+        rules_file = self.config.config_dir / "rules"
+        if rules_file.exists():
+            self.logger.debug(f"Loading rules from {rules_file}")
+
+            for record in self.config.records(
+                rules_file, RULE_COLUMNS, conditions=self._conditions()
+            ):
+                if record.columns and record.columns[0] != "SECTION":
+                    count += self._process_rule(record)
+        else:
+            self.logger.debug("No rules file found")
+
+        lines.append(f"# {count} rules in {len(self.rule_chains)} zone-pair chains")
+
+        if self.actions.instances:
+            summary = f"{len(self.actions.instances)} shared action chains"
+            if self.actions.saved > 0:
+                summary += f", {self.actions.saved} rules saved over inlining"
+            lines.append(f"# {summary}")
+            lines.extend(self.actions.report())
+            self.logger.info(summary)
+
+        self._load_policies()
+        lines.append(f"# Policies applied to {self._apply_policies()} zone-pair chains")
+
+        if str(self.config.get("AUTO_SETS", "Yes")).lower() not in ("no", "false"):
+            removed = SetCompiler(self.chain_manager).compile(
+                self.rule_chains.values()
+            )
+            if removed:
+                lines.append(f"# {removed} rules folded into sets")
+
+        if str(self.config.get("MULTIPORT", "Yes")).lower() not in ("no", "false"):
+            removed = MultiportCompiler().compile(self.rule_chains.values())
+            if removed:
+                lines.append(f"# {removed} rules eliminated by multiport coalescing")
+
+        lines.append("")
         return lines
 
+    def _process_rule(self, record: Record) -> int:
+        """
+        Compile one rules file entry.
+
+        Args:
+            record: Tokenized entry
+
+        Returns:
+            Number of chain rules generated
+        """
+        location = record.location
+        comment = (record.options or {}).get("comment", record.comment)
+        action, source, dest, proto, dport, sport = (
+            record.get(index) for index in range(COLUMNS)
+        )
+
+        target, params, level = parse_action(action or "")
+        if target in TARGETS:
+            return self._compile_rule(
+                target, level, source, dest, proto, dport, sport, comment, location
+            )
+
+        if target in self.actions:
+            return self._compile_action(
+                target,
+                params,
+                level,
+                source,
+                dest,
+                proto,
+                dport,
+                sport,
+                comment,
+                location,
+            )
+
+        if target not in self.macros:
+            raise ConfigError(f"{location}: unsupported action {action}")
+
+        try:
+            expansion = self.macros.expand(
+                target, params, level, source, dest, proto, dport, sport
+            )
+        except ValueError as e:
+            raise ConfigError(f"{location}: {e}") from None
+
+        count = 0
+        for rule in expansion:
+            target, params, level = parse_action(rule.action)
+            if target in self.actions:
+                count += self._compile_action(
+                    target,
+                    params,
+                    level,
+                    rule.source,
+                    rule.dest,
+                    rule.proto,
+                    rule.dport,
+                    rule.sport,
+                    comment or rule.comment,
+                    location,
+                )
+                continue
+            if target not in TARGETS:
+                raise ConfigError(
+                    f"{location}: unsupported action {rule.action} in macro"
+                )
+            count += self._compile_rule(
+                target,
+                level,
+                rule.source,
+                rule.dest,
+                rule.proto,
+                rule.dport,
+                rule.sport,
+                comment or rule.comment,
+                location,
+            )
+        return count
+
+    def _compile_rule(
+        self,
+        target: str,
+        level: str,
+        source: Optional[str],
+        dest: Optional[str],
+        proto: Optional[str],
+        dport: Optional[str],
+        sport: Optional[str],
+        comment: Optional[str],
+        location: str,
+    ) -> int:
+        """
+        Compile a rule with a basic target into its zone-pair chains.
+
+        Returns:
+            Number of chain rules generated
+
+        Raises:
+            ConfigError: For an unknown zone, an invalid address or an
+                unknown protocol or service
+        """
+        if target == "LOG" and not level:
+            level = "info"
+
+        sources = self._endpoints(source, location)
+        dests = self._endpoints(dest, location)
+
+        try:
+            variants = self._matches(proto, dport, sport)
+        except ValueError as e:
+            raise ConfigError(f"{location}: {e}") from None
+
+        count = 0
+        for src_zone, src_addrs in sources:
+            for dst_zone, dst_addrs in dests:
+                if src_zone == dst_zone and (source == "all" or dest == "all"):
+                    continue
+                chain = self._rule_chain(
+                    self.zone_manager.pair_chain(src_zone, dst_zone)
+                )
+                for src_addr in src_addrs:
+                    for dst_addr in dst_addrs:
+                        for matches in variants:
+                            for rule in self._rules(
+                                chain.name,
+                                target,
+                                level,
+                                matches,
+                                src_addr,
+                                dst_addr,
+                                comment,
+                            ):
+                                chain.add_rule(rule)
+                                count += 1
+        return count
+
+    def _matches(
+        self, proto: Optional[str], dport: Optional[str], sport: Optional[str]
+    ) -> List[List[Match]]:
+        """
+        Build the protocol and port matches of an entry.
+
+        A port list longer than one multiport match takes is split, so
+        the entry needs a rule per part.
+
+        Returns:
+            One match list per rule
+
+        Raises:
+            ValueError: For an unknown protocol or service, invalid ports
+                or a negated port list that does not fit one match
+        """
+        variants: List[List[Match]] = [[]]
+        if proto:
+            proto = self.resolver.protocol(proto)
+            negated = proto.startswith("!")
+            proto = proto.lstrip("!")
+            variants[0].append(Match.get("-p", (proto,), negated))
+            icmp = (ICMP6_OPTIONS if self.family == 6 else ICMP_OPTIONS).get(proto)
+            if icmp:
+                if dport:
+                    variants[0].append(Match.get(icmp, (dport,)))
+                dport = sport = None
+            for option, ports in (("dport", dport), ("sport", sport)):
+                if not ports:
+                    continue
+                ports = self.resolver.ports(ports, proto)
+                negated = ports.startswith("!")
+                ports = ports.lstrip("!")
+                if "," not in ports:
+                    for matches in variants:
+                        matches.append(Match.get(f"--{option}", (ports,), negated))
+                    continue
+                groups = split_ports(ports)
+                if negated and len(groups) > 1:
+                    # '! a or ! b' would match every port
+                    raise ValueError(
+                        f"More than {MAX_MULTIPORT} ports cannot be negated (!{ports})"
+                    )
+                variants = [
+                    matches
+                    + [
+                        Match.get("-m", ("multiport",)),
+                        Match.get(f"--{option}s", (group,), negated),
+                    ]
+                    for matches in variants
+                    for group in groups
+                ]
+        return variants
+
+    def _compile_action(
+        self,
+        name: str,
+        params: Tuple[str, ...],
+        level: str,
+        source: Optional[str],
+        dest: Optional[str],
+        proto: Optional[str],
+        dport: Optional[str],
+        sport: Optional[str],
+        comment: Optional[str],
+        location: str,
+    ) -> int:
+        """
+        Compile an action invocation into jumps to its shared chain.
+
+        Returns:
+            Number of chain rules generated
+        """
+        instance = self._action_instance(name, params, level, location)
+        proto = proto or self.actions.declaration(name).proto
+        jumps = self._compile_rule(
+            instance.chain, "", source, dest, proto, dport, sport, comment, location
+        )
+        instance.references += jumps
+        return jumps
+
+    def _action_instance(
+        self, name: str, params: Tuple[str, ...], level: str, location: str
+    ):
+        """
+        Instantiate an action.
+
+        Raises:
+            ConfigError: If the action body cannot be compiled
+        """
+
+        def populate(chain, instance):
+            native = NATIVE_ACTIONS.get(instance.name)
+            if native:
+                native(self.actions, chain, instance)
+            else:
+                self._populate_action(chain, instance, location)
+
+        try:
+            return self.actions.instantiate(name, params, level, populate)
+        except (ValueError, OSError, ConfigError) as e:
+            raise ConfigError(f"{location}: action {name}: {e}") from None
+
+    def _populate_action(self, chain, instance, location: str):
+        """
+        Compile an action file into its chain.
+
+        Raises:
+            ConfigError: For an ?ERROR directive, a malformed body or an
+                invalid entry
+            ValueError: For an invalid state action parameter
+        """
+        declaration = self.actions.declaration(instance.name)
+        level = instance.level.partition(":")[0]
+        perl: List[List[str]] = []
+
+        if declaration.state:
+            # A state action dispatches its first parameter on the state
+            state = [
+                Match.get("-m", ("conntrack",)),
+                Match.get("--ctstate", (declaration.state,)),
+            ]
+            target = instance.params[0] if instance.params else "-"
+            self._action_entry(
+                chain, (target,), state, level, None, location, instance.name
+            )
+
+        records = self.config.records(
+            declaration.path,
+            RULE_COLUMNS,
+            conditions=self._conditions(instance.params),
+            perl=perl.append,
+        )
+        for record in records:
+            if record.columns and record.columns[0].upper() in ("DEFAULT", "DEFAULTS"):
+                continue
+
+            columns = [record.get(index, "-") for index in range(COLUMNS)]
+            extra: List[Match] = []
+            if record.passthrough:
+                # ';;' passes raw iptables matches ('+' only affects inlining)
+                rule = Rule.parse(record.passthrough.lstrip("+"))
+                extra = list(rule.matches)
+                columns[1] = rule.source or columns[1]
+                columns[2] = rule.destination or columns[2]
+
+            try:
+                self._action_entry(
+                    chain,
+                    tuple(columns),
+                    extra,
+                    level,
+                    (record.options or {}).get("comment", record.comment),
+                    location,
+                    instance.name,
+                )
+            except ValueError as e:
+                raise ConfigError(f"{record.location}: {e}") from None
+
+        if perl:
+            self.logger.warning(
+                f"Action {instance.name} uses embedded Perl, which is not supported"
+            )
+
+    def _action_entry(
+        self,
+        chain,
+        columns: Tuple[str, ...],
+        extra: List[Match],
+        level: str,
+        comment: Optional[str],
+        location: str,
+        action: str,
+    ):
+        """
+        Compile one entry of an action body into the action chain.
+
+        Raises:
+            ValueError: For an unsupported target, an unknown macro,
+                protocol or service, or invalid ports
+        """
+        columns = tuple(columns) + ("-",) * (COLUMNS - len(columns))
+        target, source, dest, proto, dport, sport = (
+            None if column == "-" else column for column in columns[:COLUMNS]
+        )
+        if not target:
+            raise ValueError(f"Action {action}: missing ACTION")
+
+        target, params, elevel = parse_action(target)
+        elevel = elevel or level
+        if elevel.lower() in ("none", "-"):
+            elevel = ""
+
+        if target in self.macros and target not in self.actions:
+            for rule in self.macros.expand(
+                target, params, elevel, source, dest, proto, dport, sport
+            ):
+                self._action_entry(
+                    chain,
+                    (
+                        rule.action,
+                        rule.source or "-",
+                        rule.dest or "-",
+                        rule.proto or "-",
+                        rule.dport or "-",
+                        rule.sport or "-",
+                    ),
+                    extra,
+                    "",
+                    comment or rule.comment,
+                    location,
+                    action,
+                )
+            return
+
+        instance = None
+        if target in self.actions:
+            instance = self._action_instance(target, params, elevel, location)
+            proto = proto or self.actions.declaration(target).proto
+            target, elevel = instance.chain, ""
+        elif target not in ACTION_TARGETS:
+            raise ValueError(f"Action {action}: unsupported action {target}")
+
+        sources = [a for a in (source or "").split(",") if a] or [None]
+        dests = [a for a in (dest or "").split(",") if a] or [None]
+        variants = [matches + extra for matches in self._matches(proto, dport, sport)]
+        for src_addr in sources:
+            if src_addr and not self._in_family(src_addr.lstrip("!")):
+                continue
+            for dst_addr in dests:
+                if dst_addr and not self._in_family(dst_addr.lstrip("!")):
+                    continue
+                for matches in variants:
+                    for rule in self._rules(
+                        chain.name, target, elevel, matches, src_addr, dst_addr, comment
+                    ):
+                        chain.add_rule(rule)
+                        if instance:
+                            instance.references += 1
+
+    def _rules(
+        self,
+        chain_name: str,
+        target: str,
+        level: str,
+        matches: List[Match],
+        source: Optional[str],
+        destination: Optional[str],
+        comment: Optional[str] = None,
+    ) -> List[Rule]:
+        """Build the chain rules of one entry, log rule first."""
+        rules = []
+        if level:
+            rules.append(
+                Rule(
+                    matches,
+                    "LOG",
+                    source=source,
+                    destination=destination,
+                    comment=comment,
+                    target_options=[
+                        Match.get(
+                            "--log-prefix", (f"Shorewall:{chain_name}:{target}:",)
+                        ),
+                        Match.get("--log-level", (level,)),
+                    ],
+                )
+            )
+        if target != "LOG":
+            rules.append(
+                Rule(
+                    matches,
+                    target,
+                    source=source,
+                    destination=destination,
+                    comment=comment,
+                )
+            )
+        return rules
+
+    def _endpoints(
+        self, column: Optional[str], location: str
+    ) -> List[Tuple[str, List[Optional[str]]]]:
+        """
+        Parse a SOURCE or DEST column of the form zone[:address,...].
+
+        Returns:
+            (zone, addresses) pairs; empty if no address is of this family
+
+        Raises:
+            ConfigError: For a missing or unknown zone or an invalid address
+        """
+        if not column:
+            raise ConfigError(f"{location}: missing zone")
+
+        zone, _, addresses = column.partition(":")
+        addrs: List[Optional[str]] = [None]
+        if addresses:
+            addrs = [a for a in addresses.split(",") if self._in_family(a)]
+            if not addrs:
+                return []
+            try:
+                addrs = collapse(addrs, self.family)
+            except AddressError as e:
+                raise ConfigError(f"{location}: {e}") from None
+
+        if zone == "all":
+            return [(name, addrs) for name in self.zone_manager.zones]
+        if zone not in self.zone_manager.zones:
+            raise ConfigError(f"{location}: unknown zone {zone}")
+        return [(zone, addrs)]
+
+    def _load_policies(self):
+        """Load the policy file (SOURCE DEST POLICY [LOGLEVEL])."""
+        policy_file = self.config.config_dir / "policy"
+        if not policy_file.exists():
+            self.logger.debug("No policy file found")
+            return
+
+        for record in self.config.records(
+            policy_file, POLICY_COLUMNS, conditions=self._conditions()
+        ):
+            source, dest, policy = (record.get(column) for column in POLICY_COLUMNS[:3])
+            if not source or not dest or not policy:
+                self.logger.warning(f"{record.location}: invalid policy entry")
+                continue
+
+            policy = policy.split(":", 1)[0]
+            if policy not in POLICIES:
+                self.logger.warning(
+                    f"{record.location}: unsupported policy {policy}"
+                )
+                continue
+
+            level = record.get("loglevel", "")
+            # The first entry for a pair wins, as in Shorewall
+            self.policies.setdefault((source, dest), (policy, level))
+
+    def policy(self, source: str, dest: str) -> Optional[Tuple[str, str]]:
+        """
+        Find the policy for a zone pair.
+
+        Args:
+            source: Source zone
+            dest: Destination zone
+
+        Returns:
+            (policy, log level), or None if no entry applies
+        """
+        for key in ((source, dest), (source, "all"), ("all", dest), ("all", "all")):
+            if key in self.policies:
+                return self.policies[key]
+        if source == dest:
+            return ("ACCEPT", "")  # Implicit intra-zone policy
+        return None
+
+    def _apply_policies(self) -> int:
+        """
+        End every zone-pair chain with its policy.
+
+        Returns:
+            Number of chains that received a policy
+        """
+        applied = 0
+        for src in self.zone_manager.zones:
+            for dst in self.zone_manager.zones:
+                chain = self.chain_manager.get_chain(
+                    self.zone_manager.pair_chain(src, dst)
+                )
+                policy = self.policy(src, dst)
+                if chain is None or policy is None:
+                    continue
+
+                name, level = policy
+                target = POLICIES[name]
+                if level and target:
+                    chain.add_rule(
+                        Rule(
+                            target="LOG",
+                            target_options=[
+                                Match.get(
+                                    "--log-prefix", (f"Shorewall:{chain.name}:{name}:",)
+                                ),
+                                Match.get("--log-level", (level,)),
+                            ],
+                        )
+                    )
+                if target:
+                    chain.add_rule(Rule(target=target))
+                applied += 1
+        return applied
+
+    def _in_family(self, address: str) -> bool:
+        """True if an address belongs to the processor's IP family."""
+        return (":" in address) == (self.family == 6)
+
+    def _conditions(self, params: Optional[Tuple[str, ...]] = None) -> Conditions:
+        """Evaluator over the params, with $FW naming the firewall zone."""
+        conditions = Conditions(self.family, params, self.config.params)
+        if self.firewall_zone:
+            conditions.variables.maps.insert(1, {"FW": self.firewall_zone})
+        return conditions
+
+    def _rule_chain(self, name: str):
+        """Return the zone-pair chain, creating it on first use."""
+        chain = self.chain_manager.get_chain(name)
+        if chain is None:
+            chain = self.chain_manager.create_chain(name, ChainType.FILTER)
+        self.rule_chains.setdefault(name, chain)
+        return chain
+
     def validate(self):
         """Validate rule configuration."""
         self.logger.debug("Validating rules")
@@ -4,13 +4,45 @@ Phreakwall Zone Management
 
 Manages network zones and inter-zone policies.
 
+Packets reach their zone-pair chain through two levels of dispatch
+instead of one linear list of zone-pair jumps: the built-in chains
+classify by ingress interface (and host addresses) into the source
+zone, and a per-source-zone forward chain classifies by egress into the
+pair chain. Each level is a short run of interface rules, which the
+nftables backend folds into a single verdict map lookup.
+
 Copyright (c) 2025 Phreakwall Contributors
 """
 
 import logging
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
+
+from phreakwall.core.addresses import AddressError, Overlap, collapse, find_overlaps
+from phreakwall.core.chains import ChainType
+from phreakwall.core.rule import Match, Rule
+
+# A dispatch entry: (zone, interface, address or None)
+Dispatch = Tuple[str, str, Optional[str]]
+
+ZONE_COLUMNS = ("zone", "type", "options", "in_options", "out_options")
+
+# ?FORMAT 1 interfaces files carry a BROADCAST column before OPTIONS
+INTERFACE_COLUMNS = {
+    1: ("zone", "interface", "broadcast", "options"),
+    2: ("zone", "interface", "options"),
+}
+
+HOST_COLUMNS = ("zone", "hosts", "options")
+
+
+def _unbracket(address: str) -> str:
+    """Strip the brackets of an IPv6 host address: [2001:db8::]/64."""
+    if address.startswith("["):
+        inner, _, rest = address[1:].partition("]")
+        return inner + rest
+    return address
 
 
 @dataclass
@@ -20,25 +52,41 @@ class Zone:
     name: str
     zone_type: str
     options: List[str] = None
+    parents: List[str] = None
+    interfaces: Dict[str, List[str]] = None  # interface -> options
+    hosts: Dict[str, List[str]] = None  # interface -> addresses
 
     def __post_init__(self):
         if self.options is None:
             self.options = []
+        if self.parents is None:
+            self.parents = []
+        if self.interfaces is None:
+            self.interfaces = {}
+        if self.hosts is None:
+            self.hosts = {}
+
+    @property
+    def addresses(self) -> List[str]:
+        """Host addresses of the zone on all interfaces."""
+        return [address for hosts in self.hosts.values() for address in hosts]
 
 
 class ZoneManager:
     """Manages network zones and zone policies."""
 
-    def __init__(self, config, family: int = 4):
+    def __init__(self, config, family: int = 4, chain_manager=None):
         """
         Initialize zone manager.
 
         Args:
             config: Configuration object
             family: IP family
+            chain_manager: Chain manager receiving the dispatch chains
         """
         self.config = config
         self.family = family
+        self.chain_manager = chain_manager
         self.logger = logging.getLogger(__name__)
 
         self.zones: Dict[str, Zone] = {}
@@ -52,29 +100,300 @@ class ZoneManager:
             self.logger.warning("No zones file found")
             return
 
+        interfaces_file = self.config.config_dir / "interfaces"
+        hosts_file = self.config.config_dir / "hosts"
+
+        # $PARAMS and ?IF conditions in these files come from params and
+        # phreakwall.conf; INCLUDEd files are validated by get_checked()
+        cache = self.config.cache
+        key = None
+        if cache:
+            key = cache.digest(
+                "zones",
+                self.family,
+                cache.file_digest(zones_file),
+                cache.file_digest(interfaces_file),
+                cache.file_digest(hosts_file),
+                cache.file_digest(self.config.config_dir / "params"),
+                cache.file_digest(self.config.config_dir / "phreakwall.conf"),
+            )
+            cached = cache.get_checked("zones", key)
+            if cached is not None:
+                self.zones, files = cached
+                self.config.files.update(files)
+                self.logger.info(f"Loaded {len(self.zones)} zones from cache")
+                return
+
         self.logger.debug(f"Loading zones from {zones_file}")
 
-        with zones_file.open() as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
+        files: Set[str] = set()
+        for record in self.config.records(zones_file, ZONE_COLUMNS, files=files):
+            parts = record.columns
+            if len(parts) >= 2:
+                name, _, parents = parts[0].partition(":")
+                zone_type = parts[1]
+                options = parts[2:] if len(parts) > 2 else []
+                self.zones[name] = Zone(
+                    name, zone_type, options, [p for p in parents.split(",") if p]
+                )
 
-                parts = line.split()
-                if len(parts) >= 2:
-                    name, zone_type = parts[0], parts[1]
-                    options = parts[2:] if len(parts) > 2 else []
-                    self.zones[name] = Zone(name, zone_type, options)
+        if interfaces_file.exists():
+            self._load_interfaces(interfaces_file, files)
+        if hosts_file.exists():
+            self._load_hosts(hosts_file, files)
+
+        self.config.files.update(files)
+        if key:
+            cache.put_checked("zones", key, self.zones, files)
 
         self.logger.info(f"Loaded {len(self.zones)} zones")
 
+    def _load_interfaces(self, interfaces_file: Path, files: Set[str]):
+        """
+        Load zone interfaces from the interfaces file.
+
+        Each entry is ZONE INTERFACE [OPTIONS] (?FORMAT 2, the default)
+        or ZONE INTERFACE BROADCAST [OPTIONS] (?FORMAT 1); a '-' zone
+        declares an interface whose zones are given in the hosts file.
+        Every file read is added to files.
+        """
+        self.logger.debug(f"Loading interfaces from {interfaces_file}")
+
+        for record in self.config.records(
+            interfaces_file, INTERFACE_COLUMNS[2], format=2, files=files
+        ):
+            if record.format == 1:
+                record.names = INTERFACE_COLUMNS[1]
+            zone, interface = record.get("zone"), record.get("interface")
+            if not zone or not interface:
+                self.logger.warning(f"{record.location}: invalid entry")
+                continue
+
+            interface = interface.split(":", 1)[0]
+            if zone == "-":
+                continue
+            if zone not in self.zones:
+                self.logger.warning(f"{record.location}: unknown zone {zone}")
+                continue
+
+            options = record.get("options", "").split(",")
+            self.zones[zone].interfaces[interface] = [o for o in options if o]
+
+    def _load_hosts(self, hosts_file: Path, files: Set[str]):
+        """
+        Load zone host lists from the hosts file.
+
+        Each entry is ZONE INTERFACE:ADDRESS[,ADDRESS...], IPv6 addresses
+        optionally in brackets ([2001:db8::]/64); the addresses of a zone
+        on an interface are collapsed to their minimal CIDR cover.
+        Every file read is added to files.
+        """
+        self.logger.debug(f"Loading hosts from {hosts_file}")
+
+        hosts: Dict[Tuple[str, str], List[str]] = {}
+        for record in self.config.records(hosts_file, HOST_COLUMNS, files=files):
+            zone, host = record.get("zone"), record.get("hosts")
+            if not zone or not host or ":" not in host:
+                self.logger.warning(f"{record.location}: invalid entry")
+                continue
+
+            if zone not in self.zones:
+                self.logger.warning(f"{record.location}: unknown zone {zone}")
+                continue
+
+            interface, addresses = host.split(":", 1)
+            hosts.setdefault((zone, interface), []).extend(
+                _unbracket(a) for a in addresses.split(",") if (":" in a) == (self.family == 6)
+            )
+
+        for (zone, interface), addresses in hosts.items():
+            if not addresses:
+                continue
+            try:
+                self.zones[zone].hosts[interface] = collapse(addresses, self.family)
+            except AddressError as e:
+                self.logger.warning(f"hosts: zone {zone}: {e}")
+
+    def find_overlaps(self) -> List[Overlap]:
+        """
+        Find host addresses claimed by more than one zone.
+
+        Overlaps between a zone and one of its parent zones are expected
+        (nested zones) and not reported.
+
+        Returns:
+            Overlaps between unrelated zones
+        """
+        lists = {
+            zone.name: zone.addresses for zone in self.zones.values() if zone.hosts
+        }
+        return [
+            overlap
+            for overlap in find_overlaps(lists, self.family)
+            if not self._nested(overlap.first, overlap.second)
+        ]
+
+    def _ancestors(self, name: str) -> set:
+        """All (transitive) parent zones of a zone."""
+        seen: set = set()
+        pending = list(self.zones[name].parents) if name in self.zones else []
+        while pending:
+            parent = pending.pop()
+            if parent not in seen:
+                seen.add(parent)
+                if parent in self.zones:
+                    pending.extend(self.zones[parent].parents)
+        return seen
+
+    def _nested(self, first: str, second: str) -> bool:
+        """True if one zone is a (transitive) sub-zone of the other."""
+        return first in self._ancestors(second) or second in self._ancestors(first)
+
+    @property
+    def firewall_zone(self) -> Optional[str]:
+        """Name of the firewall zone, if one is defined."""
+        for zone in self.zones.values():
+            if zone.zone_type == "firewall":
+                return zone.name
+        return None
+
+    @staticmethod
+    def pair_chain(source: str, dest: str) -> str:
+        """Name of the chain holding the rules from one zone to another."""
+        return f"{source}2{dest}"
+
+    @staticmethod
+    def forward_chain(source: str) -> str:
+        """Name of the per-source-zone egress dispatch chain."""
+        return f"{source}_frwd"
+
+    def dispatch_entries(self) -> List[Dispatch]:
+        """
+        Return where each zone is attached, most specific first.
+
+        Host entries precede whole-interface entries, and sub-zones
+        precede their parents, so the first matching entry decides the
+        zone as Shorewall does.
+
+        Returns:
+            (zone, interface, address) triples; address None for a whole
+            interface
+        """
+        hosts = [
+            (len(self._ancestors(zone.name)), zone.name, interface, address)
+            for zone in self.zones.values()
+            for interface, addresses in zone.hosts.items()
+            for address in addresses
+        ]
+        hosts.sort(key=lambda entry: -entry[0])
+
+        entries = [(zone, interface, address) for _, zone, interface, address in hosts]
+        entries.extend(
+            (zone.name, interface, None)
+            for zone in self.zones.values()
+            if zone.zone_type != "firewall"
+            for interface in zone.interfaces
+        )
+        return entries
+
+    def _intrazone(self, name: str) -> bool:
+        """True if traffic may be routed between hosts of one zone."""
+        zone = self.zones[name]
+        attachments = len(zone.interfaces) + sum(map(len, zone.hosts.values()))
+        return attachments > 1 or any(
+            "routeback" in options for options in zone.interfaces.values()
+        )
+
     def generate_zone_rules(self) -> List[str]:
-        """Generate zone-related firewall rules."""
+        """
+        Generate the zone-pair chains and the dispatch into them.
+
+        Layout (fw is the firewall zone):
+
+            INPUT       -i IF [-s ADDR] -j net2fw
+            OUTPUT      -o IF [-d ADDR] -j fw2net
+            FORWARD     -i IF [-s ADDR] -j net_frwd
+            net_frwd    -o IF [-d ADDR] -j net2loc
+
+        Every zone pair is reached in at most two jumps. Pair chains
+        start by accepting established traffic; the rules and policy
+        phases fill in the rest.
+
+        Returns:
+            Comment lines summarizing the dispatch
+        """
         lines = ["# Zone rules", ""]
 
         for zone in self.zones.values():
             lines.append(f"# Zone: {zone.name} ({zone.zone_type})")
 
+        if self.chain_manager is None:
+            lines.append("")
+            return lines
+
+        fw = self.firewall_zone
+        entries = self.dispatch_entries()
+        sources = list(dict.fromkeys(zone for zone, _, _ in entries))
+
+        fastaccept = str(self.config.get("FASTACCEPT", "No")).lower() in ("yes", "1")
+        established = [
+            Match.get("-m", ("conntrack",)),
+            Match.get("--ctstate", ("ESTABLISHED,RELATED",)),
+        ]
+
+        def pair(source: str, dest: str) -> str:
+            name = self.pair_chain(source, dest)
+            if not self.chain_manager.get_chain(name):
+                chain = self.chain_manager.create_chain(name, ChainType.FILTER)
+                if not fastaccept:
+                    chain.add_rule(Rule(established, "ACCEPT"))
+            return name
+
+        def dispatch(option: str, interface: str, address: Optional[str], target):
+            matches = [Match.get(option, (interface,))]
+            if option == "-i":
+                return Rule(matches, target, source=address)
+            return Rule(matches, target, destination=address)
+
+        for name in ("INPUT", "OUTPUT", "FORWARD"):
+            builtin = self.chain_manager.get_chain(name)
+            loopback = "-o" if name == "OUTPUT" else "-i"
+            if fastaccept:
+                builtin.add_rule(Rule(established, "ACCEPT"))
+            if name != "FORWARD":
+                builtin.add_rule(Rule([Match.get(loopback, ("lo",))], "ACCEPT"))
+
+        pairs = 0
+        for zone, interface, address in entries:
+            if fw:
+                self.chain_manager.add_rule(
+                    "INPUT", dispatch("-i", interface, address, pair(zone, fw))
+                )
+                self.chain_manager.add_rule(
+                    "OUTPUT", dispatch("-o", interface, address, pair(fw, zone))
+                )
+                pairs += 2
+            self.chain_manager.add_rule(
+                "FORWARD",
+                dispatch("-i", interface, address, self.forward_chain(zone)),
+            )
+
+        for source in sources:
+            forward = self.chain_manager.create_chain(
+                self.forward_chain(source), ChainType.FILTER
+            )
+            for dest, interface, address in entries:
+                if dest == source and not self._intrazone(source):
+                    continue
+                forward.add_rule(
+                    dispatch("-o", interface, address, pair(source, dest))
+                )
+                pairs += 1
+
+        lines.append(
+            f"# {len(entries)} zone attachments, {len(sources)} source zones, "
+            f"{pairs} dispatch rules"
+        )
         lines.append("")
         return lines
 
@@ -85,4 +404,7 @@ class ZoneManager:
         if not self.zones:
             self.logger.warning("No zones defined")
 
+        for overlap in self.find_overlaps():
+            self.logger.warning(f"Zones {overlap}")
+
         self.logger.debug("Zone validation passed")
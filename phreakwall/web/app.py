@@ -7,16 +7,23 @@ Flask-based web interface for managing Phreakwall firewall.
 Copyright (c) 2025 Phreakwall Contributors
 """
 
+import json
+import math
 import os
 import secrets
+import time
 from pathlib import Path
 from functools import wraps
 
-from flask import flash, Flask, jsonify, redirect, render_template, request, session, url_for
+from flask import flash, Flask, jsonify, redirect, render_template, request, Response, session, stream_with_context, url_for
 from werkzeug.security import check_password_hash, generate_password_hash
 from phreakwall import __version__
-from phreakwall.core.compiler import Compiler, CompilerOptions
+from phreakwall.core.compiler import Compiler
 from phreakwall.core.config import Config
+from phreakwall.daemon import DEFAULT_SOCKET, DaemonClient, DaemonError
+from phreakwall.web.jobs import JobError, JobManager
+from phreakwall.web.metrics import WINDOWS, MetricsSampler, delta
+from phreakwall.web.timeseries import DEFAULT_STORE, MetricStore, StoreError
 
 
 # Simple user store (in production, use a database)
@@ -35,13 +42,44 @@ def login_required(f):
     return decorated_function
 
 
-def create_app(config_dir="/etc/phreakwall"):
+def create_app(
+    config_dir="/etc/phreakwall",
+    socket=DEFAULT_SOCKET,
+    workers=2,
+    job_timeout=300.0,
+    metrics_interval=2.0,
+    metrics_store=DEFAULT_STORE,
+):
     """Create and configure the Flask application."""
     app = Flask(__name__)
     app.secret_key = os.environ.get("SECRET_KEY", secrets.token_hex(32))
     app.config["CONFIG_DIR"] = Path(config_dir)
+    app.config["DAEMON_SOCKET"] = Path(socket) if socket else None
     app.config["PERMANENT_SESSION_LIFETIME"] = 3600  # 1 hour
 
+    # Checks and compiles run as background jobs
+    jobs = JobManager(
+        app.config["CONFIG_DIR"],
+        socket=app.config["DAEMON_SOCKET"],
+        workers=workers,
+        timeout=job_timeout,
+    )
+    app.extensions["phreakwall_jobs"] = jobs
+
+    # Metrics history; read-only if another process already records it
+    store = None
+    if metrics_store:
+        try:
+            store = MetricStore(metrics_store)
+        except (OSError, StoreError) as e:
+            app.logger.warning("Metrics history disabled: %s", e)
+
+    # One sampler for all dashboards, started on first use
+    sampler = MetricsSampler(
+        interval=metrics_interval, history=max(WINDOWS.values()), store=store
+    )
+    app.extensions["phreakwall_metrics"] = sampler
+
     @app.route("/login", methods=["GET", "POST"])
     def login():
         """Login page."""
@@ -122,43 +160,105 @@ def create_app(config_dir="/etc/phreakwall"):
 
         return redirect(url_for("config"))
 
+    def daemon_request(command, **args):
+        """Run a command in phreakwalld; None if it is not running."""
+        if not app.config["DAEMON_SOCKET"]:
+            return None
+        client = DaemonClient(app.config["DAEMON_SOCKET"])
+        if not client.available():
+            return None
+        try:
+            return client.request(
+                command, directory=str(app.config["CONFIG_DIR"].resolve()), **args
+            )
+        except DaemonError as e:
+            return e.response
+
     @app.route("/check")
     @login_required
     def check():
-        """Validate configuration."""
-        options = CompilerOptions(directory=app.config["CONFIG_DIR"])
-        compiler = Compiler(options)
-
-        try:
-            compiler.initialize_components()
-            compiler.validate_configuration()
-            result = {"status": "success", "message": "Configuration is valid"}
-        except Exception as e:
-            result = {"status": "error", "message": str(e)}
-
-        return jsonify(result)
+        """Validate configuration in the background."""
+        return submit_job("check")
 
     @app.route("/compile", methods=["POST"])
     @login_required
     def compile_config():
-        """Compile firewall configuration."""
-        output = Path("/var/lib/phreakwall/firewall.sh")
-        options = CompilerOptions(script=output, directory=app.config["CONFIG_DIR"])
-        compiler = Compiler(options)
+        """Compile firewall configuration in the background."""
+        return submit_job("compile", output="/var/lib/phreakwall/firewall.sh")
 
+    def submit_job(kind, **args):
+        """Queue a job and answer with its id (202 Accepted)."""
         try:
-            result = compiler.compile()
-            if result == 0:
-                return jsonify(
-                    {
-                        "status": "success",
-                        "message": f"Compiled successfully to {output}",
-                    }
-                )
-            else:
-                return jsonify({"status": "error", "message": "Compilation failed"})
-        except Exception as e:
-            return jsonify({"status": "error", "message": str(e)})
+            job, merged = jobs.submit(kind, **args)
+        except JobError as e:
+            return jsonify({"status": "error", "message": str(e)}), 503
+        return (
+            jsonify(
+                {
+                    "status": "accepted",
+                    "message": f"{kind.capitalize()} job {job.state}",
+                    "merged": merged,
+                    "job": job.to_dict(events=False),
+                    "url": url_for("api_job", job_id=job.id),
+                }
+            ),
+            202,
+        )
+
+    @app.route("/api/jobs", methods=["GET", "POST"])
+    @login_required
+    def api_jobs():
+        """List jobs, or submit one: {"kind": "check"|"compile", "backend": ...}."""
+        if request.method == "GET":
+            return jsonify([job.to_dict(events=False) for job in jobs.jobs()])
+
+        data = request.get_json(silent=True) or {}
+        kind = data.get("kind", "check")
+        if kind == "compile":
+            backend = data.get("backend", "restore")
+            if backend not in Compiler.BACKENDS:
+                return jsonify({"status": "error", "message": f"Unknown backend: {backend}"}), 400
+            return submit_job(kind, output="/var/lib/phreakwall/firewall.sh", backend=backend)
+        return submit_job(kind)
+
+    @app.route("/api/jobs/<job_id>", methods=["GET", "DELETE"])
+    @login_required
+    def api_job(job_id):
+        """Poll a job, or cancel it with DELETE."""
+        if request.method == "DELETE":
+            job = jobs.cancel(job_id)
+        else:
+            job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": "No such job"}), 404
+        return jsonify(job.to_dict())
+
+    @app.route("/api/jobs/<job_id>/events")
+    @login_required
+    def api_job_events(job_id):
+        """Stream a job's events and final state as Server-Sent Events."""
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": "No such job"}), 404
+
+        def stream():
+            seen = 0
+            while True:
+                events = jobs.wait(job, seen, timeout=15.0)
+                for event in events:
+                    yield f"event: log\ndata: {json.dumps(event)}\n\n"
+                seen += len(events)
+                if job.done and seen == len(job.events):
+                    yield f"event: done\ndata: {json.dumps(job.to_dict(events=False))}\n\n"
+                    return
+                if not events:
+                    yield ": keepalive\n\n"
+
+        return Response(
+            stream_with_context(stream()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
     @app.route("/status")
     @login_required
@@ -170,11 +270,13 @@ def create_app(config_dir="/etc/phreakwall"):
     @login_required
     def api_status():
         """API endpoint for status."""
+        response = daemon_request("status")
         return jsonify(
             {
                 "version": __version__,
                 "config_dir": str(app.config["CONFIG_DIR"]),
                 "firewall_state": "unknown",
+                "daemon": response["result"] if response and response["ok"] else None,
             }
         )
 
@@ -350,54 +452,74 @@ def create_app(config_dir="/etc/phreakwall"):
     @app.route("/api/metrics")
     @login_required
     def api_metrics():
-        """API for metrics data."""
-        import time
-
+        """Latest metrics sample; ?window=1m|15m|1h adds a summary."""
+        sampler.start()
+        data = sampler.latest().to_dict()
+
+        window = request.args.get("window")
+        if window:
+            if window not in WINDOWS:
+                return jsonify({"status": "error", "message": f"Unknown window: {window}"}), 400
+            data["window"] = sampler.window(WINDOWS[window])
+        return jsonify(data)
+
+    @app.route("/api/metrics/history")
+    @login_required
+    def api_metrics_history():
+        """
+        Recorded series over a range.
+
+        Query: series=cpu,memory,... range=1h|6h|1d|7d|30d (or from/to
+        as epoch seconds), points=maximum points per series.
+        """
+        if store is None:
+            return jsonify({"status": "error", "message": "Metrics history disabled"}), 503
+        sampler.start()
+
+        ranges = {"1h": 3600, "6h": 21600, "1d": 86400, "7d": 604800, "30d": 2592000}
         try:
-            import psutil
-
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage("/")
-            net_io = psutil.net_io_counters()
-
-            return jsonify(
-                {
-                    "cpu": {"percent": cpu_percent, "count": psutil.cpu_count()},
-                    "memory": {
-                        "total": memory.total,
-                        "used": memory.used,
-                        "percent": memory.percent,
-                    },
-                    "disk": {
-                        "total": disk.total,
-                        "used": disk.used,
-                        "percent": disk.percent,
-                    },
-                    "network": {
-                        "bytes_sent": net_io.bytes_sent,
-                        "bytes_recv": net_io.bytes_recv,
-                        "packets_sent": net_io.packets_sent,
-                        "packets_recv": net_io.packets_recv,
-                    },
-                    "timestamp": int(time.time()),
-                }
-            )
-        except:
-            return jsonify(
-                {
-                    "cpu": {"percent": 0, "count": 0},
-                    "memory": {"total": 0, "used": 0, "percent": 0},
-                    "disk": {"total": 0, "used": 0, "percent": 0},
-                    "network": {
-                        "bytes_sent": 0,
-                        "bytes_recv": 0,
-                        "packets_sent": 0,
-                        "packets_recv": 0,
-                    },
-                    "timestamp": int(time.time()),
-                }
-            )
+            end = float(request.args.get("to", time.time()))
+            if "from" in request.args:
+                start = float(request.args["from"])
+            else:
+                start = end - ranges[request.args.get("range", "1h")]
+            points = min(int(request.args.get("points", 300)), 5000)
+            # float() accepts 'nan' and 'inf', which no range can use
+            if not (math.isfinite(start) and math.isfinite(end)) or start >= end:
+                raise ValueError(f"invalid range {start} to {end}")
+            if points < 1:
+                raise ValueError(f"invalid points {points}")
+        except (KeyError, ValueError):
+            return jsonify({"status": "error", "message": "Invalid range"}), 400
+
+        names = request.args.get("series", "cpu,memory,disk").split(",")
+        data = store.query(names, start, end, points)
+        data["series"] = store.series()
+        return jsonify(data)
+
+    @app.route("/api/metrics/stream")
+    @login_required
+    def api_metrics_stream():
+        """Push metrics as Server-Sent Events: a snapshot, then deltas."""
+        sampler.start()
+
+        def stream():
+            previous = sampler.latest()
+            yield f"event: snapshot\ndata: {json.dumps(previous.to_dict())}\n\n"
+            while True:
+                sample = sampler.wait(previous.seq, timeout=15.0)
+                if sample is None:
+                    yield ": keepalive\n\n"
+                    continue
+                # A slow client gets one delta covering the samples it missed
+                yield f"event: delta\ndata: {json.dumps(delta(previous, sample))}\n\n"
+                previous = sample
+
+        return Response(
+            stream_with_context(stream()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
     return app
 
@@ -413,10 +535,36 @@ def main():
     parser.add_argument("-p", "--port", type=int, default=5000, help="Port to run on")
     parser.add_argument("--host", default="127.0.0.1", help="Host to bind to")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode")
+    parser.add_argument(
+        "--socket",
+        default=str(DEFAULT_SOCKET),
+        help="phreakwalld socket; compiles run in the daemon when it is up",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=2, help="Compile jobs running at the same time"
+    )
+    parser.add_argument(
+        "--job-timeout", type=float, default=300.0, help="Seconds a compile job may run"
+    )
+    parser.add_argument(
+        "--metrics-interval", type=float, default=2.0, help="Seconds between metrics samples"
+    )
+    parser.add_argument(
+        "--metrics-store",
+        default=str(DEFAULT_STORE),
+        help="Metrics history file ('' to disable)",
+    )
 
     args = parser.parse_args()
 
-    app = create_app(args.directory)
+    app = create_app(
+        args.directory,
+        args.socket,
+        args.workers,
+        args.job_timeout,
+        args.metrics_interval,
+        args.metrics_store or None,
+    )
     print(f"Starting Phreakwall Web Interface v{__version__}")
     print(f"Open your browser to http://{args.host}:{args.port}")
     print(f"Default login: admin / phreakwall123")
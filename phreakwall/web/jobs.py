@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Web Compile Jobs
+
+Runs checks and compiles for the web interface in the background, so a
+request returns a job id at once instead of holding a worker for the
+whole compile.
+
+Jobs are keyed by a digest of the configuration tree and their options:
+submitting a job identical to one that is still queued or running
+returns that job instead of starting another compile. At most
+`workers` jobs run at a time. Each runs in phreakwalld when it is up,
+otherwise in a child process, which is what makes cancellation and the
+timeout effective: the process is terminated. The compiler's log
+messages are recorded as job events while it runs, for polling or
+streaming.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from phreakwall.core.compiler import Compiler, CompilerOptions
+from phreakwall.daemon import DaemonClient, DaemonError
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+
+FINISHED = (SUCCEEDED, FAILED, CANCELLED, TIMED_OUT)
+
+KINDS = ("check", "compile")
+
+# How often a running job checks for cancellation (seconds)
+POLL_INTERVAL = 0.1
+
+# Time a terminated worker gets to clean up before it is killed
+KILL_GRACE = 2.0
+
+
+class JobError(Exception):
+    """Raised when a job cannot be submitted."""
+
+    pass
+
+
+@dataclass
+class Job:
+    """One background check or compile."""
+
+    id: str
+    kind: str
+    key: str
+    args: Dict[str, Any]
+    state: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    events: List[Dict[str, str]] = field(default_factory=list)
+    requests: int = 1
+    cancel_requested: threading.Event = field(
+        default_factory=threading.Event, repr=False
+    )
+
+    @property
+    def done(self) -> bool:
+        """Whether the job has finished."""
+        return self.state in FINISHED
+
+    def to_dict(self, events: bool = True) -> Dict[str, Any]:
+        """
+        Convert to a JSON-serializable dictionary.
+
+        Args:
+            events: Include the recorded events
+        """
+        job = {
+            "id": self.id,
+            "kind": self.kind,
+            "args": self.args,
+            "state": self.state,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "result": self.result,
+            "error": self.error,
+            "requests": self.requests,
+        }
+        if events:
+            job["events"] = self.events
+        return job
+
+
+def config_digest(directory: Path) -> str:
+    """
+    Digest of a configuration tree.
+
+    Covers the same files as CompileCache.tree_digests(): everything
+    below the directory except hidden files and editor backups.
+
+    Args:
+        directory: Configuration directory
+
+    Returns:
+        Hex SHA-256
+    """
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if name.startswith(".") or name.endswith("~"):
+                continue
+            path = Path(root, name)
+            h.update(str(path.relative_to(directory)).encode() + b"\0")
+            try:
+                h.update(hashlib.sha256(path.read_bytes()).digest())
+            except OSError:
+                h.update(b"-")
+    return h.hexdigest()
+
+
+class _PipeHandler(logging.Handler):
+    """Forwards log records from a worker process to the job manager."""
+
+    def __init__(self, conn):
+        super().__init__(logging.INFO)
+        self.conn = conn
+
+    def emit(self, record: logging.LogRecord):
+        self.conn.send(
+            ("event", {"level": record.levelname, "message": record.getMessage()})
+        )
+
+
+def _work(kind: str, directory: str, args: Dict[str, Any], conn):
+    """Run one job (in a worker process)."""
+    # Let terminate() unwind, so a half-written script is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
+    logger = logging.getLogger("phreakwall")
+    logger.addHandler(_PipeHandler(conn))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    script = Path(args["output"]) if kind == "compile" else None
+    options = CompilerOptions(
+        script=script,
+        directory=Path(directory),
+        backend=args.get("backend", "restore"),
+        verbosity=-1,
+    )
+    ok = Compiler(options).compile() == 0
+    if kind == "check":
+        conn.send(("done", {"valid": ok}))
+    else:
+        conn.send(("done", {"script": str(script), "compiled": ok}))
+
+
+class JobManager:
+    """Queues, deduplicates and runs background jobs."""
+
+    def __init__(
+        self,
+        directory: Path,
+        socket: Optional[Path] = None,
+        workers: int = 2,
+        timeout: float = 300.0,
+        max_pending: int = 32,
+        keep: int = 100,
+    ):
+        """
+        Initialize the job manager.
+
+        Args:
+            directory: Configuration directory
+            socket: phreakwalld socket, used when the daemon is up
+            workers: Jobs running at the same time
+            timeout: Seconds a job may run before it is stopped
+            max_pending: Queued and running jobs accepted
+            keep: Finished jobs remembered for polling
+        """
+        self.directory = Path(directory)
+        self.socket = Path(socket) if socket else None
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.keep = keep
+        self.logger = logging.getLogger(__name__)
+
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[Tuple, Job] = {}
+        self._changed = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+        # Workers are forked from a clean server process, not from the
+        # threaded web application
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+
+    def submit(self, kind: str, **args: Any) -> Tuple[Job, bool]:
+        """
+        Queue a job, or join an identical one that has not finished.
+
+        Args:
+            kind: 'check' or 'compile'
+            args: Job options (compile: output, backend)
+
+        Returns:
+            (job, merged) where merged is True for an existing job
+
+        Raises:
+            JobError: For unknown kinds or when too many jobs are pending
+        """
+        if kind not in KINDS:
+            raise JobError(f"Unknown job kind: {kind}")
+
+        key = (kind, config_digest(self.directory), tuple(sorted(args.items())))
+        with self._changed:
+            job = self._active.get(key)
+            if job is not None:
+                job.requests += 1
+                return job, True
+            if len(self._active) >= self.max_pending:
+                raise JobError(f"Too many pending jobs ({self.max_pending})")
+
+            job = Job(uuid.uuid4().hex, kind, key[1], args)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._prune()
+
+        self._pool.submit(self._execute, job)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by id."""
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        """Return the known jobs, newest first."""
+        with self._changed:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job.
+
+        A queued job is dropped; a running one is stopped. A job is
+        shared by every request merged into it, so all of them see it
+        cancelled.
+
+        Returns:
+            The job, or None if there is no such job
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        with self._changed:
+            if job.state == QUEUED:
+                self._finish(job, CANCELLED, error="Cancelled")
+            elif job.state == RUNNING:
+                job.cancel_requested.set()
+        return job
+
+    def wait(self, job: Job, seen: int, timeout: float) -> List[Dict[str, str]]:
+        """
+        Wait for new events of a job.
+
+        Args:
+            job: Job to follow
+            seen: Number of events already seen
+            timeout: Seconds to wait
+
+        Returns:
+            Events after the first `seen`; empty on timeout or when the
+            job finished without new events
+        """
+        with self._changed:
+            self._changed.wait_for(
+                lambda: len(job.events) > seen or job.done, timeout
+            )
+            return job.events[seen:]
+
+    def shutdown(self):
+        """Cancel every job and stop the workers."""
+        for job in self.jobs():
+            self.cancel(job.id)
+        self._pool.shutdown(wait=True)
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond `keep`."""
+        finished = [job.id for job in self._jobs.values() if job.done]
+        for job_id in finished[: max(0, len(finished) - self.keep)]:
+            del self._jobs[job_id]
+
+    def _event(self, job: Job, event: Dict[str, str]):
+        """Record a job event and wake up its followers."""
+        with self._changed:
+            job.events.append(event)
+            self._changed.notify_all()
+
+    def _finish(
+        self,
+        job: Job,
+        state: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+    ):
+        """Record the outcome of a job (with the condition held)."""
+        job.state = state
+        job.result = result
+        job.error = error
+        job.finished = time.time()
+        for key, active in list(self._active.items()):
+            if active is job:
+                del self._active[key]
+        self._changed.notify_all()
+
+    def _execute(self, job: Job):
+        """Run a job in a pool thread."""
+        with self._changed:
+            if job.state != QUEUED:
+                return
+            job.state = RUNNING
+            job.started = time.time()
+            self._changed.notify_all()
+
+        try:
+            outcome = self._run_daemon(job)
+            if outcome is None:
+                outcome = self._run_process(job)
+        except Exception as e:
+            self.logger.exception("Job %s failed", job.id)
+            outcome = (FAILED, None, str(e))
+
+        with self._changed:
+            self._finish(job, *outcome)
+        self.logger.info(
+            "Job %s (%s) %s in %.1fs",
+            job.id,
+            job.kind,
+            job.state,
+            job.finished - job.started,
+        )
+
+    def _run_daemon(self, job: Job) -> Optional[Tuple]:
+        """
+        Run a job in phreakwalld.
+
+        The daemon finishes a request it has started, so cancelling or
+        timing out only abandons its result.
+
+        Returns:
+            (state, result, error), or None if the daemon is not running
+        """
+        if not self.socket:
+            return None
+        client = DaemonClient(self.socket, timeout=self.timeout)
+        if not client.available():
+            return None
+
+        try:
+            response = client.request(
+                job.kind, directory=str(self.directory.resolve()), **job.args
+            )
+        except DaemonError as e:
+            if time.time() - job.started >= self.timeout:
+                return TIMED_OUT, None, f"Timed out after {self.timeout:.0f}s"
+            if e.response is None:
+                self.logger.info("%s; running job %s locally", e, job.id)
+                return None
+            response = e.response
+
+        for message in response["messages"]:
+            self._event(job, message)
+        if job.cancel_requested.is_set():
+            return CANCELLED, None, "Cancelled"
+        if not response["ok"]:
+            return FAILED, None, response["error"]
+        return self._outcome(job, response["result"])
+
+    def _run_process(self, job: Job) -> Tuple:
+        """
+        Run a job in a child process.
+
+        Returns:
+            (state, result, error)
+        """
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_work,
+            args=(job.kind, str(self.directory), job.args, sender),
+            daemon=True,
+        )
+        process.start()
+        sender.close()
+
+        deadline = job.started + self.timeout
+        try:
+            while True:
+                if job.cancel_requested.is_set():
+                    return CANCELLED, None, "Cancelled"
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return TIMED_OUT, None, f"Timed out after {self.timeout:.0f}s"
+                if not receiver.poll(min(remaining, POLL_INTERVAL)):
+                    continue
+
+                try:
+                    kind, payload = receiver.recv()
+                except EOFError:
+                    process.join()
+                    return FAILED, None, f"Worker exited with code {process.exitcode}"
+                if kind == "event":
+                    self._event(job, payload)
+                else:
+                    return self._outcome(job, payload)
+        finally:
+            if process.is_alive():
+                process.terminate()
+                process.join(KILL_GRACE)
+            if process.is_alive():
+                process.kill()
+            process.join()
+            receiver.close()
+
+    @staticmethod
+    def _outcome(job: Job, result: Dict[str, Any]) -> Tuple:
+        """Map a check or compile result to (state, result, error)."""
+        if job.kind == "check":
+            if result["valid"]:
+                return SUCCEEDED, result, None
+            return FAILED, result, "Configuration has errors"
+        if result.get("compiled", True):
+            return SUCCEEDED, result, None
+        return FAILED, result, "Compilation failed"
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Metrics Sampler
+
+A single background thread samples CPU, memory, disk and per-interface
+network counters at a fixed interval into a ring buffer. Requests read
+the latest sample without blocking; the 1m/15m/1h summaries and the
+deltas pushed to streaming clients are computed from the buffer, so
+the number of dashboards open does not change how often the system is
+sampled.
+
+psutil is used when it is installed; otherwise the values are read from
+/proc and statvfs (Linux). With a MetricStore every sample is also
+recorded as series (see series()) for the history charts.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from phreakwall.web.timeseries import MetricStore
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Summary windows served from the buffer (seconds)
+WINDOWS = {"1m": 60, "15m": 900, "1h": 3600}
+
+# Per-interface counters: bytes_sent, bytes_recv, packets_sent, packets_recv
+COUNTERS = ("bytes_sent", "bytes_recv", "packets_sent", "packets_recv")
+
+# Fields sent in a delta when they changed
+GAUGES = (
+    "cpu_percent",
+    "cpu_count",
+    "memory_total",
+    "memory_used",
+    "memory_percent",
+    "disk_total",
+    "disk_used",
+    "disk_percent",
+)
+
+
+@dataclass
+class Sample:
+    """System metrics at one point in time."""
+
+    seq: int
+    timestamp: float
+    cpu_percent: float = 0.0
+    cpu_count: int = 0
+    memory_total: int = 0
+    memory_used: int = 0
+    memory_percent: float = 0.0
+    disk_total: int = 0
+    disk_used: int = 0
+    disk_percent: float = 0.0
+    interfaces: Dict[str, Tuple[int, int, int, int]] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to the /api/metrics response layout."""
+        totals = [sum(counters) for counters in zip(*self.interfaces.values())]
+        return {
+            "seq": self.seq,
+            "cpu": {"percent": self.cpu_percent, "count": self.cpu_count},
+            "memory": {
+                "total": self.memory_total,
+                "used": self.memory_used,
+                "percent": self.memory_percent,
+            },
+            "disk": {
+                "total": self.disk_total,
+                "used": self.disk_used,
+                "percent": self.disk_percent,
+            },
+            "network": dict(zip(COUNTERS, totals or [0] * len(COUNTERS))),
+            "interfaces": {
+                name: dict(zip(COUNTERS, counters))
+                for name, counters in sorted(self.interfaces.items())
+            },
+            "timestamp": int(self.timestamp),
+        }
+
+
+def delta(previous: Sample, current: Sample) -> Dict[str, Any]:
+    """
+    Describe how a sample differs from an earlier one.
+
+    Args:
+        previous: Sample the client has
+        current: Newer sample
+
+    Returns:
+        The gauges that changed, and per interface the counter
+        increments (zero for counters that were reset)
+    """
+    changes: Dict[str, Any] = {
+        "seq": current.seq,
+        "timestamp": int(current.timestamp),
+        "interval": round(current.timestamp - previous.timestamp, 3),
+    }
+    for name in GAUGES:
+        value = getattr(current, name)
+        if value != getattr(previous, name):
+            changes[name] = value
+
+    interfaces = {}
+    for name, counters in current.interfaces.items():
+        before = previous.interfaces.get(name, (0,) * len(COUNTERS))
+        increments = [max(0, now - then) for now, then in zip(counters, before)]
+        if any(increments):
+            interfaces[name] = dict(zip(COUNTERS, increments))
+    changes["interfaces"] = interfaces
+    return changes
+
+
+def series(previous: Optional[Sample], current: Sample) -> Dict[str, float]:
+    """
+    Flatten a sample into named series for the time-series store.
+
+    Args:
+        previous: Preceding sample, for the counter rates (optional)
+        current: Sample to record
+
+    Returns:
+        cpu, memory and disk percentages, and per interface the rates
+        per second of each counter, e.g. 'eth0.bytes_recv'
+    """
+    values = {
+        "cpu": current.cpu_percent,
+        "memory": current.memory_percent,
+        "disk": current.disk_percent,
+    }
+    if previous is not None:
+        elapsed = current.timestamp - previous.timestamp
+        if elapsed > 0:
+            for name, increments in delta(previous, current)["interfaces"].items():
+                for counter, value in increments.items():
+                    values[f"{name}.{counter}"] = value / elapsed
+            # Quiet interfaces are recorded as zero, not as gaps
+            for name in current.interfaces:
+                for counter in COUNTERS:
+                    values.setdefault(f"{name}.{counter}", 0.0)
+    return values
+
+
+class RingBuffer:
+    """Fixed-size buffer keeping the most recent items, oldest first."""
+
+    def __init__(self, capacity: int):
+        """
+        Initialize the buffer.
+
+        Args:
+            capacity: Items kept before the oldest is overwritten
+        """
+        self.capacity = capacity
+        self._items: List[Any] = [None] * capacity
+        self._next = 0
+        self._count = 0
+
+    def append(self, item: Any):
+        """Add an item, overwriting the oldest when full."""
+        self._items[self._next] = item
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> Any:
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("ring buffer index out of range")
+        return self._items[(self._next - self._count + index) % self.capacity]
+
+    def since(self, timestamp: float) -> List[Sample]:
+        """Samples taken at or after a time (the buffer holds Samples)."""
+        start = bisect.bisect_left(self, timestamp, key=lambda sample: sample.timestamp)
+        return [self[index] for index in range(start, self._count)]
+
+
+class MetricsSampler:
+    """Samples system metrics in a background thread."""
+
+    def __init__(
+        self,
+        interval: float = 2.0,
+        history: float = 3600,
+        disk_path: str = "/",
+        store: Optional[MetricStore] = None,
+    ):
+        """
+        Initialize the sampler.
+
+        Args:
+            interval: Seconds between samples
+            history: Seconds of samples kept (the longest window)
+            disk_path: File system whose usage is sampled
+            store: Writable time-series store recording every sample
+        """
+        self.interval = interval
+        self.disk_path = disk_path
+        self.store = store if store and store.writable else None
+        self.buffer = RingBuffer(max(2, int(history / interval) + 1))
+        self.logger = logging.getLogger(__name__)
+
+        self._seq = 0
+        self._cpu: Optional[Tuple[int, int]] = None
+        self._changed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start sampling; does nothing if already started."""
+        with self._changed:
+            if self._thread:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="metrics-sampler", daemon=True
+            )
+        if psutil:
+            # The first cpu_percent() call only sets the reference point
+            psutil.cpu_percent(interval=None)
+        else:
+            self._cpu = _proc_cpu()
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self.store:
+            self.store.flush()
+
+    def _run(self):
+        """Take a sample every interval, without drifting."""
+        # The first sample comes soon, with CPU usage over a short span
+        next_time = time.monotonic() + min(self.interval, 0.1)
+        while not self._stop.wait(max(0.0, next_time - time.monotonic())):
+            next_time += self.interval
+            try:
+                sample = self._sample()
+            except Exception as e:
+                self.logger.warning("Metrics sample failed: %s", e)
+                continue
+            with self._changed:
+                previous = self.buffer[-1] if len(self.buffer) else None
+                self.buffer.append(sample)
+                self._changed.notify_all()
+
+            if self.store:
+                try:
+                    self.store.append(sample.timestamp, series(previous, sample))
+                except (OSError, ValueError) as e:
+                    self.logger.warning("Metrics not recorded, store disabled: %s", e)
+                    self.store = None
+
+    def _sample(self) -> Sample:
+        """Read the current metrics."""
+        self._seq += 1
+        sample = Sample(self._seq, time.time())
+
+        if psutil:
+            sample.cpu_percent = psutil.cpu_percent(interval=None)
+            sample.cpu_count = psutil.cpu_count() or 0
+            memory = psutil.virtual_memory()
+            sample.memory_total = memory.total
+            sample.memory_used = memory.used
+            sample.memory_percent = memory.percent
+            sample.interfaces = {
+                name: (c.bytes_sent, c.bytes_recv, c.packets_sent, c.packets_recv)
+                for name, c in psutil.net_io_counters(pernic=True).items()
+            }
+        else:
+            cpu = _proc_cpu()
+            busy, total = (now - then for now, then in zip(cpu, self._cpu))
+            self._cpu = cpu
+            sample.cpu_percent = round(100.0 * busy / total, 1) if total else 0.0
+            sample.cpu_count = os.cpu_count() or 0
+            (
+                sample.memory_total,
+                sample.memory_used,
+                sample.memory_percent,
+            ) = _proc_memory()
+            sample.interfaces = _proc_interfaces()
+
+        st = os.statvfs(self.disk_path)
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        available = st.f_bavail * st.f_frsize
+        sample.disk_total = st.f_blocks * st.f_frsize
+        sample.disk_used = used
+        sample.disk_percent = (
+            round(100.0 * used / (used + available), 1) if used + available else 0.0
+        )
+        return sample
+
+    def latest(self) -> Sample:
+        """Most recent sample; an empty one before the first."""
+        with self._changed:
+            if len(self.buffer):
+                return self.buffer[-1]
+        return Sample(0, time.time())
+
+    def wait(self, seq: int, timeout: float) -> Optional[Sample]:
+        """
+        Wait for a sample newer than seq.
+
+        Returns:
+            The most recent sample, or None on timeout
+        """
+        with self._changed:
+            self._changed.wait_for(
+                lambda: len(self.buffer) and self.buffer[-1].seq > seq, timeout
+            )
+            if len(self.buffer) and self.buffer[-1].seq > seq:
+                return self.buffer[-1]
+        return None
+
+    def window(self, seconds: float) -> Dict[str, Any]:
+        """
+        Summarize the samples of the last `seconds`.
+
+        Returns:
+            Minimum, average and maximum of the CPU, memory and disk
+            percentages, and the average rate of each interface counter
+            per second
+        """
+        with self._changed:
+            samples = self.buffer.since(time.time() - seconds)
+
+        summary: Dict[str, Any] = {"seconds": seconds, "samples": len(samples)}
+        if not samples:
+            return summary
+
+        first, last = samples[0], samples[-1]
+        summary["from"] = int(first.timestamp)
+        summary["to"] = int(last.timestamp)
+        for name in ("cpu_percent", "memory_percent", "disk_percent"):
+            values = [getattr(sample, name) for sample in samples]
+            summary[name.split("_")[0]] = {
+                "min": min(values),
+                "avg": round(sum(values) / len(values), 2),
+                "max": max(values),
+            }
+
+        elapsed = last.timestamp - first.timestamp
+        rates = {}
+        if elapsed > 0:
+            for name, increments in delta(first, last)["interfaces"].items():
+                rates[name] = {
+                    f"{counter}_rate": round(value / elapsed, 2)
+                    for counter, value in increments.items()
+                }
+        summary["network"] = rates
+        return summary
+
+    def stats(self) -> Dict[str, Any]:
+        """Sampler configuration and buffer fill."""
+        return {
+            "interval": self.interval,
+            "capacity": self.buffer.capacity,
+            "samples": len(self.buffer),
+            "source": "psutil" if psutil else "proc",
+        }
+
+
+def _proc_cpu() -> Tuple[int, int]:
+    """Busy and total CPU jiffies from /proc/stat."""
+    with open("/proc/stat") as f:
+        values = [int(value) for value in f.readline().split()[1:]]
+    # idle and iowait
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    total = sum(values[:8])
+    return total - idle, total
+
+
+def _proc_memory() -> Tuple[int, int, float]:
+    """Total and used memory in bytes and the used percentage."""
+    info = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            name, value = line.split(":", 1)
+            info[name] = int(value.split()[0]) * 1024
+    total = info.get("MemTotal", 0)
+    available = info.get("MemAvailable", info.get("MemFree", 0))
+    used = total - available
+    return total, used, round(100.0 * used / total, 1) if total else 0.0
+
+
+def _proc_interfaces() -> Dict[str, Tuple[int, int, int, int]]:
+    """Per-interface counters from /proc/net/dev."""
+    interfaces = {}
+    with open("/proc/net/dev") as f:
+        for line in f.readlines()[2:]:
+            name, data = line.split(":", 1)
+            values = [int(value) for value in data.split()]
+            # rx: bytes packets ... (8 fields), then tx: bytes packets ...
+            interfaces[name.strip()] = (values[8], values[0], values[9], values[1])
+    return interfaces
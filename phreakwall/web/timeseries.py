@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Phreakwall Metrics Time-Series Store
+
+A fixed-size, memory-mapped file holding the metrics history, so the
+dashboard can chart it and it survives restarts.
+
+Layout (little-endian)::
+
+    header   HEADER_SIZE bytes: magic, version, series slots, tiers,
+             then per tier (step, capacity, offset), then the series
+             names at NAMES_OFFSET, NAME_SIZE bytes each
+    tier 0   capacity records
+    tier 1   ...
+
+A record is an array of structs entry: a uint32 timestamp followed by
+one float32 per series slot (NaN where a series has no value). Each
+tier is a round-robin ring at its own resolution, like RRDtool: the
+record for time t lives in slot (t // step) % capacity and holds the
+average of the samples in that step. Locating any point is therefore
+arithmetic, so a range query costs O(points returned) whatever the
+history length; the slot's own timestamp tells a stale or empty slot
+from current data.
+
+The default tiers keep 10 s points for a day, 1 min points for a week
+and 10 min points for a month; with 48 series slots the file is about
+4.5 MB. Series are registered on first write; when every slot is
+taken, the slot of a series that has no value left in the coarsest
+tier (written to for none of the retention period) is handed to the
+new series. A single process writes (it holds an exclusive lock on the
+file); any number may read.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import fcntl
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+DEFAULT_STORE = Path("/var/lib/phreakwall/metrics.pwts")
+
+MAGIC = b"PWTS"
+VERSION = 1
+
+HEADER_SIZE = 4096
+NAMES_OFFSET = 512
+NAME_SIZE = 32
+
+# Series slots per record
+MAX_SERIES = 48
+
+# (step seconds, records): 10 s for a day, 1 min for a week, 10 min for 31 days
+TIERS = ((10, 8640), (60, 10080), (600, 4464))
+
+_HEADER = struct.Struct("<4sHHH")
+_TIER = struct.Struct("<IIQ")
+
+
+class StoreError(Exception):
+    """Raised for unusable store files."""
+
+    pass
+
+
+@dataclass
+class Tier:
+    """One round-robin ring of a store."""
+
+    step: int
+    capacity: int
+    offset: int
+
+    @property
+    def retention(self) -> int:
+        """Seconds of history the ring covers."""
+        return self.step * self.capacity
+
+
+class _Bucket:
+    """Running averages of the samples in the current step of a tier."""
+
+    def __init__(self, size: int):
+        self.time = -1
+        self.sums = [0.0] * size
+        self.counts = [0] * size
+
+
+class MetricStore:
+    """Memory-mapped round-robin store of metric series."""
+
+    def __init__(
+        self,
+        path: Path = DEFAULT_STORE,
+        tiers: Iterable[Tuple[int, int]] = TIERS,
+        max_series: int = MAX_SERIES,
+        writable: bool = True,
+    ):
+        """
+        Open a store, creating it if needed.
+
+        Args:
+            path: Store file
+            tiers: (step, records) per tier, finest first; must match an
+                existing file
+            max_series: Series slots; must match an existing file
+            writable: Open for writing; falls back to read-only when
+                another process is writing
+
+        Raises:
+            StoreError: If the file has another format or layout
+            OSError: If the file cannot be opened or created
+        """
+        self.path = Path(path)
+        self.max_series = max_series
+        self.record = struct.Struct(f"<I{max_series}f")
+        self.logger = logging.getLogger(__name__)
+
+        self.tiers: List[Tier] = []
+        offset = HEADER_SIZE
+        for step, capacity in tiers:
+            self.tiers.append(Tier(step, capacity, offset))
+            offset += capacity * self.record.size
+        size = offset
+
+        if writable:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        else:
+            fd = os.open(self.path, os.O_RDONLY)
+        try:
+            self.writable = writable and self._lock(fd)
+            if os.fstat(fd).st_size == 0 and self.writable:
+                os.ftruncate(fd, size)
+                self._format(fd)
+            if os.fstat(fd).st_size != size:
+                raise StoreError(f"{self.path}: size does not match the tiers")
+            access = mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ
+            self._map = mmap.mmap(fd, size, access=access)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        # The writer keeps its descriptor, and with it the lock
+        self._fd: Optional[int] = fd
+        if not self.writable:
+            os.close(fd)
+            self._fd = None
+
+        try:
+            self._check_header()
+        except StoreError:
+            self.close()
+            raise
+
+        # Views over the whole file; reads never copy records
+        self._u32 = memoryview(self._map).cast("I")
+        self._f32 = memoryview(self._map).cast("f")
+        self._columns: Dict[str, Optional[int]] = {}
+        self._buckets = [_Bucket(max_series) for _ in self.tiers]
+        # When a full store next looks for stale slots
+        self._reclaim_after = 0
+        self._load_names()
+
+    @staticmethod
+    def _lock(fd: int) -> bool:
+        """Take the writer lock; False if another process holds it."""
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _format(self, fd: int):
+        """Write the header of a new file."""
+        header = bytearray(HEADER_SIZE)
+        _HEADER.pack_into(header, 0, MAGIC, VERSION, self.max_series, len(self.tiers))
+        for index, tier in enumerate(self.tiers):
+            _TIER.pack_into(
+                header, _HEADER.size + index * _TIER.size, tier.step, tier.capacity, tier.offset
+            )
+        os.pwrite(fd, bytes(header), 0)
+
+    def _check_header(self):
+        """Verify that the file has this store's format and layout."""
+        magic, version, max_series, tiers = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise StoreError(f"{self.path}: not a version {VERSION} metrics store")
+        layout = [
+            _TIER.unpack_from(self._map, _HEADER.size + index * _TIER.size)
+            for index in range(tiers)
+        ]
+        expected = [(tier.step, tier.capacity, tier.offset) for tier in self.tiers]
+        if max_series != self.max_series or layout != expected:
+            raise StoreError(f"{self.path}: created with a different layout")
+
+    def _load_names(self):
+        """Read the registered series names from the header."""
+        for column in range(self.max_series):
+            start = NAMES_OFFSET + column * NAME_SIZE
+            name = bytes(self._map[start : start + NAME_SIZE]).rstrip(b"\0")
+            if name:
+                self._columns[name.decode()] = column
+
+    def series(self) -> List[str]:
+        """Names of the registered series."""
+        self._load_names()
+        return sorted(name for name, column in self._columns.items() if column is not None)
+
+    def _set_name(self, column: int, name: str):
+        """Write the name of a series slot ('' frees it)."""
+        start = NAMES_OFFSET + column * NAME_SIZE
+        encoded = name.encode()[:NAME_SIZE]
+        self._map[start : start + NAME_SIZE] = encoded.ljust(NAME_SIZE, b"\0")
+
+    def _column(self, name: str, now: int, live: Set[Optional[int]]) -> Optional[int]:
+        """
+        Column of a series, registering it if there is a free slot.
+
+        Args:
+            name: Series name
+            now: Sample time
+            live: Columns written with this sample, which stay in use
+        """
+        column = self._columns.get(name)
+        if column is not None:
+            return column
+        if name in self._columns and now < self._reclaim_after:
+            return None
+
+        used = set(self._columns.values())
+        free = [column for column in range(self.max_series) if column not in used]
+        if not free:
+            free = self._reclaim(now, live)
+        if not free:
+            if name not in self._columns:
+                self.logger.warning("Metrics store full, not recording %s", name)
+            self._columns[name] = None
+            # The coarsest tier changes only once per step
+            self._reclaim_after = now + self.tiers[-1].step
+            return None
+
+        column = free[0]
+        self._set_name(column, name)
+        self._columns[name] = column
+        return column
+
+    def _reclaim(self, now: int, live: Set[Optional[int]]) -> List[int]:
+        """
+        Free the slots of series not written for a whole retention period.
+
+        The coarsest tier spans the longest retention, and every sample
+        reaches its current record, so a series without a value there
+        has none in the store.
+
+        Returns:
+            The freed columns
+        """
+        tier = self.tiers[-1]
+        stale = set(range(self.max_series)) - live
+        for slot in range(tier.capacity):
+            base = (tier.offset + slot * self.record.size) // 4
+            if now - self._u32[base] >= tier.retention:
+                continue
+            stale = {c for c in stale if math.isnan(self._f32[base + 1 + c])}
+            if not stale:
+                return []
+
+        for name, column in list(self._columns.items()):
+            if column in stale:
+                self.logger.info(
+                    "Reclaiming the metrics slot of %s, unused for %ds", name, tier.retention
+                )
+                self._columns[name] = None
+        for column in stale:
+            self._set_name(column, "")
+        return sorted(stale)
+
+    def append(self, timestamp: float, values: Dict[str, float]):
+        """
+        Record one sample in every tier.
+
+        The record of the current step is rewritten with the running
+        average on every sample, so the latest values are visible at
+        once.
+
+        Args:
+            timestamp: Sample time (seconds since the epoch)
+            values: Value per series name
+        """
+        if not self.writable:
+            raise StoreError(f"{self.path} is open read-only")
+
+        now = int(timestamp)
+        live = {self._columns.get(name) for name in values}
+        columns = []
+        for name, value in values.items():
+            column = self._column(name, now, live)
+            if column is not None and not math.isnan(value):
+                columns.append((column, value))
+
+        for tier, bucket in zip(self.tiers, self._buckets):
+            start = now - now % tier.step
+            if bucket.time != start:
+                bucket.time = start
+                bucket.sums = [0.0] * self.max_series
+                bucket.counts = [0] * self.max_series
+            for column, value in columns:
+                bucket.sums[column] += value
+                bucket.counts[column] += 1
+
+            averages = [
+                total / count if count else math.nan
+                for total, count in zip(bucket.sums, bucket.counts)
+            ]
+            slot = (start // tier.step) % tier.capacity
+            self.record.pack_into(
+                self._map, tier.offset + slot * self.record.size, start, *averages
+            )
+
+    def choose_tier(self, start: float, end: float, points: int) -> Tier:
+        """
+        Pick the tier for a range.
+
+        The finest tier that still covers the start of the range is
+        used, unless a coarser one yields no more than `points` points.
+        """
+        age = time.time() - start
+        covering = [tier for tier in self.tiers if tier.retention >= age] or self.tiers[-1:]
+        for tier in covering:
+            if (end - start) / tier.step <= points:
+                return tier
+        return covering[-1]
+
+    def query(
+        self,
+        names: Iterable[str],
+        start: float,
+        end: float,
+        points: int = 500,
+    ) -> Dict[str, object]:
+        """
+        Read series over a time range.
+
+        Args:
+            names: Series to read
+            start: Range start (seconds since the epoch)
+            end: Range end
+            points: Most points returned per series; when the chosen
+                tier has more, every n-th record is used
+
+        Returns:
+            {'step': seconds between points, 'timestamps': [...],
+             'values': {name: [value or None, ...]}}
+        """
+        self._load_names()
+        tier = self.choose_tier(start, end, points)
+        first = int(start) - int(start) % tier.step
+        count = max(0, (int(end) - first) // tier.step + 1)
+        stride = max(1, math.ceil(count / max(1, points)))
+
+        columns = {name: self._columns.get(name) for name in names}
+        timestamps: List[int] = []
+        values: Dict[str, List[Optional[float]]] = {name: [] for name in columns}
+
+        for t in range(first, first + count * tier.step, stride * tier.step):
+            slot = (t // tier.step) % tier.capacity
+            base = (tier.offset + slot * self.record.size) // 4
+            valid = self._u32[base] == t
+            timestamps.append(t)
+            for name, column in columns.items():
+                value = self._f32[base + 1 + column] if valid and column is not None else None
+                if value is None or math.isnan(value):
+                    values[name].append(None)
+                else:
+                    # float32 precision; more digits would only be noise
+                    values[name].append(round(value, 4))
+
+        return {"step": tier.step * stride, "timestamps": timestamps, "values": values}
+
+    def flush(self):
+        """Write the mapped pages back to the file."""
+        if self.writable:
+            self._map.flush()
+
+    def close(self):
+        """Unmap and close the store."""
+        for view in ("_u32", "_f32"):
+            if hasattr(self, view):
+                getattr(self, view).release()
+        self._map.close()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -77,6 +77,7 @@ setup(
         "console_scripts": [
             "phreakwall=phreakwall.cli.main:main",
             "phreakwall-compiler=phreakwall.core.compiler:main",
+            "phreakwalld=phreakwall.daemon.server:main",
         ],
     },
     package_data={
@@ -0,0 +1,66 @@
+"""
+Shared fixtures for the Phreakwall tests.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from phreakwall.core.compiler import Compiler, CompilerOptions
+
+# A small two-zone configuration: the firewall, the internet on eth0
+# and a local network on eth1 whose address comes from params
+CONFIG: Dict[str, str] = {
+    "zones": "fw firewall\nnet ipv4\nloc ipv4\n",
+    "interfaces": "net eth0\n- eth1\n",
+    "hosts": "loc eth1:$LOCNET\n",
+    "policy": "loc net ACCEPT\nnet all DROP\nall all REJECT\n",
+    "rules": "ACCEPT loc fw tcp 22\n",
+    "params": "LOCNET=192.168.1.0/24\n",
+    "phreakwall.conf": "OPTIMIZE=0\n",
+}
+
+
+def write_config(directory: Path, files: Dict[str, str]):
+    """Write configuration files into a directory."""
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, text in files.items():
+        (directory / name).write_text(text)
+
+
+@pytest.fixture
+def config_dir(tmp_path: Path) -> Path:
+    """A configuration directory holding CONFIG."""
+    directory = tmp_path / "etc"
+    write_config(directory, CONFIG)
+    return directory
+
+
+@pytest.fixture
+def compile_script(tmp_path: Path):
+    """
+    Compile a configuration directory and return the script text.
+
+    Called as compile_script(directory, cache=True, **options); the
+    cache lives in the test's temporary directory.
+    """
+
+    def compile_script(directory: Path, cache: bool = True, **options) -> str:
+        script = tmp_path / "firewall"
+        compiler = Compiler(
+            CompilerOptions(
+                script=script,
+                directory=directory,
+                test=True,
+                verbosity=-1,
+                cache_dir=tmp_path / "cache" if cache else None,
+                **options,
+            )
+        )
+        assert compiler.compile() == 0
+        return script.read_text()
+
+    return compile_script
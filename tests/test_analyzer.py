@@ -0,0 +1,149 @@
+"""
+Tests for the shadowed, redundant and policy rule analysis.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+from typing import List, Tuple
+
+import pytest
+
+from phreakwall.core.analyzer import RuleAnalyzer
+from phreakwall.core.chains import ChainManager
+from phreakwall.core.compiler import Compiler, CompilerOptions
+
+
+def analyze(rules: List[str], chain: str = "net2fw", family: int = 4) -> List[Tuple]:
+    """(kind, rule number, other rule number) of the findings in a chain."""
+    chain_manager = ChainManager(family=family)
+    target = chain_manager.get_chain(chain) or chain_manager.create_chain(chain)
+    for rule in rules:
+        target.add_rule(rule)
+    findings = RuleAnalyzer(chain_manager).analyze([target])
+    return [
+        (f.kind, f.index + 1, None if f.other is None else f.other + 1) for f in findings
+    ]
+
+
+@pytest.mark.parametrize(
+    "rules, findings",
+    [
+        # Same verdict, wider match first
+        (
+            ["-s 10.0.0.0/8 -j DROP", "-s 10.1.0.0/16 -p tcp --dport 22 -j DROP"],
+            [("redundant", 2, 1)],
+        ),
+        # Another verdict
+        (
+            ["-s 10.0.0.0/8 -j DROP", "-s 10.1.2.3 -j ACCEPT"],
+            [("shadowed", 2, 1)],
+        ),
+        # Port ranges and lists
+        (
+            [
+                "-p tcp -m multiport --dports 20:30,80 -j ACCEPT",
+                "-p tcp --dport 22 -j DROP",
+                "-p tcp -m multiport --dports 25,80 -j ACCEPT",
+            ],
+            [("shadowed", 2, 1), ("redundant", 3, 1)],
+        ),
+        # A rule without protocol covers every protocol
+        (
+            ["-d 192.0.2.1 -j ACCEPT", "-d 192.0.2.1 -p udp --dport 53 -j ACCEPT"],
+            [("redundant", 2, 1)],
+        ),
+    ],
+)
+def test_covered_rules(rules: List[str], findings: List[Tuple]):
+    assert analyze(rules + ["-j REJECT"]) == findings
+
+
+@pytest.mark.parametrize(
+    "rules",
+    [
+        # The earlier rule is narrower
+        ["-s 10.1.0.0/16 -j DROP", "-s 10.0.0.0/8 -j ACCEPT"],
+        # Other protocol or ports
+        ["-p tcp --dport 22 -j DROP", "-p udp --dport 22 -j ACCEPT"],
+        ["-p tcp --dport 22 -j DROP", "-p tcp ! --dport 22 -j ACCEPT"],
+        # Extra matches on the earlier rule make it narrower
+        ["-s 10.0.0.0/8 -m conntrack --ctstate NEW -j DROP", "-s 10.1.0.0/16 -j ACCEPT"],
+        # Jumps to other chains do not end the chain
+        ["-s 10.0.0.0/8 -j loc2fw", "-s 10.1.0.0/16 -j ACCEPT"],
+    ],
+)
+def test_uncovered_rules(rules: List[str]):
+    assert analyze(rules + ["-j REJECT"]) == []
+
+
+def test_partial_port_overlap_is_correlated():
+    rules = ["-p tcp -m multiport --dports 20:25 -j DROP", "-p tcp --dport 22:80 -j ACCEPT"]
+    assert analyze(rules + ["-j REJECT"]) == [("correlated", 2, 1)]
+
+
+def test_rules_repeating_the_final_verdict():
+    rules = [
+        "-s 10.0.0.0/8 -p tcp --dport 22 -j ACCEPT",
+        "-s 10.1.0.0/16 -j REJECT",
+        "-p udp --dport 53 -j ACCEPT",
+        "-p udp -j REJECT",
+        "-j REJECT",
+    ]
+    # Rule 3 would accept some of rule 2's packets; nothing after rule 4
+    # accepts any of its packets
+    assert analyze(rules) == [("policy", 4, None)]
+
+
+def test_builtin_chain_policy():
+    # INPUT drops by default
+    rules = ["-i lo -j ACCEPT", "-p tcp --dport 22 -j ACCEPT", "-s 10.0.0.0/8 -j DROP"]
+    assert analyze(rules, chain="INPUT") == [("policy", 3, None)]
+
+    # An accepting rule behind it may see the same packets
+    rules = ["-i lo -j ACCEPT", "-s 10.0.0.0/8 -j DROP", "-p tcp --dport 22 -j ACCEPT"]
+    assert analyze(rules, chain="INPUT") == []
+
+
+def test_chain_without_a_final_verdict_has_no_policy_findings():
+    assert analyze(["-s 10.0.0.0/8 -j DROP", "-p tcp -j RETURN"]) == []
+
+
+def test_ipv6_addresses():
+    rules = ["-s 2001:db8::/32 -j DROP", "-s 2001:db8:1::1 -p tcp -j DROP", "-j ACCEPT"]
+    assert analyze(rules, family=6) == [("redundant", 2, 1)]
+
+
+def test_drop_removes_removable_findings():
+    chain_manager = ChainManager(family=4)
+    chain = chain_manager.create_chain("net2fw")
+    for rule in (
+        "-s 10.0.0.0/8 -j DROP",
+        "-s 10.1.0.0/16 -j DROP",
+        "-p tcp -m multiport --dports 20:25 -j ACCEPT",
+        "-p tcp --dport 22:80 -j DROP",
+        "-j DROP",
+    ):
+        chain.add_rule(rule)
+    analyzer = RuleAnalyzer(chain_manager)
+
+    # Rule 4 only overlaps rule 3, but repeats the final verdict
+    assert analyzer.drop(analyzer.analyze([chain])) == 2
+    assert [rule.render() for rule in chain.rules] == [
+        "-s 10.0.0.0/8 -j DROP",
+        "-p tcp -m multiport --dports 20:25 -j ACCEPT",
+        "-j DROP",
+    ]
+
+
+def test_check_reports_findings(config_dir, caplog):
+    (config_dir / "rules").write_text(
+        "ACCEPT loc fw tcp 22\nDROP loc fw tcp 22\nACCEPT loc fw tcp 22\n"
+    )
+    options = CompilerOptions(directory=config_dir, verbosity=-1, cache_dir=None)
+    with caplog.at_level("INFO", logger="phreakwall"):
+        assert Compiler(options).compile() == 0
+
+    # loc2fw starts with the ESTABLISHED,RELATED rule
+    messages = "\n".join(record.getMessage() for record in caplog.records)
+    assert "loc2fw rule 3 (-p tcp --dport 22 -j DROP) is shadowed by rule 2" in messages
+    assert "loc2fw rule 4 (-p tcp --dport 22 -j ACCEPT) is redundant by rule 2" in messages
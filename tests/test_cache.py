@@ -0,0 +1,88 @@
+"""
+Tests for the compile cache and its invalidation.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+from pathlib import Path
+
+from phreakwall.core.cache import CompileCache
+from phreakwall.core.config import Config
+
+
+def test_get_checked_misses_when_a_file_changes(tmp_path: Path):
+    cache = CompileCache(tmp_path / "cache")
+    source = tmp_path / "source"
+    source.write_text("one\n")
+
+    cache.put_checked("test", "key", {"value": 1}, [str(source)])
+    assert cache.get_checked("test", "key") == ({"value": 1}, [str(source)])
+
+    source.write_text("two\n")
+    assert cache.get_checked("test", "key") is None
+
+
+def test_params_change_invalidates_zones(config_dir: Path, compile_script):
+    assert "-s 192.168.1.0/24 -i eth1" in compile_script(config_dir)
+
+    (config_dir / "params").write_text("LOCNET=10.9.9.0/24\n")
+    script = compile_script(config_dir)
+
+    assert "-s 10.9.9.0/24 -i eth1" in script
+    assert "192.168.1.0/24" not in script
+    assert script == compile_script(config_dir, cache=False)
+
+
+def test_included_rules_change_invalidates_script(
+    tmp_path: Path, config_dir: Path, compile_script
+):
+    # Outside the configuration tree, so not covered by its digests
+    extra = tmp_path / "shared" / "rules.extra"
+    extra.parent.mkdir()
+    extra.write_text("ACCEPT loc fw tcp 2222\n")
+    with (config_dir / "rules").open("a") as f:
+        f.write(f"INCLUDE {extra}\n")
+
+    assert "2222" in compile_script(config_dir)
+
+    extra.write_text("ACCEPT loc fw tcp 3333\n")
+    script = compile_script(config_dir)
+    assert "3333" in script
+    assert "2222" not in script
+
+
+def test_included_settings_change_invalidates_config(tmp_path: Path, config_dir: Path):
+    included = tmp_path / "settings"
+    included.write_text("LOG_LEVEL=info\n")
+    (config_dir / "phreakwall.conf").write_text(f"OPTIMIZE=0\nINCLUDE {included}\n")
+    cache = CompileCache(tmp_path / "cache")
+
+    config = Config(config_dir, cache=cache)
+    config.load()
+    assert config.get("LOG_LEVEL") == "info"
+    assert str(included) in config.files
+
+    included.write_text("LOG_LEVEL=debug\n")
+    config = Config(config_dir, cache=cache)
+    config.load()
+    assert config.get("LOG_LEVEL") == "debug"
+
+
+def test_macro_change_invalidates_script(tmp_path: Path, config_dir: Path, compile_script):
+    # Macros on CONFIG_PATH live outside the configuration tree
+    first, second = tmp_path / "site", tmp_path / "shared"
+    for directory in (first, second):
+        directory.mkdir()
+    (second / "macro.Web").write_text("PARAM - - tcp 80\n")
+    (config_dir / "phreakwall.conf").write_text(f"OPTIMIZE=0\nCONFIG_PATH={first}:{second}\n")
+    (config_dir / "rules").write_text("Web(ACCEPT) loc fw\n")
+    assert "--dport 80 " in compile_script(config_dir)
+
+    (second / "macro.Web").write_text("PARAM - - tcp 443\n")
+    assert "--dport 443 " in compile_script(config_dir)
+
+    # A macro earlier on the search path shadows the one read before
+    (first / "macro.Web").write_text("PARAM - - tcp 8443\n")
+    script = compile_script(config_dir)
+    assert "--dport 8443 " in script
+    assert script == compile_script(config_dir, cache=False)
@@ -0,0 +1,40 @@
+"""
+Tests for the configuration file tokenizer.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from phreakwall.core.conditions import Conditions
+from phreakwall.core.config import ConfigError, ConfigTokenizer
+
+
+def tokenize(tmp_path: Path, text: str) -> List[List[str]]:
+    path = tmp_path / "rules"
+    path.write_text(text)
+    tokenizer = ConfigTokenizer(tmp_path, Conditions())
+    return [
+        [record.location] + list(record.columns)
+        for record in tokenizer.records(path, ("action", "source", "dest"))
+    ]
+
+
+def test_continuation_lines(tmp_path: Path):
+    records = tokenize(
+        tmp_path, "ACCEPT \\\n  net \\\n  fw  # comment\nDROP net fw\n"
+    )
+    assert records == [
+        [f"{tmp_path}/rules:1", "ACCEPT", "net", "fw"],
+        [f"{tmp_path}/rules:4", "DROP", "net", "fw"],
+    ]
+
+
+@pytest.mark.parametrize("text", ["ACCEPT net \\\n", "DROP net fw\nACCEPT \\\n\n  \\\n"])
+def test_continuation_at_end_of_file(tmp_path: Path, text: str):
+    line = text.count("\n", 0, text.index("\\")) + 1
+    with pytest.raises(ConfigError, match=rf"rules:{line}: continuation line at end of file"):
+        tokenize(tmp_path, text)
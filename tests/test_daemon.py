@@ -0,0 +1,130 @@
+"""
+Tests for the phreakwalld request handling.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import stat
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+
+from phreakwall.daemon.server import Daemon
+
+
+@pytest.fixture
+def daemon(tmp_path: Path, config_dir: Path) -> Daemon:
+    return Daemon(config_dir, tmp_path / "run" / "phreakwalld.sock", tmp_path / "cache")
+
+
+def request(daemon: Daemon, command: str, **args) -> Dict[str, Any]:
+    response = daemon.handle({"id": 1, "command": command, "args": args})
+    assert response["id"] == 1
+    return response
+
+
+def test_check_is_cached_until_a_file_changes(daemon: Daemon, config_dir: Path):
+    first = request(daemon, "check")
+    assert first["ok"] and first["result"] == {"valid": True, "cached": False}
+    assert request(daemon, "check")["result"]["cached"]
+
+    # Other options are a separate result
+    assert not request(daemon, "check", family=6)["result"]["cached"]
+
+    (config_dir / "rules").write_text("ACCEPT loc fw tcp 2222\n")
+    assert request(daemon, "check")["result"] == {"valid": True, "cached": False}
+
+    (config_dir / "rules").write_text("ACCEPT loc nozone tcp 22\n")
+    response = request(daemon, "check")
+    assert response["result"] == {"valid": False, "cached": False}
+    assert any("nozone" in message["message"] for message in response["messages"])
+
+    # The messages of a cached failure are reported again
+    cached = request(daemon, "check")
+    assert cached["result"]["cached"]
+    assert cached["messages"] == response["messages"]
+
+
+def test_compile_is_cached_until_the_tree_or_script_changes(
+    daemon: Daemon, config_dir: Path, tmp_path: Path
+):
+    script = tmp_path / "firewall"
+    compile_args = {"output": str(script), "test": True}
+
+    assert request(daemon, "compile", **compile_args)["result"] == {
+        "script": str(script),
+        "cached": False,
+    }
+    assert request(daemon, "compile", **compile_args)["result"]["cached"]
+
+    (config_dir / "rules").write_text("ACCEPT loc fw tcp 2222\n")
+    assert not request(daemon, "compile", **compile_args)["result"]["cached"]
+    assert "--dport 2222" in script.read_text()
+
+    # A script changed behind the daemon's back is written again
+    script.write_text("#!/bin/sh\n")
+    assert not request(daemon, "compile", **compile_args)["result"]["cached"]
+    assert "--dport 2222" in script.read_text()
+
+
+@pytest.mark.parametrize(
+    "message, error",
+    [
+        ({"command": "frobnicate"}, "Unknown command: frobnicate"),
+        ({"command": "check", "args": [4]}, "args must be an object"),
+        ({"command": "check", "args": {"famly": 4}}, "Unknown arguments: famly"),
+        ({"command": "check", "args": {"family": 5}}, "Invalid family: 5"),
+        ({"command": "check", "args": {"optimize": "all"}}, "Invalid optimization level"),
+        ({"command": "check", "args": {"optimize": 32}}, "Invalid optimization level"),
+        ({"command": "compile", "args": {}}, "missing a required argument: 'output'"),
+        ({"command": "compile", "args": {"output": 1}}, "Invalid output: 1"),
+        (
+            {"command": "compile", "args": {"output": "/tmp/x", "backend": "pf"}},
+            "Unknown backend: pf",
+        ),
+        ({"command": "apply", "args": {"backend": "pf"}}, "Unknown backend: pf"),
+    ],
+)
+def test_invalid_requests_are_refused(daemon: Daemon, message: Dict, error: str):
+    response = daemon.handle(message)
+    assert not response["ok"]
+    assert error in response["error"]
+
+
+@pytest.mark.parametrize("command", ["check", "compile", "apply"])
+def test_other_directories_are_refused(daemon: Daemon, tmp_path: Path, command: str):
+    args = {"directory": str(tmp_path)}
+    if command == "compile":
+        args["output"] = str(tmp_path / "firewall")
+    response = daemon.handle({"command": command, "args": args})
+
+    assert not response["ok"]
+    assert "phreakwalld serves" in response["error"]
+
+
+def test_same_directory_is_accepted(daemon: Daemon, config_dir: Path):
+    response = request(daemon, "check", directory=str(config_dir / ".." / config_dir.name))
+    assert response["ok"]
+
+
+def test_status(daemon: Daemon):
+    request(daemon, "check")
+    request(daemon, "check")
+    status = request(daemon, "status")["result"]
+
+    assert status["directory"] == str(daemon.directory)
+    assert status["commands"]["check"]["requests"] == 2
+    assert status["commands"]["check"]["cached"] == 1
+    assert not status["busy"]
+
+
+def test_socket_is_bound_owner_and_group_only(daemon: Daemon):
+    daemon._prepare_socket()
+    server = daemon._bind()
+    try:
+        mode = daemon.socket_path.stat().st_mode
+        assert stat.S_ISSOCK(mode)
+        assert stat.S_IMODE(mode) == 0o660
+    finally:
+        server.server_close()
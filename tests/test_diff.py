@@ -0,0 +1,308 @@
+"""
+Tests for the live ruleset parsers and differential apply.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import json
+from typing import Dict, List, Tuple
+
+import pytest
+
+from phreakwall.core.backends.base import BackendError
+from phreakwall.core.backends.diff import (
+    edit_script,
+    iptables_key,
+    nft_statement,
+    parse_iptables_save,
+    parse_nft_json,
+)
+from phreakwall.core.backends.iptables import RestoreBackend
+from phreakwall.core.backends.nftables import NftablesBackend
+from phreakwall.core.chains import ChainManager
+from phreakwall.core.rule import Rule
+
+
+def restore_backend(chains: Dict[str, List[str]]) -> RestoreBackend:
+    """Restore backend over filter chains with the given rules."""
+    chain_manager = ChainManager(family=4)
+    for name, rules in chains.items():
+        chain = chain_manager.get_chain(name) or chain_manager.create_chain(name)
+        for rule in rules:
+            chain.add_rule(rule)
+    return RestoreBackend(chain_manager)
+
+
+def save(chains: Dict[str, List[str]]) -> str:
+    """iptables-save output of the standard chains plus the given rules."""
+    policies = {"INPUT": "DROP", "FORWARD": "DROP", "OUTPUT": "ACCEPT"}
+    lines = ["# Generated by iptables-save", "*filter"]
+    lines += [f":{name} {policy} [10:1000]" for name, policy in policies.items()]
+    lines += [f":{name} - [0:0]" for name in chains if name not in policies]
+    for name, rules in chains.items():
+        lines += [f"[5:500] -A {name} {rule}" for rule in rules]
+    lines.append("COMMIT")
+    lines += ["*nat", ":PREROUTING ACCEPT [0:0]", ":POSTROUTING ACCEPT [0:0]", "COMMIT"]
+    return "\n".join(lines) + "\n"
+
+
+# Custom chains every ChainManager starts with
+STANDARD = {"phreakwall_input": [], "phreakwall_output": [], "phreakwall_forward": []}
+
+
+def test_iptables_save_rejects_lines_outside_a_table():
+    with pytest.raises(BackendError, match="outside a table"):
+        parse_iptables_save(":INPUT ACCEPT [0:0]\n")
+    with pytest.raises(BackendError, match="outside a table"):
+        parse_iptables_save("*filter\nCOMMIT\n-A INPUT -j ACCEPT\n")
+
+
+@pytest.mark.parametrize(
+    "old, new, opcodes",
+    [
+        ("abc", "abc", []),
+        ("abcd", "abXd", [("replace", 2, 3, 2, 3)]),
+        ("abcd", "abd", [("delete", 2, 3, 2, 2)]),
+        ("abd", "abcd", [("insert", 2, 2, 2, 3)]),
+        ("", "ab", [("insert", 0, 0, 0, 2)]),
+        ("aXbYc", "abc", [("delete", 1, 2, 1, 1), ("delete", 3, 4, 2, 2)]),
+    ],
+)
+def test_edit_script(old: str, new: str, opcodes):
+    assert edit_script(list(old), list(new)) == opcodes
+
+
+def test_parse_iptables_save():
+    tables = parse_iptables_save(
+        save({"net2fw": ['-p tcp -m tcp --dport 22 -m comment --comment "ssh in" -j ACCEPT']})
+    )
+
+    assert set(tables) == {"filter", "nat"}
+    filter_chains = tables["filter"]
+    assert filter_chains["INPUT"].policy == "DROP"
+    assert filter_chains["INPUT"].counters == (10, 1000)
+    assert filter_chains["net2fw"].policy is None
+
+    (rule,) = filter_chains["net2fw"].rules
+    assert rule.counters == (5, 500)
+    assert rule.comment == "ssh in"
+    assert rule.get("--dport").value == "22"
+
+
+def test_parse_iptables_save_rejects_unknown_lines():
+    with pytest.raises(BackendError, match="line 3"):
+        parse_iptables_save("*filter\n:INPUT DROP [0:0]\n-A nochain -j ACCEPT\nCOMMIT\n")
+
+
+@pytest.mark.parametrize(
+    "compiled, live",
+    [
+        (
+            "-s 10.0.0.1 -p tcp --dport 22 -j ACCEPT",
+            "-s 10.0.0.1/32 -p tcp -m tcp --dport 22 -j ACCEPT",
+        ),
+        ("-p 6 -i eth0 -j DROP", "-i eth0 -p tcp -j DROP"),
+        ("-j REJECT", "-j REJECT --reject-with icmp-port-unreachable"),
+        ("-j LOG --log-prefix x: --log-level warning", "-j LOG --log-prefix x:"),
+        ("-j LOG --log-prefix x: --log-level info", "-j LOG --log-prefix x: --log-level 6"),
+        (
+            "-m conntrack --ctstate ESTABLISHED,NEW -j ACCEPT",
+            "-m conntrack --ctstate NEW,ESTABLISHED -j ACCEPT",
+        ),
+        (
+            "-m limit --limit 3/min --limit-burst 5 -j ACCEPT",
+            "-m limit --limit 3/m -j ACCEPT",
+        ),
+    ],
+)
+def test_iptables_key_matches_iptables_save_output(compiled: str, live: str):
+    assert iptables_key(Rule.parse(compiled), 4) == iptables_key(Rule.parse(live), 4)
+
+
+def test_iptables_key_tells_rules_apart():
+    key = iptables_key(Rule.parse("-p tcp --dport 22 -j ACCEPT"), 4)
+    assert key != iptables_key(Rule.parse("-p tcp --dport 23 -j ACCEPT"), 4)
+    assert key != iptables_key(Rule.parse("-p tcp ! --dport 22 -j ACCEPT"), 4)
+
+
+def test_restore_delta_of_an_unchanged_ruleset_is_empty():
+    backend = restore_backend(
+        {"INPUT": ["-j net2fw"], "net2fw": ["-p tcp --dport 22 -j ACCEPT"]}
+    )
+    live = save(
+        {
+            **STANDARD,
+            "INPUT": ["-j net2fw"],
+            "net2fw": ["-p tcp -m tcp --dport 22 -j ACCEPT"],
+        }
+    )
+
+    assert backend.generate_delta(live) == []
+    assert backend.delta_stats.unchanged == 2
+
+
+def test_restore_delta():
+    backend = restore_backend(
+        {
+            "INPUT": ["-j net2fw"],
+            "net2fw": ["-p tcp --dport 22 -j ACCEPT", "-p tcp --dport 443 -j ACCEPT", "-j DROP"],
+            "loc2fw": ["-j ACCEPT"],
+        }
+    )
+    live = save(
+        {
+            **STANDARD,
+            "INPUT": ["-j net2fw"],
+            "net2fw": [
+                "-p tcp -m tcp --dport 22 -j ACCEPT",
+                "-p tcp -m tcp --dport 80 -j ACCEPT",
+                "-p tcp -m tcp --dport 25 -j ACCEPT",
+                "-j DROP",
+            ],
+            "old2fw": ["-j ACCEPT"],
+        }
+    )
+    delta = backend.generate_delta(live)
+
+    assert delta == [
+        "*filter",
+        ":loc2fw - [0:0]",
+        "-R net2fw 2 -p tcp --dport 443 -j ACCEPT",
+        "-D net2fw 3",
+        "-A loc2fw -j ACCEPT",
+        "-F old2fw",
+        "-X old2fw",
+        "COMMIT",
+    ]
+    stats = backend.delta_stats
+    assert (stats.inserted, stats.deleted, stats.replaced, stats.unchanged) == (1, 2, 1, 3)
+    assert (stats.chains_added, stats.chains_removed) == (1, 1)
+
+
+def test_restore_delta_keeps_policy_counters():
+    backend = restore_backend({})
+    backend.chain_manager.chains["OUTPUT"].policy = "DROP"
+    delta = backend.generate_delta(save(STANDARD))
+
+    assert delta == ["*filter", ":OUTPUT DROP [10:1000]", "COMMIT"]
+
+
+def nft_dump(rules: Dict[str, List[Tuple[int, List[Dict]]]], table: str = "phreakwall") -> str:
+    """nft -j list ruleset output of one inet table."""
+    objects: List[Dict] = [{"metainfo": {"json_schema_version": 1}}]
+    objects.append({"table": {"family": "inet", "name": table, "handle": 1}})
+    objects.append({"table": {"family": "ip", "name": "other", "handle": 2}})
+    for chain, chain_rules in rules.items():
+        objects.append({"chain": {"family": "inet", "table": table, "name": chain}})
+        for handle, expr in chain_rules:
+            objects.append(
+                {
+                    "rule": {
+                        "family": "inet",
+                        "table": table,
+                        "chain": chain,
+                        "handle": handle,
+                        "expr": expr,
+                    }
+                }
+            )
+    return json.dumps({"nftables": objects})
+
+
+def match(left: Dict, right, op: str = "==") -> Dict:
+    return {"match": {"op": op, "left": left, "right": right}}
+
+
+def payload(protocol: str, name: str) -> Dict:
+    return {"payload": {"protocol": protocol, "field": name}}
+
+
+def dport(port: int, verdict: str = "accept") -> List[Dict]:
+    """Expressions of a 'tcp dport PORT VERDICT' rule, with its counter."""
+    return [
+        match(payload("tcp", "dport"), port),
+        {"counter": {"packets": 0, "bytes": 0}},
+        {verdict: None},
+    ]
+
+
+def test_parse_nft_json():
+    dump = nft_dump({"net2fw": [(4, dport(22)), (5, dport(80, "drop"))]})
+    live = parse_nft_json(dump, "phreakwall")
+
+    assert list(live.chains) == ["net2fw"]
+    assert live.chains["net2fw"].rules == [
+        (4, "tcp dport 22 accept"),
+        (5, "tcp dport 80 drop"),
+    ]
+    assert parse_nft_json(nft_dump({}), "phreakwall6") is None
+
+
+def test_parse_nft_json_rejects_invalid_dumps():
+    with pytest.raises(BackendError, match="Invalid nft JSON"):
+        parse_nft_json("[]", "phreakwall")
+
+
+@pytest.mark.parametrize(
+    "expr, statement",
+    [
+        (
+            match({"ct": {"key": "state"}}, ["established", "related"], "in"),
+            "ct state { established, related }",
+        ),
+        (match({"meta": {"key": "iifname"}}, "eth0"), 'iifname "eth0"'),
+        (
+            match(payload("ip", "saddr"), {"prefix": {"addr": "10.0.0.0", "len": 8}}, "!="),
+            "ip saddr != 10.0.0.0/8",
+        ),
+        (
+            {"log": {"prefix": "net2fw:DROP:", "level": "info"}},
+            'log prefix "net2fw:DROP:" level info',
+        ),
+        ({"reject": {"type": "tcp reset"}}, "reject with tcp reset"),
+        ({"snat": {"addr": "192.0.2.1", "family": "ip"}}, "snat ip to 192.0.2.1"),
+        (
+            {"limit": {"rate": 3, "per": "minute", "burst": 5, "inv": True}},
+            "limit rate over 3/minute burst 5 packets",
+        ),
+        ({"jump": {"target": "Limit_1"}}, "jump Limit_1"),
+        ({"counter": None}, None),
+    ],
+)
+def test_nft_expressions(expr: Dict, statement: str):
+    assert nft_statement([expr]) == (statement or "continue")
+
+
+def test_nft_delta():
+    chain_manager = ChainManager(family=4)
+    chain = chain_manager.create_chain("net2fw")
+    for port in (22, 443, 8080):
+        chain.add_rule(f"-p tcp --dport {port} -j ACCEPT")
+    chain.add_rule("-j DROP")
+    backend = NftablesBackend(chain_manager)
+
+    dump = nft_dump(
+        {
+            "net2fw": [(10, dport(22)), (11, dport(80)), (12, [{"drop": None}])],
+            "old2fw": [(20, dport(1))],
+        }
+    )
+    delta = [line for line in backend.generate_delta(dump) if "2fw" in line]
+
+    # Rules are addressed by handle; new ones go before the next live rule
+    assert delta == [
+        "replace rule inet phreakwall net2fw handle 11 tcp dport 443 accept",
+        "insert rule inet phreakwall net2fw position 12 tcp dport 8080 accept",
+        "flush chain inet phreakwall old2fw",
+        "delete chain inet phreakwall old2fw",
+    ]
+    stats = backend.delta_stats
+    assert (stats.replaced, stats.chains_removed) == (1, 1)
+
+
+def test_nft_delta_without_a_live_table_is_a_full_load():
+    backend = NftablesBackend(ChainManager(family=4))
+    delta = backend.generate_delta(nft_dump({}, table="other"))
+
+    assert backend.delta_stats is None
+    assert delta == list(backend.render_ruleset())
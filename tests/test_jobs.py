@@ -0,0 +1,102 @@
+"""
+Tests for the web interface's background jobs.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import time
+from pathlib import Path
+
+import pytest
+
+from phreakwall.web import jobs
+from phreakwall.web.jobs import CANCELLED, QUEUED, RUNNING, SUCCEEDED, TIMED_OUT, Job, JobManager
+
+
+def stub_work(kind: str, directory: str, args, conn):
+    """Worker that reports one event, then sleeps for args['sleep'] seconds."""
+    conn.send(("event", {"level": "INFO", "message": f"{kind} started"}))
+    time.sleep(args.get("sleep", 0))
+    conn.send(("done", {"valid": True}))
+
+
+@pytest.fixture
+def manager(tmp_path: Path, monkeypatch) -> JobManager:
+    monkeypatch.setattr(jobs, "_work", stub_work)
+    manager = JobManager(tmp_path, workers=1, timeout=30.0)
+    yield manager
+    manager.shutdown()
+
+
+def wait_for(manager: JobManager, job: Job, condition, timeout: float = 20.0):
+    """Wait until condition() holds for a job."""
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, f"job still {job.state}"
+        manager.wait(job, len(job.events), 0.1)
+
+
+def test_job_runs_in_a_worker_process(manager: JobManager):
+    job, merged = manager.submit("check")
+    wait_for(manager, job, lambda: job.done)
+
+    assert not merged
+    assert job.state == SUCCEEDED
+    assert job.result == {"valid": True}
+    assert job.events == [{"level": "INFO", "message": "check started"}]
+
+
+def test_identical_jobs_are_merged_until_finished(manager: JobManager):
+    job, merged = manager.submit("check", sleep=1.0)
+    again, merged_again = manager.submit("check", sleep=1.0)
+    other, merged_other = manager.submit("check", sleep=0.0)
+
+    assert not merged and merged_again and not merged_other
+    assert again is job and job.requests == 2
+    assert other is not job
+
+    wait_for(manager, job, lambda: job.done)
+    after, merged_after = manager.submit("check", sleep=1.0)
+    assert not merged_after and after is not job
+
+
+def test_cancel_stops_a_running_job_and_drops_a_queued_one(manager: JobManager):
+    running, _ = manager.submit("check", sleep=30.0)
+    queued, _ = manager.submit("check", sleep=0.0)
+    wait_for(manager, running, lambda: running.events)
+    assert running.state == RUNNING and queued.state == QUEUED
+
+    assert manager.cancel(queued.id) is queued
+    assert queued.state == CANCELLED
+
+    started = time.time()
+    manager.cancel(running.id)
+    wait_for(manager, running, lambda: running.done)
+    assert running.state == CANCELLED
+    assert time.time() - started < 10
+
+    # The dropped job never starts
+    assert queued.started is None
+    assert manager.cancel("nonexistent") is None
+
+
+def test_job_is_stopped_after_the_timeout(manager: JobManager):
+    manager.timeout = 0.5
+    job, _ = manager.submit("check", sleep=30.0)
+    wait_for(manager, job, lambda: job.done)
+
+    assert job.state == TIMED_OUT
+    assert job.finished - job.started < 10
+
+
+def test_api_rejects_unknown_backends(tmp_path: Path):
+    pytest.importorskip("flask")
+    from phreakwall.web.app import create_app
+
+    app = create_app(config_dir=tmp_path, socket=None, metrics_store=None)
+    client = app.test_client()
+    client.post("/login", data={"username": "admin", "password": "phreakwall123"})
+
+    response = client.post("/api/jobs", json={"kind": "compile", "backend": "../../bin/sh"})
+    assert response.status_code == 400
+    assert app.extensions["phreakwall_jobs"].jobs() == []
@@ -0,0 +1,94 @@
+"""
+Tests for the metrics sampler buffer and the metrics API.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import pytest
+
+from phreakwall.web.metrics import RingBuffer, Sample, delta, series
+
+
+def sample(seq: int, timestamp: float, **fields) -> Sample:
+    return Sample(seq=seq, timestamp=timestamp, **fields)
+
+
+def test_ring_buffer_keeps_the_newest_items_in_order():
+    buffer = RingBuffer(3)
+    assert len(buffer) == 0
+
+    for item in range(5):
+        buffer.append(item)
+
+    assert len(buffer) == 3
+    assert [buffer[index] for index in range(3)] == [2, 3, 4]
+    assert buffer[-1] == 4
+    with pytest.raises(IndexError):
+        buffer[3]
+
+
+def test_ring_buffer_since():
+    buffer = RingBuffer(4)
+    for seq in range(6):
+        buffer.append(sample(seq, 100.0 + 10 * seq))
+
+    assert [s.seq for s in buffer.since(135)] == [4, 5]
+    assert [s.seq for s in buffer.since(0)] == [2, 3, 4, 5]
+    assert buffer.since(200) == []
+
+
+def test_delta_reports_changes_and_counter_increments():
+    previous = sample(1, 100.0, cpu_percent=5.0, interfaces={"eth0": (100, 10, 1, 1)})
+    current = sample(
+        2,
+        102.0,
+        cpu_percent=7.5,
+        interfaces={"eth0": (300, 10, 3, 1), "eth1": (5, 0, 1, 0)},
+    )
+    changes = delta(previous, current)
+
+    assert changes["seq"] == 2
+    assert changes["interval"] == 2.0
+    assert changes["cpu_percent"] == 7.5
+    assert "memory_percent" not in changes
+    assert changes["interfaces"]["eth0"]["bytes_sent"] == 200
+    assert changes["interfaces"]["eth1"]["packets_sent"] == 1
+
+
+def test_series_records_rates_per_second():
+    previous = sample(1, 100.0, interfaces={"eth0": (100, 0, 0, 0)})
+    current = sample(2, 102.0, disk_percent=50.0, interfaces={"eth0": (300, 0, 0, 0)})
+    values = series(previous, current)
+
+    assert values["disk"] == 50.0
+    assert values["eth0.bytes_sent"] == 100.0
+    assert values["eth0.bytes_recv"] == 0.0
+
+
+@pytest.fixture
+def client(tmp_path):
+    pytest.importorskip("flask")
+    from phreakwall.web.app import create_app
+
+    app = create_app(
+        config_dir=tmp_path, socket=None, metrics_store=tmp_path / "metrics.pwts"
+    )
+    client = app.test_client()
+    client.post("/login", data={"username": "admin", "password": "phreakwall123"})
+    yield client
+    app.extensions["phreakwall_metrics"].stop()
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["to=nan", "from=nan", "from=-inf&to=100", "to=inf", "from=200&to=100", "from=100&to=100"],
+)
+def test_history_rejects_invalid_ranges(client, query: str):
+    response = client.get(f"/api/metrics/history?{query}")
+    assert response.status_code == 400
+
+
+def test_history_accepts_a_range(client):
+    response = client.get("/api/metrics/history?from=1000&to=2000&series=cpu")
+    assert response.status_code == 200
+    assert "cpu" in response.get_json()["values"]
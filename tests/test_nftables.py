@@ -0,0 +1,174 @@
+"""
+Tests for the nftables backend translation.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from phreakwall.core.backends.base import BackendError
+from phreakwall.core.backends.nftables import NftablesBackend
+from phreakwall.core.chains import ChainManager, ChainType
+from phreakwall.core.rule import Rule
+from phreakwall.core.sets import IpSet
+
+
+@pytest.fixture
+def backend() -> NftablesBackend:
+    chain_manager = ChainManager(family=4)
+    chain_manager.create_chain("net2fw", ChainType.FILTER)
+    chain_manager.create_chain("Limit_1", ChainType.FILTER)
+    return NftablesBackend(chain_manager)
+
+
+def translate(backend: NftablesBackend, text: str, chain: str = "net2fw") -> str:
+    return backend.translate(backend.chain_manager.chains[chain], Rule.parse(text))
+
+
+@pytest.mark.parametrize(
+    "rule, statement",
+    [
+        ("-p tcp --dport 22 -j ACCEPT", "tcp dport 22 accept"),
+        ("-s 10.0.0.0/8 -j DROP", "ip saddr 10.0.0.0/8 drop"),
+        ("-j RETURN", "return"),
+        ("-p udp -j REJECT", "meta l4proto udp reject"),
+        (
+            "-p tcp -j REJECT --reject-with tcp-reset",
+            "meta l4proto tcp reject with tcp reset",
+        ),
+        (
+            "-j LOG --log-prefix Shorewall:net2fw:DROP: --log-level info",
+            'log prefix "Shorewall:net2fw:DROP:" level info',
+        ),
+        (
+            "-p tcp -m multiport --dports 22,80:90 -j ACCEPT",
+            "tcp dport { 22, 80-90 } accept",
+        ),
+        ("-i eth0 -j Limit_1", 'iifname "eth0" jump Limit_1'),
+        ("-g Limit_1", "goto Limit_1"),
+        (
+            "-m conntrack --ctstate ESTABLISHED,RELATED -j ACCEPT",
+            "ct state { established, related } accept",
+        ),
+        ("-m addrtype --src-type BROADCAST -j DROP", "fib saddr type broadcast drop"),
+        ("-p tcp ! --syn -j DROP", "tcp flags & (fin|syn|rst|ack) != syn drop"),
+    ],
+)
+def test_filter_targets(backend, rule: str, statement: str):
+    assert translate(backend, rule) == statement
+
+
+@pytest.mark.parametrize(
+    "rule, statement",
+    [
+        ("-o eth0 -j MASQUERADE", 'oifname "eth0" masquerade'),
+        ("-j MASQUERADE --to-ports 1024-2048", "masquerade to :1024-2048"),
+        ("-j SNAT --to-source 192.0.2.1", "snat ip to 192.0.2.1"),
+        (
+            "-p tcp --dport 80 -j DNAT --to-destination 10.0.0.2:8080",
+            "tcp dport 80 dnat ip to 10.0.0.2:8080",
+        ),
+        (
+            "-p tcp --dport 80 -j REDIRECT --to-ports 3128",
+            "tcp dport 80 redirect to :3128",
+        ),
+        ("-p tcp --dport 80 -j REDIRECT", "tcp dport 80 redirect"),
+    ],
+)
+def test_nat_targets(backend, rule: str, statement: str):
+    assert translate(backend, rule, "PREROUTING") == statement
+
+
+def test_mark_and_notrack(backend):
+    assert translate(backend, "-j MARK --set-mark 0x1") == "meta mark set 0x1"
+    assert translate(backend, "-j CT --notrack") == "notrack"
+
+
+@pytest.mark.parametrize(
+    "rule, option",
+    [
+        ("-j SNAT", "--to-source"),
+        ("-j DNAT", "--to-destination"),
+        ("-j MARK", "--set-mark"),
+    ],
+)
+def test_missing_target_option_is_a_backend_error(backend, rule: str, option: str):
+    with pytest.raises(BackendError, match=f"without {option}.*{rule}"):
+        translate(backend, rule, "PREROUTING")
+
+
+def test_recent_limit_becomes_a_meter(backend):
+    assert translate(backend, "-m recent --name SSH --set", "Limit_1") is None
+    assert translate(
+        backend,
+        "-m recent --name SSH --update --seconds 60 --hitcount 4 -j DROP",
+        "Limit_1",
+    ) == "meter SSH { ip saddr limit rate over 3/minute burst 3 packets } drop"
+    assert translate(
+        backend,
+        "-m recent --name SSH --update --seconds 90 --hitcount 5 -j DROP",
+        "Limit_1",
+    ) == "meter SSH { ip saddr limit rate over 160/hour burst 4 packets } drop"
+
+
+def test_untranslatable_match_is_a_backend_error(backend):
+    with pytest.raises(BackendError, match="--foo"):
+        translate(backend, "-m foo --foo bar -j ACCEPT")
+
+
+def test_strings_are_quoted_literally(backend):
+    rule = "-p tcp --dport 22 -m comment --comment 'cost $5 `id`' -j ACCEPT"
+    assert translate(backend, rule) == 'tcp dport 22 accept comment "cost $5 `id`"'
+
+
+@pytest.mark.parametrize(
+    "rule",
+    [
+        '-m comment --comment "say \\"hi\\"" -j ACCEPT',
+        '-j LOG --log-prefix "a\\\\b"',
+    ],
+)
+def test_unquotable_strings_are_a_backend_error(backend, rule: str):
+    with pytest.raises(BackendError, match="Cannot quote"):
+        translate(backend, rule)
+
+
+def test_delta_skips_elements_of_an_empty_set(backend):
+    chain_manager = backend.chain_manager
+    chain_manager.sets["empty_s1"] = IpSet("empty_s1", "net")
+    chain_manager.chains["net2fw"].add_rule(
+        Rule.parse("-m set --match-set empty_s1 src -j DROP")
+    )
+    dump = json.dumps(
+        {"nftables": [{"table": {"family": "inet", "name": "phreakwall"}}]}
+    )
+    delta = backend.generate_delta(dump)
+    assert "flush set inet phreakwall empty_s1" in delta
+    assert not [line for line in delta if line.startswith("add element")]
+
+
+def test_load_is_not_expanded_by_the_shell(config_dir: Path, compile_script):
+    (config_dir / "rules").write_text("?COMMENT cost $5 `id`\nACCEPT loc fw tcp 22\n")
+    script = compile_script(config_dir, backend="nft")
+
+    assert "run_nft -f /dev/stdin <<'__PHREAKWALL_NFT__'" in script
+    assert 'comment "cost $5 `id`"' in script
+
+
+def test_shipped_actions_compile_with_nft(config_dir: Path, compile_script):
+    (config_dir / "rules").write_text(
+        "Invalid(DROP) net all\n"
+        "DropSmurfs net all\n"
+        "NotSyn(DROP):info net all\n"
+        "TCPFlags net all\n"
+        "Limit:info:SSH,3,60 net fw tcp 22\n"
+        "SSH(ACCEPT) loc fw\n"
+        "REJECT:info net fw udp 53\n"
+        "LOG:info net fw icmp\n"
+    )
+    script = compile_script(config_dir, backend="nft")
+    assert "meter SSH { ip saddr limit rate over 3/minute burst 3 packets }" in script
+    assert "recent" not in script
@@ -0,0 +1,214 @@
+"""
+Tests for the chain optimizer passes.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+from typing import Dict, List
+
+import pytest
+
+from phreakwall.core.chains import (
+    DONT_DELETE,
+    DONT_MOVE,
+    DONT_OPTIMIZE,
+    ChainManager,
+    ChainType,
+)
+from phreakwall.core.optimizer import (
+    OPTIMIZE_ALL,
+    OPTIMIZE_DUPLICATE,
+    OPTIMIZE_POLICY,
+    OPTIMIZE_SHORT,
+    ChainOptimizer,
+    parse_level,
+)
+
+
+def build(chains: Dict[str, List[str]]) -> ChainManager:
+    """Chain manager with the given chains and rules (created if needed)."""
+    chain_manager = ChainManager(family=4)
+    for name, rules in chains.items():
+        chain = chain_manager.get_chain(name) or chain_manager.create_chain(
+            name, ChainType.FILTER
+        )
+        for rule in rules:
+            chain.add_rule(rule)
+    return chain_manager
+
+
+def rules(chain_manager: ChainManager, name: str) -> List[str]:
+    return [rule.render() for rule in chain_manager.chains[name].rules]
+
+
+@pytest.mark.parametrize(
+    "value, level",
+    [("0", 0), ("None", 0), ("", 0), ("All", OPTIMIZE_ALL), ("yes", OPTIMIZE_ALL), (12, 12)],
+)
+def test_parse_level(value, level: int):
+    assert parse_level(value) == level
+
+
+@pytest.mark.parametrize("value", ["32", "-1", "fast"])
+def test_parse_level_rejects(value):
+    with pytest.raises(ValueError):
+        parse_level(value)
+
+
+def test_level_0_deletes_unreferenced_chains():
+    chain_manager = build(
+        {
+            "INPUT": ["-j net2fw"],
+            "net2fw": ["-p tcp --dport 22 -j ACCEPT"],
+            "orphan": ["-j orphan_log"],
+            "orphan_log": ["-j DROP"],
+        }
+    )
+    ChainOptimizer(chain_manager).optimize(0)
+
+    assert "net2fw" in chain_manager.chains
+    # A chain only referenced from a deleted chain goes in a later pass
+    assert "orphan" not in chain_manager.chains
+    assert "orphan_log" not in chain_manager.chains
+    assert "INPUT" in chain_manager.chains
+
+
+def test_policy_pass_trims_repeated_verdicts():
+    chain_manager = build(
+        {
+            "INPUT": ["-j net2fw", "-j DROP", "-j DROP"],
+            "net2fw": ["-p tcp --dport 22 -j ACCEPT", "-j DROP", "-j DROP"],
+            "loc2fw": ["-p tcp --dport 22 -j ACCEPT", "-j RETURN"],
+            "FORWARD": ["-j loc2fw"],
+        }
+    )
+    ChainOptimizer(chain_manager).optimize(OPTIMIZE_POLICY)
+
+    # INPUT falls through to its DROP policy
+    assert rules(chain_manager, "INPUT") == ["-j net2fw"]
+    assert rules(chain_manager, "net2fw") == ["-p tcp --dport 22 -j ACCEPT", "-j DROP"]
+    assert rules(chain_manager, "loc2fw") == ["-p tcp --dport 22 -j ACCEPT"]
+
+
+def test_policy_pass_keeps_conditional_tail():
+    chain_manager = build(
+        {"INPUT": ["-j net2fw"], "net2fw": ["-s 10.0.0.0/8 -j DROP", "-j ACCEPT"]}
+    )
+    ChainOptimizer(chain_manager).optimize(OPTIMIZE_POLICY)
+
+    assert rules(chain_manager, "net2fw") == ["-s 10.0.0.0/8 -j DROP", "-j ACCEPT"]
+
+
+def test_short_pass_inlines_single_rule_chains():
+    chain_manager = build(
+        {
+            "INPUT": ["-i eth0 -j net2fw", "-i eth1 -j empty"],
+            "net2fw": ["-p tcp --dport 22 -j ACCEPT"],
+            "empty": [],
+        }
+    )
+    stats = ChainOptimizer(chain_manager).optimize(OPTIMIZE_SHORT)
+
+    assert rules(chain_manager, "INPUT") == ["-i eth0 -p tcp --dport 22 -j ACCEPT"]
+    assert "net2fw" not in chain_manager.chains
+    assert "empty" not in chain_manager.chains
+    assert {s.name: s.jumps for s in stats}["short"] == 2
+
+
+def test_short_pass_keeps_goto_to_return_chain():
+    chain_manager = build({"INPUT": ["-i eth0 -g done"], "done": ["-j RETURN"]})
+    ChainOptimizer(chain_manager).optimize(OPTIMIZE_SHORT)
+
+    # A goto to a chain that returns leaves the calling chain
+    assert rules(chain_manager, "INPUT") == ["-i eth0 -g done"]
+
+
+@pytest.mark.parametrize(
+    "inner, inlined",
+    [
+        (["-j ACCEPT"], "-i eth0 -j ACCEPT"),
+        (["-j net2fw"], "-i eth0 -g net2fw"),
+        # A goto cannot target LOG, and LOG does not end the chain
+        (["-j LOG --log-prefix x:"], "-i eth0 -g short"),
+        (["-p tcp -j ACCEPT"], "-i eth0 -g short"),
+    ],
+)
+def test_short_pass_inlines_into_goto(inner: List[str], inlined: str):
+    chain_manager = build(
+        {
+            "INPUT": ["-i eth0 -g short"],
+            "short": inner,
+            "net2fw": ["-p tcp --dport 22 -j ACCEPT", "-j DROP"],
+            "FORWARD": ["-j net2fw"],
+        }
+    )
+    ChainOptimizer(chain_manager).optimize(OPTIMIZE_SHORT)
+
+    assert rules(chain_manager, "INPUT") == [inlined]
+
+
+def test_short_pass_keeps_conflicting_matches():
+    chain_manager = build(
+        {"INPUT": ["-i eth0 -j net2fw"], "net2fw": ["-i eth1 -j ACCEPT"]}
+    )
+    ChainOptimizer(chain_manager).optimize(OPTIMIZE_SHORT)
+
+    assert rules(chain_manager, "INPUT") == ["-i eth0 -j net2fw"]
+
+
+def test_duplicate_pass_merges_identical_chains():
+    chain_manager = build(
+        {
+            "INPUT": ["-i eth0 -j net2fw", "-i eth1 -j loc2fw"],
+            "net2fw": ["-p tcp --dport 22 -j ACCEPT", "-j DROP"],
+            "loc2fw": ["-p tcp --dport 22 -j ACCEPT", "-j DROP"],
+        }
+    )
+    ChainOptimizer(chain_manager).optimize(OPTIMIZE_DUPLICATE)
+
+    assert rules(chain_manager, "INPUT") == ["-i eth0 -j net2fw", "-i eth1 -j net2fw"]
+    assert "loc2fw" not in chain_manager.chains
+
+
+def test_opt_out_flags():
+    chain_manager = build(
+        {
+            "INPUT": ["-i eth0 -j net2fw", "-i eth1 -j loc2fw", "-i eth2 -j dmz2fw"],
+            "net2fw": ["-p tcp --dport 22 -j ACCEPT", "-j DROP", "-j DROP"],
+            "loc2fw": ["-p tcp --dport 22 -j ACCEPT", "-j DROP"],
+            "dmz2fw": ["-j ACCEPT"],
+        }
+    )
+    for name, flags in (
+        ("net2fw", DONT_OPTIMIZE),
+        ("loc2fw", DONT_DELETE),
+        ("dmz2fw", DONT_MOVE),
+        ("phreakwall_input", DONT_DELETE),
+    ):
+        chain_manager.chains[name].optflags = flags
+    ChainOptimizer(chain_manager).optimize(OPTIMIZE_ALL)
+
+    assert rules(chain_manager, "INPUT") == [
+        "-i eth0 -j net2fw",
+        "-i eth1 -j loc2fw",
+        "-i eth2 -j dmz2fw",
+    ]
+    assert len(chain_manager.chains["net2fw"].rules) == 3
+    # Unreferenced, but kept
+    assert "phreakwall_input" in chain_manager.chains
+    assert "phreakwall_output" not in chain_manager.chains
+
+
+def test_compile_keeps_chains_listed_in_the_config(config_dir, compile_script):
+    (config_dir / "phreakwall.conf").write_text("OPTIMIZE=All\nDONT_DELETE=phreakwall_input\n")
+    script = compile_script(config_dir)
+
+    assert ":phreakwall_input" in script
+    assert ":phreakwall_output" not in script
+
+
+def test_compile_with_optimize_0_deletes_unreferenced_chains(config_dir, compile_script):
+    script = compile_script(config_dir, optimize=0)
+
+    assert ":phreakwall_input" not in script
+    assert "-A loc2fw" in script
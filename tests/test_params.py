@@ -0,0 +1,92 @@
+"""
+Tests for the in-process params evaluation.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import os
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from phreakwall.core.params import Params, ParamsError, Unsupported, parse
+
+# Environment of both evaluations; UNSET is never set
+ENVIRONMENT = {"PATH": os.environ.get("PATH", "/usr/bin:/bin"), "SET": "env", "EMPTY": ""}
+
+
+def evaluate(tmp_path: Path, text: str) -> Dict[str, Dict[str, str]]:
+    """Values of a params file evaluated in-process and by the shell."""
+    path = tmp_path / "params"
+    path.write_text(text)
+    return {
+        "in-process": dict(Params(parse(text), ENVIRONMENT)),
+        "shell": dict(Params.from_shell(path, ENVIRONMENT)),
+    }
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # Quoting
+        "A=1 B='x  $y' C=\"a $A ${A}b\"\nD=a\\ b E=\"q\\\"\\$A\\\\\" F='it'\\''s'\n",
+        "LOCNET=192.168.1.0/24\nNETS=$LOCNET,10.0.0.0/8\nexport LOCNET\n",
+        "export A=1 B=2\nreadonly C=$A$B\nset -a\n",
+        # Defaults and alternates of unset, empty and set names
+        "A=${UNSET:-d} B=${EMPTY:-d} C=${SET:-d} D=${UNSET-d} E=${EMPTY-d}\n",
+        "A=${UNSET:+a} B=${EMPTY:+a} C=${SET:+a} D=${UNSET+a} E=${EMPTY+a}\n",
+        "A=${UNSET:-\"x $SET\"} B=${UNSET:-${SET}x}\n",
+        # Command substitution
+        "A=$(echo one  two) B=`echo -n x` C=\"$(echo \"$SET\")\"\n",
+        "HOST=$(hostname) NODE=$(uname -n)\n",
+        # Comments, continuations and mid-word '#'
+        "A=a#b B=1 # comment\n# C=2\nD=x\\\ny; E=z\n",
+        # Later assignments see earlier ones, in order
+        "A=1\nB=$A\nA=2\nC=$A$B\n",
+    ],
+)
+def test_matches_the_shell(tmp_path: Path, text: str):
+    values = evaluate(tmp_path, text)
+    assert values["in-process"] == values["shell"]
+
+
+def test_cat(tmp_path: Path):
+    (tmp_path / "net").write_text("10.1.0.0/16\n")
+    values = evaluate(tmp_path, f"NET=$(cat {tmp_path}/net)\n")
+    assert values["in-process"] == values["shell"] == {"NET": "10.1.0.0/16"}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "if [ -n \"$SET\" ]; then A=1; else A=2; fi\n",
+        "A=1\nB=2\nunset A\n",
+        "A=$((1 + 2))\n",
+        "A=$(echo x | tr x y)\n",
+        "A=$(date)\n",
+        "f() { A=1; }\nf\n",
+    ],
+)
+def test_unsupported_syntax_falls_back_to_the_shell(tmp_path: Path, text: str):
+    with pytest.raises(Unsupported):
+        parse(text)
+
+    path = tmp_path / "params"
+    path.write_text(text)
+    params = Params.load(path, ENVIRONMENT)
+    assert dict(params) == dict(Params.from_shell(path, ENVIRONMENT))
+    assert params
+
+
+def test_values_are_evaluated_on_lookup(tmp_path: Path):
+    params = Params(parse(f"USED=1\nUNUSED=$(cat {tmp_path}/missing)\n"), ENVIRONMENT)
+    assert params["USED"] == "1"
+    with pytest.raises(ParamsError, match="cat"):
+        params["UNUSED"]
+
+
+@pytest.mark.parametrize("text", ["A='x\n", 'A="x\n', "A=$(echo x\n", "A=`echo x\n"])
+def test_unterminated_quotes(text: str):
+    with pytest.raises(ParamsError, match="unterminated"):
+        parse(text)
@@ -0,0 +1,88 @@
+"""
+Tests for the rule representation and its interning.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import pickle
+import subprocess
+import threading
+
+import pytest
+
+from phreakwall.core.rule import Match, Rule, interning, quote
+
+
+def test_parse_and_render_round_trip():
+    text = '-s 10.0.0.0/8 -p tcp ! --dport 22 -m comment --comment "ssh in" -j REJECT'
+    rule = Rule.parse(text)
+
+    assert rule.source == "10.0.0.0/8"
+    assert rule.get("--dport").negated
+    assert rule.render() == text
+    assert Rule.parse(rule.render()) == rule
+
+
+def test_fragments_are_shared_inside_a_block():
+    with interning():
+        first = Rule.parse("-p tcp --dport 22 -j ACCEPT")
+        second = Rule.parse("-p tcp --dport 22 -j ACCEPT")
+
+        assert first.matches is second.matches
+        assert first.action is second.action
+        assert Match.get("-p", ("tcp",)) is first.matches[0]
+
+
+def test_tables_are_dropped_after_the_block():
+    with interning() as table:
+        rule = Rule.parse("-p tcp --dport 22 -j ACCEPT")
+        assert table.matches
+
+    with interning() as other:
+        assert not other.matches
+        again = Rule.parse("-p tcp --dport 22 -j ACCEPT")
+
+    assert other is not table
+    assert again.matches is not rule.matches
+    assert again == rule
+
+
+def test_nested_blocks_share_the_outer_table():
+    with interning() as outer:
+        with interning() as inner:
+            assert inner is outer
+
+
+def test_no_interning_outside_a_block():
+    assert Match.get("-p", ("tcp",)) is not Match.get("-p", ("tcp",))
+    assert Match.get("-p", ("tcp",)) == Match.get("-p", ("tcp",))
+
+
+def test_threads_have_their_own_table():
+    tables = []
+    with interning() as table:
+        thread = threading.Thread(target=lambda: tables.append(Match.get("-p", ("tcp",))))
+        thread.start()
+        thread.join()
+
+        assert tables[0] is not Match.get("-p", ("tcp",))
+        assert ("-p", ("tcp",), False) in table.matches
+
+
+def test_unpickled_rules_are_interned():
+    data = pickle.dumps(Rule.parse("-p tcp --dport 22 -j ACCEPT"))
+    with interning():
+        first, second = pickle.loads(data), pickle.loads(data)
+
+        assert first.matches[0] is second.matches[0]
+
+
+@pytest.mark.parametrize(
+    "value", ["ssh in", "cost $5 `id`", 'say "hi"', "a\\b $HOME", "it's $5"]
+)
+def test_quoted_arguments_read_the_same_in_the_shell(value: str):
+    quoted = quote(value)
+    shell = subprocess.run(["sh", "-c", f"printf %s {quoted}"], capture_output=True, text=True)
+
+    assert shell.stdout == value
+    assert Rule.parse(f"-m comment --comment {quoted} -j ACCEPT").comment == value
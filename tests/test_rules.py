@@ -0,0 +1,84 @@
+"""
+Tests for the rules module.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+from pathlib import Path
+
+import pytest
+
+from phreakwall.core.compiler import Compiler, CompilerOptions
+from phreakwall.core.config import ConfigError
+
+
+def check(directory: Path):
+    """Check a configuration, raising its first error."""
+    options = CompilerOptions(
+        directory=directory, verbosity=-1, cache_dir=None, confess=True
+    )
+    return Compiler(options).compile()
+
+
+@pytest.mark.parametrize(
+    "rule, error",
+    [
+        ("DROP nett fw tcp 22", "unknown zone nett"),
+        ("DROP net fw tpc 22", r"Unknown protocol \(tpc\)"),
+        ("DROP net fw tcp sshh", r"Unknown tcp service \(sshh\)"),
+        ("REJECT net:10.0.0.300 fw tcp 22", r"Invalid IPv4 address \(10.0.0.300\)"),
+        ("Sshh(DROP) net fw", r"unsupported action Sshh\(DROP\)"),
+        ("DROP - fw tcp 22", "missing zone"),
+    ],
+)
+def test_invalid_rule_fails_the_compile(config_dir: Path, rule: str, error: str):
+    (config_dir / "rules").write_text(f"ACCEPT loc fw tcp 22\n{rule}\n")
+    with pytest.raises(ConfigError, match=rf"rules:2: {error}"):
+        check(config_dir)
+
+
+def test_invalid_action_entry_reports_the_action_file(config_dir: Path):
+    (config_dir / "actions").write_text("Custom\n")
+    (config_dir / "action.Custom").write_text("ACCEPT - - tcp 22\nDROP - - tcp sshh\n")
+    (config_dir / "rules").write_text("Custom net fw\n")
+    with pytest.raises(ConfigError, match=r"rules:1: action Custom: .*action.Custom:2: "):
+        check(config_dir)
+
+
+def test_long_port_list_is_split_into_multiport_matches(config_dir: Path, compile_script):
+    # 16 ports and a range (counting as two) need two multiport matches
+    ports = [str(port) for port in range(1000, 1032, 2)] + ["2000:2010"]
+    (config_dir / "rules").write_text(f"ACCEPT loc fw tcp {','.join(ports)}\n")
+    script = compile_script(config_dir)
+
+    lists = [
+        line.split("--dports ")[1].split()[0]
+        for line in script.splitlines()
+        if line.startswith("-A loc2fw") and "--dports" in line
+    ]
+    assert lists == [",".join(ports[:15]), ",".join(ports[15:])]
+
+
+def test_long_negated_port_list_fails_the_compile(config_dir: Path):
+    ports = ",".join(str(port) for port in range(1000, 1032, 2))
+    (config_dir / "rules").write_text(f"DROP net fw tcp !{ports}\n")
+    with pytest.raises(ConfigError, match=r"rules:1: More than 15 ports cannot be negated"):
+        check(config_dir)
+
+
+def test_comments_are_not_expanded_by_the_shell(config_dir: Path, compile_script):
+    (config_dir / "rules").write_text("?COMMENT cost $5 `id`\nACCEPT loc fw tcp 22\n")
+    script = compile_script(config_dir)
+
+    assert "run_iptables_restore <<'__PHREAKWALL_RESTORE__'" in script
+    assert "--comment 'cost $5 `id`'" in script
+
+
+def test_set_load_is_not_expanded_by_the_shell(config_dir: Path, compile_script):
+    # Four separate networks become one set
+    (config_dir / "rules").write_text(
+        "".join(f"DROP net:10.0.{n}.0/24 fw\n" for n in range(0, 8, 2))
+    )
+    script = compile_script(config_dir)
+
+    assert "ipset restore <<'__PHREAKWALL_SETS__'" in script
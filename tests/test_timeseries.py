@@ -0,0 +1,110 @@
+"""
+Tests for the metrics time-series store.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import math
+import time
+from pathlib import Path
+
+import pytest
+
+from phreakwall.web.timeseries import MetricStore, StoreError
+
+# 10 s points for 10 minutes, 1 min points for 15 minutes
+TIERS = ((10, 60), (60, 15))
+
+
+@pytest.fixture
+def path(tmp_path) -> Path:
+    return tmp_path / "metrics.pwts"
+
+
+@pytest.fixture
+def now() -> int:
+    # Start of a minute, so the samples below share the coarse steps
+    return int(time.time()) // 60 * 60 - 60
+
+
+def open_store(path: Path, **options) -> MetricStore:
+    options.setdefault("tiers", TIERS)
+    options.setdefault("max_series", 3)
+    return MetricStore(path, **options)
+
+
+def test_round_trip(path: Path, now: int):
+    store = open_store(path)
+    store.append(now, {"cpu": 10.0, "memory": 50.0})
+    store.append(now + 5, {"cpu": 20.0, "memory": math.nan})
+    store.append(now + 10, {"cpu": 30.0})
+    store.close()
+
+    reader = open_store(path, writable=False)
+    try:
+        assert not reader.writable
+        assert reader.series() == ["cpu", "memory"]
+
+        fine = reader.query(["cpu", "memory", "disk"], now, now + 10)
+        assert fine["step"] == 10
+        assert fine["timestamps"] == [now, now + 10]
+        assert fine["values"]["cpu"] == [15.0, 30.0]
+        assert fine["values"]["memory"] == [50.0, None]
+        assert fine["values"]["disk"] == [None, None]
+
+        # One point per minute comes from the coarse tier
+        coarse = reader.query(["cpu"], now, now + 59, points=1)
+        assert coarse["step"] == 60
+        assert coarse["values"]["cpu"] == [20.0]
+    finally:
+        reader.close()
+
+
+def test_stale_records_are_not_returned(path: Path, now: int):
+    store = open_store(path)
+    # The slot of now + 600 in the 10 s ring, one lap earlier
+    store.append(now, {"cpu": 1.0})
+    result = store.query(["cpu"], now + 600, now + 600)
+    store.close()
+
+    assert result["values"]["cpu"] == [None]
+
+
+def test_second_writer_falls_back_to_read_only(path: Path, now: int):
+    store = open_store(path)
+    other = open_store(path)
+    try:
+        assert store.writable
+        assert not other.writable
+        with pytest.raises(StoreError):
+            other.append(now, {"cpu": 1.0})
+    finally:
+        other.close()
+        store.close()
+
+
+def test_layout_mismatch(path: Path):
+    open_store(path).close()
+    with pytest.raises(StoreError):
+        open_store(path, max_series=4)
+    with pytest.raises(StoreError, match="different layout"):
+        open_store(path, tiers=((10, 15), (60, 60)))
+
+
+def test_full_store_reclaims_unused_slots(path: Path, now: int):
+    store = open_store(path)
+    store.append(now, {"cpu": 1.0, "veth1.bytes_sent": 2.0, "veth2.bytes_sent": 3.0})
+
+    # Every slot is written within the retention period
+    store.append(now + 60, {"cpu": 1.0, "veth3.bytes_sent": 4.0})
+    assert "veth3.bytes_sent" not in store.series()
+
+    # The veth series stop; once the coarse ring no longer holds them
+    # their slots go to new series
+    later = now + 16 * 60
+    store.append(later, {"cpu": 1.0, "veth3.bytes_sent": 4.0})
+    assert store.series() == ["cpu", "veth3.bytes_sent"]
+
+    result = store.query(["veth3.bytes_sent", "veth1.bytes_sent"], later, later)
+    store.close()
+    assert result["values"] == {"veth3.bytes_sent": [4.0], "veth1.bytes_sent": [None]}
@@ -0,0 +1,164 @@
+"""
+Tests for the configuration watcher and its cache invalidation.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from phreakwall.core.cache import CompileCache
+from phreakwall.daemon.watch import IN_CLOSE_WRITE, IN_Q_OVERFLOW, ChangeBatch, Watcher
+
+
+class Recorder:
+    """Rebuild callback that records its batches."""
+
+    def __init__(self):
+        self.batches: List[ChangeBatch] = []
+        self.called = threading.Event()
+
+    def __call__(self, batch: ChangeBatch) -> bool:
+        self.batches.append(batch)
+        self.called.set()
+        return True
+
+
+@pytest.fixture
+def directory(tmp_path: Path) -> Path:
+    directory = tmp_path / "etc"
+    (directory / "conf.d").mkdir(parents=True)
+    return directory
+
+
+def test_burst_of_changes_is_one_batch(directory: Path):
+    recorder = Recorder()
+    watcher = Watcher(directory, recorder, debounce=0.2, report=lambda batch: None)
+    watcher.start()
+    try:
+        for name in ("rules", "policy", "conf.d/extra", ".rules.swp", "rules~"):
+            (directory / name).write_text("ACCEPT\n")
+            time.sleep(0.02)
+        assert recorder.called.wait(5)
+        time.sleep(0.4)
+    finally:
+        watcher.stop()
+
+    # Editor and backup files are ignored
+    (batch,) = recorder.batches
+    assert batch.files == ["conf.d/extra", "policy", "rules"]
+    assert batch.ok and not batch.overflow
+    assert watcher.stats.batches == 1
+    assert watcher.stats.events == batch.events >= 3
+
+
+def test_steady_changes_are_cut_off_after_max_delay(directory: Path):
+    recorder = Recorder()
+    watcher = Watcher(
+        directory, recorder, debounce=0.3, max_delay=0.5, report=lambda batch: None
+    )
+    watcher.start()
+    try:
+        # Never quiet for the debounce window
+        end = time.monotonic() + 1.5
+        while time.monotonic() < end:
+            (directory / "rules").write_text("ACCEPT\n")
+            time.sleep(0.05)
+        time.sleep(0.5)
+    finally:
+        watcher.stop()
+
+    assert len(recorder.batches) >= 2
+    assert all(batch.files == ["rules"] for batch in recorder.batches)
+
+
+def test_new_directories_are_watched(directory: Path):
+    recorder = Recorder()
+    watcher = Watcher(directory, recorder, debounce=0.2, report=lambda batch: None)
+    watcher.start()
+    try:
+        (directory / "new").mkdir()
+        time.sleep(0.1)
+        (directory / "new" / "rules").write_text("ACCEPT\n")
+        assert recorder.called.wait(5)
+        time.sleep(0.4)
+    finally:
+        watcher.stop()
+
+    files = {name for batch in recorder.batches for name in batch.files}
+    assert files == {"new", "new/rules"}
+
+
+class FakeInotify:
+    """Stand-in for Inotify delivering the queued events."""
+
+    def __init__(self):
+        self.fd, self._w = os.pipe()
+        self.events: List[tuple] = []
+
+    def queue(self, *events: tuple):
+        self.events.extend(events)
+        os.write(self._w, b"x")
+
+    def read(self) -> List[tuple]:
+        os.read(self.fd, 1024)
+        events, self.events = self.events, []
+        return events
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self._w)
+
+
+def test_overflow_is_reported(directory: Path):
+    recorder = Recorder()
+    watcher = Watcher(directory, recorder, debounce=0.05, report=lambda batch: None)
+    inotify = watcher._inotify = FakeInotify()
+    watcher._dirs[1] = watcher.directory
+    thread = threading.Thread(target=watcher._serve)
+    thread.start()
+    try:
+        inotify.queue((1, IN_CLOSE_WRITE, "rules"), (-1, IN_Q_OVERFLOW, ""))
+        assert recorder.called.wait(5)
+    finally:
+        watcher.stop()
+        thread.join()
+
+    (batch,) = recorder.batches
+    assert batch.overflow
+    assert batch.files == ["rules"]
+    assert batch.events == 2
+
+
+def test_forget_rehashes_rewrites_the_stat_signature_misses(tmp_path: Path):
+    cache = CompileCache(tmp_path / "cache")
+    directory = tmp_path / "etc"
+    directory.mkdir()
+    path = directory / "rules"
+    path.write_text("ACCEPT net fw tcp 22\n")
+    # Old enough for the signature to be trusted
+    old = time.time_ns() - 60 * 10**9
+    os.utime(path, ns=(old, old))
+    before = cache.file_digest(path)
+
+    # Same size, mtime and inode
+    with path.open("r+") as f:
+        f.write("ACCEPT net fw tcp 23\n")
+    os.utime(path, ns=(old, old))
+    assert cache.file_digest(path) == before
+
+    cache.forget([path])
+    after = cache.file_digest(path)
+    assert after != before
+
+    # A directory covers the files below it
+    with path.open("r+") as f:
+        f.write("ACCEPT net fw tcp 22\n")
+    os.utime(path, ns=(old, old))
+    cache.forget([directory])
+    assert cache.file_digest(path) == before
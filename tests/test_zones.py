@@ -0,0 +1,129 @@
+"""
+Tests for the zone dispatch.
+
+Copyright (c) 2025 Phreakwall Contributors
+"""
+
+import ipaddress
+from pathlib import Path
+from typing import Dict, Optional
+
+import pytest
+
+from phreakwall.core.chains import ChainManager
+from phreakwall.core.compiler import Compiler, CompilerOptions
+
+# vpn is a sub-zone of loc on part of eth1
+ZONES = {
+    4: {
+        "zones": "fw firewall\nnet ipv4\nloc ipv4\nvpn:loc ipv4\ndmz ipv4\n",
+        "hosts": "vpn eth1:10.8.0.0/24,10.9.0.0/24\n",
+    },
+    6: {
+        "zones": "fw firewall\nnet ipv6\nloc ipv6\nvpn:loc ipv6\ndmz ipv6\n",
+        "hosts": "vpn eth1:[2001:db8:8::]/64,[2001:db8:9::1]\n",
+    },
+}
+CONFIG = {
+    "interfaces": "net eth0\nloc eth1\ndmz eth2\n",
+    "policy": "loc net ACCEPT\nvpn all ACCEPT\nnet all DROP\nall all REJECT\n",
+    "rules": "ACCEPT net dmz tcp 80\n",
+    "phreakwall.conf": "OPTIMIZE=0\n",
+}
+
+
+def compile_chains(directory: Path, family: int) -> ChainManager:
+    directory.mkdir()
+    for name, text in {**CONFIG, **ZONES[family]}.items():
+        (directory / name).write_text(text)
+    compiler = Compiler(
+        CompilerOptions(directory=directory, family=family, verbosity=-1, cache_dir=None)
+    )
+    assert compiler.compile() == 0
+    return compiler.chain_manager
+
+
+def pair_chain(
+    chain_manager: ChainManager, chain: str, packet: Dict[str, str]
+) -> Optional[str]:
+    """
+    Follow a new packet through the dispatch to its zone-pair chain.
+
+    Only interface and address matches are evaluated; rules with other
+    matches (established traffic) do not apply to a new packet.
+    """
+    for rule in chain_manager.chains[chain].rules:
+        matches = {match.option: match.value for match in rule.matches}
+        if set(matches) - {"-i", "-o"}:
+            continue
+        if any(packet.get(option) != value for option, value in matches.items()):
+            continue
+        addresses = (("src", rule.source), ("dst", rule.destination))
+        if any(
+            network and ipaddress.ip_address(packet[key]) not in ipaddress.ip_network(network)
+            for key, network in addresses
+        ):
+            continue
+        if "2" in rule.target:
+            return rule.target
+        if rule.target in chain_manager.chains:
+            found = pair_chain(chain_manager, rule.target, packet)
+            if found:
+                return found
+    return None
+
+
+# (built-in chain, packet, zone pair, policy)
+PACKETS = [
+    ("INPUT", {"-i": "eth0", "src": "net"}, "net2fw", "DROP"),
+    ("INPUT", {"-i": "eth1", "src": "loc"}, "loc2fw", "REJECT"),
+    ("INPUT", {"-i": "eth1", "src": "vpn"}, "vpn2fw", "ACCEPT"),
+    ("INPUT", {"-i": "eth1", "src": "vpn2"}, "vpn2fw", "ACCEPT"),
+    # vpn addresses arriving on another interface are not vpn
+    ("INPUT", {"-i": "eth0", "src": "vpn"}, "net2fw", "DROP"),
+    ("OUTPUT", {"-o": "eth2", "dst": "dmz"}, "fw2dmz", "REJECT"),
+    ("OUTPUT", {"-o": "eth1", "dst": "vpn"}, "fw2vpn", "REJECT"),
+    ("FORWARD", {"-i": "eth0", "-o": "eth1", "src": "net", "dst": "loc"}, "net2loc", "DROP"),
+    ("FORWARD", {"-i": "eth0", "-o": "eth1", "src": "net", "dst": "vpn"}, "net2vpn", "DROP"),
+    ("FORWARD", {"-i": "eth1", "-o": "eth0", "src": "loc", "dst": "net"}, "loc2net", "ACCEPT"),
+    ("FORWARD", {"-i": "eth1", "-o": "eth2", "src": "vpn", "dst": "dmz"}, "vpn2dmz", "ACCEPT"),
+    ("FORWARD", {"-i": "eth1", "-o": "eth1", "src": "vpn", "dst": "loc"}, "vpn2loc", "ACCEPT"),
+    ("FORWARD", {"-i": "eth0", "-o": "eth2", "src": "net", "dst": "dmz"}, "net2dmz", "DROP"),
+]
+
+# Addresses of each zone's hosts per family
+ADDRESSES = {
+    4: {
+        "net": "192.0.2.1",
+        "loc": "192.168.1.5",
+        "vpn": "10.8.0.5",
+        "vpn2": "10.9.0.9",
+        "dmz": "198.51.100.7",
+    },
+    6: {
+        "net": "2001:db8:1::1",
+        "loc": "2001:db8:2::5",
+        "vpn": "2001:db8:8::5",
+        "vpn2": "2001:db8:9::1",
+        "dmz": "2001:db8:3::7",
+    },
+}
+
+
+@pytest.fixture(scope="module", params=[4, 6])
+def chains(request, tmp_path_factory):
+    family = request.param
+    return family, compile_chains(tmp_path_factory.mktemp("zones") / "etc", family)
+
+
+@pytest.mark.parametrize("builtin, packet, pair, policy", PACKETS)
+def test_packets_reach_their_zone_pair(chains, builtin, packet, pair, policy):
+    family, chain_manager = chains
+    packet = dict(packet)
+    for key in ("src", "dst"):
+        if key in packet:
+            packet[key] = ADDRESSES[family][packet[key]]
+
+    assert pair_chain(chain_manager, builtin, packet) == pair
+    # The pair chain ends in the policy of the zone pair
+    assert chain_manager.chains[pair].rules[-1].target == policy